@@ -10,6 +10,7 @@ from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.db.mongodb_utils import get_db
 from app.core.logging_utils import log_event, LogLevel
 from app.services.ai.ai_cache_manager import ai_cache_manager, CacheType, CacheStats
+from app.utils.single_flight import get_single_flight_statistics
 from app.models.user_models import User
 from app.core.security import get_current_active_user
 
@@ -48,7 +49,10 @@ async def get_cache_statistics(
             elif cache_type == "query_embedding":
                 estimated_token_savings += stats.hit_count * 50   # 每次命中節省約 50 tokens
             elif cache_type == "ai_response":
-                estimated_token_savings += stats.hit_count * 800  # 每次命中節省約 800 tokens
+                # LLM 回應緩存記錄了實際節省的 token，其餘命中按估算值計算
+                llm_stats = ai_cache_manager.get_llm_response_cache_statistics()
+                estimated_token_savings += llm_stats["tokens_saved"]
+                estimated_token_savings += max(stats.hit_count - llm_stats["hits"], 0) * 800
             elif cache_type == "prompt_template":
                 estimated_token_savings += stats.hit_count * 1800  # 每次提示詞命中節省約 1800 tokens
         
@@ -69,7 +73,8 @@ async def get_cache_statistics(
                 }
                 for cache_type, stats in cache_stats.items()
             },
-            "enhanced_statistics": enhanced_stats  # 添加完整的增強統計信息
+            "enhanced_statistics": enhanced_stats,  # 添加完整的增強統計信息
+            "single_flight": get_single_flight_statistics()  # 合併進行中相同請求的統計
         }
         
         await log_event(
@@ -170,18 +175,24 @@ async def cleanup_expired_caches(
     try:
         await ai_cache_manager.cleanup_expired_caches(db)
         
+        # 同時清理過期的 Gemini Context Caches（本地登記、遠端緩存與數據庫記錄）
+        from app.services.ai.unified_ai_service_simplified import unified_ai_service_simplified
+        context_cache_cleanup = await unified_ai_service_simplified.cleanup_expired_context_caches(db)
+        
         await log_event(
             db=db,
             level=LogLevel.INFO,
             message="手動清理過期緩存完成",
             source="api.cache_monitoring.cleanup_expired",
             user_id=str(current_user.id),
-            request_id=request_id
+            request_id=request_id,
+            details={"context_caches": context_cache_cleanup}
         )
         
         return {
             "success": True,
-            "message": "過期緩存清理完成"
+            "message": "過期緩存清理完成",
+            "context_caches": context_cache_cleanup
         }
         
     except Exception as e:
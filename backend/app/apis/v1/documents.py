@@ -9,7 +9,8 @@ from fastapi import (
     Request, 
     Query,
     BackgroundTasks,
-    Request
+    Request,
+    Response
 )
 from fastapi.responses import FileResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
@@ -36,6 +37,7 @@ from ...models.document_models import (
     DocumentUpdate,
     DocumentStatus,
     PaginatedDocumentResponse,
+    PaginatedDocumentSummaryResponse,
     DocumentAnalysis,
     BatchDeleteRequest,
     BatchDeleteResponseDetail,
@@ -44,7 +46,7 @@ from ...models.document_models import (
 from ...models.user_models import User
 # AI models (AIImageAnalysisOutput, etc.) are no longer directly used in this file
 # from ...models.ai_models_simplified import AIImageAnalysisOutput, TokenUsage, AITextAnalysisOutput, AIPromptRequest 
-from ...crud import crud_documents
+from ...crud import crud_documents, crud_document_contents
 from ...core.config import settings, Settings
 from ...core.logging_utils import log_event, LogLevel, AppLogger
 from ...core.security import get_current_active_user
@@ -55,6 +57,12 @@ from ...services.document.document_processing_service import DocumentProcessingS
 # from ...services.unified_ai_service_simplified import unified_ai_service_simplified, AIRequest, TaskType as AIServiceTaskType
 # from ...services.unified_ai_config import unified_ai_config 
 from ...services.document.document_tasks_service import DocumentTasksService
+from ...services.document.document_dedup_service import document_dedup_service
+from ...services.document.document_bulk_delete_service import document_bulk_delete_service
+from ...services.document.document_processing_scheduler import document_processing_scheduler
+from ...services.background_task_manager import background_task_manager
+from ...models.background_task_models import TaskStatus, TaskStatusResponse, TaskType
+from ...models.user_models import DocumentDedupMode
 from app.services.vector.vector_db_service import vector_db_service
 from .vector_db import BatchDeleteRequest as VectorDBBatchDeleteRequest
 from ...utils import file_handling_utils # Added
@@ -96,6 +104,7 @@ def get_document_tasks_service() -> DocumentTasksService:
 @router.post("/", response_model=Document, status_code=status.HTTP_201_CREATED, summary="上傳新文件並創建記錄")
 async def upload_document(
     request: Request,
+    response: Response,
     file: UploadFile = File(...),
     tags: Optional[List[str]] = Form(None),
     db: AsyncIOMotorDatabase = Depends(get_db),
@@ -108,6 +117,10 @@ async def upload_document(
 
     - **file**: 要上傳的文件。
     - **tags**: (可選) 與文件關聯的標籤列表。
+
+    內容與該用戶已有文檔相同時按去重模式處理（用戶設定或 DOCUMENT_DEDUP_DEFAULT_MODE）：
+    link 直接返回已有文檔，clone 創建新文檔並複製分析結果與向量；
+    兩者都在 X-Duplicate-Of 響應頭中返回已有文檔的 ID。
     """
     logger.info(f"用戶 {current_user.email} (ID: {current_user.id}) 正在上傳文件: {file.filename}")
 
@@ -121,7 +134,8 @@ async def upload_document(
     file_size = 0
 
     try:
-        file_size = await file_handling_utils.save_uploaded_file(file, file_path, safe_filename)
+        saved_upload = await file_handling_utils.save_uploaded_file(file, file_path, safe_filename)
+        file_size = saved_upload.size
         
         request_id_for_log = request.headers.get("X-Request-ID")
 
@@ -132,7 +146,8 @@ async def upload_document(
             safe_filename=safe_filename,
             db=db, # Pass db
             current_user_id=current_user.id, # Pass current_user.id
-            request_id=request_id_for_log
+            request_id=request_id_for_log,
+            sniffed_content_type=saved_upload.sniffed_content_type
         )
         # Store original_mime_type for metadata if a warning occurred
         original_mime_type = file.content_type if mime_type_warning else None
@@ -160,12 +175,29 @@ async def upload_document(
     finally:
         await file.close()
 
+    # 同一用戶已有相同內容的文檔時，link 模式不創建新記錄，clone 模式在創建後複製處理結果
+    dedup_mode = document_dedup_service.resolve_mode(current_user)
+    duplicate = None
+    if dedup_mode != DocumentDedupMode.OFF:
+        duplicate = await document_dedup_service.find_duplicate(db, current_user.id, saved_upload.sha256)
+    if duplicate is not None and dedup_mode == DocumentDedupMode.LINK:
+        existing_document = await document_dedup_service.link_duplicate(
+            db, duplicate, tags=tags, user_id=str(current_user.id)
+        )
+        if existing_document is not None:
+            file_path.unlink(missing_ok=True)
+            logger.info(f"文件 '{safe_filename}' 與已有文檔 {existing_document.id} 內容相同，已刪除新上傳的文件")
+            response.headers["X-Duplicate-Of"] = str(existing_document.id)
+            return existing_document
+        duplicate = None
+
     # 創建 DocumentCreate Pydantic 模型實例
     document_data = DocumentCreate(
         filename=safe_filename,
         owner_id=current_user.id,
         file_type=actual_content_type,
         size=file_size,
+        content_sha256=saved_upload.sha256,
         tags=tags if tags else [],
         metadata={
             "mime_type_verified": True,
@@ -207,6 +239,12 @@ async def upload_document(
         )
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="創建文件記錄時發生內部錯誤")
 
+    if duplicate is not None:
+        response.headers["X-Duplicate-Of"] = str(duplicate["_id"])
+        created_document = await document_dedup_service.clone_document(
+            db, source=duplicate, target=created_document, user_id=str(current_user.id)
+        )
+
     # 異步記錄操作日誌 (可以考慮放入 background_tasks)
     await log_event(
         db=db,
@@ -229,18 +267,26 @@ async def list_documents(
     limit: int = Query(20, ge=1, le=100, description="返回的最大記錄數"),
     status_in: Optional[List[DocumentStatus]] = Query(None, description="根據一個或多個文件狀態過濾"),
     filename_contains: Optional[str] = Query(None, description="根據文件名包含的文字過濾 (不區分大小寫)"),
+    q: Optional[str] = Query(None, max_length=200, description="搜索文件名、標籤與摘要（支持中文），預設按相關度排序"),
     tags_include: Optional[List[str]] = Query(None, description="根據包含的標籤過濾 (傳入一個或多個標籤)"),
     cluster_id: Optional[str] = Query(None, description="根據聚類ID過濾"),
     clustering_status: Optional[str] = Query(None, description="根據聚類狀態過濾 (pending, clustered, excluded)"),
-    sort_by: Optional[str] = Query(None, description="排序欄位 (例如 filename, created_at)"),
-    sort_order: Optional[str] = Query("desc", description="排序方向 ('asc' 或 'desc')")
+    sort_by: Optional[str] = Query(None, description="排序欄位 (例如 filename, created_at；搜索時可用 relevance)"),
+    sort_order: Optional[str] = Query("desc", description="排序方向 ('asc' 或 'desc')"),
+    pagination: str = Query("offset", pattern="^(offset|cursor)$", description="分頁模式 ('offset' 或 'cursor')"),
+    cursor: Optional[str] = Query(None, description="游標模式下上一頁返回的 next_cursor"),
+    total_mode: Optional[str] = Query(None, pattern="^(exact|cached|none)$", description="總數計算方式 ('exact'、'cached' 或 'none')")
 ):
     """
     檢索當前登入用戶的文件列表，支持分頁、過濾和排序。
+    - **pagination**: 'offset' 使用 skip/limit；'cursor' 按排序鍵與 _id 從 cursor 之後讀取，耗時與頁碼深度無關（忽略 skip）。
+    - **cursor**: 游標模式下上一頁返回的 next_cursor，首頁不傳。
+    - **total_mode**: 'exact' 每次精確計數（offset 模式預設）；'cached' 使用短期緩存的總數（cursor 模式預設）；'none' 不計算總數。
     - **skip**: 跳過的記錄數，用於分頁。
     - **limit**: 返回的最大記錄數。
     - **status_in**: 根據一個或多個文件狀態列表進行過濾。
     - **filename_contains**: 根據文件名包含的文字過濾 (不區分大小寫)。
+    - **q**: 搜索文件名、標籤與摘要（n-gram 索引，支持中文）；未指定 sort_by 時按相關度排序（僅 offset 分頁）。
     - **tags_include**: 根據包含的標籤過濾 (傳入一個或多個標籤)。
     - **cluster_id**: 根據聚類ID過濾,只返回屬於該聚類的文檔。
     - **clustering_status**: 根據聚類狀態過濾 (pending, clustered, excluded)。
@@ -249,34 +295,135 @@ async def list_documents(
     
     日志記錄由 log_api_operation 裝飾器自動處理。
     """
-    if sort_order and sort_order.lower() not in ["asc", "desc"]:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="無效的排序順序，必須是 'asc' 或 'desc'")
-
-    documents = await crud_documents.get_documents(
+    page = await _list_documents_page(
         db,
         owner_id=current_user.id,
+        summary_only=False,
         skip=skip,
         limit=limit,
-        status_in=status_in,
-        filename_contains=filename_contains,
-        tags_include=tags_include,
-        cluster_id=cluster_id,
-        clustering_status=clustering_status,
+        filters=dict(
+            status_in=status_in,
+            filename_contains=filename_contains,
+            tags_include=tags_include,
+            cluster_id=cluster_id,
+            clustering_status=clustering_status,
+            search=q
+        ),
         sort_by=sort_by,
-        sort_order=sort_order
+        sort_order=sort_order,
+        pagination=pagination,
+        cursor=cursor,
+        total_mode=total_mode
     )
-    
-    total_count = await crud_documents.count_documents(
+    return PaginatedDocumentResponse(**page)
+
+@router.get("/summaries", response_model=PaginatedDocumentSummaryResponse, summary="獲取當前用戶的文件輕量列表")
+@log_api_operation(operation_name="列出文檔摘要", log_success=True, success_level=LogLevel.DEBUG)
+async def list_document_summaries(
+    request: Request,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+    skip: int = Query(0, ge=0, description="跳過的記錄數，用於分頁"),
+    limit: int = Query(20, ge=1, le=100, description="返回的最大記錄數"),
+    status_in: Optional[List[DocumentStatus]] = Query(None, description="根據一個或多個文件狀態過濾"),
+    filename_contains: Optional[str] = Query(None, description="根據文件名包含的文字過濾 (不區分大小寫)"),
+    q: Optional[str] = Query(None, max_length=200, description="搜索文件名、標籤與摘要（支持中文），預設按相關度排序"),
+    tags_include: Optional[List[str]] = Query(None, description="根據包含的標籤過濾 (傳入一個或多個標籤)"),
+    cluster_id: Optional[str] = Query(None, description="根據聚類ID過濾"),
+    clustering_status: Optional[str] = Query(None, description="根據聚類狀態過濾 (pending, clustered, excluded)"),
+    sort_by: Optional[str] = Query(None, description="排序欄位 (例如 filename, created_at；搜索時可用 relevance)"),
+    sort_order: Optional[str] = Query("desc", description="排序方向 ('asc' 或 'desc')"),
+    pagination: str = Query("offset", pattern="^(offset|cursor)$", description="分頁模式 ('offset' 或 'cursor')"),
+    cursor: Optional[str] = Query(None, description="游標模式下上一頁返回的 next_cursor"),
+    total_mode: Optional[str] = Query(None, pattern="^(exact|cached|none)$", description="總數計算方式 ('exact'、'cached' 或 'none')")
+):
+    """
+    與 GET / 相同的過濾、分頁和排序，但只返回 DocumentSummary 欄位
+    （ID、文件名、狀態、標籤、聚類信息、標題與摘要），不讀取提取文本與完整的 AI 分析結果。
+    適用於只需要展示列表的場景。
+    """
+    page = await _list_documents_page(
         db,
         owner_id=current_user.id,
-        status_in=status_in,
-        filename_contains=filename_contains,
-        tags_include=tags_include,
-        cluster_id=cluster_id,
-        clustering_status=clustering_status
+        summary_only=True,
+        skip=skip,
+        limit=limit,
+        filters=dict(
+            status_in=status_in,
+            filename_contains=filename_contains,
+            tags_include=tags_include,
+            cluster_id=cluster_id,
+            clustering_status=clustering_status,
+            search=q
+        ),
+        sort_by=sort_by,
+        sort_order=sort_order,
+        pagination=pagination,
+        cursor=cursor,
+        total_mode=total_mode
     )
-    
-    return PaginatedDocumentResponse(items=documents, total=total_count)
+    return PaginatedDocumentSummaryResponse(**page)
+
+async def _list_documents_page(
+    db: AsyncIOMotorDatabase,
+    owner_id: uuid.UUID,
+    summary_only: bool,
+    skip: int,
+    limit: int,
+    filters: Dict[str, Any],
+    sort_by: Optional[str],
+    sort_order: Optional[str],
+    pagination: str,
+    cursor: Optional[str],
+    total_mode: Optional[str]
+) -> Dict[str, Any]:
+    """列表與輕量列表共用的分頁和總數邏輯"""
+    if sort_order and sort_order.lower() not in ["asc", "desc"]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="無效的排序順序，必須是 'asc' 或 'desc'")
+
+    if filters.get("search") and not sort_by and pagination == "offset":
+        sort_by = crud_documents.RELEVANCE_SORT
+
+    next_cursor = None
+    if pagination == "cursor":
+        try:
+            documents, next_cursor = await crud_documents.get_documents_page(
+                db,
+                owner_id=owner_id,
+                limit=limit,
+                cursor=cursor,
+                sort_by=sort_by,
+                sort_order=sort_order,
+                summary_only=summary_only,
+                **filters
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    else:
+        list_documents_func = crud_documents.get_document_summaries if summary_only else crud_documents.get_documents
+        documents = await list_documents_func(
+            db,
+            owner_id=owner_id,
+            skip=skip,
+            limit=limit,
+            sort_by=sort_by,
+            sort_order=sort_order,
+            **filters
+        )
+
+    total_mode = total_mode or ("cached" if pagination == "cursor" else "exact")
+    total_count = None
+    if total_mode == "exact":
+        total_count = await crud_documents.count_documents(db, owner_id=owner_id, **filters)
+    elif total_mode == "cached":
+        total_count = await crud_documents.count_documents_cached(db, owner_id=owner_id, **filters)
+
+    return {
+        "items": documents,
+        "total": total_count,
+        "total_is_cached": total_mode == "cached",
+        "next_cursor": next_cursor
+    }
 
 @router.get("/{document_id}", response_model=Document, summary="獲取特定文件的詳細信息")
 @log_api_operation(operation_name="獲取文檔詳情", log_success=True, success_level=LogLevel.DEBUG)
@@ -290,8 +437,9 @@ async def get_document_details(
     獲取特定文件的詳細信息。
     權限檢查由 get_owned_document 依賴處理。
     日志記錄由 log_api_operation 裝飾器自動處理。
+    提取文本與分析中間結果已外置時從 document_contents 讀回。
     """
-    return document
+    return await crud_document_contents.hydrate_document(db, document)
 
 @router.get("/{document_id}/file", summary="獲取/下載文件本身", response_class=FileResponse)
 async def get_document_file(
@@ -618,154 +766,98 @@ async def delete_document_route(
 
 @router.post("/batch-delete", response_model=BatchDeleteDocumentsResponse, summary="批量刪除文件")
 async def batch_delete_documents_route(
+    request: Request,
     request_data: BatchDeleteRequest,
     db: AsyncIOMotorDatabase = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
-    # vector_db_service_instance: VectorDatabaseService = Depends(get_vector_db_service) # 如果需要單獨調用
 ):
     """
     批量刪除指定ID列表的文件記錄、其實際文件以及相關的向量數據庫條目。
     只有文件擁有者才能刪除其文件。
-    """
-    processed_count = 0
-    success_count = 0
-    action_details: List[BatchDeleteResponseDetail] = []
 
-    # 獲取 request_id (如果有的話，用於日誌)
-    # request_id_for_log = getattr(request.state, 'request_id', None) if hasattr(request, 'state') else None
-    # ^^^ request is not directly available here, would need to pass Request object or handle differently if needed for logs
+    權限檢查為一次 $in 查詢，記錄與向量按批刪除，文件在後台線程池中刪除。
+    超過 DOCUMENT_BULK_DELETE_SYNC_LIMIT 個文件時轉為後台任務，立即返回 task_id，
+    通過 GET /batch-delete/{task_id} 查詢進度與結果。
+    """
+    request_id_for_log = getattr(request.state, 'request_id', None) or request.headers.get("X-Request-ID")
+    document_ids = request_data.document_ids
 
-    user_id_for_log_str = str(current_user.id)
+    if not document_ids:
+        return BatchDeleteDocumentsResponse(
+            success=True, message="No document IDs provided for batch deletion.",
+            processed_count=0, success_count=0, details=[]
+        )
 
-    doc_ids_to_delete_str = [str(doc_id) for doc_id in request_data.document_ids]
+    if len(document_ids) > settings.DOCUMENT_BULK_DELETE_SYNC_LIMIT:
+        task_id = await background_task_manager.create_task(
+            db=db,
+            task_type=TaskType.DOCUMENT_BULK_DELETE,
+            user_id=str(current_user.id),
+            total_items=len(document_ids)
+        )
 
+        async def progress_callback(progress: int, step: str, completed: int):
+            await background_task_manager.update_task_progress(
+                db=db, task_id=task_id, progress=progress, current_step=step, completed_items=completed
+            )
 
-    for doc_id_uuid in request_data.document_ids:
-        processed_count += 1
-        doc_id_str = str(doc_id_uuid)
-        existing_document: Optional[Document] = None # Define for this scope
-        
-        try:
-            document_to_check = await crud_documents.get_document_by_id(db, doc_id_uuid)
-            if not document_to_check:
-                action_details.append(BatchDeleteResponseDetail(id=doc_id_uuid, status="not_found", message="文件不存在"))
-                logger.warning(f"批量刪除：文件 ID {doc_id_str} 不存在 (請求者: {user_id_for_log_str})")
-                continue
-            if document_to_check.owner_id != current_user.id:
-                action_details.append(BatchDeleteResponseDetail(id=doc_id_uuid, status="forbidden", message="無權限刪除此文件"))
-                logger.warning(f"批量刪除授權失敗：用戶 {user_id_for_log_str} 嘗試刪除不屬於自己的文件 ID {doc_id_str}")
-                continue
-            existing_document = document_to_check # Assign if checks pass
-        except Exception as e_loop:
-            logger.error(f"Error processing document {doc_id_uuid} in batch delete during ownership check: {e_loop}", exc_info=True)
-            action_details.append(BatchDeleteResponseDetail(id=doc_id_uuid, status="error", message=f"檢查文件時發生錯誤: {str(e_loop)}"))
-            continue
-        
-        # If existing_document is still None here, it means one of the continue statements above was hit.
-        if not existing_document:
-            # This case should ideally not be reached if the logic above is correct,
-            # but as a safeguard:
-            logger.error(f"批量刪除：文件 ID {doc_id_str} 在檢查後未成功賦值，跳過。")
-            continue
-
-        file_path_to_delete = existing_document.file_path
-        delete_error = False
-
-        # 1. 從 MongoDB 刪除
-        # Use existing_document.id which is a UUID, same as doc_id_uuid here.
-        deleted_from_db = await crud_documents.delete_document_by_id(db, existing_document.id)
-        if not deleted_from_db:
-            action_details.append(BatchDeleteResponseDetail(id=doc_id_uuid, status="error", message="從數據庫刪除記錄失敗"))
-            logger.error(f"批量刪除：數據庫記錄刪除失敗: {doc_id_str} (請求者: {user_id_for_log_str})")
-            delete_error = True
-            # 即使DB刪除失敗，也可能嘗試刪除文件和向量，或在此中止此文件的處理
-            # 這裡選擇繼續嘗試刪除其他部分，但標記錯誤
-        
-        # 2. 從文件系統刪除
-        if file_path_to_delete and os.path.exists(file_path_to_delete):
+        async def run_bulk_delete_task():
             try:
-                os.remove(file_path_to_delete)
-                logger.info(f"批量刪除：文件實體成功刪除: {file_path_to_delete} (請求者: {user_id_for_log_str})")
-            except Exception as e:
-                logger.error(f"批量刪除：文件實體刪除失敗: {file_path_to_delete}. 錯誤: {str(e)}")
-                # 記錄錯誤，但不一定將其視為此文件刪除操作的完全失敗（如果DB記錄已刪）
-        elif file_path_to_delete:
-            logger.warning(f"批量刪除：文件實體在指定路徑未找到: {file_path_to_delete}")
-
-        # 3. 從向量數據庫刪除 (如果存在)
-        try:
-            # vector_db_service 是全局實例，直接使用
-            # 假設 delete_by_document_id 是同步的，如果它是異步的，需要 await
-            # 並且它應該能處理文檔ID不存在於向量庫中的情況（即靜默成功或返回特定狀態）
-            delete_vector_success = vector_db_service.delete_by_document_id(doc_id_str)
-            if delete_vector_success:
-                logger.info(f"批量刪除：成功從向量數據庫移除文檔 {doc_id_str} 的向量。")
-                # 在這裡添加日誌，記錄每個成功刪除的向量
-                await log_event(
-                    db=db, level=LogLevel.DEBUG, # DEBUG for sub-operation success
-                    message=f"Batch delete: Successfully removed vectors for document {doc_id_str}.",
-                    source="api.documents.batch_delete",
-                    user_id=user_id_for_log_str, 
-                    request_id=None,
-                    details={"document_id": doc_id_str}
+                await background_task_manager.update_task_status(db=db, task_id=task_id, status=TaskStatus.RUNNING)
+                result = await document_bulk_delete_service.delete_documents(
+                    db, current_user.id, document_ids,
+                    progress_callback=progress_callback, wait_for_files=True, request_id=request_id_for_log
                 )
-            else:
-                logger.info(f"Batch delete: Vectors for document {doc_id_str} not found or not deleted by vector_db_service.")
-                await log_event(
-                    db=db, level=LogLevel.WARNING,
-                    message=f"Batch delete: Vectors not found/deleted for document {doc_id_str}.",
-                    source="api.documents.batch_delete",
-                    user_id=user_id_for_log_str,
-                    request_id=None,
-                    details={"document_id": doc_id_str, "reason": "vector_db_service.delete_by_document_id returned false"}
+                await background_task_manager.set_task_result(db=db, task_id=task_id, result={
+                    "requested": result.requested,
+                    "deleted": result.deleted,
+                    "vector_failures": result.vector_failures,
+                    # 只返回未刪除的明細，避免任務記錄過大
+                    "rejected": [detail.model_dump(mode="json") for detail in result.details if detail.status != "deleted"]
+                })
+                await background_task_manager.update_task_status(db=db, task_id=task_id, status=TaskStatus.COMPLETED)
+            except Exception as e:
+                logger.error(f"批量刪除任務 {task_id} 失敗: {e}", exc_info=True)
+                await background_task_manager.update_task_status(
+                    db=db, task_id=task_id, status=TaskStatus.FAILED, error_message=str(e)
                 )
-        except Exception as e_vector:
-            logger.error(f"批量刪除：從向量數據庫移除文檔 {doc_id_str} 的向量時發生錯誤: {e_vector}")
-            await log_event(
-                db=db, level=LogLevel.ERROR, 
-                message=f"Batch delete: Error removing vectors for document {doc_id_str}.",
-                source="api.documents.batch_delete",
-                user_id=user_id_for_log_str, 
-                request_id=None, 
-                details={"document_id": doc_id_str, "error": str(e_vector), "error_type": type(e_vector).__name__}
-            )
 
-        if not delete_error:
-            success_count += 1
-            action_details.append(BatchDeleteResponseDetail(id=doc_id_uuid, status="deleted", message="Document deleted successfully."))
-        # Error details already added if delete_error is True
-
-    final_message = f"Batch delete operation completed. Requested: {len(request_data.document_ids)}, Processed: {processed_count}, Succeeded: {success_count}."
-    overall_success = success_count == len(request_data.document_ids) and processed_count == len(request_data.document_ids)
-
-
-    if processed_count == 0 and not request_data.document_ids: # No IDs provided
-        final_message = "No document IDs provided for batch deletion."
-        overall_success = True # Or False, depending on desired semantics for empty request
+        background_task_manager.start_background_task(task_id, run_bulk_delete_task())
+        return BatchDeleteDocumentsResponse(
+            success=True,
+            message=f"Batch delete of {len(document_ids)} documents started in background.",
+            processed_count=0,
+            success_count=0,
+            details=[],
+            task_id=task_id
+        )
 
-    # Log the overall batch operation result
-    await log_event(
-        db=db, level=LogLevel.INFO,
-        message=final_message,
-        source="api.documents.batch_delete",
-        user_id=user_id_for_log_str,
-        request_id=None, # No single request_id for batch
-        details={
-            "requested_count": len(request_data.document_ids),
-            "processed_count": processed_count,
-            "success_count": success_count,
-            "overall_success_status": overall_success
-        }
+    result = await document_bulk_delete_service.delete_documents(
+        db, current_user.id, document_ids, request_id=request_id_for_log
     )
-
+    success_count = sum(1 for detail in result.details if detail.status == "deleted")
     return BatchDeleteDocumentsResponse(
-        success=overall_success,
-        message=final_message,
-        processed_count=processed_count,
+        success=success_count == len(set(document_ids)),
+        message=f"Batch delete operation completed. Requested: {len(document_ids)}, Processed: {len(result.details)}, Succeeded: {success_count}.",
+        processed_count=len(result.details),
         success_count=success_count,
-        details=action_details
+        details=result.details
     )
 
+@router.get("/batch-delete/{task_id}", summary="查詢批量刪除任務進度")
+async def get_batch_delete_task_status(
+    task_id: str,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """查詢後台批量刪除任務的狀態、進度與結果（只能查詢自己的任務）"""
+    task = await background_task_manager.get_task_status(db, task_id)
+    if not task or task.task_type != TaskType.DOCUMENT_BULK_DELETE:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="任務不存在")
+    if task.user_id != str(current_user.id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="無權訪問此任務")
+    return TaskStatusResponse(**task.model_dump())
+
 # 可以根據需要添加更專門的觸發端點，或者將邏輯保留在 PATCH 中
 # @router.post("/{document_id}/trigger-extraction", response_model=Document, summary="觸發文本提取")
 # async def trigger_text_extraction_endpoint(...):
@@ -911,9 +1003,41 @@ async def process_batch_documents_endpoint(
             # 同上，決定如何處理錯誤
     return results
 
+def _make_batch_analysis_processor(
+    db: AsyncIOMotorDatabase,
+    current_user: User,
+    doc_processor: DocumentProcessingService,
+    settings_obj: Settings,
+    document_tasks_service: DocumentTasksService,
+    request_id: Optional[str],
+    failure_prefix: str,
+    success_statuses: Optional[List[DocumentStatus]] = None,
+    **analysis_options: Any
+):
+    """構造調度器處理單份文檔的回調：觸發分析，異常時標記為分析失敗"""
+    async def process(doc_id: uuid.UUID) -> bool:
+        try:
+            result_doc = await document_tasks_service.trigger_document_analysis(
+                db=db,
+                doc_processor=doc_processor,
+                document_id=doc_id,
+                current_user_id=current_user.id,
+                settings_obj=settings_obj,
+                request_id=request_id,
+                **analysis_options
+            )
+        except Exception as e:
+            logger.error(f"{failure_prefix}文檔 {doc_id} 時發生錯誤: {e}", exc_info=True)
+            try:
+                await crud_documents.update_document_status(db, doc_id, DocumentStatus.ANALYSIS_FAILED, f"{failure_prefix}失敗: {str(e)[:50]}")
+            except Exception as status_err:
+                logger.error(f"更新文檔 {doc_id} 狀態為失敗時再次發生錯誤: {status_err}")
+            return False
+        return success_statuses is None or result_doc.status in success_statuses
+    return process
+
 @router.post("/documents/process-unprocessed", summary="處理所有未處理的文檔")
 async def process_unprocessed_documents_endpoint(
-    background_tasks: BackgroundTasks, 
     request: Request, 
     # Depends() 參數
     db: AsyncIOMotorDatabase = Depends(get_db),
@@ -926,73 +1050,47 @@ async def process_unprocessed_documents_endpoint(
     ai_ensure_chinese_output: Optional[bool] = Form(None),
     ai_max_output_tokens: Optional[int] = Form(None)
 ):
-    # 1. 查找所有狀態為 PENDING 或 EXTRACTION_FAILED 或 ANALYSIS_FAILED 的文檔
-    #    或者，根據您的定義，"未處理"可能意味著其他狀態
+    """
+    把未處理的文檔加入批量處理調度器，立即返回任務 ID
+
+    只讀取文檔 ID；處理按全局與單用戶並發上限、在用戶之間輪流進行，
+    通過 GET /documents/processing-jobs/{task_id} 查詢進度與結果。
+    """
     unprocessed_statuses = [
         DocumentStatus.PENDING, 
         DocumentStatus.UPLOADED, # 假設剛上傳也是未處理
         DocumentStatus.EXTRACTION_FAILED, 
         DocumentStatus.ANALYSIS_FAILED
     ]
-    
-    # 獲取符合條件的文檔 ID 列表
-    # crud_documents 中可能需要一個新方法 get_documents_by_statuses
-    # 這裡假設我們有一個方法可以獲取這些文檔的 ID
-    # documents_to_process = await crud_documents.get_documents_by_statuses(db, current_user.id, unprocessed_statuses)
-    # 簡化：假設我們直接獲取ID列表
-    
-    # 為了演示，我們將使用更簡單的方法：獲取所有 PENDING 的文檔
-    # 在實際應用中，您需要一個更健壯的方法來獲取未處理的文檔ID
-    documents_to_process_full = await crud_documents.get_documents(
-        db, owner_id=current_user.id, status_in=unprocessed_statuses, limit=1000 # 限制以防過多
+    document_ids_to_process = await crud_documents.get_document_ids(
+        db, owner_id=current_user.id, status_in=unprocessed_statuses, limit=settings.DOCUMENT_PROCESSING_MAX_ADMITTED
     )
-    
-    document_ids_to_process = [doc.id for doc in documents_to_process_full if doc.id is not None]
 
     if not document_ids_to_process:
-        return {"message": "沒有找到需要處理的文檔。", "processed_count": 0}
+        return {"message": "沒有找到需要處理的文檔。", "queued_count": 0, "task_id": None}
 
-    logger.info(f"找到 {len(document_ids_to_process)} 個未處理的文檔，將開始處理...")
-    
-    results: List[Document] = []
-    processed_count = 0
-    failed_count = 0
     request_id_for_log = request.headers.get("X-Request-ID") # Simplified
-
-    for doc_id in document_ids_to_process:
-        try:
-            result_doc = await document_tasks_service.trigger_document_analysis(
-                db=db,
-                doc_processor=doc_processor,
-                document_id=doc_id,
-                current_user_id=current_user.id,
-                settings_obj=settings_obj,
-                request_id=request_id_for_log,
-                ai_model_preference=ai_model_preference,
-                ai_ensure_chinese_output=ai_ensure_chinese_output,
-                ai_max_output_tokens=ai_max_output_tokens
-                # processing_strategy, custom_prompt_id, analysis_type, task_type 留空或設預設
-            )
-            results.append(result_doc)
-            processed_count +=1
-        except Exception as e:
-            logger.error(f"處理未處理文檔 {doc_id} 時發生錯誤: {e}", exc_info=True)
-            failed_count += 1
-            # 可以選擇更新文檔狀態為某種錯誤狀態
-            try:
-                await crud_documents.update_document_status(db, doc_id, DocumentStatus.ANALYSIS_FAILED, f"自動批量處理失敗: {str(e)[:50]}")
-            except Exception as status_err:
-                 logger.error(f"更新文檔 {doc_id} 狀態為失敗時再次發生錯誤: {status_err}")
-
+    job = await document_processing_scheduler.submit(
+        db, current_user.id, document_ids_to_process,
+        _make_batch_analysis_processor(
+            db, current_user, doc_processor, settings_obj, document_tasks_service, request_id_for_log,
+            failure_prefix="自動批量處理",
+            ai_model_preference=ai_model_preference,
+            ai_ensure_chinese_output=ai_ensure_chinese_output,
+            ai_max_output_tokens=ai_max_output_tokens
+        )
+    )
+    logger.info(f"找到 {len(document_ids_to_process)} 個未處理的文檔，已加入處理隊列（任務 {job.task_id}）")
 
     return {
-        "message": f"處理了 {processed_count} 個文檔，{failed_count} 個失敗。",
-        "processed_documents": results # 返回處理過的文檔列表 (如果需要)
+        "message": f"已將 {job.total} 個文檔加入處理隊列，{job.skipped} 個已在處理中。",
+        "task_id": job.task_id,
+        "queued_count": job.total,
+        "skipped_count": job.skipped
     }
 
 @router.post("/documents/retry-failed-analysis", summary="重試所有分析失敗的文檔")
 async def retry_failed_documents_endpoint(
-    background_tasks: BackgroundTasks, 
     request: Request, 
     # Depends() 參數
     db: AsyncIOMotorDatabase = Depends(get_db),
@@ -1005,53 +1103,48 @@ async def retry_failed_documents_endpoint(
     ai_ensure_chinese_output: Optional[bool] = Form(None),
     ai_max_output_tokens: Optional[int] = Form(None)
 ):
+    """把分析或提取失敗的文檔加入批量處理調度器重試，立即返回任務 ID"""
     failed_statuses = [DocumentStatus.ANALYSIS_FAILED, DocumentStatus.EXTRACTION_FAILED] # 也重試提取失敗的
-    
-    # 獲取符合條件的文檔 ID 列表
-    documents_to_retry_full = await crud_documents.get_documents(
-        db, owner_id=current_user.id, status_in=failed_statuses, limit=1000 # 限制以防過多
+    document_ids_to_retry = await crud_documents.get_document_ids(
+        db, owner_id=current_user.id, status_in=failed_statuses, limit=settings.DOCUMENT_PROCESSING_MAX_ADMITTED
     )
-    document_ids_to_retry = [doc.id for doc in documents_to_retry_full if doc.id is not None]
 
     if not document_ids_to_retry:
-        return {"message": "沒有找到分析失敗需要重試的文檔。", "retried_count": 0}
+        return {"message": "沒有找到分析失敗需要重試的文檔。", "queued_count": 0, "task_id": None}
 
-    logger.info(f"找到 {len(document_ids_to_retry)} 個分析失敗的文檔，將開始重試...")
-    
-    results: List[Document] = []
-    retried_count = 0
-    newly_failed_count = 0
     request_id_for_log = request.headers.get("X-Request-ID") # Simplified
-
-    for doc_id in document_ids_to_retry:
-        try:
-            # 重試時，可能需要特定的 strategy 或 analysis_type，這裡簡化
-            result_doc = await document_tasks_service.trigger_document_analysis(
-                db=db,
-                doc_processor=doc_processor,
-                document_id=doc_id,
-                current_user_id=current_user.id,
-                settings_obj=settings_obj,
-                request_id=request_id_for_log,
-                ai_model_preference=ai_model_preference,
-                ai_ensure_chinese_output=ai_ensure_chinese_output,
-                ai_max_output_tokens=ai_max_output_tokens,
-                processing_strategy="full_reanalysis" # 例如，指定一個重試策略
-            )
-            results.append(result_doc)
-            if result_doc.status == DocumentStatus.ANALYSIS_COMPLETED or result_doc.status == DocumentStatus.TEXT_EXTRACTED:
-                retried_count += 1
-            else: # 如果重試後狀態仍然是失敗或錯誤
-                newly_failed_count +=1
-        except Exception as e:
-            logger.error(f"重試分析失敗的文檔 {doc_id} 時發生錯誤: {e}", exc_info=True)
-            newly_failed_count += 1
-            try:
-                await crud_documents.update_document_status(db, doc_id, DocumentStatus.ANALYSIS_FAILED, f"重試分析失敗: {str(e)[:50]}")
-            except Exception as status_err:
-                 logger.error(f"更新文檔 {doc_id} 狀態為重試失敗時再次發生錯誤: {status_err}")
+    job = await document_processing_scheduler.submit(
+        db, current_user.id, document_ids_to_retry,
+        _make_batch_analysis_processor(
+            db, current_user, doc_processor, settings_obj, document_tasks_service, request_id_for_log,
+            failure_prefix="重試分析",
+            # 重試後狀態仍然是失敗或錯誤時計為失敗
+            success_statuses=[DocumentStatus.ANALYSIS_COMPLETED, DocumentStatus.TEXT_EXTRACTED],
+            ai_model_preference=ai_model_preference,
+            ai_ensure_chinese_output=ai_ensure_chinese_output,
+            ai_max_output_tokens=ai_max_output_tokens,
+            processing_strategy="full_reanalysis" # 例如，指定一個重試策略
+        )
+    )
+    logger.info(f"找到 {len(document_ids_to_retry)} 個分析失敗的文檔，已加入重試隊列（任務 {job.task_id}）")
 
     return {
-        "message": f"嘗試重試 {len(document_ids_to_retry)} 個文檔。成功重試 {retried_count} 個，仍然失敗 {newly_failed_count} 個。",
-        "retried_documents": results # 返回處理過的文檔列表 (如果需要)
-    }
\ No newline at end of file
+        "message": f"已將 {job.total} 個文檔加入重試隊列，{job.skipped} 個已在處理中。",
+        "task_id": job.task_id,
+        "queued_count": job.total,
+        "skipped_count": job.skipped
+    }
+
+@router.get("/documents/processing-jobs/{task_id}", summary="查詢批量處理任務進度")
+async def get_processing_job_status(
+    task_id: str,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """查詢處理未處理 / 重試失敗任務的狀態、進度與結果（只能查詢自己的任務）"""
+    task = await background_task_manager.get_task_status(db, task_id)
+    if not task or task.task_type != TaskType.DOCUMENT_BATCH_PROCESSING:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="任務不存在")
+    if task.user_id != str(current_user.id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="無權訪問此任務")
+    return TaskStatusResponse(**task.model_dump())
\ No newline at end of file
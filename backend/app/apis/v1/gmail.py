@@ -11,7 +11,7 @@ import asyncio
 
 from app.db.mongodb_utils import get_db
 from app.core.security import get_current_active_user
-from app.models.user_models import User
+from app.models.user_models import DocumentDedupMode, User
 from app.models.email_models import (
     GmailMessagePreview,
     EmailImportResponse,
@@ -21,7 +21,9 @@ from app.models.email_models import (
 )
 from app.models.document_models import DocumentStatus
 from app.services.external.gmail_service import GmailService
-from app.services.document.email_document_processor import EmailDocumentProcessor
+from app.services.document.email_document_processor import EmailDocumentProcessor, email_content_sha256
+from app.services.document.document_dedup_service import document_dedup_service
+from app.services.document.document_tasks_service import DocumentTasksService
 from app.crud.crud_users import crud_users
 from app.crud import crud_documents
 from app.core.logging_utils import AppLogger, log_event, LogLevel
@@ -640,6 +642,10 @@ async def import_single_email(
     3. 保存郵件文本到本地存儲
     4. 創建 Document 記錄
     5. (可選) 觸發 AI 分析
+
+    正文（轉發郵件取原郵件正文）與已有文檔相同時按用戶的去重模式處理：
+    link 返回 status="duplicate" 與已有文檔 ID，不創建記錄；
+    clone 複製已有文檔的分析結果與向量，返回 status="cloned"，不再觸發分析。
     """
     try:
         request_id = request.headers.get("X-Request-ID")
@@ -681,6 +687,20 @@ async def import_single_email(
         
         # 2. 從 Gmail 獲取郵件內容
         email = await gmail_service.get_message_full(credentials, email_id)
+
+        # 同一用戶已有相同內容的文檔時，link 模式不創建記錄，clone 模式在創建後複製處理結果
+        dedup_mode = document_dedup_service.resolve_mode(user_doc)
+        duplicate = None
+        if dedup_mode != DocumentDedupMode.OFF:
+            duplicate = await document_dedup_service.find_duplicate(db, current_user.id, email_content_sha256(email))
+        if duplicate is not None and dedup_mode == DocumentDedupMode.LINK:
+            await document_dedup_service.link_duplicate(db, duplicate, tags=tags, user_id=str(current_user.id))
+            return EmailImportResponse(
+                email_id=email_id,
+                document_id=duplicate["_id"],
+                status="duplicate",
+                message="郵件內容與已有文檔相同，已關聯到該文檔"
+            )
         
         # 3. 處理郵件並創建 Document
         doc_create, content_path = await email_processor.create_document_from_email(
@@ -713,6 +733,24 @@ async def import_single_email(
         }
         
         await crud_documents.update_document(db, document.id, update_data)
+
+        cloned = False
+        if duplicate is not None:
+            document = await document_dedup_service.clone_document(
+                db, source=duplicate, target=document, user_id=str(current_user.id)
+            )
+            cloned = document.status in (DocumentStatus.ANALYSIS_COMPLETED, DocumentStatus.COMPLETED)
+        
+        # 6. (可選) 觸發 AI 分析（已複製分析結果的文檔不需要）
+        if trigger_analysis and not cloned:
+            background_tasks.add_task(
+                DocumentTasksService().process_document_content_analysis,
+                doc_id_str=str(document.id),
+                db=db,
+                user_id_for_log=str(current_user.id),
+                request_id_for_log=request_id,
+                settings_obj=settings
+            )
         
         await log_event(
             db=db,
@@ -727,8 +765,8 @@ async def import_single_email(
         return EmailImportResponse(
             email_id=email_id,
             document_id=document.id,
-            status="success",
-            message="郵件導入成功"
+            status="cloned" if cloned else "success",
+            message="郵件內容與已有文檔相同，已複製分析結果" if cloned else "郵件導入成功"
         )
         
     except HTTPException:
@@ -780,7 +818,7 @@ async def batch_import_emails(
                     request=request,
                     email_id=email_id,
                     tags=import_request.tags,
-                    trigger_analysis=import_request.trigger_analysis,
+                    trigger_analysis=False,  # 導入完成後統一並發分析
                     background_tasks=background_tasks,
                     current_user=current_user,
                     db=db
@@ -809,8 +847,21 @@ async def batch_import_emails(
         )
         
         details: List[EmailImportResponse] = results
-        successful = sum(1 for r in details if r.status == "success")
-        skipped = sum(1 for r in details if r.status == "already_imported")
+        
+        # 一次性並發分析所有新導入的郵件，短郵件會合併為批量分析請求
+        imported_document_ids = [str(r.document_id) for r in details if r.status == "success" and r.document_id]
+        if import_request.trigger_analysis and imported_document_ids:
+            background_tasks.add_task(
+                DocumentTasksService().process_documents_content_analysis,
+                doc_id_strs=imported_document_ids,
+                db=db,
+                user_id_for_log=str(current_user.id),
+                request_id_for_log=request_id,
+                settings_obj=settings
+            )
+        
+        successful = sum(1 for r in details if r.status in ("success", "cloned"))
+        skipped = sum(1 for r in details if r.status in ("already_imported", "duplicate"))
         failed = sum(1 for r in details if r.status in ("error",))
         
         await log_event(
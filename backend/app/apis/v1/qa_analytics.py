@@ -10,7 +10,7 @@ from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from app.dependencies import get_db
 from app.models.user_models import User
-from app.core.security import get_current_active_user
+from app.core.security import get_current_active_user, get_current_admin_user
 from app.core.logging_utils import AppLogger
 from app.services.qa_workflow.qa_analytics_service import qa_analytics_service
 
@@ -57,6 +57,28 @@ async def get_qa_statistics(
         )
 
 
+@router.get("/speculation")
+async def get_speculation_statistics(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    獲取推測式檢索統計（命中率：推測結果被直接使用並跳過查詢重寫的比例）（僅管理員）
+    """
+    from app.services.qa_workflow.speculative_retrieval_service import speculative_retrieval_service
+    return speculative_retrieval_service.get_statistics()
+
+
+@router.get("/local-classifier")
+async def get_local_classifier_statistics(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    獲取本地快速意圖分類統計（LLM 跳過率、本地預測與 LLM 分類的一致率）（僅管理員）
+    """
+    from app.services.qa_workflow.local_intent_classifier import local_intent_classifier
+    return local_intent_classifier.get_statistics()
+
+
 @router.get("/trends")
 async def get_performance_trends(
     days: int = Query(7, ge=1, le=90, description="天數"),
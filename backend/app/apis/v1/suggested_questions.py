@@ -100,12 +100,12 @@ async def generate_suggested_questions(
         from uuid import UUID
         owner_uuid = UUID(user_id)
         from app.crud import crud_documents
-        documents = await crud_documents.get_documents(db, owner_id=owner_uuid, limit=10000)
+        document_count = await crud_documents.count_documents(db, owner_id=owner_uuid)
         
-        if len(documents) < 20:
+        if document_count < 20:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"文檔數量不足（目前 {len(documents)} 個，需要至少 20 個），請先上傳更多文檔"
+                detail=f"文檔數量不足（目前 {document_count} 個，需要至少 20 個），請先上傳更多文檔"
             )
         
         # 檢查聚類
@@ -397,7 +397,7 @@ async def debug_check_clusters(
         clusters_str = await cursor_str.to_list(length=100)
         
         # 檢查文檔
-        documents = await crud_documents.get_documents(db, owner_id=owner_uuid, limit=10000)
+        document_count = await crud_documents.count_documents(db, owner_id=owner_uuid)
         
         # 檢查聚類任務狀態
         clustering_jobs = db["clustering_jobs"]
@@ -410,7 +410,7 @@ async def debug_check_clusters(
             "user_id": user_id,
             "clusters_found_by_uuid": len(clusters_uuid),
             "clusters_found_by_string": len(clusters_str),
-            "total_documents": len(documents),
+            "total_documents": document_count,
             "clusters_detail": [
                 {
                     "cluster_id": str(c.get("_id", c.get("cluster_id", ""))),
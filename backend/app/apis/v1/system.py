@@ -5,7 +5,7 @@ from typing import List
 
 from ...dependencies import get_db
 from ...models.user_models import User # Import User
-from ...core.security import get_current_active_user # Import auth dependency
+from ...core.security import get_current_active_user, get_current_admin_user # Import auth dependency
 from ...models.system_models import (
     SettingsDataResponse,
     UpdatableSettingsData,
@@ -197,4 +197,17 @@ async def get_tunnel_status_route(
         user_id=str(current_user.id),
         request_id=request_id_val
     )
-    return await crud_settings.get_tunnel_status(db) 
\ No newline at end of file
+    return await crud_settings.get_tunnel_status(db) 
+
+
+@router.get("/index-advice", summary="檢查查詢形態的索引使用情況（僅管理員）")
+async def get_index_advice_route(
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    對已登記的查詢形態（以當前管理員的 owner_id 構建）執行 explain()，
+    標記全集合掃描（COLLSCAN）與內存排序（IN_MEMORY_SORT）。
+    """
+    from ...db.index_advisor import index_advisor
+    return await index_advisor.run(db, owner_id=current_user.id)
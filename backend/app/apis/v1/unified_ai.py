@@ -1,11 +1,11 @@
 import logging
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
 from typing import Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from app.dependencies import get_db
 from app.models.user_models import User
-from app.core.security import get_current_active_user
+from app.core.security import get_current_active_user, get_current_admin_user
 from app.core.logging_utils import AppLogger
 # 切換到簡化版本的模型和服務
 from app.models.ai_models_simplified import AIPromptRequest, TokenUsage
@@ -509,6 +509,144 @@ async def ai_system_status(
             "error_message": f"System status check failed: {str(e)}"
         }
 
+@router.get("/rate-limits")
+async def get_rate_limit_statistics(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    獲取 AI 調用限流統計（各模型的 RPM/TPM 使用量、429 退避狀態、各優先級通道的排隊等待時間）（僅管理員）
+    """
+    from app.services.ai.ai_rate_limiter import ai_rate_limiter
+    return ai_rate_limiter.get_statistics()
+
+@router.get("/hedging")
+async def get_hedging_statistics(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    獲取 AI 請求對沖與故障轉移統計（各任務的對沖率、對沖勝出率、故障轉移次數與當前截止時間）（僅管理員）
+    """
+    from app.services.ai.request_hedger import request_hedger
+    return request_hedger.get_statistics()
+
+@router.get("/provider")
+async def get_ai_provider_status(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    獲取當前 AI 提供商後端（google / fake）；模擬後端附帶調用、注入錯誤與平均延遲統計（僅管理員）
+    """
+    from app.services.ai.llm_providers import get_llm_provider
+    provider = get_llm_provider()
+    status = {"backend": provider.name}
+    if hasattr(provider, "get_statistics"):
+        status["statistics"] = provider.get_statistics()
+    return status
+
+@router.get("/text-analysis-batching")
+async def get_text_analysis_batching_statistics(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    獲取批量文本分析統計（每次調用平均處理的文檔數、批次大小分佈、回退次數）（僅管理員）
+    """
+    from app.services.document.text_analysis_batcher import text_analysis_batcher
+    return text_analysis_batcher.get_statistics()
+
+@router.get("/document-dedup")
+async def get_document_dedup_statistics(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    獲取上傳 / 導入內容去重統計（命中次數、link / clone 次數與節省的分析、豐富化與 Embedding 調用）（僅管理員）
+    """
+    from app.services.document.document_dedup_service import document_dedup_service
+    return document_dedup_service.get_statistics()
+
+@router.get("/document-processing-scheduler")
+async def get_document_processing_scheduler_statistics(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    獲取批量文檔處理調度統計（並發佔用、隊列深度、排隊等待時間與成功 / 失敗數）（僅管理員）
+    """
+    from app.services.document.document_processing_scheduler import document_processing_scheduler
+    return document_processing_scheduler.get_statistics()
+
+@router.get("/detail-query-batching")
+async def get_detail_query_batching_statistics(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    獲取詳細查詢生成統計（批量與逐文檔兩種路徑的每文檔 token、調用延遲與回退次數，以及查詢計劃緩存命中率）（僅管理員）
+    """
+    from app.services.qa_core.qa_document_processor import qa_document_processor
+    return qa_document_processor.get_detail_query_statistics()
+
+@router.get("/token-estimator")
+async def get_token_estimator_statistics(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    獲取本地 token 估算器狀態（估算後端、各模型校準係數與最近一次估算誤差）（僅管理員）
+    """
+    from app.services.ai.token_estimator import token_estimator
+    return token_estimator.get_statistics()
+
+@router.get("/context-cache")
+async def get_context_cache_statistics(
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    獲取 Gemini Context Cache 統計（緩存後端、活躍緩存數與實測節省的輸入 token）（僅管理員）
+    """
+    return await unified_ai_service_simplified.get_context_cache_statistics(db)
+
+@router.get("/ledger")
+async def get_llm_ledger_status(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    獲取 LLM 調用帳本的寫入狀態（緩衝區記錄數、已寫入數、丟棄數與寫入失敗次數）（僅管理員）
+    """
+    from app.services.ai.llm_call_ledger import llm_call_ledger
+    return llm_call_ledger.get_statistics()
+
+@router.get("/ledger/rollup")
+async def get_llm_ledger_rollup(
+    group_by: str = Query("task_type,model_id", description="分組欄位（逗號分隔）: task_type, model_id, user_id, priority, cache_outcome, streaming"),
+    time_range: str = Query("24h", description="時間範圍: 1h, 24h, 7d, 30d, all"),
+    bucket: Optional[str] = Query(None, description="時間桶: hour, day"),
+    task_type: Optional[str] = Query(None, description="任務類型過濾"),
+    model_id: Optional[str] = Query(None, description="模型過濾"),
+    user_id: Optional[str] = Query(None, description="用戶過濾（僅管理員可查詢其他用戶）"),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    按任務、模型、用戶與時間桶聚合 LLM 調用帳本：token 用量、排隊/網絡/總延遲（含 p50/p95）、
+    重試次數、錯誤率與緩存命中率。非管理員只能查詢自己的記錄。
+    """
+    from app.services.ai.llm_call_ledger import llm_call_ledger
+    if not current_user.is_admin:
+        user_id = str(current_user.id)
+    
+    # 先寫出緩衝區，讓聚合包含最近的調用
+    await llm_call_ledger.flush()
+    try:
+        return await llm_call_ledger.get_rollup(
+            db,
+            group_by=[name.strip() for name in group_by.split(",") if name.strip()],
+            time_range=time_range,
+            bucket=bucket,
+            user_id=user_id,
+            task_type=task_type,
+            model_id=model_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # === 新增: 問題分類端點 ===
 @router.post("/qa/classify")
 async def classify_question_only(
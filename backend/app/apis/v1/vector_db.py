@@ -390,7 +390,7 @@ async def semantic_search(
             
         else:
             # 使用傳統單階段搜索(向後兼容)
-            query_vector = embedding_service.encode_text(request.query) 
+            query_vector = await embedding_service.encode_text_async(request.query) 
             
             vector_db_service_instance = get_vector_db_service()
             results = vector_db_service_instance.search_similar_vectors(
@@ -14,15 +14,142 @@ class Settings(BaseSettings):
     AI_MAX_OUTPUT_TOKENS_IMAGE: int = 4096
     AI_MAX_INPUT_CHARS_TEXT_ANALYSIS: int = 100000 # 新增：文本分析最大輸入字符數 (例如約 250k tokens for Gemini 1.5 Pro)
 
+    # 文本分析批處理（多份短文檔合併為一次結構化輸出請求）
+    TEXT_ANALYSIS_BATCHING_ENABLED: bool = True  # 是否啟用批量文本分析
+    TEXT_ANALYSIS_BATCH_WINDOW_SECONDS: float = 0.5  # 收集同時到達文檔的時間窗口（秒）
+    TEXT_ANALYSIS_BATCH_MAX_DOCUMENTS: int = 8  # 每批最多文檔數
+    TEXT_ANALYSIS_BATCH_TOKEN_BUDGET: int = 12000  # 每批輸入的估算 token 上限
+    TEXT_ANALYSIS_BATCH_MAX_DOC_TOKENS: int = 2000  # 超過此估算 token 數的文檔單獨分析
+    TEXT_ANALYSIS_BATCH_OUTPUT_TOKENS_PER_DOC: int = 2048  # 每份文檔預留的輸出 token 數
+
+    # 本地 token 估算與提示詞預算分配（不再調用遠端 count_tokens）
+    AI_TOKENIZER_PATH: Optional[str] = None  # 離線分詞器文件路徑（HuggingFace tokenizer.json），未設定時使用校準後的啟發式估算
+    AI_TOKEN_ESTIMATE_CJK_TOKENS_PER_CHAR: float = 1.0  # 啟發式估算：每個中日韓字符的 token 數
+    AI_TOKEN_ESTIMATE_CHARS_PER_TOKEN: float = 4.0  # 啟發式估算：其他字符每多少個算 1 token
+    AI_TOKEN_CALIBRATION_ALPHA: float = 0.1  # 以 API 回報的實際 token 數校準各模型估算係數的平滑係數
+    AI_PROMPT_BUDGET_ENABLED: bool = True  # 是否按 token 預算分配提示詞各部分
+    AI_PROMPT_TOKEN_BUDGETS: dict = {  # 各提示詞類型的輸入 token 預算，未列出的類型使用 default
+        "default": 32000,
+        "text_analysis": 110000,
+    }
+
     # MongoDB 相關設定
     MONGODB_URL: str
     DB_NAME: str # 原為 MONGODB_DATABASE，更名以保持一致性
+    DB_INDEX_ADVISOR_ON_STARTUP: bool = False  # 啟動時對已登記的查詢形態執行 explain()，記錄 COLLSCAN 與內存排序
+
+    # 文檔列表分頁（游標模式不使用 skip；總數可使用短期緩存代替每頁精確計數）
+    DOCUMENT_COUNT_CACHE_TTL_SECONDS: int = 30  # 列表總數緩存時間（秒）
+    DOCUMENT_COUNT_CACHE_MAX_ENTRIES: int = 2048  # 緩存的 (用戶, 過濾條件) 組合上限
+
+    # 文檔列表搜索（文件名、標籤與摘要的 n-gram 多鍵索引，支持中文；已有文檔用 app.db.rebuild_document_search_terms 補建）
+    DOCUMENT_SEARCH_FILENAME_PREFILTER: bool = False  # filename_contains 先用 n-gram 索引縮小範圍再以正則複核（補建完成後開啟）
+    DOCUMENT_SEARCH_SUMMARY_MAX_CHARS: int = 500  # 參與 n-gram 的摘要最大字符數
+    DOCUMENT_SEARCH_FILENAME_MATCH_BOOST: float = 2.0  # 文件名包含整個查詢詞時的相關度加分
+
+    # 文檔內容外置（extracted_text 與大型分析中間結果存到 document_contents，documents 只保留可查詢欄位）
+    DOCUMENT_CONTENT_STORE_ENABLED: bool = False  # 新寫入的文檔內容是否外置；已有文檔用 app.db.migrate_document_contents 遷移
+    DOCUMENT_CONTENT_COMPRESSION: str = "none"  # 外置內容的壓縮方式: none | zstd（需要安裝 zstandard）
+    DOCUMENT_CONTENT_COMPRESSION_LEVEL: int = 3  # zstd 壓縮級別
     
     # Redis 相關設定（用於對話緩存）
     REDIS_URL: str = "redis://localhost:6379"
     REDIS_CONVERSATION_TTL: int = 3600  # 對話緩存 TTL（秒），預設 1 小時
     REDIS_ENABLED: bool = True  # 是否啟用 Redis 緩存
 
+    # LLM 回應精確匹配緩存（僅對確定性任務生效，預設關閉）
+    AI_RESPONSE_CACHE_ENABLED: bool = False  # 是否啟用 LLM 回應緩存
+    AI_RESPONSE_CACHE_MAX_ENTRIES: int = 1000  # 進程內 LRU 緩存的最大條目數
+    AI_RESPONSE_CACHE_TASK_TTLS: dict = {  # 各任務類型的緩存 TTL（秒），未列出的任務不緩存
+        "query_rewrite": 3600,
+        "question_intent_classification": 900,
+        "cluster_label_generation": 86400,
+        "batch_cluster_labels": 86400,
+    }
+
+    # Single-flight 請求合併（相同的進行中 AI 調用 / 查詢向量 / 文檔批量查詢只執行一次）
+    SINGLE_FLIGHT_ENABLED: bool = True  # 是否啟用請求合併
+    SINGLE_FLIGHT_MAX_WAITERS: int = 50  # 每個進行中調用的最大等待者數量
+    SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS: float = 60.0  # 等待者的最長等待時間（秒）
+
+    # AI 調用限流（按模型的 RPM / TPM / 並發數，0 表示不限制；未列出的模型使用 default）
+    AI_RATE_LIMIT_ENABLED: bool = True  # 是否啟用全局 AI 調用限流
+    AI_RATE_LIMITS: dict = {
+        "default": {"rpm": 60, "tpm": 1000000, "max_concurrency": 8},
+        "gemini-2.5-pro": {"rpm": 10, "tpm": 250000, "max_concurrency": 2},
+    }
+    AI_RATE_LIMIT_INTERACTIVE_RESERVED_SLOTS: int = 1  # 為互動請求保留的並發位數
+    AI_RATE_LIMIT_MAX_BACKOFF_SECONDS: float = 60.0  # 收到 429 後的最大退避時間（秒）
+    AI_RATE_LIMIT_MAX_429_RETRIES: int = 3  # 收到 429 後經限流器重試的最大次數
+
+    # AI 請求對沖與故障轉移（互動請求超過 p95 截止時間時對沖，失敗時立即轉移到後備模型）
+    AI_HEDGING_ENABLED: bool = True  # 是否啟用對沖與故障轉移
+    AI_HEDGE_TASK_SLO_SECONDS: dict = {  # 各任務的延遲 SLO（秒），樣本不足時作為截止時間，也是截止時間上限
+        "default": 15.0,
+        "question_intent_classification": 4.0,
+        "query_rewrite": 5.0,
+        "mongodb_detail_query_generation": 6.0,
+        "batch_mongodb_detail_query_generation": 10.0,
+        "document_selection_for_query": 6.0,
+        "answer_generation": 20.0,
+    }
+    AI_HEDGE_LATENCY_PERCENTILE: float = 95.0  # 以此百分位延遲作為截止時間
+    AI_HEDGE_DEADLINE_MULTIPLIER: float = 1.0  # 截止時間 = 百分位延遲 × 此倍數
+    AI_HEDGE_MIN_DEADLINE_SECONDS: float = 1.0  # 截止時間下限（秒）
+    AI_HEDGE_MIN_SAMPLES: int = 20  # 計算百分位延遲所需的最少樣本數
+    AI_HEDGE_LATENCY_WINDOW: int = 200  # 每個任務/模型保留的最近延遲樣本數
+    AI_HEDGE_MAX_ATTEMPTS: int = 3  # 單個請求最多發出的調用數（含對沖與故障轉移）
+    AI_HEDGE_SAME_MODEL_WHEN_NO_FALLBACK: bool = True  # 沒有後備模型時是否對沖到同一模型
+
+    # Gemini Context Caching（系統指令超過最低 token 數時創建遠端緩存，後續請求以緩存 ID 調用）
+    AI_CONTEXT_CACHE_ENABLED: bool = True  # 是否啟用 Context Caching
+    AI_CONTEXT_CACHE_BACKEND: str = "google"  # "google" 調用 CachedContent API；"memory" 為進程內模擬（測試或搭配 fake 提供商）
+    AI_CONTEXT_CACHE_MIN_TOKENS: dict = {  # 各模型（按名稱前綴匹配）可創建緩存的最低 token 數
+        "default": 1024,
+        "gemini-2.5-pro": 4096,
+    }
+    AI_CONTEXT_CACHE_TTL_SECONDS: int = 3600  # 緩存 TTL（秒），續期時重設為此值
+    AI_CONTEXT_CACHE_REFRESH_BEFORE_SECONDS: int = 300  # 剩餘 TTL 少於此值時，使用前先續期
+    AI_CONTEXT_CACHE_FAILURE_TTL_SECONDS: int = 300  # 創建失敗的系統指令在此時間（秒）內不再重試
+    AI_CONTEXT_CACHE_MAX_LOCAL_ENTRIES: int = 256  # 本地保存的系統指令緩存上限，超出時淘汰最久未使用的
+
+    # LLM 調用帳本（每次調用的 token、排隊/網絡延遲、重試與緩存結果，批量寫入 llm_call_ledger 集合）
+    AI_LLM_LEDGER_ENABLED: bool = True  # 是否記錄 LLM 調用帳本
+    AI_LLM_LEDGER_TTL_DAYS: int = 30  # 記錄保留天數（TTL 索引）
+    AI_LLM_LEDGER_BATCH_SIZE: int = 100  # 緩衝區達到此數量時立即批量寫入
+    AI_LLM_LEDGER_FLUSH_INTERVAL_SECONDS: float = 5.0  # 定時寫入間隔（秒）
+    AI_LLM_LEDGER_MAX_BUFFER: int = 10000  # 緩衝區上限，數據庫不可用時超出部分丟棄最舊記錄
+
+    # AI 提供商後端（"google" 調用 Gemini；"fake" 為本地模擬，用於離線壓測）
+    AI_PROVIDER_BACKEND: str = "google"
+    FAKE_LLM_SEED: Optional[int] = None  # 模擬後端隨機種子，設定後結果可重現
+    FAKE_LLM_LATENCY_MEDIAN_SECONDS: float = 0.8  # 延遲中位數（秒），按對數常態分佈取樣
+    FAKE_LLM_LATENCY_SIGMA: float = 0.5  # 對數常態分佈的 sigma，越大長尾越明顯
+    FAKE_LLM_MAX_LATENCY_SECONDS: float = 30.0  # 單次模擬延遲上限（秒）
+    FAKE_LLM_TASK_LATENCY_MEDIANS: dict = {  # 各任務類型的延遲中位數（秒），未列出的使用全局中位數
+        "question_intent_classification": 0.5,
+        "query_rewrite": 0.8,
+        "mongodb_detail_query_generation": 1.0,
+        "batch_mongodb_detail_query_generation": 1.5,
+        "answer_generation": 2.5,
+        "text_generation": 4.0,
+        "batch_text_analysis": 8.0,
+    }
+    FAKE_LLM_ERROR_RATE: float = 0.0  # 模擬服務不可用錯誤的比例
+    FAKE_LLM_RATE_LIMIT_RATE: float = 0.0  # 模擬 429 配額不足的比例
+    FAKE_LLM_OUTPUT_TOKENS: int = 0  # 每次回報的輸出 token 數，0 表示按輸出文本估算
+    FAKE_LLM_STREAM_CHUNK_CHARS: int = 20  # 流式輸出每塊字符數
+    FAKE_LLM_STREAM_CHUNK_INTERVAL_SECONDS: float = 0.05  # 流式輸出塊間隔（秒）
+    FAKE_LLM_INTENT_WEIGHTS: dict = {  # 模擬意圖分類結果的分佈
+        "document_search": 0.55,
+        "document_detail_query": 0.1,
+        "complex_analysis": 0.1,
+        "simple_factual": 0.1,
+        "chitchat": 0.05,
+        "greeting": 0.05,
+        "clarification_needed": 0.05,
+    }
+
     # 向量資料庫相關設定 (使用 ChromaDB)
     VECTOR_DB_PATH: str = "./data/chromadb"
     EMBEDDING_MODEL: str = "paraphrase-multilingual-mpnet-base-v2"  # 預設使用多語言模型
@@ -46,6 +173,16 @@ class Settings(BaseSettings):
     QUESTION_CLASSIFIER_ENABLED: bool = True  # 是否啟用問題分類器
     QUESTION_CLASSIFIER_MODEL: str = "gemini-2.0-flash-exp"  # 分類器使用的模型
     QUESTION_CLASSIFIER_CONFIDENCE_THRESHOLD: float = 0.7  # 分類置信度閾值
+
+    # 本地快速意圖分類（規則 + 問題向量最近質心，命中時跳過 LLM 分類）
+    LOCAL_INTENT_CLASSIFIER_ENABLED: bool = True  # 是否啟用本地快速分類
+    LOCAL_INTENT_CLASSIFIER_MIN_SIMILARITY: float = 0.75  # 與最近質心的相似度達到此值才直接返回
+    LOCAL_INTENT_CLASSIFIER_MIN_MARGIN: float = 0.05  # 最近質心需領先次近質心的相似度差
+    LOCAL_INTENT_CLASSIFIER_SHADOW_RATE: float = 0.05  # 本地命中後抽樣調用 LLM 驗證一致率的比例
+    LOCAL_INTENT_CLASSIFIER_RETRAIN_SECONDS: int = 3600  # 從 qa_analytics 重新訓練質心的間隔（秒）
+    LOCAL_INTENT_CLASSIFIER_MIN_TRAINING_CONFIDENCE: float = 0.85  # 只用置信度不低於此值的 LLM 分類做訓練樣本
+    LOCAL_INTENT_CLASSIFIER_MIN_SAMPLES_PER_INTENT: int = 5  # 每個意圖至少需要的樣本數才建立質心
+    LOCAL_INTENT_CLASSIFIER_MAX_SAMPLES_PER_INTENT: int = 300  # 每個意圖最多使用的最近樣本數
     
     # 智能工作流設定
     ENABLE_INTELLIGENT_ROUTING: bool = True  # 啟用智能路由
@@ -53,8 +190,47 @@ class Settings(BaseSettings):
     ENABLE_GREETING_SHORTCUT: bool = True  # 啟用寒暄快速通道
     ENABLE_CHITCHAT_SHORTCUT: bool = True  # 啟用閒聊快速通道
 
+    # 推測式檢索（分類的同時先用原始問題做混合檢索）
+    ENABLE_SPECULATIVE_RETRIEVAL: bool = True  # 是否啟用推測式檢索
+    SPECULATIVE_RETRIEVAL_MIN_SCORE: float = 0.6  # 最高原始餘弦相似度（非 RRF 分數）達到此值時直接使用結果並跳過查詢重寫
+    SPECULATIVE_RETRIEVAL_TIMEOUT_SECONDS: float = 5.0  # 處理器等待推測結果的最長時間（秒）
+    SPECULATIVE_RETRIEVAL_MIN_QUESTION_CHARS: int = 4  # 問題少於此字數時不做推測（多為寒暄）
+
+    # 詳細查詢並發與批量生成（多個文檔的 MongoDB 查詢一次調用生成或同時發出，API 速率仍受全局 AI 限流器控制）
+    QA_DETAIL_QUERY_MAX_CONCURRENCY: int = 5  # 單次問答中同時進行的文檔詳細查詢數上限
+    QA_DETAIL_QUERY_BATCHING_ENABLED: bool = True  # 多個文檔時是否一次調用生成所有文檔的查詢（失敗的文檔回退為單獨調用）
+    QA_DETAIL_QUERY_BATCH_MAX_DOCUMENTS: int = 8  # 每次批量調用最多文檔數，超過時分批並發
+    QA_DETAIL_QUERY_BATCH_OUTPUT_TOKENS_PER_DOC: int = 512  # 每份文檔預留的輸出 token 數
+
+    # 詳細查詢計劃緩存（相似問題 + 相同意圖 + 相同文檔欄位簽名時重用已驗證的 projection，跳過 LLM）
+    DETAIL_QUERY_PLAN_CACHE_ENABLED: bool = True  # 是否啟用查詢計劃緩存
+    DETAIL_QUERY_PLAN_SIMILARITY_THRESHOLD: float = 0.9  # 問題向量餘弦相似度達到此值才重用計劃
+    DETAIL_QUERY_PLAN_TTL_SECONDS: int = 86400  # 計劃桶的存活時間（秒）
+    DETAIL_QUERY_PLAN_MAX_BUCKETS: int = 2000  # 最多保留的（用戶, 意圖, 欄位簽名）桶數
+    DETAIL_QUERY_PLAN_MAX_PER_BUCKET: int = 20  # 每個桶最多保留的計劃數，超出時丟棄最舊的
+
+    # 用戶動態欄位目錄（分析結果寫入時增量維護欄位路徑、類型、示例與頻率，作為詳細查詢的 Schema 提示）
+    FIELD_CATALOG_ENABLED: bool = True  # 是否維護並使用欄位目錄
+    FIELD_CATALOG_CACHE_TTL_SECONDS: int = 60  # 進程內目錄緩存 TTL（秒），本進程寫入時立即失效
+    FIELD_CATALOG_MAX_EXAMPLES: int = 3  # 每個欄位保留的最近示例值數
+    FIELD_CATALOG_EXAMPLE_MAX_CHARS: int = 60  # 示例值最大字符數
+    FIELD_CATALOG_MAX_HINT_FIELDS: int = 50  # Schema 提示中最多列出的欄位數（按頻率排序）
+
     # 新增上傳目錄配置
     UPLOAD_DIR: str = "uploaded_files"
+    UPLOAD_CHUNK_SIZE_BYTES: int = 1024 * 1024  # 上傳流式寫入的分塊大小，決定每個上傳的內存峰值
+    UPLOAD_MAX_FILE_SIZE_BYTES: int = 100 * 1024 * 1024  # 單個上傳文件的大小上限，寫入中超出即中止並返回 413（0 表示不限制）
+    DOCUMENT_DEDUP_DEFAULT_MODE: str = "clone"  # 用戶未設定時的內容去重模式：off / link / clone
+
+    # 文檔批量刪除
+    DOCUMENT_BULK_DELETE_BATCH_SIZE: int = 500  # 每批 delete_many 與向量刪除的文檔數
+    DOCUMENT_BULK_DELETE_SYNC_LIMIT: int = 200  # 超過此數量的批量刪除轉為後台任務並返回任務 ID
+    DOCUMENT_FILE_DELETE_WORKERS: int = 4  # 後台刪除文件的線程數
+
+    # 批量文檔處理調度（處理未處理 / 重試失敗）
+    DOCUMENT_PROCESSING_MAX_CONCURRENCY: int = 4  # 全局同時處理的文檔數
+    DOCUMENT_PROCESSING_PER_USER_CONCURRENCY: int = 2  # 單個用戶同時處理的文檔數（各用戶輪流調度）
+    DOCUMENT_PROCESSING_MAX_ADMITTED: int = 1000  # 每次請求最多加入隊列的文檔數
 
     # JWT 相關設定
     # !!! 請務必替換為一個安全的隨機字串，例如通過 `openssl rand -hex 32` 生成 !!!
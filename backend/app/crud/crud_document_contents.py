@@ -0,0 +1,264 @@
+"""
+文檔內容集合（document_contents）
+
+啟用 DOCUMENT_CONTENT_STORE_ENABLED 後，體積大而很少被查詢的欄位不再內嵌在
+documents 中，而是按文檔 ID 存到 document_contents（可選 zstd 壓縮）：
+
+- extracted_text（頂層提取文本）
+- analysis.ai_analysis_output 中的 extracted_text 與 intermediate_analysis
+
+documents 中保留 key_information、initial_summary 等會被查詢和投影的分析欄位，
+並以 content_externalized 標記內容已外置。需要全文的路徑（語義摘要、詳細查詢、
+文檔詳情等）通過 hydrate_document / hydrate_raw_document 按需讀取。
+"""
+
+import json
+import logging
+from datetime import datetime, UTC
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import Binary
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from ..core.config import settings
+from ..core.logging_utils import AppLogger
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+DOCUMENT_CONTENTS_COLLECTION = "document_contents"
+CONTENT_MARKER_FIELD = "content_externalized"
+
+# 從 analysis.ai_analysis_output 中外置的鍵
+EXTERNAL_ANALYSIS_KEYS = ("extracted_text", "intermediate_analysis")
+_ANALYSIS_OUTPUT_PATH = "analysis.ai_analysis_output"
+_ANALYSIS_OUTPUT_PREFIX = _ANALYSIS_OUTPUT_PATH + "."
+
+_zstd_warning_logged = False
+
+
+def content_store_enabled() -> bool:
+    return settings.DOCUMENT_CONTENT_STORE_ENABLED
+
+
+def _encode(value: Any) -> Dict[str, Any]:
+    """按設定壓縮內容；未安裝 zstandard 時以原始值保存"""
+    global _zstd_warning_logged
+    if settings.DOCUMENT_CONTENT_COMPRESSION == "zstd":
+        if ZSTD_AVAILABLE:
+            raw = json.dumps(value, ensure_ascii=False, default=str).encode("utf-8")
+            compressor = zstandard.ZstdCompressor(level=settings.DOCUMENT_CONTENT_COMPRESSION_LEVEL)
+            return {"codec": "zstd", "data": Binary(compressor.compress(raw))}
+        if not _zstd_warning_logged:
+            logger.warning("DOCUMENT_CONTENT_COMPRESSION=zstd 但未安裝 zstandard，內容將不壓縮保存")
+            _zstd_warning_logged = True
+    return {"codec": "none", "data": value}
+
+
+def _decode(payload: Optional[Dict[str, Any]]) -> Any:
+    if not isinstance(payload, dict):
+        return None
+    if payload.get("codec") == "zstd":
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("文檔內容以 zstd 壓縮保存，但未安裝 zstandard")
+        return json.loads(zstandard.ZstdDecompressor().decompress(bytes(payload["data"])).decode("utf-8"))
+    return payload.get("data")
+
+
+def split_heavy_fields(update_data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+    """
+    把文檔更新拆分為內嵌部分與外置內容
+
+    Returns:
+        (documents 的 $set, documents 的 $unset, document_contents 的欄位)；
+        外置內容的欄位為 extracted_text 與 analysis_extras
+    """
+    inline = dict(update_data)
+    unset: Dict[str, Any] = {}
+    content: Dict[str, Any] = {}
+
+    if "extracted_text" in inline:
+        content["extracted_text"] = inline.pop("extracted_text")
+        unset["extracted_text"] = ""
+
+    analysis = inline.get("analysis")
+    if isinstance(analysis, dict) and isinstance(analysis.get("ai_analysis_output"), dict):
+        output = dict(analysis["ai_analysis_output"])
+        # 整個分析結果被替換時外置部分也整體替換，避免保留舊分析的內容
+        content["analysis_extras"] = {key: output.pop(key) for key in EXTERNAL_ANALYSIS_KEYS if key in output}
+        inline["analysis"] = {**analysis, "ai_analysis_output": output}
+
+    if isinstance(inline.get(_ANALYSIS_OUTPUT_PATH), dict):
+        output = dict(inline[_ANALYSIS_OUTPUT_PATH])
+        content["analysis_extras"] = {key: output.pop(key) for key in EXTERNAL_ANALYSIS_KEYS if key in output}
+        inline[_ANALYSIS_OUTPUT_PATH] = output
+
+    dotted_extras = {}
+    for key in EXTERNAL_ANALYSIS_KEYS:
+        path = _ANALYSIS_OUTPUT_PREFIX + key
+        if path in inline:
+            dotted_extras[key] = inline.pop(path)
+            unset[path] = ""
+    if dotted_extras:
+        content["analysis_extras_partial"] = dotted_extras
+
+    if content:
+        inline[CONTENT_MARKER_FIELD] = True
+    return inline, unset, content
+
+
+def build_content_update(content: Dict[str, Any]) -> Dict[str, Any]:
+    """構建 document_contents 的 $set；analysis_extras 整體替換，analysis_extras_partial 只更新其中的鍵"""
+    set_fields: Dict[str, Any] = {"updated_at": datetime.now(UTC)}
+    if "extracted_text" in content:
+        set_fields["extracted_text"] = _encode(content["extracted_text"])
+    if "analysis_extras" in content:
+        set_fields["analysis_extras"] = {key: _encode(value) for key, value in content["analysis_extras"].items()}
+    for key, value in (content.get("analysis_extras_partial") or {}).items():
+        set_fields[f"analysis_extras.{key}"] = _encode(value)
+    return {"$set": set_fields}
+
+
+async def save_document_content(db: AsyncIOMotorDatabase, document_id: Any, content: Dict[str, Any]):
+    """寫入外置內容（不存在時創建）"""
+    await db[DOCUMENT_CONTENTS_COLLECTION].update_one({"_id": document_id}, build_content_update(content), upsert=True)
+
+
+async def load_document_content(db: AsyncIOMotorDatabase, document_id: Any) -> Optional[Dict[str, Any]]:
+    """讀取並解壓外置內容：{"extracted_text": ..., "analysis_extras": {...}}"""
+    raw = await db[DOCUMENT_CONTENTS_COLLECTION].find_one({"_id": document_id})
+    if raw is None:
+        return None
+    return {
+        "extracted_text": _decode(raw.get("extracted_text")),
+        "analysis_extras": {key: _decode(value) for key, value in (raw.get("analysis_extras") or {}).items()}
+    }
+
+
+async def delete_document_content(db: AsyncIOMotorDatabase, document_id: Any):
+    await db[DOCUMENT_CONTENTS_COLLECTION].delete_one({"_id": document_id})
+
+
+async def delete_document_contents(db: AsyncIOMotorDatabase, document_ids: List[Any]):
+    """批量刪除外置內容（批量刪除文檔時使用）"""
+    if document_ids:
+        await db[DOCUMENT_CONTENTS_COLLECTION].delete_many({"_id": {"$in": list(document_ids)}})
+
+
+def with_content_marker(projection: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """為包含式投影加上 content_externalized，使結果可以被 hydrate_raw_document 補充"""
+    if not projection or not any(value for key, value in projection.items() if key != "_id"):
+        return projection
+    return {**projection, CONTENT_MARKER_FIELD: 1}
+
+
+def _requested_subpath(projection: Optional[Dict[str, Any]], path: str) -> Optional[List[str]]:
+    """
+    判斷投影是否需要某個外置欄位
+
+    Returns:
+        None 表示不需要；空列表表示需要整個欄位；否則為投影請求的子路徑
+    """
+    if not projection or not any(value for key, value in projection.items() if key != "_id"):
+        return []  # 無投影或排除式投影返回完整文檔
+    for key, value in projection.items():
+        if not value:
+            continue
+        if key == path or path.startswith(key + "."):
+            return []
+        if key.startswith(path + "."):
+            return key[len(path) + 1:].split(".")
+    return None
+
+
+def _pick(value: Any, subpath: List[str]) -> Any:
+    for part in subpath:
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _nest(subpath: List[str], value: Any) -> Any:
+    for part in reversed(subpath):
+        value = {part: value}
+    return value
+
+
+def merge_content_into_raw(
+    raw: Dict[str, Any],
+    content: Dict[str, Any],
+    projection: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """把外置內容合併回原始文檔字典（內嵌值優先；給出投影時只補充投影請求的欄位）"""
+    if raw.get("extracted_text") is None and content.get("extracted_text") is not None:
+        if _requested_subpath(projection, "extracted_text") is not None:
+            raw["extracted_text"] = content["extracted_text"]
+
+    for key, value in (content.get("analysis_extras") or {}).items():
+        subpath = _requested_subpath(projection, _ANALYSIS_OUTPUT_PREFIX + key)
+        if subpath is None or value is None:
+            continue
+        if subpath:
+            value = _pick(value, subpath)
+            if value is None:
+                continue
+            value = _nest(subpath, value)
+        if not isinstance(raw.get("analysis"), dict):
+            raw["analysis"] = {}
+        output = raw["analysis"].setdefault("ai_analysis_output", {})
+        if isinstance(output, dict):
+            output.setdefault(key, value)
+    return raw
+
+
+async def hydrate_raw_document(
+    db: AsyncIOMotorDatabase,
+    raw: Optional[Dict[str, Any]],
+    projection: Optional[Dict[str, Any]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    為查詢結果補充外置內容。
+
+    查詢投影需要經過 with_content_marker，未標記的文檔不額外查詢；
+    給出投影時只補充投影請求的欄位，並移除查詢時附加的標記欄位。
+    以外置欄位為條件的過濾（例如對 extracted_text 的正則）不會匹配已外置的文檔。
+    """
+    if not raw:
+        return raw
+    externalized = raw.pop(CONTENT_MARKER_FIELD, False) if projection else raw.get(CONTENT_MARKER_FIELD)
+    if not externalized:
+        return raw
+    try:
+        content = await load_document_content(db, raw["_id"])
+    except Exception as e:
+        logger.warning(f"讀取文檔 {raw.get('_id')} 的外置內容失敗: {e}")
+        return raw
+    return merge_content_into_raw(raw, content, projection) if content else raw
+
+
+async def hydrate_document(db: AsyncIOMotorDatabase, document: Any) -> Any:
+    """為 Document 模型補充外置的提取文本與分析內容（原地修改並返回）"""
+    if document is None or not getattr(document, CONTENT_MARKER_FIELD, False):
+        return document
+    try:
+        content = await load_document_content(db, document.id)
+    except Exception as e:
+        logger.warning(f"讀取文檔 {document.id} 的外置內容失敗: {e}")
+        return document
+    if not content:
+        return document
+
+    if document.extracted_text is None and content.get("extracted_text") is not None:
+        document.extracted_text = content["extracted_text"]
+    output = document.analysis.ai_analysis_output if document.analysis else None
+    if isinstance(output, dict):
+        for key, value in (content.get("analysis_extras") or {}).items():
+            output.setdefault(key, value)
+    return document
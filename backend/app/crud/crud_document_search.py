@@ -0,0 +1,201 @@
+"""
+文檔列表搜索（n-gram 索引）
+
+MongoDB 的 $text 索引不支持中文分詞，不區分大小寫的非錨定 $regex 又無法使用
+filename 索引。這裡為每個文檔維護 search_terms：文件名、標籤與摘要的 n-gram
+（中日韓文字取二元組，字母數字取三元組），以 (owner_id, search_terms) 多鍵索引支撐查詢：
+
+- search（q 參數）：查詢詞的 n-gram 全部出現在 search_terms 中即命中，按相關度排序
+  （文件名包含整個查詢詞 > 文件名 / 標籤中的 n-gram 命中數 > 其他）
+- filename_contains：先以 n-gram 縮小候選範圍，再用原正則複核，結果與原正則一致
+
+子串的 n-gram 必然是原文 n-gram 的子集，因此索引過濾不會漏掉正則能匹配的文檔；
+查詢詞太短（不足一個 n-gram）時回退到正則。寫入文件名、標籤或分析結果時更新 search_terms，
+已有文檔用 `python -m app.db.rebuild_document_search_terms` 補建。
+"""
+
+import logging
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from ..core.config import settings
+from ..core.logging_utils import AppLogger
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+DOCUMENT_COLLECTION = "documents"
+
+SEARCH_TERMS_FIELD = "search_terms"  # 文件名、標籤與摘要的 n-gram（多鍵索引）
+SEARCH_TITLE_TERMS_FIELD = "search_title_terms"  # 文件名與標籤的 n-gram（只用於相關度計算）
+SEARCH_SCORE_FIELD = "_search_score"
+RELEVANCE_SORT = "relevance"
+
+# 列表讀取完整文檔時排除的搜索欄位
+SEARCH_FIELDS_EXCLUSION = {SEARCH_TERMS_FIELD: 0, SEARCH_TITLE_TERMS_FIELD: 0}
+
+# 計算 search_terms 需要的欄位
+SEARCH_SOURCE_PROJECTION = {
+    "filename": 1,
+    "tags": 1,
+    "enriched_data.title": 1,
+    "enriched_data.summary": 1,
+    "analysis.ai_analysis_output.key_information.auto_title": 1,
+    "analysis.ai_analysis_output.key_information.content_summary": 1,
+}
+
+# 寫入這些欄位時需要重新計算 search_terms
+SEARCH_SOURCE_FIELDS = ("filename", "tags", "analysis", "enriched_data")
+
+_CJK_NGRAM = 2
+_ALNUM_NGRAM = 3
+_CJK_RUN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+_ALNUM_RUN = re.compile(r"[0-9a-z\u00c0-\u024f]+")
+
+
+def _run_ngrams(run: str, size: int) -> Iterable[str]:
+    return (run[i:i + size] for i in range(len(run) - size + 1))
+
+
+def text_ngrams(text: Optional[str]) -> List[str]:
+    """把文本拆為 n-gram（小寫；中日韓文字二元組，字母數字三元組），保持首次出現的順序並去重"""
+    if not text:
+        return []
+    lowered = text.lower()
+    terms: Dict[str, None] = {}
+    for match in _CJK_RUN.finditer(lowered):
+        terms.update(dict.fromkeys(_run_ngrams(match.group(), _CJK_NGRAM)))
+    for match in _ALNUM_RUN.finditer(lowered):
+        terms.update(dict.fromkeys(_run_ngrams(match.group(), _ALNUM_NGRAM)))
+    return list(terms)
+
+
+def _summary_texts(raw: Dict[str, Any]) -> List[str]:
+    enriched = raw.get("enriched_data") or {}
+    key_information = (((raw.get("analysis") or {}).get("ai_analysis_output") or {}).get("key_information")) or {}
+    texts = [
+        enriched.get("title"),
+        key_information.get("auto_title"),
+        key_information.get("content_summary"),
+        enriched.get("summary"),
+    ]
+    return [text for text in texts if isinstance(text, str) and text]
+
+
+def build_search_terms(raw: Dict[str, Any]) -> Dict[str, List[str]]:
+    """從原始文檔（或包含 SEARCH_SOURCE_PROJECTION 欄位的字典）計算搜索欄位"""
+    title_terms: Dict[str, None] = dict.fromkeys(text_ngrams(raw.get("filename")))
+    for tag in raw.get("tags") or []:
+        title_terms.update(dict.fromkeys(text_ngrams(str(tag))))
+
+    summary = " ".join(_summary_texts(raw))[:settings.DOCUMENT_SEARCH_SUMMARY_MAX_CHARS]
+    all_terms = dict(title_terms)
+    all_terms.update(dict.fromkeys(text_ngrams(summary)))
+    return {
+        SEARCH_TERMS_FIELD: sorted(all_terms),
+        SEARCH_TITLE_TERMS_FIELD: sorted(title_terms),
+    }
+
+
+def _query_terms(text: Optional[str]) -> List[str]:
+    return sorted(text_ngrams((text or "").strip()))
+
+
+def filename_prefilter(filename_contains: str) -> Optional[Dict[str, Any]]:
+    """filename_contains 的 n-gram 預過濾條件；未啟用或查詢詞太短時返回 None"""
+    if not settings.DOCUMENT_SEARCH_FILENAME_PREFILTER:
+        return None
+    terms = _query_terms(filename_contains)
+    if not terms:
+        return None
+    return {SEARCH_TERMS_FIELD: {"$all": terms}}
+
+
+def build_search_condition(search: str) -> Optional[Dict[str, Any]]:
+    """
+    q 參數的查詢條件：所有查詢 n-gram 都出現在 search_terms 中；
+    查詢詞不足一個 n-gram 時回退到文件名與標籤的正則匹配
+    """
+    search = (search or "").strip()
+    if not search:
+        return None
+    terms = _query_terms(search)
+    if terms:
+        return {SEARCH_TERMS_FIELD: {"$all": terms}}
+    pattern = {"$regex": re.escape(search), "$options": "i"}
+    return {"$or": [{"filename": pattern}, {"tags": pattern}]}
+
+
+def relevance_stages(search: str) -> List[Dict[str, Any]]:
+    """計算相關度的聚合階段（在 $match 之後、$sort 之前）"""
+    search = search.strip()
+    terms = _query_terms(search)
+    score_parts: List[Any] = [
+        # 文件名包含整個查詢詞
+        {"$cond": [
+            {"$regexMatch": {"input": {"$ifNull": ["$filename", ""]}, "regex": re.escape(search), "options": "i"}},
+            settings.DOCUMENT_SEARCH_FILENAME_MATCH_BOOST,
+            0
+        ]}
+    ]
+    if terms:
+        # 文件名與標籤中命中的 n-gram 比例
+        score_parts.append({"$divide": [
+            {"$size": {"$setIntersection": [{"$ifNull": [f"${SEARCH_TITLE_TERMS_FIELD}", []]}, terms]}},
+            len(terms)
+        ]})
+    return [{"$addFields": {SEARCH_SCORE_FIELD: {"$add": score_parts}}}]
+
+
+async def refresh_document_search_terms(db: AsyncIOMotorDatabase, document_id: Any) -> bool:
+    """重新計算單個文檔的搜索欄位；未變化時不寫入"""
+    raw = await db[DOCUMENT_COLLECTION].find_one(
+        {"_id": document_id},
+        projection={**SEARCH_SOURCE_PROJECTION, SEARCH_TERMS_FIELD: 1, SEARCH_TITLE_TERMS_FIELD: 1}
+    )
+    if raw is None:
+        return False
+    fields = build_search_terms(raw)
+    if all(raw.get(key) == value for key, value in fields.items()):
+        return False
+    await db[DOCUMENT_COLLECTION].update_one({"_id": document_id}, {"$set": fields})
+    return True
+
+
+async def rebuild_search_terms(
+    db: AsyncIOMotorDatabase,
+    owner_id: Any = None,
+    batch_size: int = 500
+) -> Tuple[int, int]:
+    """
+    按 _id 分批為已有文檔補建搜索欄位
+
+    Returns:
+        (掃描的文檔數, 更新的文檔數)
+    """
+    query: Dict[str, Any] = {} if owner_id is None else {"owner_id": owner_id}
+    projection = {**SEARCH_SOURCE_PROJECTION, SEARCH_TERMS_FIELD: 1, SEARCH_TITLE_TERMS_FIELD: 1}
+    scanned = updated = 0
+    last_id = None
+
+    while True:
+        batch_query = query if last_id is None else {**query, "_id": {"$gt": last_id}}
+        batch = await db[DOCUMENT_COLLECTION].find(batch_query, projection=projection).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        operations = []
+        for raw in batch:
+            scanned += 1
+            fields = build_search_terms(raw)
+            if any(raw.get(key) != value for key, value in fields.items()):
+                operations.append(UpdateOne({"_id": raw["_id"]}, {"$set": fields}))
+        if operations:
+            await db[DOCUMENT_COLLECTION].bulk_write(operations, ordered=False)
+            updated += len(operations)
+        logger.info(f"搜索欄位補建進度: 已掃描 {scanned}，已更新 {updated}")
+
+    return scanned, updated
@@ -1,13 +1,20 @@
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Union
 from datetime import datetime, UTC
+import base64
+import json
 import uuid
 import re # 用於不區分大小寫的搜尋
 import logging
 
+from bson import json_util
+from bson.binary import UuidRepresentation
+from cachetools import TTLCache
+
 from ..models.document_models import (
     DocumentCreate, 
     Document, 
+    DocumentSummary,
     DocumentStatus, 
     VectorStatus, # <-- Import VectorStatus
     DocumentInDBBase, # 用於構建更新返回
@@ -15,12 +22,69 @@ from ..models.document_models import (
 from ..core.config import settings
 from ..core.logging_utils import AppLogger, log_event 
 from ..models.log_models import LogLevel 
+from ..utils.single_flight import SingleFlight
+from .crud_document_contents import (
+    content_store_enabled,
+    delete_document_content,
+    hydrate_document,
+    save_document_content,
+    split_heavy_fields,
+)
+from .crud_document_search import (
+    RELEVANCE_SORT,
+    SEARCH_FIELDS_EXCLUSION,
+    SEARCH_SCORE_FIELD,
+    SEARCH_SOURCE_FIELDS,
+    build_search_condition,
+    build_search_terms,
+    filename_prefilter,
+    refresh_document_search_terms,
+    relevance_stages,
+)
 
 DOCUMENT_COLLECTION = "documents"
 
 # 初始化logger
 logger = AppLogger(__name__, level=logging.INFO).get_logger()
 
+# 合併同時進行中的相同 ID 集合的批量查詢
+_documents_by_ids_single_flight = SingleFlight("crud.get_documents_by_ids")
+
+_document_summaries_by_ids_single_flight = SingleFlight("crud.get_document_summaries_by_ids")
+
+# DocumentSummary 需要的欄位；排序欄位必須包含在內（游標分頁從記錄中讀取排序鍵）
+DOCUMENT_SUMMARY_PROJECTION = {
+    "owner_id": 1,
+    "filename": 1,
+    "file_type": 1,
+    "size": 1,
+    "tags": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "status": 1,
+    "vector_status": 1,
+    "clustering_status": 1,
+    "cluster_info": 1,
+    "enriched_data.title": 1,
+    "enriched_data.summary": 1,
+    "analysis.ai_analysis_output.key_information.content_summary": 1,
+    "analysis.ai_analysis_output.key_information.key_concepts": 1,
+    "analysis.ai_analysis_output.key_information.main_topics": 1,
+}
+
+# 文檔列表允許的排序欄位
+ALLOWED_SORT_FIELDS = ["created_at", "updated_at", "filename", "status", "size"]
+DEFAULT_SORT_FIELD = "created_at"
+
+# 游標中的值需保留 datetime / UUID 類型，才能與資料庫中的排序鍵比較
+_CURSOR_JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS.with_options(uuid_representation=UuidRepresentation.STANDARD)
+
+# 列表總數的短期緩存：(owner_id, 過濾條件) -> 總數
+_count_cache: TTLCache = TTLCache(
+    maxsize=settings.DOCUMENT_COUNT_CACHE_MAX_ENTRIES,
+    ttl=settings.DOCUMENT_COUNT_CACHE_TTL_SECONDS
+)
+
 def _build_document_filter_query(
     owner_id: uuid.UUID,
     uploader_device_id: Optional[str] = None,
@@ -29,7 +93,8 @@ def _build_document_filter_query(
     tags_include: Optional[List[str]] = None,
     cluster_id: Optional[str] = None,
     clustering_status: Optional[str] = None,
-    has_enriched_data: Optional[bool] = None
+    has_enriched_data: Optional[bool] = None,
+    search: Optional[str] = None
 ) -> Dict[str, Any]:
     query: Dict[str, Any] = {"owner_id": owner_id}
     if uploader_device_id:
@@ -37,7 +102,15 @@ def _build_document_filter_query(
     if status_in:
         query["status"] = {"$in": [s.value for s in status_in]}
     if filename_contains:
+        # 啟用 n-gram 預過濾時先用 (owner_id, search_terms) 索引縮小範圍，正則只在候選文檔上複核
+        prefilter = filename_prefilter(filename_contains)
+        if prefilter:
+            query.setdefault("$and", []).append(prefilter)
         query["filename"] = {"$regex": re.escape(filename_contains), "$options": "i"}
+    if search:
+        search_condition = build_search_condition(search)
+        if search_condition:
+            query.setdefault("$and", []).append(search_condition)
     if tags_include and len(tags_include) > 0:
         query["tags"] = {"$in": tags_include}
     
@@ -66,6 +139,49 @@ def _build_document_filter_query(
     
     return query
 
+def encode_page_cursor(sort_by: str, sort_order: str, last_document: Dict[str, Any]) -> str:
+    """把頁面最後一條記錄的排序鍵與 _id 編碼為不透明的游標"""
+    payload = {"s": sort_by, "o": sort_order, "v": last_document.get(sort_by), "i": last_document["_id"]}
+    raw = json_util.dumps(payload, json_options=_CURSOR_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_page_cursor(token: str) -> Dict[str, Any]:
+    """解碼游標；格式無效時拋出 ValueError"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"), json_options=_CURSOR_JSON_OPTIONS)
+    except Exception as e:
+        raise ValueError(f"無效的分頁游標: {e}") from e
+    if not isinstance(payload, dict) or not {"s", "o", "v", "i"} <= payload.keys():
+        raise ValueError("無效的分頁游標")
+    return payload
+
+def _keyset_condition(sort_by: str, direction: int, last_value: Any, last_id: Any) -> Dict[str, Any]:
+    """
+    游標之後的記錄條件（排序鍵，_id 相同方向作為並列時的次序）。
+    MongoDB 的比較運算只匹配同類型的值，null / 缺失的排序鍵需單獨處理：
+    升序時排在最前，降序時排在最後。
+    """
+    op = "$gt" if direction > 0 else "$lt"
+    if last_value is None:
+        conditions = [{sort_by: None, "_id": {op: last_id}}]
+        if direction > 0:
+            conditions.append({sort_by: {"$ne": None}})
+    else:
+        conditions = [{sort_by: {op: last_value}}, {sort_by: last_value, "_id": {op: last_id}}]
+        if direction < 0:
+            conditions.append({sort_by: None})
+    return {"$or": conditions}
+
+def _count_cache_key(owner_id: uuid.UUID, filters: Dict[str, Any]) -> Tuple[str, str]:
+    return str(owner_id), json.dumps(filters, sort_keys=True, default=str)
+
+def invalidate_document_count_cache(owner_id: Any):
+    """用戶的文檔增刪後清除其列表總數緩存"""
+    owner_key = str(owner_id)
+    for key in [key for key in list(_count_cache.keys()) if key[0] == owner_key]:
+        _count_cache.pop(key, None)
+
 async def create_document(
     db: AsyncIOMotorDatabase, 
     document_data: DocumentCreate, 
@@ -85,9 +201,11 @@ async def create_document(
     db_document_data["vector_status"] = VectorStatus.NOT_VECTORIZED.value # <-- Set default vector_status
     db_document_data["uploader_device_id"] = uploader_device_id
     db_document_data["file_path"] = file_path
+    db_document_data.update(build_search_terms(db_document_data))
     
     try:
         await db[DOCUMENT_COLLECTION].insert_one(db_document_data)
+        invalidate_document_count_cache(owner_id)
         # 從資料庫讀取剛插入的記錄以確保一致性，並轉換為 Document 模型
         created_doc_raw = await db[DOCUMENT_COLLECTION].find_one({"_id": document_id_uuid})
         if created_doc_raw:
@@ -166,7 +284,8 @@ async def count_documents(
     filename_contains: Optional[str] = None,
     tags_include: Optional[List[str]] = None,
     cluster_id: Optional[str] = None,
-    clustering_status: Optional[str] = None
+    clustering_status: Optional[str] = None,
+    search: Optional[str] = None
 ) -> int:
     """計算符合條件的文檔數量"""
     query = _build_document_filter_query(
@@ -176,11 +295,29 @@ async def count_documents(
         filename_contains=filename_contains,
         tags_include=tags_include,
         cluster_id=cluster_id,
-        clustering_status=clustering_status
+        clustering_status=clustering_status,
+        search=search
     )
     count = await db[DOCUMENT_COLLECTION].count_documents(query)
     return count
 
+async def count_documents_cached(
+    db: AsyncIOMotorDatabase,
+    owner_id: uuid.UUID,
+    **filters: Any
+) -> int:
+    """
+    計算符合條件的文檔數量，結果短期緩存（DOCUMENT_COUNT_CACHE_TTL_SECONDS）。
+    用戶新增或刪除文檔時緩存失效；狀態變化導致的過濾結果變化在 TTL 內可能不反映。
+    """
+    key = _count_cache_key(owner_id, filters)
+    cached = _count_cache.get(key)
+    if cached is not None:
+        return cached
+    count = await count_documents(db, owner_id=owner_id, **filters)
+    _count_cache[key] = count
+    return count
+
 async def get_documents(
     db: AsyncIOMotorDatabase, 
     owner_id: uuid.UUID, # 新增 owner_id
@@ -193,9 +330,10 @@ async def get_documents(
     cluster_id: Optional[str] = None,  # 新增: 聚類ID過濾
     clustering_status: Optional[str] = None,  # 新增: 聚類狀態過濾
     sort_by: Optional[str] = None, # <--- 新增排序參數
-    sort_order: Optional[str] = "desc" # <--- 新增排序參數，預設為 desc
+    sort_order: Optional[str] = "desc", # <--- 新增排序參數，預設為 desc
+    search: Optional[str] = None
 ) -> List[Document]:
-    """獲取文件列表，支持過濾、分頁和排序。"""
+    """獲取文件列表，支持過濾、搜索、分頁和排序（sort_by="relevance" 時按搜索相關度排序）。"""
     query = _build_document_filter_query(
         owner_id=owner_id,
         uploader_device_id=uploader_device_id,
@@ -203,32 +341,172 @@ async def get_documents(
         filename_contains=filename_contains,
         tags_include=tags_include,
         cluster_id=cluster_id,  # 傳遞cluster_id
-        clustering_status=clustering_status  # 傳遞clustering_status
+        clustering_status=clustering_status,  # 傳遞clustering_status
+        search=search
+    )
+    return await _find_documents(db, query, skip, limit, sort_by, sort_order, Document, search=search)
+
+async def get_document_summaries(
+    db: AsyncIOMotorDatabase,
+    owner_id: uuid.UUID,
+    skip: int = 0,
+    limit: int = 100,
+    uploader_device_id: Optional[str] = None,
+    status_in: Optional[List[DocumentStatus]] = None,
+    filename_contains: Optional[str] = None,
+    tags_include: Optional[List[str]] = None,
+    cluster_id: Optional[str] = None,
+    clustering_status: Optional[str] = None,
+    sort_by: Optional[str] = None,
+    sort_order: Optional[str] = "desc",
+    search: Optional[str] = None
+) -> List[DocumentSummary]:
+    """與 get_documents 相同的過濾、搜索、分頁和排序，只讀取 DocumentSummary 需要的欄位。"""
+    query = _build_document_filter_query(
+        owner_id=owner_id,
+        uploader_device_id=uploader_device_id,
+        status_in=status_in,
+        filename_contains=filename_contains,
+        tags_include=tags_include,
+        cluster_id=cluster_id,
+        clustering_status=clustering_status,
+        search=search
+    )
+    return await _find_documents(
+        db, query, skip, limit, sort_by, sort_order, DocumentSummary,
+        projection=DOCUMENT_SUMMARY_PROJECTION, search=search
     )
-    cursor = db[DOCUMENT_COLLECTION].find(query)
 
-    # 添加排序邏輯
-    ALLOWED_SORT_FIELDS = ["created_at", "updated_at", "filename", "status", "size"] # 修正: file_size -> size 以匹配數據庫模型
-    if sort_by and sort_by in ALLOWED_SORT_FIELDS: # 修改：檢查 sort_by 是否在允許列表中
-        direction = 1 if sort_order.lower() == "asc" else -1
-        cursor = cursor.sort(sort_by, direction)
-    elif sort_by:
-        logger.warning(f"不允許的排序欄位: {sort_by}。將使用預設排序。") # 新增：對不允許的排序欄位發出警告
+async def get_document_ids(
+    db: AsyncIOMotorDatabase,
+    owner_id: uuid.UUID,
+    status_in: Optional[List[DocumentStatus]] = None,
+    limit: int = 1000
+) -> List[uuid.UUID]:
+    """只讀取 _id 的狀態掃描（按創建時間倒序，走 owner_status_created_at 索引），供批量處理入隊使用。"""
+    query = _build_document_filter_query(owner_id=owner_id, status_in=status_in)
+    cursor = db[DOCUMENT_COLLECTION].find(query, projection={"_id": 1}).sort("created_at", -1).limit(limit)
+    return [raw["_id"] for raw in await cursor.to_list(length=limit)]
+
+async def _find_documents(
+    db: AsyncIOMotorDatabase,
+    query: Dict[str, Any],
+    skip: int,
+    limit: int,
+    sort_by: Optional[str],
+    sort_order: Optional[str],
+    model: Any,
+    projection: Optional[Dict[str, Any]] = None,
+    search: Optional[str] = None
+) -> List[Any]:
+    # 完整文檔不讀取搜索用的 n-gram 陣列
+    projection = projection or SEARCH_FIELDS_EXCLUSION
+
+    if sort_by == RELEVANCE_SORT and search and search.strip():
+        # 相關度排序：同分時按創建時間倒序
+        pipeline = [
+            {"$match": query},
+            *relevance_stages(search),
+            {"$sort": {SEARCH_SCORE_FIELD: -1, "created_at": -1, "_id": -1}},
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$project": projection}
+        ]
+        documents_from_db = await db[DOCUMENT_COLLECTION].aggregate(pipeline).to_list(length=limit)
+    else:
+        cursor = db[DOCUMENT_COLLECTION].find(query, projection)
+
+        # 添加排序邏輯
+        if sort_by and sort_by in ALLOWED_SORT_FIELDS: # 修改：檢查 sort_by 是否在允許列表中
+            direction = 1 if sort_order.lower() == "asc" else -1
+            cursor = cursor.sort(sort_by, direction)
+        elif sort_by:
+            logger.warning(f"不允許的排序欄位: {sort_by}。將使用預設排序。") # 新增：對不允許的排序欄位發出警告
 
-    documents_from_db = await cursor.skip(skip).limit(limit).to_list(length=limit) # 鏈式調用
+        documents_from_db = await cursor.skip(skip).limit(limit).to_list(length=limit) # 鏈式調用
     
     processed_documents = []
     for doc_data_from_db in documents_from_db: # documents_from_db is the list from MongoDB
         try:
             # Ensure '_id' is present for logging, even if other parts fail validation
             doc_id_for_log = str(doc_data_from_db.get('_id', 'Unknown ID'))
-            document_instance = Document(**doc_data_from_db)
+            document_instance = model(**doc_data_from_db)
             processed_documents.append(document_instance)
         except Exception as e: # Catches Pydantic ValidationError and other potential errors
             logger.error(f"Error validating document data for ID {doc_id_for_log} in get_documents: {e}", exc_info=True)
             # Skip this document and continue with others
     return processed_documents
 
+async def get_documents_page(
+    db: AsyncIOMotorDatabase,
+    owner_id: uuid.UUID,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    uploader_device_id: Optional[str] = None,
+    status_in: Optional[List[DocumentStatus]] = None,
+    filename_contains: Optional[str] = None,
+    tags_include: Optional[List[str]] = None,
+    cluster_id: Optional[str] = None,
+    clustering_status: Optional[str] = None,
+    sort_by: Optional[str] = None,
+    sort_order: Optional[str] = "desc",
+    summary_only: bool = False,
+    search: Optional[str] = None
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    以游標（keyset）分頁獲取文件列表，耗時與頁碼深度無關。
+
+    按 (排序欄位, _id) 排序，從游標記錄的位置之後繼續讀取，不使用 skip。
+    summary_only 時只讀取 DOCUMENT_SUMMARY_PROJECTION 並返回 DocumentSummary。
+
+    Returns:
+        (本頁文檔, 下一頁游標)；沒有更多記錄時游標為 None
+
+    Raises:
+        ValueError: 游標無效、與本次的排序方式不一致，或要求相關度排序（只支持 offset 分頁）
+    """
+    if sort_by == RELEVANCE_SORT:
+        raise ValueError("相關度排序不支持游標分頁，請使用 offset 分頁")
+    sort_field = sort_by if sort_by in ALLOWED_SORT_FIELDS else DEFAULT_SORT_FIELD
+    order = "asc" if (sort_order or "desc").lower() == "asc" else "desc"
+    direction = 1 if order == "asc" else -1
+
+    query = _build_document_filter_query(
+        owner_id=owner_id,
+        uploader_device_id=uploader_device_id,
+        status_in=status_in,
+        filename_contains=filename_contains,
+        tags_include=tags_include,
+        cluster_id=cluster_id,
+        clustering_status=clustering_status,
+        search=search
+    )
+    if cursor:
+        position = decode_page_cursor(cursor)
+        if position["s"] != sort_field or position["o"] != order:
+            raise ValueError("分頁游標與當前排序方式不一致")
+        # 過濾條件可能已有頂層 $or（聚類待分類），游標條件以 $and 疊加
+        query.setdefault("$and", []).append(_keyset_condition(sort_field, direction, position["v"], position["i"]))
+
+    # 多取一條判斷是否還有下一頁
+    projection = DOCUMENT_SUMMARY_PROJECTION if summary_only else SEARCH_FIELDS_EXCLUSION
+    model = DocumentSummary if summary_only else Document
+    raw_documents = await db[DOCUMENT_COLLECTION].find(query, projection).sort(
+        [(sort_field, direction), ("_id", direction)]
+    ).limit(limit + 1).to_list(length=limit + 1)
+
+    has_more = len(raw_documents) > limit
+    raw_documents = raw_documents[:limit]
+    next_cursor = encode_page_cursor(sort_field, order, raw_documents[-1]) if has_more and raw_documents else None
+
+    documents = []
+    for raw in raw_documents:
+        try:
+            documents.append(model(**raw))
+        except Exception as e:
+            logger.error(f"Error validating document data for ID {raw.get('_id')} in get_documents_page: {e}", exc_info=True)
+    return documents, next_cursor
+
 async def update_document(
     db: AsyncIOMotorDatabase, 
     document_id: uuid.UUID, 
@@ -249,9 +527,18 @@ async def update_document(
     if "vector_status" in update_data and isinstance(update_data["vector_status"], VectorStatus):
         update_data["vector_status"] = update_data["vector_status"].value
 
+    update_operation: Dict[str, Any] = {"$set": update_data}
+    content: Dict[str, Any] = {}
+    if content_store_enabled():
+        # 提取文本與分析中間結果寫入 document_contents，documents 只保留可查詢欄位
+        inline_data, unset_fields, content = split_heavy_fields(update_data)
+        update_operation = {"$set": inline_data}
+        if unset_fields:
+            update_operation["$unset"] = unset_fields
+
     result = await db[DOCUMENT_COLLECTION].update_one(
         {"_id": document_id},
-        {"$set": update_data}
+        update_operation
     )
     if result.matched_count == 0:
         # Log if document not found for update
@@ -264,7 +551,16 @@ async def update_document(
         )
         return None
 
+    if content:
+        await save_document_content(db, document_id, content)
+    if any(key.split(".", 1)[0] in SEARCH_SOURCE_FIELDS for key in update_data):
+        # 文件名、標籤或分析摘要變化時更新搜索用的 n-gram
+        await refresh_document_search_terms(db, document_id)
+
     updated_document = await get_document_by_id(db, document_id)
+    if content:
+        # 調用者可能直接使用返回文檔中剛寫入的提取文本
+        updated_document = await hydrate_document(db, updated_document)
     if updated_document:
         # Log successful update
         await log_event(
@@ -283,18 +579,27 @@ async def delete_document_by_id(db: AsyncIOMotorDatabase, document_id: uuid.UUID
     """按 ID 刪除文件記錄。"""
     logger.info(f"Attempting to delete document with UUID: {document_id} (type: {type(document_id)}))")
     # 注意：這裡只刪除資料庫記錄，實際的文件刪除需要在服務層處理
-    result = await db[DOCUMENT_COLLECTION].delete_one({"_id": document_id})
-    if result.deleted_count == 1:
+    # 刪除時取回所屬用戶與已計入欄位目錄的欄位，以便從目錄中扣除
+    from ..services.document.field_catalog_service import field_catalog_service
+    catalog_projection = {"owner_id": 1, "catalog_field_paths": 1}
+    deleted = await db[DOCUMENT_COLLECTION].find_one_and_delete({"_id": document_id}, projection=catalog_projection)
+    if deleted is not None:
         logger.info(f"Successfully deleted document with UUID: {document_id}")
+        invalidate_document_count_cache(deleted.get("owner_id"))
+        await delete_document_content(db, document_id)
+        await field_catalog_service.remove_document_fields(db, deleted.get("owner_id"), deleted.get("catalog_field_paths"))
         return True
     
     # 如果使用 UUID 對象刪除失敗，嘗試使用其字符串表示形式
-    logger.warning(f"Failed to delete document with UUID: {document_id}. Delete result: {result.raw_result}. Attempting with string ID.")
+    logger.warning(f"Failed to delete document with UUID: {document_id}. Attempting with string ID.")
     document_id_str = str(document_id)
     logger.info(f"Attempting to delete document with string ID: {document_id_str} (type: {type(document_id_str)}))")
-    result_str = await db[DOCUMENT_COLLECTION].delete_one({"_id": document_id_str})
-    if result_str.deleted_count == 1:
+    deleted_str = await db[DOCUMENT_COLLECTION].find_one_and_delete({"_id": document_id_str}, projection=catalog_projection)
+    if deleted_str is not None:
         logger.info(f"Successfully deleted document with string ID: {document_id_str} (original UUID: {document_id})")
+        invalidate_document_count_cache(deleted_str.get("owner_id"))
+        await delete_document_content(db, document_id_str)
+        await field_catalog_service.remove_document_fields(db, deleted_str.get("owner_id"), deleted_str.get("catalog_field_paths"))
         # Log successful deletion (string ID fallback)
         await log_event(
             db=db,
@@ -305,7 +610,7 @@ async def delete_document_by_id(db: AsyncIOMotorDatabase, document_id: uuid.UUID
         )
         return True
     
-    logger.error(f"Failed to delete document with UUID {document_id} and string ID {document_id_str}. Last delete result: {result_str.raw_result}")
+    logger.error(f"Failed to delete document with UUID {document_id} and string ID {document_id_str}.")
     # Log failed deletion
     await log_event(
         db=db,
@@ -318,43 +623,102 @@ async def delete_document_by_id(db: AsyncIOMotorDatabase, document_id: uuid.UUID
 
 async def get_documents_by_ids(
     db: AsyncIOMotorDatabase, 
-    document_ids: List[str]  # 接受字符串ID列表
+    document_ids: List[str],  # 接受字符串ID列表
+    owner_id: Optional[Union[str, uuid.UUID]] = None,
+    projection: Optional[Dict[str, Any]] = None
 ) -> List[Document]:
-    """根據文檔ID列表批量獲取文檔"""
-    if not document_ids:
+    """
+    根據文檔ID列表批量獲取文檔，按請求順序返回（重複或無效的 ID 跳過）
+
+    傳入 owner_id 時擁有者條件在查詢中過濾，其他用戶的文檔不會被讀取與解碼；
+    projection 只讀取部分欄位（必須包含構造 Document 所需的欄位）。
+    相同 ID 集合的並發查詢只執行一次。
+    """
+    return await _get_by_ids_in_order(
+        _documents_by_ids_single_flight, db, document_ids, owner_id, Document, projection
+    )
+
+
+async def get_document_summaries_by_ids(
+    db: AsyncIOMotorDatabase,
+    document_ids: List[str],
+    owner_id: Optional[Union[str, uuid.UUID]] = None
+) -> List[DocumentSummary]:
+    """根據文檔ID列表批量獲取 DocumentSummary（只讀取摘要所需欄位），按請求順序返回"""
+    return await _get_by_ids_in_order(
+        _document_summaries_by_ids_single_flight, db, document_ids, owner_id, DocumentSummary, DOCUMENT_SUMMARY_PROJECTION
+    )
+
+
+def _parse_document_ids(document_ids: List[Any]) -> List[uuid.UUID]:
+    """轉換為 UUID 並去重（保留首次出現的順序）"""
+    uuid_ids: Dict[uuid.UUID, None] = {}
+    for doc_id in document_ids:
+        try:
+            uuid_ids.setdefault(doc_id if isinstance(doc_id, uuid.UUID) else uuid.UUID(str(doc_id)), None)
+        except ValueError:
+            logger.warning(f"無效的文檔ID格式: {doc_id}")
+    return list(uuid_ids)
+
+
+async def _get_by_ids_in_order(
+    flight: SingleFlight,
+    db: AsyncIOMotorDatabase,
+    document_ids: List[Any],
+    owner_id: Optional[Union[str, uuid.UUID]],
+    model: Any,
+    projection: Optional[Dict[str, Any]]
+) -> List[Any]:
+    uuid_ids = _parse_document_ids(document_ids)
+    if not uuid_ids:
         return []
-    
-    try:
-        # 將字符串ID轉換為UUID
-        uuid_ids = []
-        for doc_id in document_ids:
-            try:
-                uuid_ids.append(uuid.UUID(doc_id))
-            except ValueError:
-                logger.warning(f"無效的文檔ID格式: {doc_id}")
-                continue
-        
-        if not uuid_ids:
+    owner_uuid: Optional[uuid.UUID] = None
+    if owner_id:
+        try:
+            owner_uuid = owner_id if isinstance(owner_id, uuid.UUID) else uuid.UUID(str(owner_id))
+        except ValueError:
+            logger.warning(f"無效的用戶ID格式: {owner_id}")
             return []
-        
-        # 查詢資料庫
-        documents = await db[DOCUMENT_COLLECTION].find({"_id": {"$in": uuid_ids}}).to_list(length=None)
-        
-        # 轉換為Document模型
-        result_documents = []
-        for doc_data in documents:
-            try:
-                document = Document(**doc_data)
-                result_documents.append(document)
-            except Exception as e:
-                logger.warning(f"轉換文檔模型失敗: {e}")
-                continue
-        
-        return result_documents
-        
+
+    # 查詢結果是按 _id 的索引，共享同一次查詢的調用者各自按自己的請求順序取出
+    flight_key = ":".join([
+        str(getattr(db, 'name', '')),
+        str(owner_uuid or ''),
+        ",".join(sorted(projection)) if projection else '',
+        ",".join(sorted(str(doc_id) for doc_id in uuid_ids))
+    ])
+    documents_by_id = await flight.do(
+        flight_key,
+        lambda: _fetch_documents_by_ids(db, uuid_ids, model, projection, owner_uuid)
+    )
+    return [documents_by_id[doc_id] for doc_id in uuid_ids if doc_id in documents_by_id]
+
+
+async def _fetch_documents_by_ids(
+    db: AsyncIOMotorDatabase,
+    uuid_ids: List[uuid.UUID],
+    model: Any = Document,
+    projection: Optional[Dict[str, Any]] = None,
+    owner_id: Optional[uuid.UUID] = None
+) -> Dict[uuid.UUID, Any]:
+    """一次 $in 查詢，返回 _id -> 模型的索引"""
+    query: Dict[str, Any] = {"_id": {"$in": uuid_ids}}
+    if owner_id is not None:
+        query["owner_id"] = owner_id
+    try:
+        # 完整文檔不讀取搜索用的 n-gram 陣列
+        documents = await db[DOCUMENT_COLLECTION].find(query, projection or SEARCH_FIELDS_EXCLUSION).to_list(length=None)
     except Exception as e:
         logger.error(f"批量獲取文檔失敗: {e}")
-        return []
+        return {}
+
+    documents_by_id: Dict[uuid.UUID, Any] = {}
+    for doc_data in documents:
+        try:
+            documents_by_id[doc_data["_id"]] = model(**doc_data)
+        except Exception as e:
+            logger.warning(f"轉換文檔模型失敗: {e}")
+    return documents_by_id
 
 # 更多專用更新函數可以按需添加，例如：
 async def update_document_status(
@@ -457,7 +821,18 @@ async def set_document_analysis(
     #    update_payload["analyzed_content_type"] = analyzed_content_type_str
     update_payload["analyzed_content_type"] = analyzed_content_type_str
 
-    return await update_document(db, document_id, update_payload)
+    updated_document = await update_document(db, document_id, update_payload)
+    if updated_document:
+        # 增量更新所屬用戶的動態欄位目錄（延遲導入，避免 crud 與服務層循環依賴）
+        from ..services.document.field_catalog_service import field_catalog_service
+        await field_catalog_service.record_document_fields(
+            db,
+            document_id,
+            current_doc.owner_id,
+            analysis_data_dict,
+            previous_paths=(raw_doc_check or {}).get("catalog_field_paths") or []
+        )
+    return updated_document
 
 # count_documents 函數已在第151行定義,此處刪除重複定義
 
@@ -0,0 +1,103 @@
+"""
+補建文檔內容指紋
+
+內容去重上線前的文檔沒有 content_sha256，無法被新上傳命中。這裡按 _id 分批讀取
+磁盤上的文件計算指紋（上傳文件按文件字節；Gmail 郵件按正規化正文，與導入時一致）。
+文件不存在的文檔跳過。可以重複執行，只處理缺少指紋的文檔：
+
+    python -m app.db.backfill_content_hashes
+    python -m app.db.backfill_content_hashes --owner-id <用戶 UUID> --dry-run
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from app.core.config import settings
+from app.crud.crud_documents import DOCUMENT_COLLECTION
+from app.models.email_models import EmailSource
+from app.services.document.email_document_processor import normalize_email_body
+
+
+def file_content_sha256(raw: Dict[str, Any]) -> Optional[str]:
+    """按導入方式計算指紋；文件不存在或不可讀時返回 None"""
+    file_path = Path(raw.get("file_path") or "")
+    if not raw.get("file_path") or not file_path.is_file():
+        return None
+    try:
+        if raw.get("email_source") == EmailSource.GMAIL.value:
+            body = file_path.read_text(encoding="utf-8")
+            return hashlib.sha256(normalize_email_body(body).encode("utf-8")).hexdigest()
+        digest = hashlib.sha256()
+        with file_path.open("rb") as handle:
+            while chunk := handle.read(settings.UPLOAD_CHUNK_SIZE_BYTES):
+                digest.update(chunk)
+        return digest.hexdigest()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+async def backfill_content_hashes(
+    db: AsyncIOMotorDatabase,
+    owner_id: Optional[uuid.UUID] = None,
+    batch_size: int = 200,
+    dry_run: bool = False
+) -> Dict[str, int]:
+    query: Dict[str, Any] = {"content_sha256": None}
+    if owner_id is not None:
+        query["owner_id"] = owner_id
+    projection = {"file_path": 1, "email_source": 1}
+    counts = {"scanned": 0, "updated": 0, "missing_file": 0}
+    last_id = None
+
+    while True:
+        batch_query = query if last_id is None else {**query, "_id": {"$gt": last_id}}
+        batch = await db[DOCUMENT_COLLECTION].find(batch_query, projection=projection).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        operations = []
+        for raw in batch:
+            counts["scanned"] += 1
+            content_sha256 = await asyncio.to_thread(file_content_sha256, raw)
+            if content_sha256 is None:
+                counts["missing_file"] += 1
+                continue
+            operations.append(UpdateOne({"_id": raw["_id"]}, {"$set": {"content_sha256": content_sha256}}))
+        if operations and not dry_run:
+            await db[DOCUMENT_COLLECTION].bulk_write(operations, ordered=False)
+        counts["updated"] += len(operations)
+        print(f"已掃描 {counts['scanned']}，{'可' if dry_run else '已'}更新 {counts['updated']}")
+
+    return counts
+
+
+async def run_backfill(owner_id: Optional[uuid.UUID], batch_size: int, dry_run: bool):
+    client = AsyncIOMotorClient(settings.MONGODB_URL, uuidRepresentation='standard')
+    try:
+        return await backfill_content_hashes(client[settings.DB_NAME], owner_id=owner_id, batch_size=batch_size, dry_run=dry_run)
+    finally:
+        client.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="為已有文檔補建內容指紋（content_sha256）")
+    parser.add_argument("--owner-id", type=uuid.UUID, default=None, help="只處理指定用戶的文檔")
+    parser.add_argument("--batch-size", type=int, default=200, help="每批處理的文檔數")
+    parser.add_argument("--dry-run", action="store_true", help="只統計，不寫入")
+    args = parser.parse_args(argv)
+
+    counts = asyncio.run(run_backfill(args.owner_id, args.batch_size, args.dry_run))
+    print(json.dumps(counts, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+文檔列表搜索基準測試
+
+在獨立的資料庫中生成一個大租戶（預設 100k 文檔，另有 10% 其他用戶的文檔），
+對同一組查詢詞比較三條路徑的列表頁（20 條）+ 精確總數的耗時與 explain 的掃描量：
+
+- regex：原來的 filename_contains 非錨定不區分大小寫正則
+- prefilter：DOCUMENT_SEARCH_FILENAME_PREFILTER 開啟後的 n-gram 預過濾 + 正則複核（結果應與 regex 相同）
+- search：q 參數的 n-gram 搜索（文件名、標籤與摘要）按相關度排序
+
+    python -m app.db.benchmark_document_search --documents 100000 --repeat 20
+    python -m app.db.benchmark_document_search --skip-seed --keep
+
+需要可寫的 MongoDB；預設使用 "<DB_NAME>_search_benchmark" 資料庫，結束後刪除（--keep 保留）。
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, UTC
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+
+from app.core.config import settings
+from app.crud import crud_documents
+from app.crud.crud_document_search import build_search_terms
+from app.db.db_init import DOCUMENT_OWNER_INDEXES
+
+_CJK_WORDS = [
+    "電費", "水費", "帳單", "發票", "收據", "保險", "合約", "報告", "會議記錄", "旅遊", "行程",
+    "醫療", "診所", "稅務", "申報", "薪資", "明細", "租賃", "貸款", "信用卡", "訂單", "報價單",
+]
+_LATIN_WORDS = ["invoice", "report", "contract", "receipt", "statement", "meeting", "travel", "scan", "draft", "final"]
+_TAGS = ["工作", "家庭", "財務", "醫療", "旅遊", "重要", "待辦", "2023", "2024", "archive"]
+_RARE_WORD = "稀有關鍵字"
+
+# 常見詞、中等頻率詞、複合詞、英文子串、數字與稀有詞
+DEFAULT_QUERIES = ["帳單", "會議記錄", "信用卡帳單", "report", "port", "2023", _RARE_WORD]
+
+
+def _synthetic_document(owner_id: uuid.UUID, index: int, rng: random.Random, base_time: datetime) -> Dict[str, Any]:
+    cjk = rng.sample(_CJK_WORDS, 2)
+    latin = rng.choice(_LATIN_WORDS)
+    year = rng.choice(["2021", "2022", "2023", "2024"])
+    rare = _RARE_WORD if index % 5000 == 0 else ""
+    filename = f"{year}_{cjk[0]}{cjk[1]}{rare}_{latin}_{index:06d}.pdf"
+    summary = f"這是一份關於{cjk[0]}與{rng.choice(_CJK_WORDS)}的文件，包含{rng.choice(_CJK_WORDS)}相關資訊。"
+    created_at = base_time - timedelta(minutes=index)
+    raw = {
+        "_id": uuid.uuid4(),
+        "owner_id": owner_id,
+        "filename": filename,
+        "file_type": "application/pdf",
+        "size": rng.randint(10_000, 5_000_000),
+        "tags": rng.sample(_TAGS, rng.randint(0, 3)),
+        "status": "analysis_completed",
+        "vector_status": "vectorized",
+        "created_at": created_at,
+        "updated_at": created_at,
+        "analysis": {"ai_analysis_output": {"key_information": {"content_summary": summary}}},
+    }
+    raw.update(build_search_terms(raw))
+    return raw
+
+
+async def seed_documents(db: AsyncIOMotorDatabase, owner_id: uuid.UUID, count: int, batch_size: int = 5000):
+    """生成目標租戶的文檔與 10% 其他用戶的文檔，並創建生產環境相同的索引"""
+    rng = random.Random(42)
+    base_time = datetime.now(UTC)
+    other_owners = [uuid.uuid4() for _ in range(10)]
+    total = count + count // 10
+    for start in range(0, total, batch_size):
+        batch = [
+            _synthetic_document(owner_id if index < count else rng.choice(other_owners), index, rng, base_time)
+            for index in range(start, min(start + batch_size, total))
+        ]
+        await db[crud_documents.DOCUMENT_COLLECTION].insert_many(batch, ordered=False)
+    await db[crud_documents.DOCUMENT_COLLECTION].create_index("filename")
+    await db[crud_documents.DOCUMENT_COLLECTION].create_indexes(DOCUMENT_OWNER_INDEXES)
+
+
+@contextmanager
+def _filename_prefilter(enabled: bool):
+    previous = settings.DOCUMENT_SEARCH_FILENAME_PREFILTER
+    settings.DOCUMENT_SEARCH_FILENAME_PREFILTER = enabled
+    try:
+        yield
+    finally:
+        settings.DOCUMENT_SEARCH_FILENAME_PREFILTER = previous
+
+
+async def _time_runs(run: Callable[[], Awaitable[Any]], repeat: int) -> Dict[str, Any]:
+    await run()  # 預熱
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await run()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "median_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        "result": result,
+    }
+
+
+async def _explain(db: AsyncIOMotorDatabase, query: Dict[str, Any], sort: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    command: Dict[str, Any] = {"find": crud_documents.DOCUMENT_COLLECTION, "filter": query, "limit": 20}
+    if sort:
+        command["sort"] = sort
+    output = await db.command({"explain": command, "verbosity": "executionStats"})
+    stats = output.get("executionStats") or {}
+    return {"keys_examined": stats.get("totalKeysExamined"), "docs_examined": stats.get("totalDocsExamined")}
+
+
+async def benchmark_query(db: AsyncIOMotorDatabase, owner_id: uuid.UUID, text: str, repeat: int) -> Dict[str, Any]:
+    """對一個查詢詞測量三條路徑：列表頁 + 精確總數"""
+
+    def filename_page():
+        async def run():
+            items = await crud_documents.get_document_summaries(db, owner_id=owner_id, limit=20, filename_contains=text)
+            total = await crud_documents.count_documents(db, owner_id=owner_id, filename_contains=text)
+            return len(items), total
+        return run
+
+    async def search_page():
+        items = await crud_documents.get_document_summaries(
+            db, owner_id=owner_id, limit=20, search=text, sort_by=crud_documents.RELEVANCE_SORT
+        )
+        total = await crud_documents.count_documents(db, owner_id=owner_id, search=text)
+        return len(items), total
+
+    result: Dict[str, Any] = {"query": text}
+    for name, prefilter in (("regex", False), ("prefilter", True)):
+        with _filename_prefilter(prefilter):
+            timing = await _time_runs(filename_page(), repeat)
+            query = crud_documents._build_document_filter_query(owner_id=owner_id, filename_contains=text)
+            result[name] = {
+                "median_ms": timing["median_ms"],
+                "p95_ms": timing["p95_ms"],
+                "total": timing["result"][1],
+                **await _explain(db, query, {"created_at": -1}),
+            }
+
+    timing = await _time_runs(search_page, repeat)
+    query = crud_documents._build_document_filter_query(owner_id=owner_id, search=text)
+    result["search"] = {
+        "median_ms": timing["median_ms"],
+        "p95_ms": timing["p95_ms"],
+        "total": timing["result"][1],
+        **await _explain(db, query, None),
+    }
+    # 預過濾只縮小範圍，結果必須與正則一致
+    result["prefilter_matches_regex"] = result["prefilter"]["total"] == result["regex"]["total"]
+    return result
+
+
+async def run_benchmark(
+    documents: int,
+    repeat: int,
+    db_name: str,
+    queries: List[str],
+    skip_seed: bool,
+    keep: bool
+) -> Dict[str, Any]:
+    client = AsyncIOMotorClient(settings.MONGODB_URL, uuidRepresentation='standard')
+    db = client[db_name]
+    try:
+        if skip_seed:
+            sample = await db[crud_documents.DOCUMENT_COLLECTION].find_one({}, projection={"owner_id": 1})
+            if not sample:
+                raise RuntimeError(f"資料庫 {db_name} 中沒有可用的基準數據，請去掉 --skip-seed")
+            owner_id = sample["owner_id"]
+        else:
+            await db.drop_collection(crud_documents.DOCUMENT_COLLECTION)
+            owner_id = uuid.uuid4()
+            seed_started = time.perf_counter()
+            await seed_documents(db, owner_id, documents)
+            print(f"已生成 {documents} 份文檔，耗時 {time.perf_counter() - seed_started:.1f}s")
+
+        results = [await benchmark_query(db, owner_id, text, repeat) for text in queries]
+        return {"documents": documents, "repeat": repeat, "results": results}
+    finally:
+        if not keep:
+            await client.drop_database(db_name)
+        client.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="比較正則文件名過濾與 n-gram 搜索的列表查詢性能")
+    parser.add_argument("--documents", type=int, default=100_000, help="目標租戶的文檔數")
+    parser.add_argument("--repeat", type=int, default=20, help="每條路徑的重複次數")
+    parser.add_argument("--db", default=f"{settings.DB_NAME}_search_benchmark", help="基準測試使用的資料庫")
+    parser.add_argument("--query", action="append", dest="queries", help="查詢詞（可重複，預設使用內置查詢）")
+    parser.add_argument("--skip-seed", action="store_true", help="使用已有的基準數據")
+    parser.add_argument("--keep", action="store_true", help="結束後保留基準資料庫")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_benchmark(
+        args.documents, args.repeat, args.db, args.queries or DEFAULT_QUERIES, args.skip_seed, args.keep
+    ))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,34 @@
 import logging
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from pymongo import ASCENDING, DESCENDING
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
 logger = logging.getLogger(__name__)
 
+# 以 owner_id 為前綴的複合索引，對應 _build_document_filter_query 構建的實際查詢形態
+# （列表、計數、聚類待分類掃描、向量狀態掃描）；排序欄位放在相等條件之後，避免內存排序。
+# 查詢形態與這些索引的匹配情況可通過 app.db.index_advisor 的 explain() 檢查。
+DOCUMENT_OWNER_INDEXES = [
+    # 預設列表與按時間排序的分頁
+    IndexModel([("owner_id", ASCENDING), ("created_at", DESCENDING)], name="owner_created_at"),
+    IndexModel([("owner_id", ASCENDING), ("updated_at", DESCENDING)], name="owner_updated_at"),
+    # 按文件名排序或過濾
+    IndexModel([("owner_id", ASCENDING), ("filename", ASCENDING)], name="owner_filename"),
+    # 按處理狀態過濾的列表與計數（含處理未完成 / 重試失敗文檔的掃描）
+    IndexModel([("owner_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)], name="owner_status_created_at"),
+    # 按聚類過濾的列表與計數
+    IndexModel([("owner_id", ASCENDING), ("cluster_info.cluster_id", ASCENDING), ("created_at", DESCENDING)], name="owner_cluster_created_at"),
+    # 聚類狀態掃描（pending 包含欄位不存在 / null，兩者都落在索引的 null 鍵上）
+    IndexModel([("owner_id", ASCENDING), ("clustering_status", ASCENDING), ("created_at", DESCENDING)], name="owner_clustering_status_created_at"),
+    # 向量化狀態掃描
+    IndexModel([("owner_id", ASCENDING), ("vector_status", ASCENDING), ("created_at", DESCENDING)], name="owner_vector_status_created_at"),
+    # 按標籤過濾（多鍵）
+    IndexModel([("owner_id", ASCENDING), ("tags", ASCENDING), ("created_at", DESCENDING)], name="owner_tags_created_at"),
+    # 列表搜索與 filename_contains 預過濾（文件名、標籤與摘要的 n-gram，多鍵）
+    IndexModel([("owner_id", ASCENDING), ("search_terms", ASCENDING)], name="owner_search_terms"),
+    # 上傳 / 導入時的內容去重（同一內容優先取最早的文檔）
+    IndexModel([("owner_id", ASCENDING), ("content_sha256", ASCENDING), ("created_at", ASCENDING)], name="owner_content_sha256_created_at"),
+]
+
 async def create_database_indexes(db: AsyncIOMotorDatabase):
     """
     在資料庫中為指定集合創建索引。
@@ -38,8 +63,13 @@ async def create_database_indexes(db: AsyncIOMotorDatabase):
         await db.documents.create_index("tags")
         # filename: 按文件名查詢，可考慮文本索引以支援更複雜的文本搜索
         await db.documents.create_index("filename")
-        # 可選的文本索引 (如果需要更強大的全文搜索功能)
-        # await db.documents.create_index([("filename", "text"), ("extracted_text", "text")], name="document_text_search")
+        # 全文搜索不使用 $text 索引（不支持中文分詞），改用 search_terms 的 n-gram 索引（見 owner_search_terms）
+        # 以 owner_id 為前綴的複合索引（所有用戶查詢都以 owner_id 開頭）
+        await db.documents.create_indexes(DOCUMENT_OWNER_INDEXES)
+
+        # Clusters collection
+        # owner_id: 列出與統計用戶的聚類
+        await db.clusters.create_index("owner_id")
 
 
         # Logs collection
@@ -0,0 +1,281 @@
+"""
+索引顧問
+
+對已登記的查詢形態（與 CRUD / API 實際構建的查詢一致）執行 explain()，
+標記使用 COLLSCAN（全集合掃描）或內存排序（SORT 階段）的形態。
+可在啟動時執行（DB_INDEX_ADVISOR_ON_STARTUP）或通過系統 API 按需執行。
+"""
+
+import logging
+import uuid
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.logging_utils import AppLogger
+from app.crud.crud_documents import DOCUMENT_COLLECTION, _build_document_filter_query
+from app.models.document_models import DocumentStatus, VectorStatus
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+# 執行計劃樹中可能包含子階段的鍵（經典引擎與 SBE 的 queryPlan 格式）
+_CHILD_STAGE_KEYS = ("inputStage", "innerStage", "outerStage", "thenStage", "elseStage", "queryPlan")
+
+
+@dataclass(frozen=True)
+class QueryShape:
+    """一個需要索引支撐的查詢形態"""
+    name: str
+    collection: str
+    build_filter: Callable[[Any], Dict[str, Any]]  # owner_id -> 查詢條件
+    operation: str = "find"  # find | count
+    sort: Optional[Tuple[Tuple[str, int], ...]] = None
+    limit: Optional[int] = None
+    description: str = ""
+
+
+def _collect_stages(plan: Any, stages: List[Dict[str, Any]]):
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        stages.append(plan)
+    for key in _CHILD_STAGE_KEYS:
+        _collect_stages(plan.get(key), stages)
+    for child in plan.get("inputStages") or []:
+        _collect_stages(child, stages)
+
+
+def analyze_explain(explain_output: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    解析 explain() 的 queryPlanner 輸出
+
+    Returns:
+        stages（階段名稱）、indexes（使用的索引名）、collscan、in_memory_sort
+    """
+    query_planner = explain_output.get("queryPlanner") or {}
+    winning_plans = [query_planner.get("winningPlan") or {}]
+    # 分片集群的計劃按分片列出
+    for shard in winning_plans[0].get("shards") or []:
+        winning_plans.append(shard.get("winningPlan") or {})
+
+    stages: List[Dict[str, Any]] = []
+    for plan in winning_plans:
+        _collect_stages(plan, stages)
+
+    stage_names = [stage["stage"] for stage in stages]
+    indexes = sorted({stage["indexName"] for stage in stages if stage.get("indexName")})
+    return {
+        "stages": stage_names,
+        "indexes": indexes,
+        "collscan": "COLLSCAN" in stage_names,
+        "in_memory_sort": any(name in ("SORT", "SORT_KEY_GENERATOR") for name in stage_names)
+    }
+
+
+def _default_query_shapes() -> List[QueryShape]:
+    """文檔相關的實際查詢形態"""
+    recent_first = (("created_at", -1),)
+    unprocessed = [DocumentStatus.UPLOADED, DocumentStatus.PENDING_EXTRACTION, DocumentStatus.PENDING_ANALYSIS]
+    failed = [DocumentStatus.EXTRACTION_FAILED, DocumentStatus.ANALYSIS_FAILED, DocumentStatus.PROCESSING_ERROR]
+    return [
+        QueryShape(
+            name="documents.list",
+            collection=DOCUMENT_COLLECTION,
+            build_filter=lambda owner_id: _build_document_filter_query(owner_id=owner_id),
+            sort=recent_first, limit=20,
+            description="文檔列表（按創建時間）"
+        ),
+        QueryShape(
+            name="documents.list_by_updated",
+            collection=DOCUMENT_COLLECTION,
+            build_filter=lambda owner_id: _build_document_filter_query(owner_id=owner_id),
+            sort=(("updated_at", -1),), limit=20,
+            description="文檔列表（按更新時間）"
+        ),
+        QueryShape(
+            name="documents.list_by_filename",
+            collection=DOCUMENT_COLLECTION,
+            build_filter=lambda owner_id: _build_document_filter_query(owner_id=owner_id),
+            sort=(("filename", 1),), limit=20,
+            description="文檔列表（按文件名）"
+        ),
+        QueryShape(
+            name="documents.count",
+            collection=DOCUMENT_COLLECTION,
+            build_filter=lambda owner_id: _build_document_filter_query(owner_id=owner_id),
+            operation="count",
+            description="文檔總數"
+        ),
+        QueryShape(
+            name="documents.list_by_status",
+            collection=DOCUMENT_COLLECTION,
+            build_filter=lambda owner_id: _build_document_filter_query(owner_id=owner_id, status_in=unprocessed),
+            sort=recent_first, limit=1000,
+            description="待處理文檔掃描"
+        ),
+        QueryShape(
+            name="documents.count_by_status",
+            collection=DOCUMENT_COLLECTION,
+            build_filter=lambda owner_id: _build_document_filter_query(owner_id=owner_id, status_in=failed),
+            operation="count",
+            description="按狀態計數"
+        ),
+        QueryShape(
+            name="documents.list_by_cluster",
+            collection=DOCUMENT_COLLECTION,
+            build_filter=lambda owner_id: _build_document_filter_query(owner_id=owner_id, cluster_id="cluster"),
+            sort=recent_first, limit=20,
+            description="聚類內文檔列表"
+        ),
+        QueryShape(
+            name="documents.list_by_tag",
+            collection=DOCUMENT_COLLECTION,
+            build_filter=lambda owner_id: _build_document_filter_query(owner_id=owner_id, tags_include=["tag"]),
+            sort=recent_first, limit=20,
+            description="按標籤過濾的文檔列表"
+        ),
+        QueryShape(
+            name="documents.search",
+            collection=DOCUMENT_COLLECTION,
+            build_filter=lambda owner_id: _build_document_filter_query(owner_id=owner_id, search="電費帳單"),
+            limit=20,
+            description="文檔列表搜索（n-gram）"
+        ),
+        QueryShape(
+            name="documents.content_duplicate",
+            collection=DOCUMENT_COLLECTION,
+            build_filter=lambda owner_id: {"owner_id": owner_id, "content_sha256": "0" * 64},
+            sort=(("created_at", 1),), limit=5,
+            description="上傳 / 導入時的內容去重"
+        ),
+        QueryShape(
+            name="documents.clustering_pending",
+            collection=DOCUMENT_COLLECTION,
+            build_filter=lambda owner_id: _build_document_filter_query(owner_id=owner_id, clustering_status="pending"),
+            sort=recent_first, limit=20,
+            description="待分類文檔列表"
+        ),
+        QueryShape(
+            name="documents.clustering_pending_enriched",
+            collection=DOCUMENT_COLLECTION,
+            build_filter=lambda owner_id: {
+                "owner_id": owner_id, "clustering_status": "pending", "enriched_data": {"$ne": None}
+            },
+            description="聚類服務的待分類文檔掃描"
+        ),
+        QueryShape(
+            name="documents.count_by_clustering_status",
+            collection=DOCUMENT_COLLECTION,
+            build_filter=lambda owner_id: {"owner_id": owner_id, "clustering_status": "clustered"},
+            operation="count",
+            description="聚類統計"
+        ),
+        QueryShape(
+            name="documents.vector_status_scan",
+            collection=DOCUMENT_COLLECTION,
+            build_filter=lambda owner_id: {
+                "owner_id": owner_id,
+                "vector_status": {"$in": [VectorStatus.NOT_VECTORIZED.value, VectorStatus.FAILED.value]}
+            },
+            sort=recent_first, limit=100,
+            description="未向量化 / 向量化失敗文檔掃描"
+        ),
+        QueryShape(
+            name="clusters.count",
+            collection="clusters",
+            build_filter=lambda owner_id: {"owner_id": owner_id},
+            operation="count",
+            description="用戶聚類數"
+        ),
+    ]
+
+
+class IndexAdvisor:
+    """對登記的查詢形態執行 explain() 並標記全集合掃描與內存排序"""
+
+    def __init__(self):
+        self._shapes: Dict[str, QueryShape] = {}
+
+    def register(self, shape: QueryShape):
+        self._shapes[shape.name] = shape
+
+    @property
+    def shapes(self) -> List[QueryShape]:
+        return list(self._shapes.values())
+
+    @staticmethod
+    def _explain_command(shape: QueryShape, owner_id: Any) -> Dict[str, Any]:
+        query_filter = shape.build_filter(owner_id)
+        if shape.operation == "count":
+            command: Dict[str, Any] = {"count": shape.collection, "query": query_filter}
+        else:
+            command = {"find": shape.collection, "filter": query_filter}
+            if shape.sort:
+                command["sort"] = dict(shape.sort)
+            if shape.limit:
+                command["limit"] = shape.limit
+        return {"explain": command, "verbosity": "queryPlanner"}
+
+    async def explain_shape(self, db: AsyncIOMotorDatabase, shape: QueryShape, owner_id: Any) -> Dict[str, Any]:
+        """對單個查詢形態執行 explain()，失敗時返回錯誤而不拋出"""
+        advice: Dict[str, Any] = {
+            "shape": shape.name,
+            "collection": shape.collection,
+            "operation": shape.operation,
+            "description": shape.description
+        }
+        try:
+            explain_output = await db.command(self._explain_command(shape, owner_id))
+        except Exception as e:
+            advice.update({"error": str(e), "problems": []})
+            return advice
+
+        advice.update(analyze_explain(explain_output))
+        problems = []
+        if advice["collscan"]:
+            problems.append("COLLSCAN")
+        if advice["in_memory_sort"]:
+            problems.append("IN_MEMORY_SORT")
+        advice["problems"] = problems
+        return advice
+
+    async def run(self, db: AsyncIOMotorDatabase, owner_id: Any = None) -> Dict[str, Any]:
+        """
+        檢查所有登記的查詢形態
+
+        Args:
+            owner_id: 用於構建查詢條件的用戶 ID；未提供時取任一文檔的 owner_id
+        """
+        if owner_id is None:
+            sample = await db[DOCUMENT_COLLECTION].find_one({}, projection={"owner_id": 1})
+            owner_id = (sample or {}).get("owner_id") or uuid.uuid4()
+
+        results = [await self.explain_shape(db, shape, owner_id) for shape in self.shapes]
+        flagged = [result for result in results if result["problems"]]
+        return {
+            "checked": len(results),
+            "flagged": len(flagged),
+            "errors": sum(1 for result in results if "error" in result),
+            "shapes": results
+        }
+
+    async def log_report(self, db: AsyncIOMotorDatabase) -> Dict[str, Any]:
+        """執行檢查並把有問題的查詢形態寫入日誌（啟動時使用）"""
+        report = await self.run(db)
+        for result in report["shapes"]:
+            if result["problems"]:
+                logger.warning(
+                    f"查詢形態 {result['shape']} ({result['collection']}) 存在 {', '.join(result['problems'])}，"
+                    f"執行階段: {' <- '.join(result['stages'])}"
+                )
+            elif "error" in result:
+                logger.warning(f"無法 explain 查詢形態 {result['shape']}: {result['error']}")
+        logger.info(f"索引顧問檢查完成: {report['checked']} 個查詢形態，{report['flagged']} 個需要索引")
+        return report
+
+
+# 全局實例
+index_advisor = IndexAdvisor()
+for _shape in _default_query_shapes():
+    index_advisor.register(_shape)
@@ -0,0 +1,199 @@
+"""
+文檔內容外置遷移
+
+把已有文檔中的 extracted_text 與 analysis.ai_analysis_output 的大型中間結果
+移到 document_contents（按 DOCUMENT_CONTENT_COMPRESSION 壓縮），或反向遷回。
+遷移按 _id 分批進行，可以中斷後重新執行：
+
+    python -m app.db.migrate_document_contents --batch-size 200
+    python -m app.db.migrate_document_contents --dry-run
+    python -m app.db.migrate_document_contents --reverse
+
+正向遷移先寫入 document_contents 再從 documents 移除欄位，中斷時最多留下重複內容。
+遷移前後應保持 DOCUMENT_CONTENT_STORE_ENABLED 與遷移方向一致。
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from app.core.config import settings
+from app.core.logging_utils import AppLogger
+from app.crud.crud_document_contents import (
+    CONTENT_MARKER_FIELD,
+    DOCUMENT_CONTENTS_COLLECTION,
+    EXTERNAL_ANALYSIS_KEYS,
+    build_content_update,
+    load_document_content,
+)
+from app.crud.crud_documents import DOCUMENT_COLLECTION
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+_OUTPUT_PATH = "analysis.ai_analysis_output"
+
+# 需要遷移的欄位（documents 中的路徑）
+HEAVY_FIELD_PATHS = ["extracted_text"] + [f"{_OUTPUT_PATH}.{key}" for key in EXTERNAL_ANALYSIS_KEYS]
+
+
+@dataclass
+class MigrationStats:
+    """遷移統計"""
+    scanned: int = 0
+    migrated: int = 0
+    skipped: int = 0
+    inline_bytes: int = 0  # 移出 / 移回 documents 的內容大小（JSON 編碼後的估算值）
+
+
+def _heavy_fields_query() -> Dict[str, Any]:
+    return {"$or": [{path: {"$exists": True, "$ne": None}} for path in HEAVY_FIELD_PATHS]}
+
+
+def _estimate_size(value: Any) -> int:
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+def extract_heavy_content(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """從原始文檔中取出要外置的內容（格式與 split_heavy_fields 一致，分析部分按鍵合併）"""
+    content: Dict[str, Any] = {}
+    if raw.get("extracted_text") is not None:
+        content["extracted_text"] = raw["extracted_text"]
+    output = (raw.get("analysis") or {}).get("ai_analysis_output")
+    if isinstance(output, dict):
+        extras = {key: output[key] for key in EXTERNAL_ANALYSIS_KEYS if output.get(key) is not None}
+        if extras:
+            content["analysis_extras_partial"] = extras
+    return content
+
+
+async def _next_batch(
+    db: AsyncIOMotorDatabase,
+    query: Dict[str, Any],
+    projection: Dict[str, Any],
+    last_id: Any,
+    batch_size: int
+) -> List[Dict[str, Any]]:
+    batch_query = {"$and": [query, {"_id": {"$gt": last_id}}]} if last_id is not None else query
+    cursor = db[DOCUMENT_COLLECTION].find(batch_query, projection=projection).sort("_id", 1).limit(batch_size)
+    return await cursor.to_list(length=batch_size)
+
+
+async def externalize_documents(
+    db: AsyncIOMotorDatabase,
+    batch_size: int = 200,
+    dry_run: bool = False
+) -> MigrationStats:
+    """把 documents 中的大型欄位移到 document_contents"""
+    stats = MigrationStats()
+    projection = {path: 1 for path in HEAVY_FIELD_PATHS}
+    last_id = None
+
+    while True:
+        batch = await _next_batch(db, _heavy_fields_query(), projection, last_id, batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        content_ops: List[UpdateOne] = []
+        document_ops: List[UpdateOne] = []
+        for raw in batch:
+            stats.scanned += 1
+            content = extract_heavy_content(raw)
+            if not content:
+                stats.skipped += 1
+                continue
+            stats.migrated += 1
+            stats.inline_bytes += _estimate_size(content)
+            content_ops.append(UpdateOne({"_id": raw["_id"]}, build_content_update(content), upsert=True))
+            document_ops.append(UpdateOne(
+                {"_id": raw["_id"]},
+                {"$set": {CONTENT_MARKER_FIELD: True}, "$unset": {path: "" for path in HEAVY_FIELD_PATHS}}
+            ))
+
+        if not dry_run and content_ops:
+            # 先寫內容再移除欄位，中斷時文檔仍保留完整內容
+            await db[DOCUMENT_CONTENTS_COLLECTION].bulk_write(content_ops, ordered=False)
+            await db[DOCUMENT_COLLECTION].bulk_write(document_ops, ordered=False)
+        logger.info(f"外置遷移進度: 已掃描 {stats.scanned}，已遷移 {stats.migrated}{'（試運行）' if dry_run else ''}")
+
+    return stats
+
+
+def _restore_update(raw: Dict[str, Any], content: Dict[str, Any]) -> Dict[str, Any]:
+    """構建遷回 documents 的 $set（內嵌值優先，只補回缺失的欄位）"""
+    set_fields: Dict[str, Any] = {CONTENT_MARKER_FIELD: False}
+    if raw.get("extracted_text") is None and content.get("extracted_text") is not None:
+        set_fields["extracted_text"] = content["extracted_text"]
+    output = (raw.get("analysis") or {}).get("ai_analysis_output")
+    if isinstance(output, dict):
+        for key, value in (content.get("analysis_extras") or {}).items():
+            if output.get(key) is None and value is not None:
+                set_fields[f"{_OUTPUT_PATH}.{key}"] = value
+    return set_fields
+
+
+async def internalize_documents(
+    db: AsyncIOMotorDatabase,
+    batch_size: int = 200,
+    dry_run: bool = False
+) -> MigrationStats:
+    """把 document_contents 中的內容遷回 documents（回滾外置）"""
+    stats = MigrationStats()
+    projection = {CONTENT_MARKER_FIELD: 1, "extracted_text": 1, _OUTPUT_PATH: 1}
+    last_id = None
+
+    while True:
+        batch = await _next_batch(db, {CONTENT_MARKER_FIELD: True}, projection, last_id, batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        document_ops: List[UpdateOne] = []
+        restored_ids: List[Any] = []
+        for raw in batch:
+            stats.scanned += 1
+            content = await load_document_content(db, raw["_id"]) or {}
+            set_fields = _restore_update(raw, content)
+            stats.migrated += 1
+            stats.inline_bytes += _estimate_size({key: value for key, value in set_fields.items() if key != CONTENT_MARKER_FIELD})
+            document_ops.append(UpdateOne({"_id": raw["_id"]}, {"$set": set_fields}))
+            restored_ids.append(raw["_id"])
+
+        if not dry_run and document_ops:
+            await db[DOCUMENT_COLLECTION].bulk_write(document_ops, ordered=False)
+            await db[DOCUMENT_CONTENTS_COLLECTION].delete_many({"_id": {"$in": restored_ids}})
+        logger.info(f"內嵌遷移進度: 已掃描 {stats.scanned}，已遷回 {stats.migrated}{'（試運行）' if dry_run else ''}")
+
+    return stats
+
+
+async def run_migration(batch_size: int, dry_run: bool, reverse: bool) -> MigrationStats:
+    client = AsyncIOMotorClient(settings.MONGODB_URL, uuidRepresentation='standard')
+    try:
+        db = client[settings.DB_NAME]
+        if reverse:
+            return await internalize_documents(db, batch_size=batch_size, dry_run=dry_run)
+        return await externalize_documents(db, batch_size=batch_size, dry_run=dry_run)
+    finally:
+        client.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="把文檔的提取文本與分析中間結果遷移到 document_contents")
+    parser.add_argument("--batch-size", type=int, default=200, help="每批處理的文檔數")
+    parser.add_argument("--dry-run", action="store_true", help="只統計，不修改數據")
+    parser.add_argument("--reverse", action="store_true", help="把內容遷回 documents")
+    args = parser.parse_args(argv)
+
+    stats = asyncio.run(run_migration(args.batch_size, args.dry_run, args.reverse))
+    print(json.dumps(asdict(stats), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
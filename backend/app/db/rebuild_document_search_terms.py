@@ -0,0 +1,42 @@
+"""
+補建文檔搜索欄位
+
+為 n-gram 搜索上線前已存在的文檔計算 search_terms / search_title_terms，
+完成後可開啟 DOCUMENT_SEARCH_FILENAME_PREFILTER。可以重複執行，未變化的文檔不寫入：
+
+    python -m app.db.rebuild_document_search_terms
+    python -m app.db.rebuild_document_search_terms --owner-id <用戶 UUID> --batch-size 1000
+"""
+
+import argparse
+import asyncio
+import json
+import uuid
+from typing import List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.core.config import settings
+from app.crud.crud_document_search import rebuild_search_terms
+
+
+async def run_rebuild(owner_id: Optional[uuid.UUID], batch_size: int):
+    client = AsyncIOMotorClient(settings.MONGODB_URL, uuidRepresentation='standard')
+    try:
+        return await rebuild_search_terms(client[settings.DB_NAME], owner_id=owner_id, batch_size=batch_size)
+    finally:
+        client.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="為已有文檔補建 n-gram 搜索欄位")
+    parser.add_argument("--owner-id", type=uuid.UUID, default=None, help="只處理指定用戶的文檔")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批處理的文檔數")
+    args = parser.parse_args(argv)
+
+    scanned, updated = asyncio.run(run_rebuild(args.owner_id, args.batch_size))
+    print(json.dumps({"scanned": scanned, "updated": updated}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
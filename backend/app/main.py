@@ -58,6 +58,12 @@ async def lifespan(app: FastAPI):
         await db_manager.connect_to_mongo() # 確保連接已建立
         if db_manager.db is not None:
             await create_database_indexes(db_manager.db) # 創建索引
+            if settings.DB_INDEX_ADVISOR_ON_STARTUP:
+                try:
+                    from .db.index_advisor import index_advisor
+                    await index_advisor.log_report(db_manager.db)
+                except Exception as e:
+                    std_logger.warning(f"索引顧問檢查失敗: {e}")
 
         
         # 連接到 Redis
@@ -68,6 +74,21 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             std_logger.warning(f"Redis 連接失敗（將繼續使用純 MongoDB 模式）: {e}")
         
+        # LLM 回應緩存（Redis 共享層，未啟用或不可用時僅使用進程內 LRU）
+        try:
+            from .services.ai.ai_cache_manager import ai_cache_manager
+            await ai_cache_manager.connect_llm_response_cache()
+        except Exception as e:
+            std_logger.warning(f"LLM 回應緩存初始化失敗（將使用進程內緩存）: {e}")
+        
+        # LLM 調用帳本（批量寫入帶 TTL 索引的 llm_call_ledger 集合）
+        if db_manager.db is not None:
+            try:
+                from .services.ai.llm_call_ledger import llm_call_ledger
+                await llm_call_ledger.start(db_manager.db)
+            except Exception as e:
+                std_logger.warning(f"LLM 調用帳本啟動失敗（記錄將只保留在內存中）: {e}")
+        
         # 使用新的智能預熱機制
         try:
             std_logger.info("開始應用程序智能預熱...")
@@ -135,6 +156,19 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             std_logger.error(f"關閉 Redis 連接失敗: {e}")
         
+        try:
+            from .services.ai.ai_cache_manager import ai_cache_manager
+            await ai_cache_manager.disconnect_llm_response_cache()
+        except Exception as e:
+            std_logger.error(f"關閉 LLM 回應緩存連接失敗: {e}")
+        
+        # 寫出 LLM 調用帳本中尚未寫入的記錄（須在關閉 MongoDB 連接之前）
+        try:
+            from .services.ai.llm_call_ledger import llm_call_ledger
+            await llm_call_ledger.stop()
+        except Exception as e:
+            std_logger.error(f"寫出 LLM 調用帳本失敗: {e}")
+        
         # 關閉向量資料庫連接
         try:
             from .services.vector.vector_db_service import vector_db_service
@@ -27,6 +27,12 @@ class AIMongoDBQueryDetailOutput(BaseModel):
     sub_filter: Optional[Dict[str, Any]] = Field(None, description="MongoDB filter dictionary to apply conditions on sub-fields or array elements within the document. e.g., {\"sections.title\": \"Introduction\"} or {\"keywords\": {\"$in\": [\"AI\", \"MongoDB\"]}}")
     reasoning: Optional[str] = Field(None, description="AI's explanation for why it chose the projection and/or sub-filter.")
 
+class AIBatchMongoDBQueryDetailOutput(BaseModel):
+    """多文檔詳細查詢輸出 - 每個文檔一個結果槽位，由調用方逐個驗證為 AIMongoDBQueryDetailOutput"""
+    results: List[Dict[str, Any]] = Field(..., description="各文檔的查詢組件，每項包含 document_index")
+
+    model_config = ConfigDict(extra='allow')
+
 # === 核心通用結構 ===
 
 class BaseKeyInformation(BaseModel):
@@ -120,6 +126,12 @@ class AITextAnalysisOutput(BaseModel):
     model_used: Optional[str] = Field(None, description="實際用於分析的AI模型名稱")
     error_message: Optional[str] = Field(None, description="分析過程中的錯誤訊息")
 
+class AIBatchTextAnalysisOutput(BaseModel):
+    """多文檔批量文本分析輸出 - 每份文檔一個結果槽位，由調用方逐個驗證為 AITextAnalysisOutput"""
+    results: List[Dict[str, Any]] = Field(..., description="各文檔的分析結果，每項包含 document_index")
+
+    model_config = ConfigDict(extra='allow')
+
 # === New Model Definitions ===
 
 class AIQueryRewriteOutput(BaseModel):
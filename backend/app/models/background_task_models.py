@@ -19,6 +19,8 @@ class TaskStatus(str, Enum):
 class TaskType(str, Enum):
     """任務類型"""
     QUESTION_GENERATION = "question_generation"  # 問題生成
+    DOCUMENT_BULK_DELETE = "document_bulk_delete"  # 文檔批量刪除
+    DOCUMENT_BATCH_PROCESSING = "document_batch_processing"  # 批量處理未處理 / 重試失敗的文檔
 
 
 class BackgroundTask(BaseModel):
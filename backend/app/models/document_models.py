@@ -26,6 +26,7 @@ class DocumentBase(BaseModel):
     filename: str = Field(..., description="原始文件名")
     file_type: Optional[str] = Field(None, description="文件MIME類型")
     size: Optional[int] = Field(None, description="文件大小 (bytes)")
+    content_sha256: Optional[str] = Field(None, description="內容指紋 sha256（上傳文件為文件字節，Gmail 郵件為正規化後的正文），用於按用戶去重")
     uploader_device_id: Optional[str] = Field(None, description="上傳設備的ID")
     owner_id: uuid.UUID = Field(..., description="文件擁有者的用戶ID")
     
@@ -61,6 +62,7 @@ class DocumentInDBBase(DocumentBase):
 
     extracted_text: Optional[str] = Field(None, description="從文件中提取的文本內容")
     text_extraction_completed_at: Optional[datetime] = None
+    content_externalized: bool = Field(False, description="提取文本與分析中間結果是否已外置到 document_contents")
     
     analysis: Optional[DocumentAnalysis] = Field(None, description="AI分析結果")
     
@@ -148,9 +150,78 @@ class Document(DocumentInDBBase):
     """用於API響應的模型"""
     pass
 
+class DocumentSummary(BaseModel):
+    """
+    文檔的輕量視圖（列表、問答分類與建議問題使用）。
+    只從資料庫讀取 crud_documents.DOCUMENT_SUMMARY_PROJECTION 中的欄位，
+    不包含 extracted_text、完整的 AI 分析結果與 enriched_data。
+    """
+    id: uuid.UUID = Field(description="文件唯一ID")
+    owner_id: uuid.UUID = Field(..., description="文件擁有者的用戶ID")
+    filename: str = Field(..., description="原始文件名")
+    file_type: Optional[str] = Field(None, description="文件MIME類型")
+    size: Optional[int] = Field(None, description="文件大小 (bytes)")
+    tags: Optional[List[str]] = Field(default_factory=list, description="用戶定義的標籤")
+    created_at: datetime = Field(default_factory=datetime.utcnow, description="文件記錄創建時間")
+    updated_at: datetime = Field(default_factory=datetime.utcnow, description="文件記錄最後更新時間")
+    status: DocumentStatus = Field(DocumentStatus.UPLOADED, description="文件處理狀態")
+    vector_status: VectorStatus = Field(VectorStatus.NOT_VECTORIZED, description="文檔的向量化狀態")
+    clustering_status: str = Field("pending", description="聚類狀態: pending/clustered/excluded")
+    cluster_info: Optional[Dict[str, Any]] = Field(None, description="聚類信息")
+
+    # 以下欄位從 enriched_data 與 analysis.ai_analysis_output.key_information 展平
+    title: Optional[str] = Field(None, description="AI生成的標題 (enriched_data.title)")
+    summary: Optional[str] = Field(None, description="語義豐富化摘要 (enriched_data.summary)")
+    content_summary: Optional[str] = Field(None, description="AI分析的內容摘要 (key_information.content_summary)")
+    key_concepts: List[str] = Field(default_factory=list, description="AI分析的關鍵概念")
+    main_topics: List[str] = Field(default_factory=list, description="AI分析的主題")
+
+    @root_validator(pre=True)
+    @classmethod
+    def _flatten_raw_document(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        values = dict(values)
+        underscore_id = values.pop("_id", None)
+        if underscore_id is not None and values.get("id") is None:
+            values["id"] = underscore_id
+
+        enriched_data = values.pop("enriched_data", None)
+        if isinstance(enriched_data, dict):
+            values.setdefault("title", enriched_data.get("title"))
+            values.setdefault("summary", enriched_data.get("summary"))
+
+        analysis = values.pop("analysis", None)
+        analysis_output = analysis.get("ai_analysis_output") if isinstance(analysis, dict) else None
+        key_information = analysis_output.get("key_information") if isinstance(analysis_output, dict) else None
+        if isinstance(key_information, dict):
+            values.setdefault("content_summary", key_information.get("content_summary"))
+            values.setdefault("key_concepts", [str(item) for item in key_information.get("key_concepts") or []])
+            values.setdefault("main_topics", [str(item) for item in key_information.get("main_topics") or []])
+        return values
+
+    @property
+    def display_summary(self) -> str:
+        """優先使用語義豐富化摘要，沒有時使用 AI 分析的內容摘要"""
+        return self.summary or self.content_summary or ""
+
+    class Config:
+        populate_by_name = True
+        json_encoders = {
+            datetime: lambda v: v.isoformat(),
+            uuid.UUID: lambda v: str(v)
+        }
+
 class PaginatedDocumentResponse(BaseModel):
     items: List[Document]
-    total: int
+    total: Optional[int] = Field(None, description="總數；total_mode=none 時為 None")
+    total_is_cached: bool = Field(False, description="總數是否來自短期緩存（可能略有延遲）")
+    next_cursor: Optional[str] = Field(None, description="游標分頁模式下的下一頁游標；沒有更多記錄時為 None")
+
+class PaginatedDocumentSummaryResponse(BaseModel):
+    """文檔輕量列表（欄位見 DocumentSummary），分頁與總數參數同 PaginatedDocumentResponse"""
+    items: List[DocumentSummary]
+    total: Optional[int] = Field(None, description="總數；total_mode=none 時為 None")
+    total_is_cached: bool = Field(False, description="總數是否來自短期緩存（可能略有延遲）")
+    next_cursor: Optional[str] = Field(None, description="游標分頁模式下的下一頁游標；沒有更多記錄時為 None")
 
 # 新增用於批量刪除的請求模型
 class BatchDeleteRequest(BaseModel):
@@ -168,6 +239,7 @@ class BatchDeleteDocumentsResponse(BaseModel):
     processed_count: int
     success_count: int
     details: List[BatchDeleteResponseDetail]
+    task_id: Optional[str] = None  # 超過同步上限時轉為後台任務，通過任務 ID 查詢進度
 
 class DocumentPreviewInfo(BaseModel):
     """用於API響應的模型"""
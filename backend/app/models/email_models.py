@@ -69,7 +69,7 @@ class EmailImportResponse(BaseModel):
     """郵件導入響應"""
     email_id: str
     document_id: Optional[uuid.UUID] = None
-    status: str  # "success" | "already_imported" | "error"
+    status: str  # "success" | "cloned" | "duplicate" | "already_imported" | "error"
     message: Optional[str] = None
 
 
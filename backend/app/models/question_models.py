@@ -40,6 +40,9 @@ class QuestionClassification(BaseModel):
     target_document_ids: Optional[List[str]] = Field(None, description="目標文檔ID列表（用於 document_detail_query）")
     target_document_reasoning: Optional[str] = Field(None, description="選擇這些文檔的原因")
     
+    # 分類來源: llm, local_rule, local_centroid
+    classified_by: Optional[str] = Field(None, description="分類來源")
+    
     class Config:
         use_enum_values = True
 
@@ -1,8 +1,14 @@
 from pydantic import BaseModel, Field, EmailStr
 from datetime import datetime
+from enum import Enum
 from typing import Optional
 from uuid import UUID, uuid4
 
+class DocumentDedupMode(str, Enum):
+    OFF = "off"  # 不去重
+    LINK = "link"  # 相同內容直接返回已有文檔
+    CLONE = "clone"  # 創建新文檔並複製已有文檔的分析結果與向量
+
 # --- User Models ---
 class UserBase(BaseModel):
     username: str = Field(..., min_length=3, max_length=50, description="使用者名稱")
@@ -23,6 +29,7 @@ class UserUpdate(BaseModel):
     google_credentials: Optional[dict] = None
     google_credentials_encrypted_at: Optional[datetime] = None
     gmail_synced_at: Optional[datetime] = None
+    document_dedup_mode: Optional[DocumentDedupMode] = None
     # 密碼更新應通過特定端點處理
 
 class UserInDBBase(UserBase):
@@ -44,6 +51,10 @@ class UserInDBBase(UserBase):
         None,
         description="Gmail 最後同步時間"
     )
+    document_dedup_mode: Optional[DocumentDedupMode] = Field(
+        None,
+        description="上傳內容去重模式 (off / link / clone)，未設定時使用系統預設"
+    )
 
     model_config = {
         "from_attributes": True, # Pydantic v2 (舊版 orm_mode)
@@ -55,6 +66,7 @@ class User(UserBase):
     id: UUID
     created_at: datetime
     updated_at: datetime
+    document_dedup_mode: Optional[DocumentDedupMode] = None
     # is_active 和 is_admin 已經在 UserBase 中
 
     class Config:
@@ -5,14 +5,18 @@ AI 緩存管理器
 
 import asyncio
 import hashlib
+import json
+import time
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 from dataclasses import dataclass
 from enum import Enum
 import logging
 
+import redis.asyncio as redis
 from cachetools import LRUCache, TTLCache
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.core.config import settings
 from app.core.logging_utils import log_event, LogLevel
 from app.services.cache.google_context_cache_service import (
     google_context_cache_service,
@@ -66,6 +70,22 @@ class AICacheManager:
         self.ai_response_cache: TTLCache[str, Dict[str, Any]] = TTLCache(maxsize=500, ttl=900)
         self.prompt_template_cache: TTLCache[str, Any] = TTLCache(maxsize=100, ttl=7200)  # 2小時TTL，提示詞相對穩定
         
+        # LLM 回應精確匹配緩存（每個條目自帶過期時間，以支援按任務設定 TTL）
+        self.llm_response_cache: LRUCache[str, Dict[str, Any]] = LRUCache(
+            maxsize=settings.AI_RESPONSE_CACHE_MAX_ENTRIES
+        )
+        self.llm_response_cache_enabled = settings.AI_RESPONSE_CACHE_ENABLED
+        self.llm_response_task_ttls: Dict[str, int] = dict(settings.AI_RESPONSE_CACHE_TASK_TTLS or {})
+        self.redis_client: Optional[redis.Redis] = None
+        self.llm_response_stats: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "redis_hits": 0,
+            "local_hits": 0,
+            "writes": 0,
+            "tokens_saved": 0
+        }
+        
         # Google Context Caching 服務
         self.google_context_cache_service = google_context_cache_service
         
@@ -254,6 +274,141 @@ class AICacheManager:
         self.ai_response_cache[cache_key] = response
         logger.debug(f"AI 回答已緩存: {cache_key}")
     
+    # === LLM 回應精確匹配緩存 ===
+    async def connect_llm_response_cache(self):
+        """連接 Redis 作為 LLM 回應緩存的共享層，失敗時僅使用進程內 LRU"""
+        if not self.llm_response_cache_enabled:
+            logger.info("LLM 回應緩存未啟用")
+            return
+        if not settings.REDIS_ENABLED:
+            logger.info("Redis 已禁用，LLM 回應緩存僅使用進程內 LRU")
+            return
+        
+        try:
+            self.redis_client = await redis.from_url(
+                settings.REDIS_URL,
+                encoding="utf-8",
+                decode_responses=True
+            )
+            await self.redis_client.ping()
+            logger.info("LLM 回應緩存已連接 Redis 共享層")
+        except Exception as e:
+            logger.warning(f"LLM 回應緩存連接 Redis 失敗，改用進程內 LRU: {e}")
+            self.redis_client = None
+    
+    async def disconnect_llm_response_cache(self):
+        """關閉 LLM 回應緩存的 Redis 連接"""
+        if self.redis_client:
+            await self.redis_client.close()
+            self.redis_client = None
+    
+    def is_llm_response_cacheable(self, task_type: str) -> bool:
+        """判斷任務類型是否啟用回應緩存（只有配置了 TTL 的確定性任務才緩存）"""
+        return self.llm_response_cache_enabled and self.llm_response_task_ttls.get(task_type, 0) > 0
+    
+    def build_llm_response_cache_key(
+        self,
+        model_id: str,
+        task_type: str,
+        system_prompt: Optional[str],
+        user_prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """以 模型 + 任務 + 格式化後的系統/用戶提示詞 + 生成配置 計算緩存鍵值"""
+        payload = json.dumps(
+            {
+                "model": model_id,
+                "task": task_type,
+                "system": system_prompt or "",
+                "user": user_prompt,
+                "generation_config": generation_config or {}
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str
+        )
+        return f"llm_response:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+    
+    def _record_llm_response_lookup(self, entry: Optional[Dict[str, Any]], tier: Optional[str] = None):
+        """記錄 LLM 回應緩存的命中/未命中"""
+        self._update_cache_stats(CacheType.AI_RESPONSE, entry is not None)
+        if entry is None:
+            self.llm_response_stats["misses"] += 1
+            return
+        self.llm_response_stats["hits"] += 1
+        self.llm_response_stats[f"{tier}_hits"] += 1
+        self.llm_response_stats["tokens_saved"] += int(entry.get("total_tokens", 0) or 0)
+    
+    async def get_llm_response(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """
+        查詢 LLM 回應緩存，先查進程內 LRU 再查 Redis
+        
+        Returns:
+            包含 output_text 與原始 token 數量的字典，未命中時返回 None
+        """
+        entry = self.llm_response_cache.get(cache_key)
+        if entry is not None:
+            if entry.get("expires_at", 0) > time.time():
+                self._record_llm_response_lookup(entry, "local")
+                return entry
+            self.llm_response_cache.pop(cache_key, None)
+        
+        if self.redis_client:
+            try:
+                cached_data = await self.redis_client.get(cache_key)
+                if cached_data:
+                    entry = json.loads(cached_data)
+                    # 回填本地緩存，避免重複訪問 Redis
+                    self.llm_response_cache[cache_key] = entry
+                    self._record_llm_response_lookup(entry, "redis")
+                    return entry
+            except Exception as e:
+                logger.warning(f"讀取 Redis LLM 回應緩存失敗: {e}")
+        
+        self._record_llm_response_lookup(None)
+        return None
+    
+    async def set_llm_response(
+        self,
+        cache_key: str,
+        task_type: str,
+        output_text: str,
+        total_tokens: int
+    ):
+        """寫入 LLM 回應緩存，TTL 依任務類型決定"""
+        ttl = self.llm_response_task_ttls.get(task_type, 0)
+        if ttl <= 0:
+            return
+        
+        entry = {
+            "output_text": output_text,
+            "task_type": task_type,
+            "total_tokens": total_tokens,
+            "expires_at": time.time() + ttl
+        }
+        self.llm_response_cache[cache_key] = entry
+        self.llm_response_stats["writes"] += 1
+        
+        if self.redis_client:
+            try:
+                await self.redis_client.setex(cache_key, ttl, json.dumps(entry, ensure_ascii=False))
+            except Exception as e:
+                logger.warning(f"寫入 Redis LLM 回應緩存失敗: {e}")
+        
+        logger.debug(f"LLM 回應已緩存: {cache_key} (task={task_type}, ttl={ttl}s)")
+    
+    def get_llm_response_cache_statistics(self) -> Dict[str, Any]:
+        """獲取 LLM 回應緩存統計"""
+        lookups = self.llm_response_stats["hits"] + self.llm_response_stats["misses"]
+        return {
+            **self.llm_response_stats,
+            "enabled": self.llm_response_cache_enabled,
+            "backend": "redis+local" if self.redis_client else "local",
+            "local_entries": len(self.llm_response_cache),
+            "hit_rate": round(self.llm_response_stats["hits"] / lookups * 100, 2) if lookups > 0 else 0.0,
+            "task_ttls": self.llm_response_task_ttls
+        }
+    
     # === 提示詞緩存（支援 Context Caching） ===
     async def get_or_create_prompt_cache(
         self,
@@ -411,7 +566,7 @@ class AICacheManager:
             elif cache_type == CacheType.DOCUMENT_CONTENT:
                 self.cache_stats[cache_type].memory_usage_mb = len(self.document_content_cache) * 0.2
             elif cache_type == CacheType.AI_RESPONSE:
-                self.cache_stats[cache_type].memory_usage_mb = len(self.ai_response_cache) * 0.1
+                self.cache_stats[cache_type].memory_usage_mb = (len(self.ai_response_cache) + len(self.llm_response_cache)) * 0.1
             elif cache_type == CacheType.PROMPT_TEMPLATE:
                 self.cache_stats[cache_type].memory_usage_mb = len(self.prompt_template_cache) * 0.15
         
@@ -439,6 +594,7 @@ class AICacheManager:
                     "overall_local_hit_rate": self._calculate_overall_hit_rate()
                 },
                 "google_context_caching": google_stats,
+                "llm_response_caching": self.get_llm_response_cache_statistics(),
                 "combined_statistics": {
                     "is_google_context_caching_available": self.google_context_cache_service.is_available(),
                     "estimated_total_cost_savings": google_stats.get("estimated_savings", 0.0),
@@ -474,6 +630,7 @@ class AICacheManager:
                 self.document_content_cache.clear()
             elif cache_type == CacheType.AI_RESPONSE:
                 self.ai_response_cache.clear()
+                self.llm_response_cache.clear()
             elif cache_type == CacheType.PROMPT_TEMPLATE:
                 self.prompt_template_cache.clear()
             logger.info(f"已清理 {cache_type.value} 緩存")
@@ -484,6 +641,7 @@ class AICacheManager:
             self.system_instruction_cache.clear()
             self.document_content_cache.clear()
             self.ai_response_cache.clear()
+            self.llm_response_cache.clear()
             self.prompt_template_cache.clear()
             logger.info("已清理所有緩存")
     
@@ -508,6 +666,16 @@ class AICacheManager:
             if cleaned > 0:
                 logger.info(f"{cache_type.value} 緩存清理了 {cleaned} 個過期項目")
         
+        # LLM 回應緩存的條目自帶過期時間，需手動清理
+        now = time.time()
+        expired_keys = [
+            key for key, entry in list(self.llm_response_cache.items())
+            if entry.get("expires_at", 0) <= now
+        ]
+        for key in expired_keys:
+            self.llm_response_cache.pop(key, None)
+        total_cleaned += len(expired_keys)
+        
         if total_cleaned > 0:
             await log_event(
                 db=db,
@@ -0,0 +1,292 @@
+"""
+AI 調用速率限制器
+
+為所有經過 UnifiedAIServiceSimplified 的 Gemini 調用提供統一的：
+1. 按模型的 RPM / TPM / 並發數限制
+2. 優先級通道（互動請求優先於後台任務，並為互動請求保留並發位）
+3. 根據 429 回應自適應退避
+4. 排隊等待時間統計
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.logging_utils import AppLogger
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+# 滑動窗口長度（秒）
+_WINDOW_SECONDS = 60.0
+
+
+class RequestPriority(str, Enum):
+    """AI 請求優先級通道"""
+    INTERACTIVE = "interactive"  # 用戶正在等待的請求（問答、分類、查詢重寫）
+    BACKGROUND = "background"  # 後台任務（文檔分析、聚類標籤、建議問題）
+
+
+_PRIORITY_RANK = {
+    RequestPriority.INTERACTIVE: 0,
+    RequestPriority.BACKGROUND: 1,
+}
+
+
+@dataclass
+class ModelRateLimitConfig:
+    """單個模型的限流配置（0 表示不限制）"""
+    rpm: int = 0
+    tpm: int = 0
+    max_concurrency: int = 0
+
+
+@dataclass
+class LaneStats:
+    """單個優先級通道的統計"""
+    acquired: int = 0
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    waiting: int = 0
+
+
+@dataclass
+class RateLimitReservation:
+    """一次已獲得的調用配額，釋放時可回填實際 token 數"""
+    model_id: str
+    priority: RequestPriority
+    estimated_tokens: int
+    wait_seconds: float
+    actual_tokens: Optional[int] = None
+    _token_event: Optional[List[float]] = field(default=None, repr=False)
+
+
+class _ModelLimiter:
+    """單個模型的限流狀態"""
+
+    def __init__(self, model_id: str, config: ModelRateLimitConfig):
+        self.model_id = model_id
+        self.config = config
+        self.condition = asyncio.Condition()
+        self.request_times: Deque[float] = deque()
+        self.token_events: Deque[List[float]] = deque()  # [時間戳, token 數]
+        self.in_flight = 0
+        self.waiting: List[Tuple[int, int]] = []  # (優先級, 序號) 的最小堆
+        self.backoff_seconds = 0.0
+        self.backoff_until = 0.0
+        self.rate_limited_count = 0
+        self.lanes: Dict[RequestPriority, LaneStats] = {p: LaneStats() for p in RequestPriority}
+
+    def prune(self, now: float):
+        while self.request_times and self.request_times[0] <= now - _WINDOW_SECONDS:
+            self.request_times.popleft()
+        while self.token_events and self.token_events[0][0] <= now - _WINDOW_SECONDS:
+            self.token_events.popleft()
+
+    def tokens_in_window(self) -> int:
+        return int(sum(event[1] for event in self.token_events))
+
+    def concurrency_limit(self, priority: RequestPriority) -> int:
+        limit = self.config.max_concurrency
+        if limit <= 0:
+            return 0
+        if priority == RequestPriority.BACKGROUND:
+            # 為互動請求保留並發位，但至少允許一個後台請求
+            return max(1, limit - settings.AI_RATE_LIMIT_INTERACTIVE_RESERVED_SLOTS)
+        return limit
+
+    def capacity_delay(self, now: float, tokens: int, priority: RequestPriority) -> Optional[float]:
+        """
+        計算距離可以發出請求還需等待的時間
+
+        Returns:
+            0 表示可立即發出；正數表示需等待的秒數；None 表示需等待其他請求釋放並發位
+        """
+        limit = self.concurrency_limit(priority)
+        if limit and self.in_flight >= limit:
+            return None
+        if now < self.backoff_until:
+            return self.backoff_until - now
+        if self.config.rpm and len(self.request_times) >= self.config.rpm:
+            return max(self.request_times[0] + _WINDOW_SECONDS - now, 0.01)
+        if self.config.tpm and self.token_events and self.tokens_in_window() + tokens > self.config.tpm:
+            return max(self.token_events[0][0] + _WINDOW_SECONDS - now, 0.01)
+        return 0.0
+
+
+class AIRateLimiter:
+    """
+    全局 AI 調用限流器
+
+    所有模型各自維護一個滑動窗口。等待中的請求按 (優先級, 到達順序) 排隊，
+    只有隊首請求可以獲得配額，因此互動請求總是先於已在排隊的後台請求。
+    """
+
+    def __init__(self):
+        self.enabled = settings.AI_RATE_LIMIT_ENABLED
+        self._limiters: Dict[str, _ModelLimiter] = {}
+        self._sequence = itertools.count()
+
+    def _get_model_config(self, model_id: str) -> ModelRateLimitConfig:
+        limits = settings.AI_RATE_LIMITS or {}
+        raw = limits.get(model_id) or limits.get("default") or {}
+        return ModelRateLimitConfig(
+            rpm=int(raw.get("rpm", 0)),
+            tpm=int(raw.get("tpm", 0)),
+            max_concurrency=int(raw.get("max_concurrency", 0))
+        )
+
+    def _get_limiter(self, model_id: str) -> _ModelLimiter:
+        limiter = self._limiters.get(model_id)
+        if limiter is None:
+            limiter = _ModelLimiter(model_id, self._get_model_config(model_id))
+            self._limiters[model_id] = limiter
+        return limiter
+
+    async def acquire(
+        self,
+        model_id: str,
+        estimated_tokens: int = 0,
+        priority: RequestPriority = RequestPriority.INTERACTIVE
+    ) -> RateLimitReservation:
+        """等待直到可以向指定模型發出請求"""
+        if not self.enabled:
+            return RateLimitReservation(model_id, priority, estimated_tokens, 0.0)
+
+        limiter = self._get_limiter(model_id)
+        if limiter.config.tpm:
+            # 單個請求不能超過整個窗口的配額，否則永遠無法發出
+            estimated_tokens = min(estimated_tokens, limiter.config.tpm)
+        ticket = (_PRIORITY_RANK[priority], next(self._sequence))
+        lane = limiter.lanes[priority]
+        start = time.monotonic()
+
+        async with limiter.condition:
+            heapq.heappush(limiter.waiting, ticket)
+            lane.waiting += 1
+            try:
+                while True:
+                    now = time.time()
+                    limiter.prune(now)
+                    delay: Optional[float] = None
+                    if limiter.waiting[0] == ticket:
+                        delay = limiter.capacity_delay(now, estimated_tokens, priority)
+                        if delay == 0:
+                            break
+                    try:
+                        await asyncio.wait_for(limiter.condition.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                limiter.waiting.remove(ticket)
+                heapq.heapify(limiter.waiting)
+                lane.waiting -= 1
+                limiter.condition.notify_all()
+
+            now = time.time()
+            limiter.in_flight += 1
+            limiter.request_times.append(now)
+            token_event = [now, float(estimated_tokens)]
+            limiter.token_events.append(token_event)
+
+        wait_seconds = time.monotonic() - start
+        lane.acquired += 1
+        lane.total_wait_seconds += wait_seconds
+        lane.max_wait_seconds = max(lane.max_wait_seconds, wait_seconds)
+        if wait_seconds > 1.0:
+            logger.info(f"[RateLimiter] {model_id} ({priority.value}) 排隊 {wait_seconds:.2f}s 後獲得配額")
+
+        return RateLimitReservation(
+            model_id=model_id,
+            priority=priority,
+            estimated_tokens=estimated_tokens,
+            wait_seconds=wait_seconds,
+            _token_event=token_event
+        )
+
+    async def release(self, reservation: RateLimitReservation):
+        """釋放配額，並以實際 token 數修正 TPM 窗口"""
+        if not self.enabled or reservation._token_event is None:
+            return
+
+        limiter = self._get_limiter(reservation.model_id)
+        async with limiter.condition:
+            limiter.in_flight = max(0, limiter.in_flight - 1)
+            if reservation.actual_tokens is not None:
+                reservation._token_event[1] = float(reservation.actual_tokens)
+            limiter.condition.notify_all()
+
+    @asynccontextmanager
+    async def limit(
+        self,
+        model_id: str,
+        estimated_tokens: int = 0,
+        priority: RequestPriority = RequestPriority.INTERACTIVE
+    ) -> AsyncIterator[RateLimitReservation]:
+        """以 async with 方式獲取並自動釋放配額"""
+        reservation = await self.acquire(model_id, estimated_tokens, priority)
+        try:
+            yield reservation
+        finally:
+            await self.release(reservation)
+
+    def report_rate_limited(self, model_id: str, retry_after: Optional[float] = None):
+        """收到 429 時調用：指數增加該模型的退避時間"""
+        limiter = self._get_limiter(model_id)
+        limiter.rate_limited_count += 1
+        if retry_after:
+            limiter.backoff_seconds = min(float(retry_after), settings.AI_RATE_LIMIT_MAX_BACKOFF_SECONDS)
+        else:
+            limiter.backoff_seconds = min(
+                max(limiter.backoff_seconds * 2, 2.0),
+                settings.AI_RATE_LIMIT_MAX_BACKOFF_SECONDS
+            )
+        limiter.backoff_until = time.time() + limiter.backoff_seconds
+        logger.warning(f"[RateLimiter] {model_id} 觸發 429，退避 {limiter.backoff_seconds:.1f}s")
+
+    def report_success(self, model_id: str):
+        """請求成功時調用：逐步縮短退避時間"""
+        limiter = self._limiters.get(model_id)
+        if limiter and limiter.backoff_seconds:
+            limiter.backoff_seconds = limiter.backoff_seconds / 2 if limiter.backoff_seconds > 1.0 else 0.0
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """獲取各模型的限流與排隊統計"""
+        now = time.time()
+        models = {}
+        for model_id, limiter in self._limiters.items():
+            limiter.prune(now)
+            models[model_id] = {
+                "limits": {
+                    "rpm": limiter.config.rpm,
+                    "tpm": limiter.config.tpm,
+                    "max_concurrency": limiter.config.max_concurrency
+                },
+                "in_flight": limiter.in_flight,
+                "requests_last_minute": len(limiter.request_times),
+                "tokens_last_minute": limiter.tokens_in_window(),
+                "rate_limited_count": limiter.rate_limited_count,
+                "backoff_seconds": round(limiter.backoff_seconds, 2),
+                "backoff_remaining_seconds": round(max(limiter.backoff_until - now, 0.0), 2),
+                "lanes": {
+                    priority.value: {
+                        "acquired": lane.acquired,
+                        "waiting": lane.waiting,
+                        "avg_wait_seconds": round(lane.total_wait_seconds / lane.acquired, 3) if lane.acquired else 0.0,
+                        "max_wait_seconds": round(lane.max_wait_seconds, 3)
+                    }
+                    for priority, lane in limiter.lanes.items()
+                }
+            }
+        return {"enabled": self.enabled, "models": models}
+
+
+# 全局限流器實例
+ai_rate_limiter = AIRateLimiter()
@@ -0,0 +1,373 @@
+"""
+本地模擬 LLM 提供商
+
+AI_PROVIDER_BACKEND=fake 時使用，不調用任何真實模型，用於離線壓測完整的 QA 流程
+（意圖分類 → 查詢重寫 → 檢索 → MongoDB 詳細查詢 → 答案生成）。
+
+- 每個 TaskType 都返回能通過對應輸出模型驗證的 JSON，內容盡量取自提示詞
+  （問題、候選文檔 ID、聚類編號、批量文檔索引），讓下游流程照常運行
+- 延遲按對數常態分佈取樣，可按任務設定中位數
+- 可注入 429 與服務不可用錯誤，驗證限流器與降級邏輯
+- 流式回應按設定的塊大小與間隔輸出
+"""
+
+import asyncio
+import json
+import logging
+import math
+import random
+import re
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable
+
+from app.core.config import settings
+from app.core.logging_utils import AppLogger
+from app.services.ai.llm_providers import LLMProvider, LLMStream
+from app.services.ai.token_estimator import IMAGE_TOKENS, token_estimator
+from app.services.ai.unified_ai_config import TaskType
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+_INTENT_STRATEGIES = {
+    "greeting": ("direct_answer", "simple", 1),
+    "chitchat": ("direct_answer", "simple", 1),
+    "clarification_needed": ("ask_clarification", "simple", 1),
+    "simple_factual": ("quick_answer", "simple", 1),
+    "document_search": ("standard_search", "moderate", 3),
+    "document_detail_query": ("mongodb_detail_query", "moderate", 2),
+    "complex_analysis": ("full_rag", "complex", 5),
+}
+
+_USER_QUESTION_PATTERN = re.compile(r"<user_question>\s*((?:(?!<user_question>).)*?)\s*</user_question>", re.DOTALL)
+_USER_QUERY_PATTERN = re.compile(r"<user_query>\s*((?:(?!<user_query>).)*?)\s*</user_query>", re.DOTALL)
+_DETAIL_QUESTION_PATTERN = re.compile(r"用戶問題：(.*)")
+_DOCUMENT_ID_PATTERN = re.compile(r"目標文件 ID：\s*(\S+)")
+_CANDIDATE_ID_PATTERN = re.compile(r'"document_id"\s*:\s*"([^"]+)"')
+_CACHED_DOCUMENT_ID_PATTERN = re.compile(r"\(ID: ([^)\s]+)\)")
+_BATCH_DOCUMENT_PATTERN = re.compile(r'<document index="(\d+)">')
+_CLUSTER_INDEX_PATTERN = re.compile(r"聚類 (\d+) \(共")
+
+
+@dataclass
+class _FakeUsage:
+    prompt_token_count: int
+    candidates_token_count: int
+    cached_content_token_count: int = 0
+
+
+@dataclass
+class _FakeResponse:
+    text: str
+    usage_metadata: _FakeUsage
+
+
+class _FakeStream(LLMStream):
+    def __init__(self, text: str, usage: _FakeUsage, first_chunk_delay: float):
+        self._text = text
+        self._usage = usage
+        self._first_chunk_delay = first_chunk_delay
+
+    async def chunks(self) -> AsyncIterator[str]:
+        await asyncio.sleep(self._first_chunk_delay)
+        size = max(1, settings.FAKE_LLM_STREAM_CHUNK_CHARS)
+        for start in range(0, len(self._text), size):
+            if start:
+                await asyncio.sleep(settings.FAKE_LLM_STREAM_CHUNK_INTERVAL_SECONDS)
+            yield self._text[start:start + size]
+
+    @property
+    def usage_metadata(self) -> Any:
+        return self._usage
+
+
+@dataclass
+class FakeProviderStats:
+    """模擬提供商統計"""
+    calls: int = 0
+    stream_calls: int = 0
+    injected_rate_limits: int = 0
+    injected_errors: int = 0
+    total_latency_seconds: float = 0.0
+    calls_by_task: Dict[str, int] = field(default_factory=dict)
+
+
+class FakeLLMProvider(LLMProvider):
+    """按任務類型返回合法結構化輸出的本地模擬提供商"""
+
+    name = "fake"
+
+    def __init__(self, seed: Optional[int] = None):
+        seed = seed if seed is not None else settings.FAKE_LLM_SEED
+        self._random = random.Random(seed)
+        self.stats = FakeProviderStats()
+
+    async def generate(self, task_type, model_id, prompt_parts, generation_config, safety_settings, cached_content=None):
+        prompt_text, image_count = self._split_prompt_parts(prompt_parts)
+        self._record_call(task_type)
+        latency = self._sample_latency(task_type)
+        await asyncio.sleep(latency)
+        self._maybe_inject_error(model_id)
+
+        text = self.build_output(task_type, prompt_text)
+        usage = self._usage(prompt_text, image_count, text)
+        if cached_content:
+            # 與 Gemini 一致：prompt_token_count 包含緩存的 token，另以 cached_content_token_count 單獨回報
+            from app.services.cache.google_context_cache_service import google_context_cache_service
+            cache_info = google_context_cache_service.get_registered_cache(cached_content)
+            if cache_info is not None:
+                usage.cached_content_token_count = cache_info.token_count
+                usage.prompt_token_count += cache_info.token_count
+        return _FakeResponse(text=text, usage_metadata=usage)
+
+    async def stream(self, task_type, model_id, prompt_parts, generation_config, safety_settings):
+        prompt_text, image_count = self._split_prompt_parts(prompt_parts)
+        self._record_call(task_type)
+        self.stats.stream_calls += 1
+        self._maybe_inject_error(model_id)
+
+        text = self._build_markdown_answer(prompt_text)
+        # 流式時延遲分佈代表首塊到達時間
+        return _FakeStream(text, self._usage(prompt_text, image_count, text), self._sample_latency(task_type))
+
+    # === 延遲、錯誤與 token 模擬 ===
+
+    def _sample_latency(self, task_type: Optional[TaskType]) -> float:
+        task_key = task_type.value if isinstance(task_type, TaskType) else str(task_type)
+        median = settings.FAKE_LLM_TASK_LATENCY_MEDIANS.get(task_key, settings.FAKE_LLM_LATENCY_MEDIAN_SECONDS)
+        if median <= 0:
+            return 0.0
+        latency = self._random.lognormvariate(math.log(median), settings.FAKE_LLM_LATENCY_SIGMA)
+        latency = min(latency, settings.FAKE_LLM_MAX_LATENCY_SECONDS)
+        self.stats.total_latency_seconds += latency
+        return latency
+
+    def _maybe_inject_error(self, model_id: str):
+        roll = self._random.random()
+        if roll < settings.FAKE_LLM_RATE_LIMIT_RATE:
+            self.stats.injected_rate_limits += 1
+            raise ResourceExhausted(f"模擬配額不足: {model_id}")
+        if roll < settings.FAKE_LLM_RATE_LIMIT_RATE + settings.FAKE_LLM_ERROR_RATE:
+            self.stats.injected_errors += 1
+            raise ServiceUnavailable(f"模擬服務不可用: {model_id}")
+
+    @staticmethod
+    def _usage(prompt_text: str, image_count: int, output_text: str) -> _FakeUsage:
+        completion_tokens = settings.FAKE_LLM_OUTPUT_TOKENS or token_estimator.count_raw(output_text)
+        return _FakeUsage(
+            prompt_token_count=token_estimator.count_raw(prompt_text) + image_count * IMAGE_TOKENS,
+            candidates_token_count=completion_tokens
+        )
+
+    @staticmethod
+    def _split_prompt_parts(prompt_parts: List[Any]):
+        texts = [part for part in prompt_parts if isinstance(part, str)]
+        return "".join(texts), len(prompt_parts) - len(texts)
+
+    def _record_call(self, task_type: Optional[TaskType]):
+        task_key = task_type.value if isinstance(task_type, TaskType) else str(task_type)
+        self.stats.calls += 1
+        self.stats.calls_by_task[task_key] = self.stats.calls_by_task.get(task_key, 0) + 1
+
+    # === 各任務的輸出 ===
+
+    def build_output(self, task_type: Optional[TaskType], prompt_text: str) -> str:
+        """按任務類型生成能通過輸出模型驗證的文本"""
+        builders = {
+            TaskType.TEXT_GENERATION: self._build_text_analysis,
+            TaskType.IMAGE_ANALYSIS: self._build_image_analysis,
+            TaskType.BATCH_TEXT_ANALYSIS: self._build_batch_text_analysis,
+            TaskType.QUERY_REWRITE: self._build_query_rewrite,
+            TaskType.ANSWER_GENERATION: self._build_answer,
+            TaskType.MONGODB_DETAIL_QUERY_GENERATION: self._build_detail_query,
+            TaskType.BATCH_MONGODB_DETAIL_QUERY_GENERATION: self._build_batch_detail_query,
+            TaskType.DOCUMENT_SELECTION_FOR_QUERY: self._build_document_selection,
+            TaskType.CLUSTER_LABEL_GENERATION: self._build_cluster_label,
+            TaskType.BATCH_CLUSTER_LABELS: self._build_batch_cluster_labels,
+            TaskType.QUESTION_INTENT_CLASSIFICATION: self._build_intent_classification,
+            TaskType.GENERATE_CLARIFICATION_QUESTION: self._build_clarification,
+            TaskType.QUESTION_GENERATION: self._build_suggested_questions,
+        }
+        builder = builders.get(task_type)
+        if builder is None:
+            return "模擬輸出"
+        # 與模型的實際輸出一樣使用縮排格式（解析前的 "}}" 清理不會誤傷緊湊的巢狀 JSON）
+        return json.dumps(builder(prompt_text), ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def _question(prompt_text: str) -> str:
+        for pattern in (_USER_QUESTION_PATTERN, _USER_QUERY_PATTERN, _DETAIL_QUESTION_PATTERN):
+            # 系統提示詞的安全指令中也有 <user_query>...</user_query> 範例，取用戶提示詞中最後一個實際內容
+            matches = [m.strip() for m in pattern.findall(prompt_text) if m.strip() not in ("", "...")]
+            if matches:
+                return matches[-1]
+        return "模擬問題"
+
+    @staticmethod
+    def _analysis(summary: str) -> Dict[str, Any]:
+        return {
+            "initial_summary": summary,
+            "content_type": "模擬文檔",
+            "intermediate_analysis": {
+                "analysis_approach": "模擬分析",
+                "key_observations": ["模擬觀察"]
+            },
+            "key_information": {
+                "content_type": "模擬文檔",
+                "content_summary": summary,
+                "semantic_tags": ["模擬"],
+                "searchable_keywords": ["模擬", "測試"],
+                "dynamic_fields": {},
+                "auto_title": "模擬文檔標題",
+                "confidence_level": "medium"
+            }
+        }
+
+    def _build_text_analysis(self, prompt_text: str) -> Dict[str, Any]:
+        return self._analysis(f"模擬文本分析摘要（輸入約 {len(prompt_text)} 字符）")
+
+    def _build_image_analysis(self, prompt_text: str) -> Dict[str, Any]:
+        return {**self._analysis("模擬圖片分析摘要"), "extracted_text": "模擬提取文字"}
+
+    def _build_batch_text_analysis(self, prompt_text: str) -> Dict[str, Any]:
+        indexes = [int(index) for index in _BATCH_DOCUMENT_PATTERN.findall(prompt_text)]
+        return {
+            "results": [
+                {"document_index": index, **self._analysis(f"模擬批量分析摘要 #{index}")}
+                for index in indexes
+            ]
+        }
+
+    def _build_query_rewrite(self, prompt_text: str) -> Dict[str, Any]:
+        question = self._question(prompt_text)
+        return {
+            "reasoning": "模擬查詢分析",
+            "query_granularity": self._random.choice(["thematic", "detailed"]),
+            "rewritten_queries": [question, f"{question} 相關文件", f"{question} 詳細內容"],
+            "search_strategy_suggestion": "rrf_fusion",
+            "extracted_parameters": {},
+            "intent_analysis": "模擬意圖分析"
+        }
+
+    def _build_answer(self, prompt_text: str) -> Dict[str, Any]:
+        return {"answer_text": self._build_markdown_answer(prompt_text)}
+
+    def _build_markdown_answer(self, prompt_text: str) -> str:
+        question = self._question(prompt_text)
+        return (
+            f"## 模擬回答\n\n針對「{question}」，根據提供的文檔上下文整理如下：\n\n"
+            "- 這是離線模擬後端生成的回答\n- 內容不代表任何真實文檔\n"
+        )
+
+    def _build_detail_query(self, prompt_text: str) -> Dict[str, Any]:
+        match = _DOCUMENT_ID_PATTERN.search(prompt_text)
+        document_id = match.group(1) if match else "unknown"
+        return {
+            "projection": {
+                "filename": 1,
+                "analysis.ai_analysis_output.key_information": 1
+            },
+            "sub_filter": None,
+            "reasoning": f"模擬查詢文檔 {document_id} 的關鍵信息"
+        }
+
+    def _build_batch_detail_query(self, prompt_text: str) -> Dict[str, Any]:
+        indexes = [int(index) for index in _BATCH_DOCUMENT_PATTERN.findall(prompt_text)]
+        return {
+            "results": [
+                {
+                    "document_index": index,
+                    "projection": {
+                        "filename": 1,
+                        "analysis.ai_analysis_output.key_information": 1
+                    },
+                    "sub_filter": None,
+                    "reasoning": f"模擬查詢第 {index} 份文檔的關鍵信息"
+                }
+                for index in indexes
+            ]
+        }
+
+    def _build_document_selection(self, prompt_text: str) -> Dict[str, Any]:
+        candidates = list(dict.fromkeys(_CANDIDATE_ID_PATTERN.findall(prompt_text)))
+        return {
+            "selected_document_ids": candidates[:3],
+            "reasoning": "模擬選擇排名靠前的候選文檔"
+        }
+
+    def _build_cluster_label(self, prompt_text: str) -> Dict[str, Any]:
+        return {
+            "cluster_name": "模擬分類",
+            "cluster_description": "離線模擬生成的聚類描述",
+            "common_themes": ["模擬"],
+            "suggested_keywords": ["模擬", "測試"],
+            "confidence": 0.8,
+            "reasoning": "模擬命名"
+        }
+
+    def _build_batch_cluster_labels(self, prompt_text: str) -> Dict[str, Any]:
+        indexes = [int(index) for index in _CLUSTER_INDEX_PATTERN.findall(prompt_text)]
+        return {
+            "labels": [
+                {"cluster_index": index, "label": f"模擬分類{index}", "keywords": ["模擬"]}
+                for index in indexes
+            ],
+            "total_clusters": len(indexes)
+        }
+
+    def _build_intent_classification(self, prompt_text: str) -> Dict[str, Any]:
+        weights = settings.FAKE_LLM_INTENT_WEIGHTS
+        intents = [intent for intent in weights if intent in _INTENT_STRATEGIES]
+        intent = self._random.choices(intents, weights=[weights[i] for i in intents])[0] if intents else "document_search"
+
+        cached_ids = list(dict.fromkeys(_CACHED_DOCUMENT_ID_PATTERN.findall(prompt_text)))
+        if intent == "document_detail_query" and not cached_ids:
+            # 沒有緩存文檔時無法指定目標文檔
+            intent = "document_search"
+
+        strategy, complexity, api_calls = _INTENT_STRATEGIES[intent]
+        return {
+            "intent": intent,
+            "confidence": round(self._random.uniform(0.75, 0.98), 2),
+            "reasoning": "模擬意圖分類",
+            "requires_documents": intent in ("document_search", "document_detail_query", "complex_analysis"),
+            "requires_context": intent == "document_detail_query",
+            "suggested_strategy": strategy,
+            "query_complexity": complexity,
+            "estimated_api_calls": api_calls,
+            "clarification_question": "請問您想查找哪一份文件？" if intent == "clarification_needed" else None,
+            "suggested_responses": ["最近的發票", "上個月的合約"] if intent == "clarification_needed" else None,
+            "target_document_ids": cached_ids[:1] if intent == "document_detail_query" else None,
+            "target_document_reasoning": "模擬匹配第一份緩存文檔" if intent == "document_detail_query" else None
+        }
+
+    def _build_clarification(self, prompt_text: str) -> Dict[str, Any]:
+        return {
+            "clarification_question": "請問您想查找哪一份文件？",
+            "reasoning": "模擬澄清",
+            "suggested_responses": ["最近的發票", "上個月的合約", "全部文件"],
+            "missing_information": ["目標文件"]
+        }
+
+    def _build_suggested_questions(self, prompt_text: str) -> Dict[str, Any]:
+        question_types = ["summary", "comparison", "analysis", "detail_query", "cross_category"]
+        return {
+            "questions": [
+                {"question": f"模擬建議問題 {i + 1}", "question_type": question_type, "reasoning": "模擬"}
+                for i, question_type in enumerate(question_types)
+            ]
+        }
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """獲取模擬調用統計"""
+        return {
+            "calls": self.stats.calls,
+            "stream_calls": self.stats.stream_calls,
+            "injected_rate_limits": self.stats.injected_rate_limits,
+            "injected_errors": self.stats.injected_errors,
+            "average_latency_seconds": (
+                round(self.stats.total_latency_seconds / self.stats.calls, 3) if self.stats.calls else 0.0
+            ),
+            "calls_by_task": dict(self.stats.calls_by_task)
+        }
@@ -0,0 +1,347 @@
+"""
+LLM 調用帳本
+
+每次 process_request 與流式調用結束後寫入一條結構化記錄：任務類型、模型、
+輸入/輸出 token、限流排隊時間、網絡延遲、重試次數、緩存結果與用戶。
+
+記錄先進入進程內緩衝區，按批次大小或定時批量寫入 llm_call_ledger 集合，
+不阻塞請求路徑；集合以 timestamp 建立 TTL 索引，過期記錄由 MongoDB 自動刪除。
+聚合查詢（按任務、模型、用戶、日期分組的 token 與延遲百分位）見 get_rollup。
+"""
+
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from app.core.config import settings
+from app.core.logging_utils import AppLogger
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+LEDGER_COLLECTION = "llm_call_ledger"
+
+# 聚合時允許的分組欄位
+ROLLUP_GROUP_FIELDS = ("task_type", "model_id", "user_id", "priority", "cache_outcome", "streaming")
+ROLLUP_BUCKET_FORMATS = {"hour": "%Y-%m-%dT%H:00", "day": "%Y-%m-%d"}
+ROLLUP_TIME_RANGES = {"1h": 1, "24h": 24, "7d": 24 * 7, "30d": 24 * 30}
+
+
+class CacheOutcome:
+    """一次請求的回應緩存結果"""
+    MISS = "miss"
+    RESPONSE_CACHE = "response_cache"  # 精確匹配回應緩存命中，未調用模型
+    SHARED = "shared"  # 共享了進行中的相同請求結果
+
+
+@dataclass
+class LLMCallMetrics:
+    """單個模型調用的計時與重試，由 _execute_google_ai_request 填寫"""
+    model_id: str
+    queue_wait_seconds: float = 0.0  # 在限流器中排隊的時間
+    network_seconds: float = 0.0  # 向提供商發出請求到收到回應的時間
+    attempts: int = 0  # 向提供商發出的請求數（含 429 重試）
+    cached_input_tokens: int = 0  # 由 Context Cache 提供的輸入 token
+    succeeded: bool = False  # 調用是否返回了輸出（對沖到同一模型時用於找出產生結果的調用）
+
+
+@dataclass
+class LedgerStats:
+    """帳本寫入統計"""
+    recorded: int = 0
+    written: int = 0
+    dropped: int = 0  # 緩衝區已滿而丟棄的記錄數
+    flushes: int = 0
+    flush_failures: int = 0
+
+
+class LLMCallLedger:
+    """批量寫入的 LLM 調用帳本"""
+
+    def __init__(self):
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._pending_flush: Optional[asyncio.Task] = None
+        self.stats = LedgerStats()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.AI_LLM_LEDGER_ENABLED
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        """綁定數據庫、建立索引並啟動定時寫入"""
+        if not self.enabled:
+            logger.info("LLM 調用帳本未啟用")
+            return
+        self._db = db
+        await self.ensure_indexes(db)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info(f"LLM 調用帳本已啟動，保留 {settings.AI_LLM_LEDGER_TTL_DAYS} 天")
+
+    async def stop(self):
+        """停止定時寫入，並寫出緩衝區中剩餘的記錄"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+    @staticmethod
+    async def ensure_indexes(db: AsyncIOMotorDatabase):
+        collection = db[LEDGER_COLLECTION]
+        try:
+            # TTL 索引：超過保留期的記錄由 MongoDB 自動刪除
+            await collection.create_index(
+                "timestamp",
+                expireAfterSeconds=int(settings.AI_LLM_LEDGER_TTL_DAYS * 86400),
+                name="ledger_ttl"
+            )
+        except OperationFailure:
+            # 保留期變更後更新現有 TTL 索引
+            await db.command({
+                "collMod": LEDGER_COLLECTION,
+                "index": {"name": "ledger_ttl", "expireAfterSeconds": int(settings.AI_LLM_LEDGER_TTL_DAYS * 86400)}
+            })
+        # 聚合查詢常用的過濾模式
+        await collection.create_index([("user_id", ASCENDING), ("timestamp", DESCENDING)])
+        await collection.create_index([("task_type", ASCENDING), ("timestamp", DESCENDING)])
+        await collection.create_index([("model_id", ASCENDING), ("timestamp", DESCENDING)])
+
+    def record(
+        self,
+        task_type: str,
+        model_id: Optional[str],
+        user_id: Optional[str] = None,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        cached_input_tokens: int = 0,
+        queue_wait_seconds: float = 0.0,
+        network_seconds: float = 0.0,
+        total_seconds: float = 0.0,
+        retries: int = 0,
+        cache_outcome: str = CacheOutcome.MISS,
+        success: bool = True,
+        streaming: bool = False,
+        priority: Optional[str] = None,
+        error_message: Optional[str] = None
+    ):
+        """寫入一條記錄到緩衝區（不等待數據庫）"""
+        if not self.enabled:
+            return
+
+        entry = {
+            "timestamp": datetime.utcnow(),
+            "task_type": task_type,
+            "model_id": model_id,
+            "user_id": user_id,
+            "priority": priority,
+            "streaming": streaming,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "cached_input_tokens": cached_input_tokens,
+            "queue_wait_ms": round(queue_wait_seconds * 1000, 1),
+            "network_latency_ms": round(network_seconds * 1000, 1),
+            "total_latency_ms": round(total_seconds * 1000, 1),
+            "retries": retries,
+            "cache_outcome": cache_outcome,
+            "success": success,
+            "error_message": error_message[:300] if error_message else None
+        }
+
+        self.stats.recorded += 1
+        if len(self._buffer) >= settings.AI_LLM_LEDGER_MAX_BUFFER:
+            # 數據庫長時間不可用時丟棄最舊的記錄，避免內存無限增長
+            self._buffer.popleft()
+            self.stats.dropped += 1
+        self._buffer.append(entry)
+
+        if (
+            self._db is not None
+            and len(self._buffer) >= settings.AI_LLM_LEDGER_BATCH_SIZE
+            and (self._pending_flush is None or self._pending_flush.done())
+        ):
+            try:
+                self._pending_flush = asyncio.get_running_loop().create_task(self.flush())
+            except RuntimeError:
+                pass
+
+    async def flush(self) -> int:
+        """把緩衝區中的記錄批量寫入數據庫，返回寫入數"""
+        if self._db is None or not self._buffer:
+            return 0
+
+        written = 0
+        async with self._flush_lock:
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(settings.AI_LLM_LEDGER_BATCH_SIZE, len(self._buffer)))]
+                try:
+                    await self._db[LEDGER_COLLECTION].insert_many(batch, ordered=False)
+                except Exception as e:
+                    self.stats.flush_failures += 1
+                    logger.warning(f"寫入 LLM 調用帳本失敗，{len(batch)} 條記錄留待下次寫入: {e}")
+                    # 放回緩衝區頭部，超出上限時丟棄最舊的記錄
+                    space = max(0, settings.AI_LLM_LEDGER_MAX_BUFFER - len(self._buffer))
+                    kept = batch[max(0, len(batch) - space):]
+                    self.stats.dropped += len(batch) - len(kept)
+                    self._buffer.extendleft(reversed(kept))
+                    break
+                written += len(batch)
+                self.stats.flushes += 1
+        self.stats.written += written
+        return written
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.AI_LLM_LEDGER_FLUSH_INTERVAL_SECONDS)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"LLM 調用帳本定時寫入失敗: {e}")
+
+    async def get_rollup(
+        self,
+        db: AsyncIOMotorDatabase,
+        group_by: List[str],
+        time_range: str = "24h",
+        bucket: Optional[str] = None,
+        user_id: Optional[str] = None,
+        task_type: Optional[str] = None,
+        model_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        按指定欄位（及可選的時間桶）聚合帳本記錄
+
+        Args:
+            group_by: 分組欄位，取自 ROLLUP_GROUP_FIELDS
+            time_range: 1h / 24h / 7d / 30d / all
+            bucket: hour / day，按時間桶再分組
+            user_id / task_type / model_id: 過濾條件
+
+        Returns:
+            每組的調用數、token 總量與平均值、延遲平均值與 p50/p95、錯誤率與緩存命中率
+        """
+        invalid = [name for name in group_by if name not in ROLLUP_GROUP_FIELDS]
+        if invalid:
+            raise ValueError(f"不支援的分組欄位: {invalid}")
+        if bucket is not None and bucket not in ROLLUP_BUCKET_FORMATS:
+            raise ValueError(f"不支援的時間桶: {bucket}")
+
+        match: Dict[str, Any] = {}
+        if time_range != "all":
+            hours = ROLLUP_TIME_RANGES.get(time_range)
+            if hours is None:
+                raise ValueError(f"不支援的時間範圍: {time_range}")
+            match["timestamp"] = {"$gte": datetime.utcnow() - timedelta(hours=hours)}
+        for name, value in (("user_id", user_id), ("task_type", task_type), ("model_id", model_id)):
+            if value is not None:
+                match[name] = value
+
+        group_id: Dict[str, Any] = {name: f"${name}" for name in group_by}
+        if bucket:
+            group_id["bucket"] = {"$dateToString": {"format": ROLLUP_BUCKET_FORMATS[bucket], "date": "$timestamp"}}
+
+        accumulators: Dict[str, Any] = {
+            "calls": {"$sum": 1},
+            "prompt_tokens": {"$sum": "$prompt_tokens"},
+            "completion_tokens": {"$sum": "$completion_tokens"},
+            "total_tokens": {"$sum": "$total_tokens"},
+            "cached_input_tokens": {"$sum": "$cached_input_tokens"},
+            "avg_total_tokens": {"$avg": "$total_tokens"},
+            "avg_queue_wait_ms": {"$avg": "$queue_wait_ms"},
+            "avg_network_latency_ms": {"$avg": "$network_latency_ms"},
+            "avg_total_latency_ms": {"$avg": "$total_latency_ms"},
+            "max_total_latency_ms": {"$max": "$total_latency_ms"},
+            "retries": {"$sum": "$retries"},
+            "errors": {"$sum": {"$cond": ["$success", 0, 1]}},
+            "cache_hits": {"$sum": {"$cond": [{"$eq": ["$cache_outcome", CacheOutcome.MISS]}, 0, 1]}}
+        }
+        percentile_accumulators = {
+            "latency_percentiles_ms": {
+                "$percentile": {"input": "$total_latency_ms", "p": [0.5, 0.95], "method": "approximate"}
+            },
+            "network_percentiles_ms": {
+                "$percentile": {"input": "$network_latency_ms", "p": [0.5, 0.95], "method": "approximate"}
+            }
+        }
+
+        collection = db[LEDGER_COLLECTION]
+        try:
+            rows = await collection.aggregate([
+                {"$match": match},
+                {"$group": {"_id": group_id, **accumulators, **percentile_accumulators}},
+                {"$sort": {"total_tokens": -1}}
+            ]).to_list(None)
+            percentiles_available = True
+        except OperationFailure as e:
+            # $percentile 需要 MongoDB 7.0+，舊版本只返回平均值與最大值
+            logger.debug(f"聚合百分位不可用，僅返回平均延遲: {e}")
+            rows = await collection.aggregate([
+                {"$match": match},
+                {"$group": {"_id": group_id, **accumulators}},
+                {"$sort": {"total_tokens": -1}}
+            ]).to_list(None)
+            percentiles_available = False
+
+        groups = []
+        for row in rows:
+            calls = row["calls"] or 1
+            group = {
+                **(row["_id"] or {}),
+                "calls": row["calls"],
+                "prompt_tokens": row["prompt_tokens"],
+                "completion_tokens": row["completion_tokens"],
+                "total_tokens": row["total_tokens"],
+                "cached_input_tokens": row["cached_input_tokens"],
+                "avg_total_tokens": round(row["avg_total_tokens"] or 0, 1),
+                "avg_queue_wait_ms": round(row["avg_queue_wait_ms"] or 0, 1),
+                "avg_network_latency_ms": round(row["avg_network_latency_ms"] or 0, 1),
+                "avg_total_latency_ms": round(row["avg_total_latency_ms"] or 0, 1),
+                "max_total_latency_ms": row["max_total_latency_ms"],
+                "retries": row["retries"],
+                "error_rate": round(row["errors"] / calls * 100, 2),
+                "cache_hit_rate": round(row["cache_hits"] / calls * 100, 2)
+            }
+            if percentiles_available:
+                latency = row.get("latency_percentiles_ms") or [None, None]
+                network = row.get("network_percentiles_ms") or [None, None]
+                group["p50_total_latency_ms"], group["p95_total_latency_ms"] = latency
+                group["p50_network_latency_ms"], group["p95_network_latency_ms"] = network
+            groups.append(group)
+
+        return {
+            "time_range": time_range,
+            "group_by": group_by,
+            "bucket": bucket,
+            "percentiles_available": percentiles_available,
+            "groups": groups
+        }
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """獲取帳本寫入狀態"""
+        return {
+            "enabled": self.enabled,
+            "started": self._db is not None,
+            "buffered": len(self._buffer),
+            "recorded": self.stats.recorded,
+            "written": self.stats.written,
+            "dropped": self.stats.dropped,
+            "flushes": self.stats.flushes,
+            "flush_failures": self.stats.flush_failures
+        }
+
+
+# 全局實例
+llm_call_ledger = LLMCallLedger()
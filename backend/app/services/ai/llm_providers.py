@@ -0,0 +1,135 @@
+"""
+LLM 提供商抽象
+
+UnifiedAIServiceSimplified 只負責提示詞、限流、重試和解析，實際的模型調用
+交給這裡的提供商：
+- GoogleAIProvider：調用 Gemini
+- FakeLLMProvider：本地模擬（見 fake_llm_provider），用於離線壓測完整 QA 流程
+
+由 AI_PROVIDER_BACKEND 設定選擇。兩者的回應都帶有 .text 和 .usage_metadata
+（prompt_token_count / candidates_token_count / cached_content_token_count），與 Gemini 回應保持一致。
+
+generate 可帶 Context Cache ID（cached_content），此時 prompt_parts 不含系統指令。
+"""
+
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import google.generativeai as genai
+
+from app.core.config import settings
+from app.core.logging_utils import AppLogger
+from app.services.ai.unified_ai_config import TaskType
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+
+class LLMStream(ABC):
+    """流式回應：逐塊產出文本，迭代結束後可讀取 usage_metadata"""
+
+    @abstractmethod
+    def chunks(self) -> AsyncIterator[str]:
+        ...
+
+    @property
+    def usage_metadata(self) -> Any:
+        return None
+
+
+class LLMProvider(ABC):
+    """LLM 提供商介面"""
+
+    name: str = "base"
+
+    @abstractmethod
+    async def generate(
+        self,
+        task_type: Optional[TaskType],
+        model_id: str,
+        prompt_parts: List[Any],
+        generation_config: Optional[Dict[str, Any]],
+        safety_settings: Optional[Dict[Any, Any]],
+        cached_content: Optional[str] = None
+    ) -> Any:
+        """單次生成，返回帶 .text 與 .usage_metadata 的回應；cached_content 為 Context Cache ID"""
+
+    @abstractmethod
+    async def stream(
+        self,
+        task_type: Optional[TaskType],
+        model_id: str,
+        prompt_parts: List[Any],
+        generation_config: Optional[Dict[str, Any]],
+        safety_settings: Optional[Dict[Any, Any]]
+    ) -> LLMStream:
+        """流式生成"""
+
+
+class _GoogleStream(LLMStream):
+    def __init__(self, response: Any):
+        self._response = response
+
+    async def chunks(self) -> AsyncIterator[str]:
+        for chunk in self._response:
+            if chunk.text:
+                yield chunk.text
+
+    @property
+    def usage_metadata(self) -> Any:
+        return getattr(self._response, "usage_metadata", None)
+
+
+class GoogleAIProvider(LLMProvider):
+    """Google Gemini 提供商"""
+
+    name = "google"
+
+    async def generate(self, task_type, model_id, prompt_parts, generation_config, safety_settings, cached_content=None):
+        if cached_content:
+            # 使用創建緩存時保存的 CachedContent 對象，避免 from_cached_content 再同步請求一次
+            from app.services.cache.google_context_cache_service import google_context_cache_service
+            model = genai.GenerativeModel.from_cached_content(
+                await google_context_cache_service.get_cached_content(cached_content),
+                generation_config=generation_config,
+                safety_settings=safety_settings
+            )
+        else:
+            model = genai.GenerativeModel(
+                model_name=model_id,
+                generation_config=generation_config,
+                safety_settings=safety_settings
+            )
+        return await model.generate_content_async(prompt_parts)
+
+    async def stream(self, task_type, model_id, prompt_parts, generation_config, safety_settings):
+        model = genai.GenerativeModel(
+            model_name=model_id,
+            generation_config=generation_config,
+            safety_settings=safety_settings
+        )
+        # 使用 stream=True 啟用流式輸出
+        return _GoogleStream(model.generate_content(prompt_parts, stream=True))
+
+
+_providers: Dict[str, LLMProvider] = {}
+
+
+def get_llm_provider(backend: Optional[str] = None) -> LLMProvider:
+    """按 AI_PROVIDER_BACKEND 返回提供商實例（"google" 或 "fake"）"""
+    backend = (backend or settings.AI_PROVIDER_BACKEND or "google").lower()
+    provider = _providers.get(backend)
+    if provider is not None:
+        return provider
+
+    if backend == "fake":
+        from app.services.ai.fake_llm_provider import FakeLLMProvider
+        provider = FakeLLMProvider()
+        logger.warning("AI 提供商使用本地模擬後端 (fake)，不會調用任何真實模型")
+    else:
+        if backend != "google":
+            logger.warning(f"未知的 AI_PROVIDER_BACKEND: {backend}，使用 google")
+        provider = GoogleAIProvider()
+    _providers[backend] = provider
+    return provider
@@ -0,0 +1,250 @@
+"""
+AI 請求對沖與故障轉移
+
+單次慢調用或模型暫時不可用會讓用戶多等很久。此模塊按任務與模型記錄最近的
+成功延遲，以 p95 作為截止時間（不超過任務的延遲 SLO）。延遲與截止時間都從限流器
+放行調用時開始計算，在限流器中排隊的時間不算慢調用，排隊期間不對沖：
+- 互動請求超過截止時間仍未返回時，向後備模型（沒有後備時為同一模型）發出一個對沖請求，
+  先成功的結果勝出，另一個請求被取消
+- 請求失敗時立即轉移到下一個後備模型，而不是在同一模型上指數退避
+
+後台任務只做故障轉移，不做對沖，避免在批量處理時成倍消耗配額。
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.logging_utils import AppLogger
+from app.models.ai_models_simplified import TokenUsage
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+CallResult = Tuple[Optional[str], Optional[TokenUsage]]
+# 以模型 ID 發起調用；第二個參數在限流器放行、實際向提供商發出請求時調用
+ModelCall = Callable[[str, Callable[[], None]], Awaitable[CallResult]]
+
+
+@dataclass
+class HedgeStats:
+    """單個任務類型的對沖統計"""
+    requests: int = 0
+    hedged: int = 0  # 超過截止時間後發出對沖的請求數
+    hedge_wins: int = 0  # 對沖請求先成功的次數
+    primary_wins: int = 0  # 已對沖但原請求先成功的次數
+    failovers: int = 0  # 失敗後轉移到後備模型的次數
+    failover_successes: int = 0
+    cancelled: int = 0  # 被取消的落後請求數
+    failures: int = 0  # 所有嘗試都失敗的請求數
+
+
+@dataclass
+class _Attempt:
+    """一次模型調用嘗試"""
+    model_id: str
+    is_hedge: bool
+    launched_at: float
+    started_at: Optional[float] = None  # 限流器放行的時間，調用未回報時為 None
+
+    def mark_started(self) -> None:
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+
+
+class RequestHedger:
+    """按任務 p95 延遲對沖並在失敗時轉移模型"""
+
+    def __init__(self):
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._stats: Dict[str, HedgeStats] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return settings.AI_HEDGING_ENABLED
+
+    def _task_stats(self, task_key: str) -> HedgeStats:
+        return self._stats.setdefault(task_key, HedgeStats())
+
+    def record_latency(self, task_key: str, model_id: str, seconds: float):
+        window = self._latencies.setdefault(
+            f"{task_key}:{model_id}", deque(maxlen=settings.AI_HEDGE_LATENCY_WINDOW)
+        )
+        window.append(seconds)
+
+    def _percentile(self, task_key: str, model_id: str) -> Optional[float]:
+        window = self._latencies.get(f"{task_key}:{model_id}")
+        if not window or len(window) < settings.AI_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(window)
+        index = min(len(ordered) - 1, int(len(ordered) * settings.AI_HEDGE_LATENCY_PERCENTILE / 100))
+        return ordered[index]
+
+    def get_deadline(self, task_key: str, model_id: str) -> float:
+        """對沖截止時間：p95 延遲（樣本不足時用任務 SLO），不超過任務 SLO"""
+        slos = settings.AI_HEDGE_TASK_SLO_SECONDS
+        slo = slos.get(task_key, slos.get("default", 15.0))
+        percentile = self._percentile(task_key, model_id)
+        if percentile is None:
+            return slo
+        return min(slo, max(settings.AI_HEDGE_MIN_DEADLINE_SECONDS, percentile * settings.AI_HEDGE_DEADLINE_MULTIPLIER))
+
+    async def execute(
+        self,
+        task_key: str,
+        primary_model: str,
+        call: ModelCall,
+        fallback_models: Optional[List[str]] = None,
+        hedge: bool = True
+    ) -> Tuple[Optional[str], Optional[TokenUsage], str]:
+        """
+        執行一次 AI 調用，必要時對沖或轉移到後備模型
+
+        Args:
+            call: 以模型 ID 與放行回調發起調用，返回 (輸出文本, token 用量)；輸出為 None 表示失敗
+            fallback_models: 後備模型（按偏好順序）
+            hedge: 是否允許超時對沖（後台任務傳 False）
+
+        Returns:
+            (輸出文本, token 用量, 實際產生結果的模型)
+        """
+        if not self.enabled:
+            output_text, token_usage = await call(primary_model, lambda: None)
+            return output_text, token_usage, primary_model
+
+        stats = self._task_stats(task_key)
+        stats.requests += 1
+        fallbacks = [m for m in (fallback_models or []) if m != primary_model]
+        max_attempts = max(1, settings.AI_HEDGE_MAX_ATTEMPTS)
+
+        attempts: Dict[asyncio.Task, _Attempt] = {}
+        attempted_models: List[str] = []
+        primary_started = asyncio.Event()
+
+        def _launch(model_id: str, is_hedge: bool) -> _Attempt:
+            is_primary = not attempted_models
+            attempted_models.append(model_id)
+            attempt = _Attempt(model_id=model_id, is_hedge=is_hedge, launched_at=time.monotonic())
+
+            def _on_start() -> None:
+                attempt.mark_started()
+                if is_primary:
+                    primary_started.set()
+
+            attempts[asyncio.create_task(call(model_id, _on_start))] = attempt
+            return attempt
+
+        def _next_model(allow_same: bool) -> Optional[str]:
+            for model_id in fallbacks:
+                if model_id not in attempted_models:
+                    return model_id
+            return primary_model if allow_same else None
+
+        primary = _launch(primary_model, False)
+        pending = set(attempts)
+        hedged = False
+        deadline = self.get_deadline(task_key, primary_model)
+        last_result: Tuple[Optional[str], Optional[TokenUsage], str] = (None, None, primary_model)
+
+        try:
+            while pending:
+                can_hedge = hedge and not hedged and len(attempted_models) < max_attempts
+                if can_hedge and primary.started_at is None:
+                    # 原請求仍在限流器排隊：等到放行或完成，排隊時間不計入截止時間
+                    started_waiter = asyncio.create_task(primary_started.wait())
+                    try:
+                        done, _ = await asyncio.wait(
+                            pending | {started_waiter}, return_when=asyncio.FIRST_COMPLETED
+                        )
+                    finally:
+                        started_waiter.cancel()
+                    done.discard(started_waiter)
+                    pending -= done
+                else:
+                    timeout = max(0.0, primary.started_at + deadline - time.monotonic()) if can_hedge else None
+                    done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                    if not done:
+                        # 超過截止時間：保留原請求，同時向後備模型（或同一模型）發出對沖
+                        hedged = True
+                        stats.hedged += 1
+                        hedge_model = _next_model(allow_same=settings.AI_HEDGE_SAME_MODEL_WHEN_NO_FALLBACK)
+                        if hedge_model is None:
+                            continue
+                        logger.info(f"[Hedge] Task: {task_key}, {primary_model} 超過截止時間，對沖到 {hedge_model}")
+                        _launch(hedge_model, True)
+                        pending = {task for task in attempts if not task.done()}
+                        continue
+
+                for task in done:
+                    attempt = attempts[task]
+                    model_id, is_hedge = attempt.model_id, attempt.is_hedge
+                    try:
+                        output_text, token_usage = task.result()
+                    except Exception as e:
+                        logger.warning(f"[Hedge] Task: {task_key}, Model: {model_id} 調用異常: {e}")
+                        output_text, token_usage = None, TokenUsage(
+                            prompt_tokens=0, completion_tokens=0, total_tokens=0, error_message=str(e)
+                        )
+
+                    if output_text is not None:
+                        started_at = attempt.started_at if attempt.started_at is not None else attempt.launched_at
+                        self.record_latency(task_key, model_id, time.monotonic() - started_at)
+                        if hedged:
+                            if is_hedge:
+                                stats.hedge_wins += 1
+                            else:
+                                stats.primary_wins += 1
+                        if model_id != primary_model and not is_hedge:
+                            stats.failover_successes += 1
+                        return output_text, token_usage, model_id
+                    last_result = (output_text, token_usage, model_id)
+
+                if not pending and len(attempted_models) < max_attempts:
+                    # 全部嘗試都失敗：立即轉移到下一個後備模型
+                    failover_model = _next_model(allow_same=False)
+                    if failover_model is not None:
+                        stats.failovers += 1
+                        logger.warning(f"[Failover] Task: {task_key}, {last_result[2]} 失敗，轉移到 {failover_model}")
+                        _launch(failover_model, False)
+                        pending = {task for task in attempts if not task.done()}
+
+            stats.failures += 1
+            return last_result
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+                    stats.cancelled += 1
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """獲取各任務的對沖率、對沖勝出率與故障轉移統計"""
+        tasks = {}
+        for task_key, stats in self._stats.items():
+            tasks[task_key] = {
+                "requests": stats.requests,
+                "hedged": stats.hedged,
+                "hedge_rate": round(stats.hedged / stats.requests * 100, 2) if stats.requests else 0.0,
+                "hedge_wins": stats.hedge_wins,
+                "primary_wins": stats.primary_wins,
+                "hedge_win_rate": round(stats.hedge_wins / stats.hedged * 100, 2) if stats.hedged else None,
+                "failovers": stats.failovers,
+                "failover_successes": stats.failover_successes,
+                "cancelled": stats.cancelled,
+                "failures": stats.failures
+            }
+        deadlines = {}
+        for key in self._latencies:
+            task_key, model_id = key.split(":", 1)
+            deadlines[key] = round(self.get_deadline(task_key, model_id), 3)
+        return {
+            "enabled": self.enabled,
+            "tasks": tasks,
+            "deadlines_seconds": deadlines
+        }
+
+
+# 全局實例
+request_hedger = RequestHedger()
@@ -14,6 +14,7 @@ from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.core.logging_utils import AppLogger
 from app.services.ai.unified_ai_service_simplified import unified_ai_service_simplified
 from app.services.ai.unified_ai_config import TaskType
+from app.services.ai.ai_rate_limiter import RequestPriority
 from app.services.external.clustering_service import ClusteringService
 from app.crud import crud_documents, crud_suggested_questions
 from app.models.suggested_question_models import (
@@ -73,8 +74,7 @@ class SuggestedQuestionsGenerator:
             # 使用 UUID 轉換
             from uuid import UUID
             owner_uuid = UUID(user_id)
-            documents = await crud_documents.get_documents(db, owner_id=owner_uuid, limit=10000)
-            doc_count = len(documents)
+            doc_count = await crud_documents.count_documents(db, owner_id=owner_uuid)
             should_gen = await crud_suggested_questions.should_regenerate_questions(
                 db, user_id, doc_count
             )
@@ -94,7 +94,8 @@ class SuggestedQuestionsGenerator:
         # 使用 UUID 轉換
         from uuid import UUID
         owner_uuid = UUID(user_id)
-        documents = await crud_documents.get_documents(db, owner_id=owner_uuid, limit=10000)
+        # 問題生成只使用文件名、類型與摘要
+        documents = await crud_documents.get_document_summaries(db, owner_id=owner_uuid, limit=10000)
         
         if len(documents) < 3:
             logger.warning(f"用戶 {user_id} 文檔數量不足（{len(documents)}），無法生成有意義的問題")
@@ -104,7 +105,7 @@ class SuggestedQuestionsGenerator:
         all_questions = []
         total_clusters = len(clusters)
         
-        # 使用信號量控制並發數量（每分鐘最多 5 個請求）
+        # 使用信號量控制本地並發數量；API 速率由全局 AI 限流器（後台通道）控制
         import asyncio
         semaphore = asyncio.Semaphore(5)  # 最多 5 個並發
         completed_count = 0
@@ -136,9 +137,6 @@ class SuggestedQuestionsGenerator:
                 
                 logger.info(f"聚類 '{cluster['cluster_name']}' 生成了 {len(cluster_questions)} 個問題")
                 
-                # 為了避免超過 API 限制，每個請求完成後等待 12 秒（5 requests/min = 12s/request）
-                await asyncio.sleep(12)
-                
                 return cluster_questions
         
         # 並發執行所有聚類的問題生成
@@ -283,10 +281,7 @@ class SuggestedQuestionsGenerator:
         # 準備文檔摘要信息
         docs_info = []
         for doc in selected_docs:
-            summary = ""
-            if doc.analysis and doc.analysis.ai_analysis_output:
-                key_info = doc.analysis.ai_analysis_output.get("key_information", {})
-                summary = key_info.get("content_summary", "")[:200]
+            summary = (doc.content_summary or "")[:200]
             
             docs_info.append({
                 "filename": doc.filename,
@@ -325,7 +320,8 @@ class SuggestedQuestionsGenerator:
                 content=prompt_content,
                 model_preference=None,
                 user_id=user_id,
-                prompt_params={"prompt_content": prompt_content}
+                prompt_params={"prompt_content": prompt_content},
+                priority=RequestPriority.BACKGROUND
             )
             
             response = await self.ai_service.process_request(request, db)
@@ -409,7 +405,8 @@ class SuggestedQuestionsGenerator:
                 task_type=TaskType.QUESTION_GENERATION,
                 content=prompt_content,
                 model_preference=None,
-                prompt_params={"prompt_content": prompt_content}
+                prompt_params={"prompt_content": prompt_content},
+                priority=RequestPriority.BACKGROUND
             )
             
             response = await self.ai_service.process_request(request, db)
@@ -0,0 +1,255 @@
+"""
+本地 token 估算器與提示詞預算分配
+
+以往的提示詞長度以字符數控制，流式路徑還會調用遠端 count_tokens API。
+此模塊在本地估算 token 數：
+1. 設定了離線分詞器（AI_TOKENIZER_PATH）時使用分詞器計數
+2. 否則按中日韓字符 / 其他字符分別估算的啟發式
+兩種方式都按模型維護校準係數，由 API 回報的實際 token 數（usage_metadata）持續修正。
+
+allocate_token_budget 在預算不足時按價值從低到高壓縮提示詞的各部分
+（對話歷史 → 文檔上下文 → 意圖分析 → 問題），系統提示詞不壓縮。
+"""
+
+import logging
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.logging_utils import AppLogger
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:  # pragma: no cover - 未安裝 tokenizers 時只使用啟發式估算
+    Tokenizer = None
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+# Gemini 每張圖片固定計為 258 個輸入 token
+IMAGE_TOKENS = 258
+
+# 校準係數的上下限，避免單次異常回報把估算帶偏
+_MIN_CALIBRATION = 0.5
+_MAX_CALIBRATION = 2.0
+
+_CJK_PATTERN = re.compile(
+    r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]"
+)
+
+TRUNCATION_MARKER_HEAD = "\n...（內容過長，已按 token 預算截斷）"
+TRUNCATION_MARKER_TAIL = "（較早的內容已按 token 預算省略）...\n"
+
+
+@dataclass
+class ModelCalibration:
+    """單個模型的估算校準狀態"""
+    factor: float = 1.0  # 實際 token 數 / 原始估算值
+    samples: int = 0
+    last_error_percent: Optional[float] = None
+
+
+class TokenEstimator:
+    """按模型校準的本地 token 估算器"""
+
+    def __init__(self, tokenizer_path: Optional[str] = None):
+        self._tokenizer_path = tokenizer_path if tokenizer_path is not None else settings.AI_TOKENIZER_PATH
+        self._tokenizer = None
+        self._tokenizer_loaded = False
+        self._calibrations: Dict[str, ModelCalibration] = {}
+
+    @property
+    def backend(self) -> str:
+        return "tokenizer" if self._get_tokenizer() is not None else "heuristic"
+
+    def _get_tokenizer(self):
+        """延遲載入離線分詞器，載入失敗時退回啟發式估算"""
+        if self._tokenizer_loaded:
+            return self._tokenizer
+        self._tokenizer_loaded = True
+        path = self._tokenizer_path
+        if not path:
+            return None
+        if Tokenizer is None:
+            logger.warning("已設定 AI_TOKENIZER_PATH 但未安裝 tokenizers，使用啟發式 token 估算")
+            return None
+        if not os.path.exists(path):
+            logger.warning(f"離線分詞器文件不存在: {path}，使用啟發式 token 估算")
+            return None
+        try:
+            self._tokenizer = Tokenizer.from_file(path)
+            logger.info(f"已載入離線分詞器: {path}")
+        except Exception as e:
+            logger.warning(f"載入離線分詞器失敗: {e}，使用啟發式 token 估算")
+            self._tokenizer = None
+        return self._tokenizer
+
+    def count_raw(self, text: Optional[str]) -> int:
+        """未經模型校準的 token 數"""
+        if not text:
+            return 0
+        tokenizer = self._get_tokenizer()
+        if tokenizer is not None:
+            try:
+                return len(tokenizer.encode(text, add_special_tokens=False).ids)
+            except Exception as e:
+                logger.debug(f"離線分詞器計數失敗，改用啟發式估算: {e}")
+        cjk_chars = len(_CJK_PATTERN.findall(text))
+        other_chars = len(text) - cjk_chars
+        return math.ceil(
+            cjk_chars * settings.AI_TOKEN_ESTIMATE_CJK_TOKENS_PER_CHAR
+            + other_chars / settings.AI_TOKEN_ESTIMATE_CHARS_PER_TOKEN
+        )
+
+    def calibration_factor(self, model_id: Optional[str]) -> float:
+        calibration = self._calibrations.get(model_id) if model_id else None
+        return calibration.factor if calibration else 1.0
+
+    def count(self, text: Optional[str], model_id: Optional[str] = None) -> int:
+        """估算文本的 token 數（按模型校準）"""
+        raw = self.count_raw(text)
+        if raw == 0:
+            return 0
+        return max(1, math.ceil(raw * self.calibration_factor(model_id)))
+
+    def count_prompt(
+        self,
+        system_prompt: Optional[str],
+        user_prompt: Optional[str],
+        model_id: Optional[str] = None,
+        image_count: int = 0
+    ) -> int:
+        """估算一次請求的輸入 token 數"""
+        text_tokens = self.count((system_prompt or "") + (user_prompt or ""), model_id)
+        return text_tokens + image_count * IMAGE_TOKENS
+
+    def calibrate(self, model_id: str, raw_estimate: int, actual_tokens: int):
+        """
+        以 API 回報的實際 token 數更新模型的校準係數
+
+        Args:
+            raw_estimate: 同一段文本的 count_raw 結果
+            actual_tokens: API 回報的文本部分 token 數（已扣除圖片）
+        """
+        if not model_id or raw_estimate <= 0 or actual_tokens <= 0:
+            return
+        calibration = self._calibrations.setdefault(model_id, ModelCalibration())
+        observed = min(max(actual_tokens / raw_estimate, _MIN_CALIBRATION), _MAX_CALIBRATION)
+        predicted = raw_estimate * calibration.factor
+        calibration.last_error_percent = round((predicted - actual_tokens) / actual_tokens * 100, 2)
+        if calibration.samples == 0:
+            calibration.factor = observed
+        else:
+            alpha = settings.AI_TOKEN_CALIBRATION_ALPHA
+            calibration.factor = (1 - alpha) * calibration.factor + alpha * observed
+        calibration.samples += 1
+
+    def truncate(
+        self,
+        text: str,
+        max_tokens: int,
+        model_id: Optional[str] = None,
+        keep: str = "head"
+    ) -> str:
+        """
+        把文本截斷到不超過 max_tokens（含截斷標記）
+
+        Args:
+            keep: "head" 保留開頭（文檔內容），"tail" 保留結尾（對話歷史中最近的輪次）
+        """
+        if self.count(text, model_id) <= max_tokens:
+            return text
+        marker = TRUNCATION_MARKER_HEAD if keep == "head" else TRUNCATION_MARKER_TAIL
+        available = max_tokens - self.count(marker, model_id)
+        if available <= 0:
+            return ""
+
+        def _piece(length: int) -> str:
+            return text[:length] if keep == "head" else text[len(text) - length:]
+
+        # 二分搜索能放入預算的最長字符數
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count(_piece(mid), model_id) <= available:
+                low = mid
+            else:
+                high = mid - 1
+        if low == 0:
+            return ""
+        return _piece(low) + marker if keep == "head" else marker + _piece(low)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """獲取估算後端與各模型校準狀態"""
+        return {
+            "backend": self.backend,
+            "tokenizer_path": self._tokenizer_path,
+            "models": {
+                model_id: {
+                    "factor": round(calibration.factor, 4),
+                    "samples": calibration.samples,
+                    "last_error_percent": calibration.last_error_percent
+                }
+                for model_id, calibration in self._calibrations.items()
+            }
+        }
+
+
+@dataclass
+class PromptSegment:
+    """提示詞中可按預算壓縮的一部分"""
+    name: str
+    text: str
+    priority: int  # 數值越小越先被壓縮
+    keep: str = "head"  # 壓縮時保留開頭或結尾
+    min_tokens: int = 0  # 壓縮後至少保留的 token 數
+    tokens: int = field(default=0, init=False)
+
+
+def allocate_token_budget(
+    segments: List[PromptSegment],
+    available_tokens: int,
+    estimator: TokenEstimator,
+    model_id: Optional[str] = None
+) -> Dict[str, str]:
+    """
+    在可用 token 內分配各部分的長度，超出時按價值從低到高壓縮
+
+    低價值部分先被壓縮到 min_tokens，仍然超出時才壓縮下一部分；
+    預算充足時原樣返回，不浪費任何上下文。
+
+    Returns:
+        {segment.name: 分配後的文本}
+    """
+    for segment in segments:
+        segment.tokens = estimator.count(segment.text, model_id)
+
+    overflow = sum(segment.tokens for segment in segments) - max(available_tokens, 0)
+    result = {segment.name: segment.text for segment in segments}
+    if overflow <= 0:
+        return result
+
+    for segment in sorted(segments, key=lambda s: s.priority):
+        if overflow <= 0:
+            break
+        reducible = segment.tokens - segment.min_tokens
+        if reducible <= 0:
+            continue
+        target = segment.tokens - min(overflow, reducible)
+        compressed = estimator.truncate(segment.text, target, model_id, keep=segment.keep)
+        compressed_tokens = estimator.count(compressed, model_id)
+        overflow -= segment.tokens - compressed_tokens
+        result[segment.name] = compressed
+        logger.info(
+            f"提示詞預算不足，壓縮 {segment.name}: {segment.tokens} -> {compressed_tokens} tokens"
+        )
+
+    if overflow > 0:
+        logger.warning(f"提示詞壓縮後仍超出預算約 {overflow} tokens")
+    return result
+
+
+# 全局實例
+token_estimator = TokenEstimator()
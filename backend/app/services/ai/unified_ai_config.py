@@ -190,12 +190,14 @@ class AIProvider(Enum):
 class TaskType(Enum):
     """AI任務類型枚舉"""
     TEXT_GENERATION = "text_generation"
+    BATCH_TEXT_ANALYSIS = "batch_text_analysis"  # 多份短文檔合併為一次文本分析
     IMAGE_ANALYSIS = "image_analysis" 
     EMBEDDING = "embedding"
     CLASSIFICATION = "classification"
     QUERY_REWRITE = "query_rewrite"
     ANSWER_GENERATION = "answer_generation"
     MONGODB_DETAIL_QUERY_GENERATION = "mongodb_detail_query_generation"
+    BATCH_MONGODB_DETAIL_QUERY_GENERATION = "batch_mongodb_detail_query_generation"  # 一次為多個文檔生成詳細查詢
     DOCUMENT_SELECTION_FOR_QUERY = "document_selection_for_query"
     CLUSTER_LABEL_GENERATION = "cluster_label_generation"  # 單個聚類標籤生成
     BATCH_CLUSTER_LABELS = "batch_cluster_labels"  # 批量聚類標籤生成
@@ -323,6 +325,11 @@ class UnifiedAIConfig:
             generation_params=GenerationParams(temperature=settings.AI_TEMPERATURE, top_p=settings.AI_TOP_P, top_k=settings.AI_TOP_K,
                                            max_output_tokens=settings.AI_MAX_OUTPUT_TOKENS, response_mime_type="application/json",
                                            safety_settings=common_safety_settings), timeout_seconds=30, retry_attempts=3)
+        self._task_configs[TaskType.BATCH_TEXT_ANALYSIS] = TaskConfig(
+            task_type=TaskType.BATCH_TEXT_ANALYSIS, preferred_models=get_preferred_models_for_task_init(False),
+            generation_params=GenerationParams(temperature=settings.AI_TEMPERATURE, top_p=settings.AI_TOP_P, top_k=settings.AI_TOP_K,
+                                           max_output_tokens=settings.AI_MAX_OUTPUT_TOKENS, response_mime_type="application/json",
+                                           safety_settings=common_safety_settings), timeout_seconds=90, retry_attempts=1)
         self._task_configs[TaskType.IMAGE_ANALYSIS] = TaskConfig(
             task_type=TaskType.IMAGE_ANALYSIS, preferred_models=get_preferred_models_for_task_init(True),
             generation_params=GenerationParams(temperature=settings.AI_TEMPERATURE, top_p=settings.AI_TOP_P, top_k=settings.AI_TOP_K,
@@ -361,6 +368,22 @@ class UnifiedAIConfig:
             retry_attempts=2
         )
         
+        # 多文檔詳細查詢一次生成（輸出 token 上限由調用方按文檔數覆蓋）
+        self._task_configs[TaskType.BATCH_MONGODB_DETAIL_QUERY_GENERATION] = TaskConfig(
+            task_type=TaskType.BATCH_MONGODB_DETAIL_QUERY_GENERATION,
+            preferred_models=get_preferred_models_for_task_init(False),
+            generation_params=GenerationParams(
+                temperature=0.3,
+                top_p=settings.AI_TOP_P,
+                top_k=settings.AI_TOP_K,
+                max_output_tokens=4096,
+                response_mime_type="application/json",
+                safety_settings=common_safety_settings
+            ),
+            timeout_seconds=40,
+            retry_attempts=1
+        )
+        
         # Configuration for Cluster Label Generation
         self._task_configs[TaskType.CLUSTER_LABEL_GENERATION] = TaskConfig(
             task_type=TaskType.CLUSTER_LABEL_GENERATION,
@@ -518,7 +541,25 @@ class UnifiedAIConfig:
             models = [m for m in models if self._is_model_suitable_for_task(m, task_type)]
         
         return sorted(models, key=lambda x: x.display_name)
-    
+
+    def get_fallback_models(self, task_type: TaskType, exclude: Optional[str] = None) -> List[str]:
+        """按任務配置的偏好列表返回可用的後備模型（不含 exclude），用於對沖請求與故障轉移"""
+        task_config = self._task_configs.get(task_type)
+        if not task_config:
+            return []
+        fallbacks = []
+        for model_id in task_config.preferred_models:
+            model_cfg = self._models.get(model_id)
+            if (
+                model_id != exclude
+                and model_id not in fallbacks
+                and model_cfg is not None
+                and model_cfg.is_available
+                and self._is_model_suitable_for_task(model_cfg, task_type)
+            ):
+                fallbacks.append(model_id)
+        return fallbacks
+
     async def verify_and_save_api_key(self, api_key: str) -> tuple[bool, str]:
         """驗證並保存API金鑰"""
         is_valid, message = verify_google_api_key(api_key)
@@ -603,9 +644,11 @@ class UnifiedAIConfig:
                 return preferred if preferred else ["gemini-2.0-flash"]
             
             if TaskType.TEXT_GENERATION in self._task_configs: self._task_configs[TaskType.TEXT_GENERATION].preferred_models = get_preferred_models_for_task_reload(False)
+            if TaskType.BATCH_TEXT_ANALYSIS in self._task_configs: self._task_configs[TaskType.BATCH_TEXT_ANALYSIS].preferred_models = get_preferred_models_for_task_reload(False)
             if TaskType.IMAGE_ANALYSIS in self._task_configs: self._task_configs[TaskType.IMAGE_ANALYSIS].preferred_models = get_preferred_models_for_task_reload(True)
             # Add MONGODB_DETAIL_QUERY_GENERATION to the reload logic
             if TaskType.MONGODB_DETAIL_QUERY_GENERATION in self._task_configs: self._task_configs[TaskType.MONGODB_DETAIL_QUERY_GENERATION].preferred_models = get_preferred_models_for_task_reload(False)
+            if TaskType.BATCH_MONGODB_DETAIL_QUERY_GENERATION in self._task_configs: self._task_configs[TaskType.BATCH_MONGODB_DETAIL_QUERY_GENERATION].preferred_models = get_preferred_models_for_task_reload(False)
             # Add DOCUMENT_SELECTION_FOR_QUERY to the reload logic
             if TaskType.DOCUMENT_SELECTION_FOR_QUERY in self._task_configs: self._task_configs[TaskType.DOCUMENT_SELECTION_FOR_QUERY].preferred_models = get_preferred_models_for_task_reload(False)
             
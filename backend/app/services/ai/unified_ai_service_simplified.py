@@ -1,4 +1,4 @@
-from typing import Union, Optional, List, Dict, Any, Tuple
+from typing import Union, Optional, List, Dict, Any, Tuple, Callable
 from enum import Enum
 import time
 import json
@@ -7,11 +7,11 @@ from datetime import datetime, timedelta
 from PIL import Image
 import io
 import google.generativeai as genai
-from tenacity import retry, stop_after_attempt, wait_exponential
+from cachetools import LRUCache, TTLCache
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from pydantic import ValidationError
 from google.generativeai.types import GenerationConfigDict
-from google.api_core.exceptions import GoogleAPIError, RetryError, ServiceUnavailable, DeadlineExceeded
+from google.api_core.exceptions import GoogleAPIError, RetryError, ServiceUnavailable, DeadlineExceeded, ResourceExhausted, NotFound
 import re
 
 from app.core.config import settings
@@ -37,6 +37,13 @@ from app.models.ai_models_simplified import (
 )
 from app.services.ai.prompt_manager_simplified import prompt_manager_simplified, PromptType, PromptTemplate
 from app.services.ai.unified_ai_config import unified_ai_config, AIModelConfig, TaskType
+from app.services.ai.ai_cache_manager import ai_cache_manager
+from app.services.ai.ai_rate_limiter import ai_rate_limiter, RequestPriority
+from app.services.ai.token_estimator import token_estimator, IMAGE_TOKENS
+from app.services.ai.llm_providers import get_llm_provider
+from app.services.ai.request_hedger import request_hedger
+from app.services.ai.llm_call_ledger import llm_call_ledger, LLMCallMetrics, CacheOutcome
+from app.utils.single_flight import SingleFlight
 import logging
 
 logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
@@ -53,6 +60,17 @@ class AIRequest:
     session_id: Optional[str] = None
     ai_max_output_tokens: Optional[int] = None
     image_mime_type: Optional[str] = None
+    priority: Optional[RequestPriority] = None  # 未指定時按任務類型決定
+
+# 預設走後台通道的任務類型（批量文檔分析、聚類標籤、建議問題）
+BACKGROUND_TASK_TYPES = {
+    TaskType.TEXT_GENERATION,
+    TaskType.BATCH_TEXT_ANALYSIS,
+    TaskType.IMAGE_ANALYSIS,
+    TaskType.CLUSTER_LABEL_GENERATION,
+    TaskType.BATCH_CLUSTER_LABELS,
+    TaskType.QUESTION_GENERATION,
+}
 
 @dataclass 
 class AIResponse:
@@ -70,7 +88,17 @@ class UnifiedAIServiceSimplified:
     def __init__(self):
         self.context_cache_service = google_context_cache_service
         self._schema_context_caches: Dict[str, ContextCacheInfo] = {}
-        self._system_instruction_caches: Dict[str, ContextCacheInfo] = {}
+        # 系統指令緩存（鍵 -> 緩存信息），超出上限時淘汰最久未使用的；被淘汰的遠端緩存到期後由清理任務刪除
+        self._system_instruction_caches: LRUCache = LRUCache(maxsize=settings.AI_CONTEXT_CACHE_MAX_LOCAL_ENTRIES)
+        # 創建失敗的系統指令鍵，在 AI_CONTEXT_CACHE_FAILURE_TTL_SECONDS 內直接走無緩存路徑
+        self._failed_system_instruction_caches: TTLCache = TTLCache(
+            maxsize=settings.AI_CONTEXT_CACHE_MAX_LOCAL_ENTRIES,
+            ttl=settings.AI_CONTEXT_CACHE_FAILURE_TTL_SECONDS
+        )
+        # 合併相同的進行中 AI 調用（重複提交、前端重試）
+        self._request_single_flight = SingleFlight("ai.process_request")
+        self._context_cache_single_flight = SingleFlight("ai.context_cache_create")
+        self._uncacheable_system_prompts: set = set()
     
     def _clean_json_output(self, output_text: str) -> str:
         """清理AI輸出的JSON格式問題"""
@@ -105,55 +133,140 @@ class UnifiedAIServiceSimplified:
         
         return cleaned
 
-    @retry(wait=wait_exponential(multiplier=1, min=2, max=30), stop=stop_after_attempt(3), reraise=True)
+    def _estimate_prompt_tokens(self, model_id: str, prompt_request: AIPromptRequest, image_count: int = 0) -> int:
+        """以本地估算器估算提示詞 token 數，用於限流器預留 TPM 配額（實際值在請求完成後回填）"""
+        return token_estimator.count_prompt(
+            prompt_request.system_prompt, prompt_request.user_prompt, model_id, image_count=image_count
+        )
+
+    def _resolve_token_usage(
+        self,
+        model_id: str,
+        response: Any,
+        prompt_request: AIPromptRequest,
+        output_text: str,
+        image_count: int = 0
+    ) -> Tuple[int, int]:
+        """
+        取得本次請求的輸入/輸出 token 數
+
+        優先使用回應自帶的 usage_metadata（同時用來校準本地估算器），
+        沒有時使用本地估算，不再額外調用遠端 count_tokens。
+        """
+        prompt_text = (prompt_request.system_prompt or "") + (prompt_request.user_prompt or "")
+        usage = getattr(response, "usage_metadata", None)
+        input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+
+        if input_tokens > 0:
+            token_estimator.calibrate(
+                model_id, token_estimator.count_raw(prompt_text), input_tokens - image_count * IMAGE_TOKENS
+            )
+        else:
+            input_tokens = token_estimator.count_prompt(
+                prompt_request.system_prompt, prompt_request.user_prompt, model_id, image_count=image_count
+            )
+        if output_tokens <= 0:
+            output_tokens = token_estimator.count(output_text, model_id)
+        return input_tokens, output_tokens
+
     async def _execute_google_ai_request(
         self,
         model_id: str,
         prompt_request: AIPromptRequest,
         generation_config_dict: genai.types.GenerationConfigDict,
         safety_settings: Dict[genai.types.HarmCategory, genai.types.HarmBlockThreshold],
-        image_content: Optional[Image.Image] = None
+        image_content: Optional[Image.Image] = None,
+        priority: RequestPriority = RequestPriority.INTERACTIVE,
+        task_type: Optional[TaskType] = None,
+        context_cache: Optional[ContextCacheInfo] = None,
+        call_metrics: Optional[LLMCallMetrics] = None,
+        on_start: Optional[Callable[[], None]] = None
     ) -> Tuple[Optional[str], Optional[TokenUsage]]:
-        try:
-            model = genai.GenerativeModel(
-                model_name=model_id, 
-                generation_config=generation_config_dict,
-                safety_settings=safety_settings
-            )
-            prompt_parts_for_api = []
-            if prompt_request.system_prompt:
-                prompt_parts_for_api.append(prompt_request.system_prompt)
-            
-            prompt_parts_for_api.append(prompt_request.user_prompt)
-            
-            if image_content:
-                prompt_parts_for_api.append(image_content)
-            
-            # 添加日誌記錄
-            logger.debug(f"[GoogleAI] Model: {model_id}, Prompt parts count: {len(prompt_parts_for_api)}, Config: {generation_config_dict}")
-            
-            response = await model.generate_content_async(prompt_parts_for_api)
-            
-            output_text = response.text
-            token_count_model_input = model.count_tokens(prompt_parts_for_api).total_tokens
-            output_token_count = model.count_tokens(response.text).total_tokens
-            total_tokens = token_count_model_input + output_token_count
-            
-            logger.info(f"[GoogleAI Success] Model: {model_id}, Input Tokens: {token_count_model_input}, Output Tokens: {output_token_count}, Total Tokens: {total_tokens}")
-            
-            # 保存原始輸出以便於後續處理
-            if hasattr(TokenUsage, "_raw_output_text"):
-                token_usage = TokenUsage(prompt_tokens=token_count_model_input, completion_tokens=output_token_count, total_tokens=total_tokens, _raw_output_text=output_text)
-            else:
-                token_usage = TokenUsage(prompt_tokens=token_count_model_input, completion_tokens=output_token_count, total_tokens=total_tokens)
+        if call_metrics is None:
+            call_metrics = LLMCallMetrics(model_id=model_id)
+        provider = get_llm_provider()
+        # Context Cache 只能用於創建它的模型（對沖/故障轉移到其他模型時照常發送系統指令）
+        if context_cache is not None and context_cache.model != model_id:
+            context_cache = None
+        image_count = 1 if image_content else 0
+        estimated_tokens = self._estimate_prompt_tokens(model_id, prompt_request, image_count)
+        error_message = None
+        
+        # 429 由限流器自適應退避後重試，不再依賴固定的指數等待
+        for attempt in range(settings.AI_RATE_LIMIT_MAX_429_RETRIES + 1):
+            try:
+                async with ai_rate_limiter.limit(model_id, estimated_tokens, priority) as reservation:
+                    call_metrics.queue_wait_seconds += reservation.wait_seconds
+                    if on_start is not None:
+                        # 通知對沖器限流器已放行，截止時間從此刻開始計算
+                        on_start()
+                    prompt_parts_for_api = []
+                    # 使用 Context Cache 時系統指令已在緩存中，不再重複發送
+                    if prompt_request.system_prompt and context_cache is None:
+                        prompt_parts_for_api.append(prompt_request.system_prompt)
+                    
+                    prompt_parts_for_api.append(prompt_request.user_prompt)
+                    
+                    if image_content:
+                        prompt_parts_for_api.append(image_content)
+                    
+                    # 添加日誌記錄
+                    logger.debug(f"[GoogleAI] Provider: {provider.name}, Model: {model_id}, Prompt parts count: {len(prompt_parts_for_api)}, Context Cache: {context_cache.cache_id if context_cache else None}, Config: {generation_config_dict}")
+                    
+                    call_metrics.attempts += 1
+                    network_start = time.monotonic()
+                    try:
+                        response = await provider.generate(
+                            task_type, model_id, prompt_parts_for_api, generation_config_dict, safety_settings,
+                            cached_content=context_cache.cache_id if context_cache else None
+                        )
+                    finally:
+                        call_metrics.network_seconds += time.monotonic() - network_start
+                    
+                    output_text = response.text
+                    token_count_model_input, output_token_count = self._resolve_token_usage(
+                        model_id, response, prompt_request, output_text, image_count
+                    )
+                    total_tokens = token_count_model_input + output_token_count
+                    reservation.actual_tokens = total_tokens
                 
-            return output_text, token_usage
-        except (GoogleAPIError, RetryError, ServiceUnavailable, DeadlineExceeded) as e:
-            logger.error(f"[GoogleAI] API 錯誤 ({type(e).__name__}) - Model: {model_id}: {e}")
-            error_message = f"Google AI API 錯誤: {str(e)}"
-        except Exception as e:
-            logger.error(f"[GoogleAI] 未預期錯誤 - Model: {model_id}: {e}", exc_info=True)
-            error_message = f"執行 Google AI 請求時發生未預期錯誤: {str(e)}"
+                if context_cache is not None:
+                    cached_tokens = getattr(getattr(response, "usage_metadata", None), "cached_content_token_count", 0) or 0
+                    self.context_cache_service.record_cache_hit(context_cache, cached_tokens, token_count_model_input)
+                    call_metrics.cached_input_tokens = cached_tokens or context_cache.token_count
+                
+                ai_rate_limiter.report_success(model_id)
+                logger.info(f"[GoogleAI Success] Model: {model_id}, Input Tokens: {token_count_model_input}, Output Tokens: {output_token_count}, Total Tokens: {total_tokens}")
+                
+                # 保存原始輸出以便於後續處理
+                if hasattr(TokenUsage, "_raw_output_text"):
+                    token_usage = TokenUsage(prompt_tokens=token_count_model_input, completion_tokens=output_token_count, total_tokens=total_tokens, _raw_output_text=output_text)
+                else:
+                    token_usage = TokenUsage(prompt_tokens=token_count_model_input, completion_tokens=output_token_count, total_tokens=total_tokens)
+                    
+                return output_text, token_usage
+            except ResourceExhausted as e:
+                ai_rate_limiter.report_rate_limited(model_id)
+                logger.warning(f"[GoogleAI] 配額不足 (429) - Model: {model_id}, 第 {attempt + 1} 次嘗試: {e}")
+                error_message = f"Google AI API 配額不足: {str(e)}"
+                continue
+            except NotFound as e:
+                if context_cache is not None:
+                    # 遠端緩存已過期或被刪除：移除登記，改為帶系統指令重發
+                    logger.warning(f"[GoogleAI] Context Cache 已失效 - {context_cache.cache_id}，改為不使用緩存重試: {e}")
+                    self.context_cache_service.invalidate(context_cache.cache_id)
+                    context_cache = None
+                    continue
+                logger.error(f"[GoogleAI] API 錯誤 ({type(e).__name__}) - Model: {model_id}: {e}")
+                error_message = f"Google AI API 錯誤: {str(e)}"
+            except (GoogleAPIError, RetryError, ServiceUnavailable, DeadlineExceeded) as e:
+                logger.error(f"[GoogleAI] API 錯誤 ({type(e).__name__}) - Model: {model_id}: {e}")
+                error_message = f"Google AI API 錯誤: {str(e)}"
+            except Exception as e:
+                logger.error(f"[GoogleAI] 未預期錯誤 - Model: {model_id}: {e}", exc_info=True)
+                error_message = f"執行 Google AI 請求時發生未預期錯誤: {str(e)}"
+            break
         
         # 返回錯誤時，需要包含所有必需字段
         return None, TokenUsage(
@@ -169,7 +282,9 @@ class UnifiedAIServiceSimplified:
         prompt_request: AIPromptRequest,
         generation_config_dict: genai.types.GenerationConfigDict,
         safety_settings: Dict[genai.types.HarmCategory, genai.types.HarmBlockThreshold],
-        image_content: Optional[Image.Image] = None
+        image_content: Optional[Image.Image] = None,
+        task_type: Optional[TaskType] = TaskType.ANSWER_GENERATION,
+        user_id: Optional[str] = None
     ):
         """
         流式執行 Google AI 請求，逐塊生成內容
@@ -177,46 +292,124 @@ class UnifiedAIServiceSimplified:
         Yields:
             str: 生成的文本塊
         """
+        provider = get_llm_provider()
+        start_time = time.monotonic()
+        call_metrics = LLMCallMetrics(model_id=model_id)
+        token_count_model_input = output_token_count = 0
+        error_message: Optional[str] = None
         try:
-            model = genai.GenerativeModel(
-                model_name=model_id, 
-                generation_config=generation_config_dict,
-                safety_settings=safety_settings
-            )
-            prompt_parts_for_api = []
-            if prompt_request.system_prompt:
-                prompt_parts_for_api.append(prompt_request.system_prompt)
-            
-            prompt_parts_for_api.append(prompt_request.user_prompt)
-            
-            if image_content:
-                prompt_parts_for_api.append(image_content)
-            
-            logger.debug(f"[GoogleAI Stream] Model: {model_id}, Prompt parts count: {len(prompt_parts_for_api)}")
-            
-            # 使用 stream=True 啟用流式輸出
-            response = model.generate_content(prompt_parts_for_api, stream=True)
-            
-            full_text = ""
-            for chunk in response:
-                if chunk.text:
-                    full_text += chunk.text
-                    yield chunk.text
-            
-            # 記錄完整統計信息
-            token_count_model_input = model.count_tokens(prompt_parts_for_api).total_tokens
-            output_token_count = model.count_tokens(full_text).total_tokens
-            total_tokens = token_count_model_input + output_token_count
+            image_count = 1 if image_content else 0
+            estimated_tokens = self._estimate_prompt_tokens(model_id, prompt_request, image_count)
+            async with ai_rate_limiter.limit(model_id, estimated_tokens, RequestPriority.INTERACTIVE) as reservation:
+                call_metrics.queue_wait_seconds = reservation.wait_seconds
+                prompt_parts_for_api = []
+                if prompt_request.system_prompt:
+                    prompt_parts_for_api.append(prompt_request.system_prompt)
+                
+                prompt_parts_for_api.append(prompt_request.user_prompt)
+                
+                if image_content:
+                    prompt_parts_for_api.append(image_content)
+                
+                logger.debug(f"[GoogleAI Stream] Provider: {provider.name}, Model: {model_id}, Prompt parts count: {len(prompt_parts_for_api)}")
+                
+                call_metrics.attempts = 1
+                network_start = time.monotonic()
+                stream = await provider.stream(
+                    task_type, model_id, prompt_parts_for_api, generation_config_dict, safety_settings
+                )
+                
+                full_text = ""
+                async for chunk_text in stream.chunks():
+                    full_text += chunk_text
+                    yield chunk_text
+                call_metrics.network_seconds = time.monotonic() - network_start
+                
+                # 記錄完整統計信息
+                token_count_model_input, output_token_count = self._resolve_token_usage(
+                    model_id, stream, prompt_request, full_text, image_count
+                )
+                total_tokens = token_count_model_input + output_token_count
+                reservation.actual_tokens = total_tokens
             
             logger.info(f"[GoogleAI Stream Success] Model: {model_id}, Input Tokens: {token_count_model_input}, Output Tokens: {output_token_count}, Total Tokens: {total_tokens}")
             
+        except ResourceExhausted as e:
+            ai_rate_limiter.report_rate_limited(model_id)
+            logger.error(f"[GoogleAI Stream] 配額不足 (429) - Model: {model_id}: {e}")
+            error_message = f"Google AI API 配額不足: {str(e)}"
+            yield f"[錯誤] Google AI API 配額不足，請稍後再試"
         except (GoogleAPIError, RetryError, ServiceUnavailable, DeadlineExceeded) as e:
             logger.error(f"[GoogleAI Stream] API 錯誤 ({type(e).__name__}) - Model: {model_id}: {e}")
+            error_message = f"Google AI API 錯誤: {str(e)}"
             yield f"[錯誤] Google AI API 錯誤: {str(e)}"
         except Exception as e:
             logger.error(f"[GoogleAI Stream] 未預期錯誤 - Model: {model_id}: {e}", exc_info=True)
+            error_message = f"執行流式請求時發生錯誤: {str(e)}"
             yield f"[錯誤] 執行流式請求時發生錯誤: {str(e)}"
+        except GeneratorExit:
+            error_message = "客戶端中斷流式輸出"
+            raise
+        finally:
+            # 客戶端中途斷開時生成器被關閉，同樣記錄（未完成的輸出不回報 token）
+            llm_call_ledger.record(
+                task_type=task_type.value if isinstance(task_type, TaskType) else str(task_type),
+                model_id=model_id,
+                user_id=user_id,
+                prompt_tokens=token_count_model_input,
+                completion_tokens=output_token_count,
+                queue_wait_seconds=call_metrics.queue_wait_seconds,
+                network_seconds=call_metrics.network_seconds or max(0.0, time.monotonic() - start_time - call_metrics.queue_wait_seconds),
+                total_seconds=time.monotonic() - start_time,
+                retries=max(0, call_metrics.attempts - 1),
+                success=error_message is None and token_count_model_input > 0,
+                streaming=True,
+                priority=RequestPriority.INTERACTIVE.value,
+                error_message=error_message
+            )
     
+    def _record_ledger_entry(
+        self,
+        request: AIRequest,
+        task_type_value: str,
+        model_id: str,
+        priority: RequestPriority,
+        token_usage: Optional[TokenUsage],
+        call_metrics: List[LLMCallMetrics],
+        response_cache_hit: bool,
+        shared_result: bool,
+        start_time: float,
+        error_message: Optional[str] = None
+    ):
+        """把一次 process_request 寫入 LLM 調用帳本（排隊與網絡延遲取自產生結果的調用）"""
+        if response_cache_hit:
+            cache_outcome = CacheOutcome.RESPONSE_CACHE
+        elif shared_result:
+            cache_outcome = CacheOutcome.SHARED
+        else:
+            cache_outcome = CacheOutcome.MISS
+        
+        winner = next((m for m in call_metrics if m.model_id == model_id and m.succeeded), None) or next(
+            (m for m in reversed(call_metrics) if m.model_id == model_id), None
+        )
+        total_attempts = sum(m.attempts for m in call_metrics)
+        llm_call_ledger.record(
+            task_type=task_type_value,
+            model_id=model_id,
+            user_id=request.user_id,
+            prompt_tokens=token_usage.prompt_tokens if token_usage else 0,
+            completion_tokens=token_usage.completion_tokens if token_usage else 0,
+            cached_input_tokens=winner.cached_input_tokens if winner else 0,
+            queue_wait_seconds=winner.queue_wait_seconds if winner else 0.0,
+            network_seconds=winner.network_seconds if winner else 0.0,
+            total_seconds=time.time() - start_time,
+            retries=max(0, total_attempts - 1),
+            cache_outcome=cache_outcome,
+            success=error_message is None,
+            priority=priority.value,
+            error_message=error_message
+        )
+
     async def process_request(
         self, 
         request: AIRequest,
@@ -246,19 +439,11 @@ class UnifiedAIServiceSimplified:
         
         logger.info(f"[UnifiedAIService] 最終為任務 '{request.task_type.value if isinstance(request.task_type, Enum) else request.task_type}' 選定的模型: {model_id}")
 
-        # 嘗試使用 Context Caching 優化系統指令
-        context_cache_info = None
-        if db is not None and self.context_cache_service.is_available():
-            context_cache_info = await self._get_or_create_system_instruction_cache(
-                task_type=request.task_type, 
-                model_id=model_id,
-                db=db,
-                user_id=request.user_id
-            )
-
         prompt_type: PromptType
         if request.task_type == TaskType.TEXT_GENERATION:
             prompt_type = PromptType.TEXT_ANALYSIS
+        elif request.task_type == TaskType.BATCH_TEXT_ANALYSIS:
+            prompt_type = PromptType.BATCH_TEXT_ANALYSIS
         elif request.task_type == TaskType.IMAGE_ANALYSIS:
             prompt_type = PromptType.IMAGE_ANALYSIS
         elif request.task_type == TaskType.ANSWER_GENERATION: 
@@ -267,6 +452,8 @@ class UnifiedAIServiceSimplified:
             prompt_type = PromptType.QUERY_REWRITE
         elif request.task_type == TaskType.MONGODB_DETAIL_QUERY_GENERATION:
             prompt_type = PromptType.MONGODB_DETAIL_QUERY_GENERATION
+        elif request.task_type == TaskType.BATCH_MONGODB_DETAIL_QUERY_GENERATION:
+            prompt_type = PromptType.BATCH_MONGODB_DETAIL_QUERY_GENERATION
         elif request.task_type == TaskType.DOCUMENT_SELECTION_FOR_QUERY:
             prompt_type = PromptType.DOCUMENT_SELECTION_FOR_QUERY
         elif request.task_type == TaskType.CLUSTER_LABEL_GENERATION:
@@ -311,6 +498,7 @@ class UnifiedAIServiceSimplified:
             prompt_template_object, 
             apply_chinese_instruction=ensure_chinese,
             user_prompt_input_max_length=user_prompt_input_max_length,
+            model_id=model_id,
             **prompt_params
         )
         
@@ -320,6 +508,17 @@ class UnifiedAIServiceSimplified:
             system_prompt=formatted_system_prompt
         )
         
+        # 系統指令足夠長時使用 Context Cache：首次使用時創建，之後以緩存 ID 調用
+        context_cache_info: Optional[ContextCacheInfo] = None
+        if formatted_system_prompt and self.context_cache_service.is_available():
+            context_cache_info = await self._get_or_create_system_instruction_cache(
+                task_type=request.task_type,
+                model_id=model_id,
+                system_prompt=formatted_system_prompt,
+                db=db,
+                user_id=request.user_id
+            )
+        
         generation_config_dict = unified_ai_config.get_generation_config(request.task_type, request.generation_params_override)
         safety_settings = unified_ai_config.get_safety_settings(request.task_type)
         
@@ -330,14 +529,78 @@ class UnifiedAIServiceSimplified:
         if request.task_type == TaskType.IMAGE_ANALYSIS and isinstance(request.content, Image.Image):
             image_to_pass = request.content
         
-        try:
-            output_text, token_usage = await self._execute_google_ai_request(
-                model_id=model_id, 
-                prompt_request=ai_prompt_request_to_use,
-                generation_config_dict=generation_config_dict,
-                safety_settings=safety_settings,
-                image_content=image_to_pass
+        # 請求鍵值：用於精確匹配回應緩存和合併進行中的相同調用（不含圖片輸入）
+        task_type_value = request.task_type.value if isinstance(request.task_type, Enum) else str(request.task_type)
+        request_key: Optional[str] = None
+        if image_to_pass is None:
+            request_key = ai_cache_manager.build_llm_response_cache_key(
+                model_id=model_id,
+                task_type=task_type_value,
+                system_prompt=formatted_system_prompt,
+                user_prompt=formatted_user_prompt,
+                generation_config=dict(generation_config_dict) if generation_config_dict else None
             )
+        
+        # 確定性任務的精確匹配回應緩存
+        response_cache_key: Optional[str] = None
+        cached_response: Optional[Dict[str, Any]] = None
+        if request_key and ai_cache_manager.is_llm_response_cacheable(task_type_value):
+            response_cache_key = request_key
+            cached_response = await ai_cache_manager.get_llm_response(response_cache_key)
+        
+        shared_result = False
+        priority = request.priority or (
+            RequestPriority.BACKGROUND if request.task_type in BACKGROUND_TASK_TYPES else RequestPriority.INTERACTIVE
+        )
+        # 每個實際發出的模型調用（含對沖與故障轉移）的計時，用於寫入調用帳本
+        call_metrics: List[LLMCallMetrics] = []
+        try:
+            if cached_response is not None:
+                logger.info(f"[AIRequest Cache Hit] Task: {task_type_value}, Model: {model_id}, 節省 Token: {cached_response.get('total_tokens', 0)}")
+                output_text = cached_response.get("output_text")
+                token_usage = TokenUsage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+            else:
+                async def _call_model(candidate_model_id: str, on_start: Callable[[], None]):
+                    metrics = LLMCallMetrics(model_id=candidate_model_id)
+                    call_metrics.append(metrics)
+                    result = await self._execute_google_ai_request(
+                        model_id=candidate_model_id, 
+                        prompt_request=ai_prompt_request_to_use,
+                        generation_config_dict=generation_config_dict,
+                        safety_settings=safety_settings,
+                        image_content=image_to_pass,
+                        priority=priority,
+                        task_type=request.task_type,
+                        context_cache=context_cache_info,
+                        call_metrics=metrics,
+                        on_start=on_start
+                    )
+                    metrics.succeeded = result[0] is not None
+                    return result
+                
+                async def _execute():
+                    # 互動請求超過 p95 截止時間時對沖，失敗時轉移到後備模型
+                    return await request_hedger.execute(
+                        task_key=task_type_value,
+                        primary_model=model_id,
+                        call=_call_model,
+                        fallback_models=unified_ai_config.get_fallback_models(request.task_type, exclude=model_id),
+                        hedge=priority == RequestPriority.INTERACTIVE
+                    )
+                
+                if request_key:
+                    (output_text, token_usage, used_model_id), shared_result = await self._request_single_flight.run(request_key, _execute)
+                else:
+                    output_text, token_usage, used_model_id = await _execute()
+                
+                if used_model_id != model_id:
+                    logger.info(f"[AIRequest Hedge/Failover] Task: {task_type_value}, 結果來自 {used_model_id}（原模型 {model_id}）")
+                    model_id = used_model_id
+                
+                if shared_result and output_text is not None:
+                    # Token 已由發起者計費，共享者不重複計算
+                    logger.info(f"[AIRequest Shared] Task: {task_type_value}, Model: {model_id}, 共享進行中的相同請求結果")
+                    token_usage = TokenUsage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
             if output_text is None:
                 raise ValueError("AI模型執行成功，但未返回任何文本輸出。")
 
@@ -377,6 +640,9 @@ class UnifiedAIServiceSimplified:
             try:
                 if request.task_type == TaskType.TEXT_GENERATION:
                     parsed_output = AITextAnalysisOutput.model_validate_json(output_text)
+                elif request.task_type == TaskType.BATCH_TEXT_ANALYSIS:
+                    from app.models.ai_models_simplified import AIBatchTextAnalysisOutput
+                    parsed_output = AIBatchTextAnalysisOutput.model_validate_json(output_text)
                 elif request.task_type == TaskType.IMAGE_ANALYSIS:
                     parsed_output = AIImageAnalysisOutput.model_validate_json(output_text)
                 elif request.task_type == TaskType.ANSWER_GENERATION:
@@ -393,6 +659,9 @@ class UnifiedAIServiceSimplified:
                     parsed_output = AIQueryRewriteOutput.model_validate_json(output_text)
                 elif request.task_type == TaskType.MONGODB_DETAIL_QUERY_GENERATION:
                     parsed_output = AIMongoDBQueryDetailOutput.model_validate_json(output_text)
+                elif request.task_type == TaskType.BATCH_MONGODB_DETAIL_QUERY_GENERATION:
+                    from app.models.ai_models_simplified import AIBatchMongoDBQueryDetailOutput
+                    parsed_output = AIBatchMongoDBQueryDetailOutput.model_validate_json(output_text)
                 elif request.task_type == TaskType.DOCUMENT_SELECTION_FOR_QUERY:
                     parsed_output = AIDocumentSelectionOutput.model_validate_json(output_text)
                 elif request.task_type == TaskType.CLUSTER_LABEL_GENERATION:
@@ -441,6 +710,16 @@ class UnifiedAIServiceSimplified:
                     raise ValueError(f"AI輸出格式錯誤 ({request.task_type}): {e}")
             
             logger.info(f"[AIRequest Success] Task: {request.task_type}, Model: {model_id}")
+            
+            # 只緩存成功解析的輸出，避免把格式錯誤的回應固化
+            if response_cache_key and cached_response is None and not shared_result:
+                await ai_cache_manager.set_llm_response(
+                    cache_key=response_cache_key,
+                    task_type=task_type_value,
+                    output_text=_raw_output_text,
+                    total_tokens=token_usage.total_tokens if token_usage else 0
+                )
+            
             response = AIResponse(
                 success=True, task_type=request.task_type, model_used=model_id, prompt_type_used=prompt_type,
                 output_data=parsed_output, token_usage=token_usage, processing_time_seconds=time.time() - start_time
@@ -450,6 +729,10 @@ class UnifiedAIServiceSimplified:
             if hasattr(response, "_raw_output_text"):
                 response._raw_output_text = _raw_output_text
             
+            self._record_ledger_entry(
+                request, task_type_value, model_id, priority, token_usage, call_metrics,
+                cached_response is not None, shared_result, start_time
+            )
             return response
         
         except Exception as e:
@@ -462,7 +745,11 @@ class UnifiedAIServiceSimplified:
             # 添加原始輸出文本以便於錯誤處理
             if hasattr(response, "_raw_output_text") and locals().get('_raw_output_text'):
                 response._raw_output_text = _raw_output_text
-                
+            
+            self._record_ledger_entry(
+                request, task_type_value, model_id, priority, token_usage, call_metrics,
+                cached_response is not None, shared_result, start_time, error_message=str(e)
+            )
             return response
 
     async def analyze_text(
@@ -485,6 +772,29 @@ class UnifiedAIServiceSimplified:
         )
         return await self.process_request(request, db)
     
+    async def analyze_text_batch(
+        self, texts: List[str],
+        model_preference: Optional[str] = None,
+        user_id: Optional[str] = None,
+        db: Optional[AsyncIOMotorDatabase] = None,
+        ai_max_output_tokens: Optional[int] = None,
+        ai_ensure_chinese_output: Optional[bool] = None
+    ) -> AIResponse:
+        """將多份短文檔合併為一次分析請求，輸出按 document_index 對應的結果列表"""
+        documents_data = "\n".join(
+            f'<document index="{index}">\n{text}\n</document>' for index, text in enumerate(texts)
+        )
+        request = AIRequest(
+            task_type=TaskType.BATCH_TEXT_ANALYSIS,
+            content=documents_data,
+            model_preference=model_preference,
+            user_id=user_id,
+            prompt_params={"document_count": str(len(texts)), "documents_data": documents_data},
+            generation_params_override={"max_output_tokens": ai_max_output_tokens} if ai_max_output_tokens else None,
+            require_language_consistency=ai_ensure_chinese_output if ai_ensure_chinese_output is not None else True
+        )
+        return await self.process_request(request, db)
+    
     async def analyze_image(
         self, image: Image.Image,
         prompt_text: Optional[str] = None,
@@ -733,90 +1043,113 @@ class UnifiedAIServiceSimplified:
         )
         return await self.process_request(request, db)
 
+    async def generate_mongodb_detail_queries_batch(
+        self,
+        user_question: str,
+        documents: List[Dict[str, Any]],
+        document_schema_info: Dict[str, Any],
+        db: Optional[AsyncIOMotorDatabase] = None,
+        model_preference: Optional[str] = None,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        ai_max_output_tokens: Optional[int] = None
+    ) -> AIResponse:
+        """
+        一次為多個文檔生成 MongoDB 查詢組件，輸出按 document_index 對應的結果列表
+
+        documents 為各文檔的精簡 Schema（文檔 ID、文件名與實際欄位），
+        問題與通用 Schema 只發送一次。
+        """
+        documents_data = "\n".join(
+            f'<document index="{index}">\n{json.dumps(document, ensure_ascii=False)}\n</document>'
+            for index, document in enumerate(documents)
+        )
+        request = AIRequest(
+            task_type=TaskType.BATCH_MONGODB_DETAIL_QUERY_GENERATION,
+            content=user_question,
+            prompt_params={
+                "user_question": user_question,
+                "document_schema_info": json.dumps(document_schema_info),
+                "document_count": str(len(documents)),
+                "documents_data": documents_data
+            },
+            model_preference=model_preference,
+            user_id=user_id,
+            session_id=session_id,
+            generation_params_override={"max_output_tokens": ai_max_output_tokens} if ai_max_output_tokens else None
+        )
+        return await self.process_request(request, db)
+
     # === Context Caching 相關方法 ===
     
     async def _get_or_create_system_instruction_cache(
         self,
         task_type: TaskType,
         model_id: str,
-        db: AsyncIOMotorDatabase,
+        system_prompt: str,
+        db: Optional[AsyncIOMotorDatabase] = None,
         user_id: Optional[str] = None
     ) -> Optional[ContextCacheInfo]:
-        """獲取或創建系統指令的 Context Cache"""
+        """
+        獲取或創建系統指令的 Context Cache
+
+        以任務、模型和格式化後系統指令的哈希為鍵；已有緩存時在使用前按需續期，
+        不符合 token 要求的系統指令會被記住，不再重複估算；創建失敗的在短時間內不再重試。
+        """
+        cache_key: Optional[str] = None
         try:
-            # 基於任務類型和模型創建緩存鍵
-            cache_key = f"{task_type.value}_{model_id}"
+            import hashlib
+            prompt_hash = hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()[:16]
+            cache_key = f"{task_type.value}_{model_id}_{prompt_hash}"
+            
+            if cache_key in self._uncacheable_system_prompts or cache_key in self._failed_system_instruction_caches:
+                return None
             
             # 檢查本地緩存
             if cache_key in self._system_instruction_caches:
                 cache_info = self._system_instruction_caches[cache_key]
-                # 檢查是否過期
-                if cache_info.expires_at > datetime.utcnow():
-                    logger.info(f"使用現有系統指令 Context Cache: {cache_info.cache_id}")
+                if await self.context_cache_service.ensure_fresh(cache_info, db):
+                    logger.debug(f"使用現有系統指令 Context Cache: {cache_info.cache_id}")
                     return cache_info
-                else:
-                    # 過期則移除
-                    del self._system_instruction_caches[cache_key]
-            
-            # 獲取對應的系統指令內容
-            from app.services.ai.prompt_manager_simplified import prompt_manager_simplified, PromptType
-            
-            prompt_type_mapping = {
-                TaskType.TEXT_GENERATION: PromptType.TEXT_ANALYSIS,
-                TaskType.IMAGE_ANALYSIS: PromptType.IMAGE_ANALYSIS,
-                TaskType.ANSWER_GENERATION: PromptType.ANSWER_GENERATION,
-                TaskType.QUERY_REWRITE: PromptType.QUERY_REWRITE,
-                TaskType.MONGODB_DETAIL_QUERY_GENERATION: PromptType.MONGODB_DETAIL_QUERY_GENERATION,
-                TaskType.DOCUMENT_SELECTION_FOR_QUERY: PromptType.DOCUMENT_SELECTION_FOR_QUERY,
-                TaskType.CLUSTER_LABEL_GENERATION: PromptType.CLUSTER_LABEL_GENERATION,
-                TaskType.BATCH_CLUSTER_LABELS: PromptType.BATCH_CLUSTER_LABEL_GENERATION,
-                TaskType.QUESTION_INTENT_CLASSIFICATION: PromptType.QUESTION_INTENT_CLASSIFICATION,
-                TaskType.GENERATE_CLARIFICATION_QUESTION: PromptType.GENERATE_CLARIFICATION_QUESTION
-            }
-            
-            prompt_type = prompt_type_mapping.get(task_type)
-            if not prompt_type:
-                logger.warning(f"未知的任務類型，無法創建系統指令緩存: {task_type}")
-                return None
-            
-            prompt_template = await prompt_manager_simplified.get_prompt(prompt_type, db)
-            if not prompt_template or not prompt_template.system_prompt:
-                logger.warning(f"無法獲取系統指令模板: {prompt_type}")
-                return None
+                # 已過期或續期失敗則移除，重新創建
+                self._system_instruction_caches.pop(cache_key, None)
             
             # 檢查 token 要求
-            token_check = self.context_cache_service.check_token_requirements(
-                prompt_template.system_prompt, 
-                model_id
-            )
-            
+            token_check = self.context_cache_service.check_token_requirements(system_prompt, model_id)
             if not token_check["meets_requirement"]:
                 logger.debug(f"系統指令不符合 Context Caching token 要求: {token_check}")
+                if len(self._uncacheable_system_prompts) >= 1000:
+                    self._uncacheable_system_prompts.clear()
+                self._uncacheable_system_prompts.add(cache_key)
                 return None
             
-            # 創建 Context Cache 配置
-            cache_config = ContextCacheConfig(
-                cache_type=ContextCacheType.SYSTEM_INSTRUCTION,
-                content=prompt_template.system_prompt,
-                ttl_hours=1,  # 1小時過期
-                model=model_id,
-                display_name=f"system_instruction_{task_type.value}",
-                metadata={
-                    "task_type": task_type.value,
-                    "prompt_type": prompt_type.value,
-                    "user_id": user_id
-                }
-            )
+            async def _create() -> Optional[ContextCacheInfo]:
+                cache_config = ContextCacheConfig(
+                    cache_type=ContextCacheType.SYSTEM_INSTRUCTION,
+                    content=system_prompt,
+                    ttl_seconds=settings.AI_CONTEXT_CACHE_TTL_SECONDS,
+                    model=model_id,
+                    display_name=f"system_instruction_{task_type.value}",
+                    metadata={
+                        "task_type": task_type.value,
+                        "prompt_hash": prompt_hash,
+                        "user_id": user_id
+                    }
+                )
+                return await self.context_cache_service.create_context_cache(cache_config, db)
             
-            # 創建 Context Cache
-            cache_info = await self.context_cache_service.create_context_cache(cache_config, db)
+            # 同時到達的相同請求只創建一次
+            cache_info = await self._context_cache_single_flight.do(cache_key, _create)
             if cache_info:
                 self._system_instruction_caches[cache_key] = cache_info
-                logger.info(f"成功創建系統指令 Context Cache: {cache_info.cache_id}")
+                logger.info(f"系統指令 Context Cache 可用: {cache_info.cache_id} ({cache_info.token_count} tokens)")
                 return cache_info
+            self._failed_system_instruction_caches[cache_key] = True
             
         except Exception as e:
             logger.error(f"創建系統指令 Context Cache 失敗: {e}")
+            if cache_key is not None:
+                self._failed_system_instruction_caches[cache_key] = True
         
         return None
     
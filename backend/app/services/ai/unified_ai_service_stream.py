@@ -113,6 +113,7 @@ async def generate_answer_stream(
             prompt_template,
             apply_chinese_instruction=ensure_chinese,
             user_prompt_input_max_length=user_prompt_input_max_length,
+            model_id=model_id,
             user_question=user_question,
             intent_analysis=intent_analysis,
             document_context=context_str
@@ -134,7 +135,8 @@ async def generate_answer_stream(
             model_id=model_id,
             prompt_request=ai_prompt_request,
             generation_config_dict=generation_config_dict,
-            safety_settings=safety_settings
+            safety_settings=safety_settings,
+            user_id=user_id
         ):
             # AI 現在直接輸出 Markdown，無需解析 JSON
             # 直接傳遞原始 chunk
@@ -1,31 +1,44 @@
 """
 Google Context Caching 服務
 提供與 Google Context Caching 相關的所有功能，包括創建、管理、刪除遠端緩存等
+
+緩存的生命週期：
+- 系統指令超過模型的最低 token 要求時，首次使用即創建遠端緩存
+- 後續請求以緩存 ID 調用模型，系統指令不再隨請求重複發送
+- 剩餘 TTL 低於續期閾值時延長 TTL，閒置的緩存自然過期後由 cleanup_expired_caches 清理
+
+遠端操作由可替換的後端完成（AI_CONTEXT_CACHE_BACKEND）：
+- google：Gemini CachedContent API
+- memory：進程內模擬，用於測試與搭配本地模擬 LLM 提供商
 """
 
 import asyncio
+import itertools
 import logging
+from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
 from enum import Enum
-from typing import Dict, List, Optional, Any, Union
-from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Any, Tuple, Union
+from dataclasses import dataclass, field
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from app.core.logging_utils import log_event, LogLevel
 from app.core.config import settings
+from app.services.ai.token_estimator import token_estimator
 
 # 設置 logger
 logger = logging.getLogger(__name__)
 
-# 嘗試導入新的 Google GenAI SDK
+# 嘗試導入 Google GenAI SDK
 try:
     import google.generativeai as genai
-    # 暫時使用舊的 SDK 結構，等新 SDK 穩定後再更新
+    from google.generativeai import caching as genai_caching
     GOOGLE_CONTEXT_CACHING_AVAILABLE = True
     # 延遲日志記錄到服務實例化時
 except ImportError as e:
     # 優雅降級：如果 SDK 不可用，記錄警告但繼續運行
     genai = None
+    genai_caching = None
     GOOGLE_CONTEXT_CACHING_AVAILABLE = False
     # 延遲日志記錄到服務實例化時
 
@@ -48,6 +61,7 @@ class ContextCacheConfig:
     model: str = "gemini-2.5-flash"  # 默認模型
     display_name: Optional[str] = None  # 顯示名稱
     metadata: Optional[Dict[str, Any]] = None  # 額外元數據
+    ttl_seconds: Optional[int] = None  # 過期時間（秒），設定時優先於 ttl_hours
 
 
 @dataclass
@@ -64,36 +78,66 @@ class ContextCacheInfo:
     metadata: Optional[Dict[str, Any]] = None
 
 
-class GoogleContextCacheService:
-    """Google Context Caching 服務類"""
-    
+@dataclass
+class ContextCacheUsageStats:
+    """Context Cache 實測使用統計"""
+    created: int = 0
+    refreshed: int = 0
+    deleted: int = 0
+    failures: int = 0
+    hits: int = 0  # 以緩存 ID 發出的請求數
+    cached_input_tokens: int = 0  # 由緩存提供、按折扣計費的輸入 token
+    total_input_tokens: int = 0  # 使用緩存的請求的全部輸入 token
+    cached_tokens_by_model: Dict[str, int] = field(default_factory=dict)
+
+
+class ContextCacheBackend(ABC):
+    """Context Cache 遠端操作介面"""
+
+    name: str = "base"
+
+    def is_available(self) -> bool:
+        return True
+
+    @abstractmethod
+    async def create(
+        self, model: str, system_instruction: str, ttl_seconds: int, display_name: Optional[str]
+    ) -> Tuple[str, Optional[int]]:
+        """創建緩存，返回 (緩存 ID, 實際 token 數；未知時為 None)"""
+
+    @abstractmethod
+    async def update_ttl(self, cache_id: str, ttl_seconds: int) -> None:
+        """把緩存的 TTL 重設為從現在起 ttl_seconds 秒"""
+
+    @abstractmethod
+    async def delete(self, cache_id: str) -> None:
+        """刪除緩存"""
+
+    async def get_cached_content(self, cache_id: str) -> Any:
+        """返回可傳給 GenerativeModel.from_cached_content 的緩存對象（默認為緩存 ID）"""
+        return cache_id
+
+    def forget(self, cache_id: str) -> None:
+        """丟棄本地保存的緩存對象（遠端緩存已過期時調用）"""
+
+
+class GoogleContextCacheBackend(ContextCacheBackend):
+    """Gemini CachedContent API 後端（SDK 為同步調用，放到線程中執行）"""
+
+    name = "google"
+
     def __init__(self):
         self.client = None
-        self._token_cost_per_1k = {
-            "gemini-2.5-flash": 0.00001875,  # $0.01875 per 1M tokens
-            "gemini-2.5-pro": 0.00035,       # $0.35 per 1M tokens
-        }
-        self._context_cache_discount = 0.75  # 75% 成本節省
-        self._min_tokens = {
-            "gemini-2.5-flash": 1024,
-            "gemini-2.5-pro": 2048,
-        }
-        
-        # 記錄 SDK 可用性狀態
-        if GOOGLE_CONTEXT_CACHING_AVAILABLE:
-            logger.info("Google GenAI SDK 載入成功，Context Caching 可用")
-        else:
-            logger.warning("Google GenAI SDK 不可用，Context Caching 將被禁用")
-        
-        # 嘗試初始化客戶端
+        # 本進程創建或取用過的 CachedContent 對象（cache_id -> 對象），避免每次調用都重新 get
+        self._cached_contents: Dict[str, Any] = {}
         self._initialize_client()
-    
+
     def _initialize_client(self):
         """初始化 Google GenAI 客戶端"""
         if not GOOGLE_CONTEXT_CACHING_AVAILABLE:
-            logger.warning("Google Context Caching 不可用：未找到 google-genai SDK")
+            logger.warning("Google Context Caching 不可用：未找到 google-generativeai SDK")
             return
-        
+
         try:
             # 使用統一的配置系統獲取 API key
             api_key = settings.GOOGLE_API_KEY
@@ -101,48 +145,170 @@ class GoogleContextCacheService:
                 logger.warning("未在配置中找到 GOOGLE_API_KEY，Context Caching 功能將受限")
                 logger.info("請在 .env 文件中設置 GOOGLE_API_KEY=your-api-key")
                 return
-            
+
             genai.configure(api_key=api_key)
             self.client = genai
             logger.info("Google Context Caching 客戶端初始化成功")
-            
+
         except Exception as e:
             logger.error(f"初始化 Google Context Caching 客戶端失敗: {e}")
             self.client = None
-    
+
     def is_available(self) -> bool:
-        """檢查 Context Caching 是否可用"""
         return GOOGLE_CONTEXT_CACHING_AVAILABLE and self.client is not None
-    
+
+    async def create(self, model, system_instruction, ttl_seconds, display_name):
+        cached = await asyncio.to_thread(
+            genai_caching.CachedContent.create,
+            model=model if model.startswith("models/") else f"models/{model}",
+            display_name=display_name,
+            system_instruction=system_instruction,
+            ttl=timedelta(seconds=ttl_seconds)
+        )
+        self._cached_contents[cached.name] = cached
+        usage = getattr(cached, "usage_metadata", None)
+        return cached.name, getattr(usage, "total_token_count", None)
+
+    async def get_cached_content(self, cache_id):
+        cached = self._cached_contents.get(cache_id)
+        if cached is None:
+            cached = await asyncio.to_thread(genai_caching.CachedContent.get, cache_id)
+            self._cached_contents[cache_id] = cached
+        return cached
+
+    def forget(self, cache_id):
+        self._cached_contents.pop(cache_id, None)
+
+    async def update_ttl(self, cache_id, ttl_seconds):
+        cached = await self.get_cached_content(cache_id)
+        await asyncio.to_thread(cached.update, ttl=timedelta(seconds=ttl_seconds))
+
+    async def delete(self, cache_id):
+        # 遠端已過期時 get 會失敗，先移除本地對象
+        cached = self._cached_contents.pop(cache_id, None)
+        if cached is None:
+            cached = await asyncio.to_thread(genai_caching.CachedContent.get, cache_id)
+        await asyncio.to_thread(cached.delete)
+
+
+class InMemoryContextCacheBackend(ContextCacheBackend):
+    """進程內的模擬後端：行為與遠端一致（過期後不可續期），token 數由本地估算器給出"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._counter = itertools.count(1)
+
+    def _get_live(self, cache_id: str) -> Dict[str, Any]:
+        entry = self._entries.get(cache_id)
+        if entry is None or entry["expires_at"] <= datetime.utcnow():
+            self._entries.pop(cache_id, None)
+            raise KeyError(f"Context Cache 不存在或已過期: {cache_id}")
+        return entry
+
+    async def create(self, model, system_instruction, ttl_seconds, display_name):
+        cache_id = f"cachedContents/local-{next(self._counter)}"
+        token_count = token_estimator.count(system_instruction, model)
+        self._entries[cache_id] = {
+            "model": model,
+            "system_instruction": system_instruction,
+            "token_count": token_count,
+            "expires_at": datetime.utcnow() + timedelta(seconds=ttl_seconds)
+        }
+        return cache_id, token_count
+
+    async def update_ttl(self, cache_id, ttl_seconds):
+        self._get_live(cache_id)["expires_at"] = datetime.utcnow() + timedelta(seconds=ttl_seconds)
+
+    async def delete(self, cache_id):
+        self._get_live(cache_id)
+        del self._entries[cache_id]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class GoogleContextCacheService:
+    """Google Context Caching 服務類"""
+
+    def __init__(self):
+        self._token_cost_per_1k = {
+            "gemini-2.5-flash": 0.00001875,  # $0.01875 per 1M tokens
+            "gemini-2.5-pro": 0.00035,       # $0.35 per 1M tokens
+        }
+        self._context_cache_discount = 0.75  # 75% 成本節省
+        self._backends: Dict[str, ContextCacheBackend] = {}
+        # 本進程創建且仍在使用的緩存（cache_id -> 信息）
+        self._caches: Dict[str, ContextCacheInfo] = {}
+        self.usage_stats = ContextCacheUsageStats()
+
+        # 記錄 SDK 可用性狀態
+        if GOOGLE_CONTEXT_CACHING_AVAILABLE:
+            logger.info("Google GenAI SDK 載入成功，Context Caching 可用")
+        else:
+            logger.warning("Google GenAI SDK 不可用，Context Caching 將被禁用")
+
+    @property
+    def backend(self) -> ContextCacheBackend:
+        """按 AI_CONTEXT_CACHE_BACKEND 返回後端實例（"google" 或 "memory"）"""
+        name = (settings.AI_CONTEXT_CACHE_BACKEND or "google").lower()
+        backend = self._backends.get(name)
+        if backend is None:
+            if name == "memory":
+                backend = InMemoryContextCacheBackend()
+            else:
+                if name != "google":
+                    logger.warning(f"未知的 AI_CONTEXT_CACHE_BACKEND: {name}，使用 google")
+                backend = GoogleContextCacheBackend()
+            self._backends[name] = backend
+        return backend
+
+    @property
+    def client(self):
+        """Google GenAI 客戶端（僅 google 後端）"""
+        return getattr(self.backend, "client", None)
+
+    def is_available(self) -> bool:
+        """檢查 Context Caching 是否可用"""
+        return settings.AI_CONTEXT_CACHE_ENABLED and self.backend.is_available()
+
+    def _min_tokens_for(self, model: str) -> int:
+        """模型的最低緩存 token 數（按模型名前綴匹配，最長前綴優先）"""
+        min_tokens = settings.AI_CONTEXT_CACHE_MIN_TOKENS
+        matches = [key for key in min_tokens if key != "default" and model.startswith(key)]
+        if matches:
+            return min_tokens[max(matches, key=len)]
+        return min_tokens.get("default", 1024)
+
     def check_token_requirements(self, content: str, model: str = "gemini-2.5-flash") -> Dict[str, Any]:
         """檢查內容是否符合 Context Caching 的 token 要求"""
-        # 簡單的 token 估算（實際應該使用 tokenizer）
-        estimated_tokens = len(content.split()) * 1.3  # 粗略估算
-        min_required = self._min_tokens.get(model, 1024)
-        
+        estimated_tokens = token_estimator.count(content, model)
+        min_required = self._min_tokens_for(model)
+
         return {
             "estimated_tokens": int(estimated_tokens),
             "min_required": min_required,
             "meets_requirement": estimated_tokens >= min_required,
             "model": model
         }
-    
-    def estimate_cost_savings(self, token_count: int, model: str = "gemini-2.5-flash", 
+
+    def estimate_cost_savings(self, token_count: int, model: str = "gemini-2.5-flash",
                             usage_count: int = 10) -> Dict[str, float]:
         """估算使用 Context Caching 的成本節省"""
         base_cost_per_1k = self._token_cost_per_1k.get(model, 0.00001875)
-        
+
         # 不使用緩存的成本
         without_cache_cost = (token_count / 1000) * base_cost_per_1k * usage_count
-        
+
         # 使用緩存的成本（首次全額 + 後續折扣）
         first_use_cost = (token_count / 1000) * base_cost_per_1k
         subsequent_cost = first_use_cost * (1 - self._context_cache_discount) * (usage_count - 1)
         with_cache_cost = first_use_cost + subsequent_cost
-        
+
         savings = without_cache_cost - with_cache_cost
         savings_percentage = (savings / without_cache_cost) * 100 if without_cache_cost > 0 else 0
-        
+
         return {
             "without_cache_cost_usd": round(without_cache_cost, 6),
             "with_cache_cost_usd": round(with_cache_cost, 6),
@@ -152,59 +318,49 @@ class GoogleContextCacheService:
             "token_count": token_count,
             "model": model
         }
-    
-    async def create_context_cache(self, config: ContextCacheConfig, 
+
+    async def create_context_cache(self, config: ContextCacheConfig,
                                  db: AsyncIOMotorDatabase = None) -> Optional[ContextCacheInfo]:
         """創建新的 Context Cache"""
         if not self.is_available():
             logger.warning("Context Caching 不可用，跳過創建")
             return None
-        
+
         try:
             # 檢查 token 要求
-            content_str = str(config.content) if isinstance(config.content, (dict, list)) else config.content
-            token_check = self.check_token_requirements(content_str, config.model)
-            
+            content_text = str(config.content) if not isinstance(config.content, str) else config.content
+            token_check = self.check_token_requirements(content_text, config.model)
+
             if not token_check["meets_requirement"]:
                 logger.warning(f"內容不符合 Context Caching token 要求: {token_check}")
                 return None
-            
-            # 準備內容 - 暫時使用字符串格式，等新 SDK 穩定後使用結構化內容
-            content_text = str(config.content) if not isinstance(config.content, str) else config.content
-            
-            # 創建 Context Cache
-            expires_at = datetime.utcnow() + timedelta(hours=config.ttl_hours)
-            
-            # 模擬 Context Cache 創建（等真實 API 可用時再實施）
-            cache_request = {
-                "model": config.model,
-                "content": content_text,
-                "ttl_hours": config.ttl_hours,
-                "display_name": config.display_name or f"{config.cache_type.value}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
-            }
-            
-            # 注意：這裡的實際 API 調用需要根據 google-genai SDK 的實際接口調整
-            # response = await self.client.beta.create_cached_content(**cache_request)
-            
-            # 暫時模擬回應（實際應該來自 API）
-            cache_id = f"cache_{config.cache_type.value}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
-            
+
+            ttl_seconds = config.ttl_seconds or config.ttl_hours * 3600
+            display_name = config.display_name or f"{config.cache_type.value}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
+
+            created_at = datetime.utcnow()
+            cache_id, actual_tokens = await self.backend.create(
+                config.model, content_text, ttl_seconds, display_name[:128]
+            )
+
             cache_info = ContextCacheInfo(
                 cache_id=cache_id,
                 cache_type=config.cache_type,
-                display_name=cache_request["display_name"],
+                display_name=display_name,
                 model=config.model,
-                token_count=token_check["estimated_tokens"],
-                created_at=datetime.utcnow(),
-                expires_at=expires_at,
+                token_count=actual_tokens or token_check["estimated_tokens"],
+                created_at=created_at,
+                expires_at=created_at + timedelta(seconds=ttl_seconds),
                 status="active",
                 metadata=config.metadata
             )
-            
+            self._caches[cache_id] = cache_info
+            self.usage_stats.created += 1
+
             # 記錄到數據庫（可選）
             if db is not None:
                 await self._save_cache_info_to_db(cache_info, db)
-            
+
             if db is not None:
                 await log_event(
                     db=db,
@@ -213,15 +369,17 @@ class GoogleContextCacheService:
                     source="google_context_cache_service.create",
                     details={
                         "cache_type": config.cache_type.value,
-                        "token_count": token_check["estimated_tokens"],
-                        "model": config.model
+                        "token_count": cache_info.token_count,
+                        "model": config.model,
+                        "backend": self.backend.name
                     }
                 )
-            
-            logger.info(f"成功創建 Context Cache: {cache_id}")
+
+            logger.info(f"成功創建 Context Cache: {cache_id} ({cache_info.token_count} tokens, 後端 {self.backend.name})")
             return cache_info
-            
+
         except Exception as e:
+            self.usage_stats.failures += 1
             if db is not None:
                 await log_event(
                     db=db,
@@ -230,36 +388,125 @@ class GoogleContextCacheService:
                     source="google_context_cache_service.create_error",
                     details={"error": str(e), "cache_type": config.cache_type.value}
                 )
-            
+
             logger.error(f"創建 Context Cache 失敗: {e}")
             return None
-    
+
     async def get_cache_info(self, cache_id: str) -> Optional[ContextCacheInfo]:
-        """獲取 Context Cache 信息"""
+        """獲取 Context Cache 信息（僅返回本進程登記且未過期的緩存）"""
         if not self.is_available():
             return None
-        
-        try:
-            # 實際 API 調用（需要根據真實 API 調整）
-            # response = await self.client.beta.get_cached_content(cache_id)
-            
-            # 暫時返回 None（實際應該來自 API 或本地緩存）
+
+        cache_info = self._caches.get(cache_id)
+        if cache_info is None or cache_info.expires_at <= datetime.utcnow():
             return None
-            
+        return cache_info
+
+    def get_registered_cache(self, cache_id: str) -> Optional[ContextCacheInfo]:
+        """同步查詢本進程登記的緩存（不檢查可用性與過期）"""
+        return self._caches.get(cache_id)
+
+    async def refresh_cache_ttl(self, cache_info: ContextCacheInfo, db: AsyncIOMotorDatabase = None,
+                                ttl_seconds: Optional[int] = None) -> bool:
+        """延長緩存 TTL；遠端緩存已不存在時返回 False 並移除登記"""
+        ttl_seconds = ttl_seconds or settings.AI_CONTEXT_CACHE_TTL_SECONDS
+        try:
+            await self.backend.update_ttl(cache_info.cache_id, ttl_seconds)
         except Exception as e:
-            logger.error(f"獲取 Context Cache 信息失敗: {e}")
-            return None
-    
-    async def delete_context_cache(self, cache_id: str, 
+            logger.warning(f"續期 Context Cache 失敗，將重新創建: {cache_info.cache_id}: {e}")
+            self.invalidate(cache_info.cache_id)
+            return False
+
+        cache_info.expires_at = datetime.utcnow() + timedelta(seconds=ttl_seconds)
+        self.usage_stats.refreshed += 1
+        if db is not None:
+            try:
+                await db.context_caches.update_one(
+                    {"cache_id": cache_info.cache_id},
+                    {"$set": {"expires_at": cache_info.expires_at}}
+                )
+            except Exception as e:
+                logger.error(f"更新 Context Cache 過期時間失敗: {e}")
+        logger.debug(f"續期 Context Cache: {cache_info.cache_id}，新過期時間 {cache_info.expires_at}")
+        return True
+
+    async def ensure_fresh(self, cache_info: ContextCacheInfo, db: AsyncIOMotorDatabase = None) -> bool:
+        """使用前檢查緩存：已過期返回 False；剩餘 TTL 低於續期閾值時先續期"""
+        remaining = (cache_info.expires_at - datetime.utcnow()).total_seconds()
+        if remaining <= 0:
+            self.invalidate(cache_info.cache_id)
+            return False
+        if remaining <= settings.AI_CONTEXT_CACHE_REFRESH_BEFORE_SECONDS:
+            return await self.refresh_cache_ttl(cache_info, db)
+        return True
+
+    async def get_cached_content(self, cache_id: str) -> Any:
+        """返回緩存 ID 對應的 CachedContent 對象，供提供商以 GenerativeModel.from_cached_content 構建模型"""
+        return await self.backend.get_cached_content(cache_id)
+
+    def invalidate(self, cache_id: str):
+        """移除本進程的緩存登記（遠端緩存已過期或被刪除時調用）"""
+        cache_info = self._caches.pop(cache_id, None)
+        if cache_info is not None:
+            cache_info.status = "expired"
+        self.backend.forget(cache_id)
+
+    def record_cache_hit(self, cache_info: ContextCacheInfo, cached_tokens: Optional[int], input_tokens: int):
+        """
+        記錄一次以緩存 ID 發出的請求
+
+        cached_tokens 取自回應的 cached_content_token_count，沒有時使用緩存創建時的 token 數。
+        """
+        cached = cached_tokens if cached_tokens else cache_info.token_count
+        stats = self.usage_stats
+        stats.hits += 1
+        stats.cached_input_tokens += cached
+        stats.total_input_tokens += max(input_tokens, cached)
+        stats.cached_tokens_by_model[cache_info.model] = stats.cached_tokens_by_model.get(cache_info.model, 0) + cached
+
+    def get_measured_savings(self) -> Dict[str, Any]:
+        """按實際請求統計的輸入 token 節省"""
+        stats = self.usage_stats
+        savings_usd = sum(
+            tokens / 1000 * self._token_cost_per_1k.get(model, 0.00001875) * self._context_cache_discount
+            for model, tokens in stats.cached_tokens_by_model.items()
+        )
+        saved_tokens = stats.cached_input_tokens * self._context_cache_discount
+        return {
+            "requests_using_cache": stats.hits,
+            "cached_input_tokens": stats.cached_input_tokens,
+            "total_input_tokens": stats.total_input_tokens,
+            "cached_input_ratio": round(stats.cached_input_tokens / stats.total_input_tokens * 100, 2) if stats.total_input_tokens else 0.0,
+            # 緩存 token 按折扣計費，折算成等價的全價輸入 token
+            "billable_input_tokens_saved": int(saved_tokens),
+            "input_cost_savings_percentage": round(saved_tokens / stats.total_input_tokens * 100, 2) if stats.total_input_tokens else 0.0,
+            "savings_usd": round(savings_usd, 6),
+            "caches_created": stats.created,
+            "caches_refreshed": stats.refreshed,
+            "caches_deleted": stats.deleted,
+            "failures": stats.failures
+        }
+
+    async def delete_context_cache(self, cache_id: str,
                                  db: AsyncIOMotorDatabase = None) -> bool:
         """刪除 Context Cache"""
         if not self.is_available():
             return False
-        
+
+        cache_info = self._caches.get(cache_id)
         try:
-            # 實際 API 調用（需要根據真實 API 調整）
-            # await self.client.beta.delete_cached_content(cache_id)
-            
+            try:
+                await self.backend.delete(cache_id)
+            except Exception as e:
+                # 遠端緩存過期後會被自動移除，此時刪除失敗可以忽略
+                expired = cache_info is None or cache_info.expires_at <= datetime.utcnow()
+                if not expired:
+                    raise
+                logger.debug(f"遠端 Context Cache 已不存在: {cache_id}: {e}")
+
+            self.invalidate(cache_id)
+            self.usage_stats.deleted += 1
+
             # 從數據庫中移除記錄（如果有）
             if db is not None:
                 await db.context_caches.delete_one({"cache_id": cache_id})
@@ -269,10 +516,10 @@ class GoogleContextCacheService:
                     message=f"刪除 Context Cache: {cache_id}",
                     source="google_context_cache_service.delete"
                 )
-            
+
             logger.info(f"成功刪除 Context Cache: {cache_id}")
             return True
-            
+
         except Exception as e:
             if db is not None:
                 await log_event(
@@ -282,23 +529,23 @@ class GoogleContextCacheService:
                     source="google_context_cache_service.delete_error",
                     details={"error": str(e), "cache_id": cache_id}
                 )
-            
+
             logger.error(f"刪除 Context Cache 失敗: {e}")
             return False
-    
+
     async def list_context_caches(self, cache_type: Optional[ContextCacheType] = None,
                                 db: AsyncIOMotorDatabase = None) -> List[ContextCacheInfo]:
         """列出所有 Context Caches"""
         if not self.is_available():
             return []
-        
+
         try:
             # 從數據庫獲取緩存信息
             if db is not None:
                 query = {}
                 if cache_type:
                     query["cache_type"] = cache_type.value
-                
+
                 cursor = db.context_caches.find(query)
                 caches = []
                 async for doc in cursor:
@@ -318,46 +565,56 @@ class GoogleContextCacheService:
                     except (KeyError, ValueError) as e:
                         logger.warning(f"跳過無效的緩存記錄: {e}")
                         continue
-                
+
                 return caches
-            
-            return []
-            
+
+            return [
+                cache_info for cache_info in self._caches.values()
+                if cache_type is None or cache_info.cache_type == cache_type
+            ]
+
         except Exception as e:
             logger.error(f"列出 Context Caches 失敗: {e}")
             return []
-    
+
     async def cleanup_expired_caches(self, db: AsyncIOMotorDatabase = None) -> int:
-        """清理過期的 Context Caches"""
+        """清理過期的 Context Caches（本進程登記的與數據庫記錄的）"""
         if not self.is_available():
             return 0
-        
+
         try:
             now = datetime.utcnow()
             cleanup_count = 0
-            
+
+            expired_ids = [
+                cache_id for cache_id, cache_info in self._caches.items()
+                if cache_info.expires_at <= now
+            ]
             if db is not None:
                 # 獲取過期的緩存
                 expired_caches = await db.context_caches.find({
                     "expires_at": {"$lt": now}
                 }).to_list(length=None)
-                
-                for cache_doc in expired_caches:
-                    cache_id = cache_doc["cache_id"]
-                    if await self.delete_context_cache(cache_id, db):
-                        cleanup_count += 1
-                
-                if cleanup_count > 0:
-                    await log_event(
-                        db=db,
-                        level=LogLevel.INFO,
-                        message=f"清理過期 Context Caches: {cleanup_count} 個",
-                        source="google_context_cache_service.cleanup"
-                    )
-            
+                expired_ids.extend(
+                    cache_doc["cache_id"] for cache_doc in expired_caches
+                    if cache_doc["cache_id"] not in expired_ids
+                )
+
+            for cache_id in expired_ids:
+                if await self.delete_context_cache(cache_id, db):
+                    cleanup_count += 1
+
+            if cleanup_count > 0 and db is not None:
+                await log_event(
+                    db=db,
+                    level=LogLevel.INFO,
+                    message=f"清理過期 Context Caches: {cleanup_count} 個",
+                    source="google_context_cache_service.cleanup"
+                )
+
             logger.info(f"清理了 {cleanup_count} 個過期的 Context Caches")
             return cleanup_count
-            
+
         except Exception as e:
             if db is not None:
                 await log_event(
@@ -367,10 +624,10 @@ class GoogleContextCacheService:
                     source="google_context_cache_service.cleanup_error",
                     details={"error": str(e)}
                 )
-            
+
             logger.error(f"清理過期 Context Caches 失敗: {e}")
             return 0
-    
+
     async def get_cache_statistics(self, db: AsyncIOMotorDatabase = None) -> Dict[str, Any]:
         """獲取 Context Cache 統計信息"""
         try:
@@ -381,48 +638,50 @@ class GoogleContextCacheService:
                 "cache_types": {},
                 "total_tokens": 0,
                 "estimated_savings": 0.0,
-                "is_available": self.is_available()
+                "is_available": self.is_available(),
+                "backend": self.backend.name,
+                "measured_savings": self.get_measured_savings()
             }
-            
+
             if not self.is_available() or db is None:
                 return stats
-            
+
             now = datetime.utcnow()
-            
+
             # 獲取所有緩存統計
             cursor = db.context_caches.find({})
             async for doc in cursor:
                 stats["total_caches"] += 1
                 stats["total_tokens"] += doc.get("token_count", 0)
-                
+
                 cache_type = doc.get("cache_type", "unknown")
                 if cache_type not in stats["cache_types"]:
                     stats["cache_types"][cache_type] = 0
                 stats["cache_types"][cache_type] += 1
-                
+
                 if doc.get("expires_at", now) > now:
                     stats["active_caches"] += 1
                 else:
                     stats["expired_caches"] += 1
-            
+
             # 估算成本節省（假設平均使用 10 次）
             if stats["total_tokens"] > 0:
                 savings_estimate = self.estimate_cost_savings(
-                    stats["total_tokens"], 
+                    stats["total_tokens"],
                     usage_count=10
                 )
                 stats["estimated_savings"] = savings_estimate["savings_usd"]
-            
+
             return stats
-            
+
         except Exception as e:
             logger.error(f"獲取 Context Cache 統計失敗: {e}")
             return {
                 "error": str(e),
                 "is_available": self.is_available()
             }
-    
-    async def _save_cache_info_to_db(self, cache_info: ContextCacheInfo, 
+
+    async def _save_cache_info_to_db(self, cache_info: ContextCacheInfo,
                                    db: AsyncIOMotorDatabase):
         """保存 Context Cache 信息到數據庫"""
         try:
@@ -437,13 +696,13 @@ class GoogleContextCacheService:
                 "status": cache_info.status,
                 "metadata": cache_info.metadata
             }
-            
+
             await db.context_caches.insert_one(doc)
             logger.debug(f"保存 Context Cache 信息到數據庫: {cache_info.cache_id}")
-            
+
         except Exception as e:
             logger.error(f"保存 Context Cache 信息到數據庫失敗: {e}")
 
 
 # 全局服務實例
-google_context_cache_service = GoogleContextCacheService() 
\ No newline at end of file
+google_context_cache_service = GoogleContextCacheService()
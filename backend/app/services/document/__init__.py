@@ -12,5 +12,6 @@ __all__ = [
     'document_task_service',
     'email_document_processor',
     'entity_extraction_service',
-    'semantic_summary_service'
+    'semantic_summary_service',
+    'text_analysis_batcher'
 ]
@@ -0,0 +1,272 @@
+"""
+文檔批量刪除服務
+
+原批量刪除逐個文檔做權限檢查、刪除文件、刪除記錄與刪除向量，每一步都寫日誌，
+刪除一個大聚類需要數千次往返。這裡改為按批處理：
+
+1. 一次 $in 查詢取回所有請求文檔的擁有者與文件路徑，區分 not_found / forbidden
+2. 每批一次 delete_many（同時刪除外置內容、扣減欄位目錄）
+3. 每批一次向量刪除（ChromaDB 的 document_id $in 過濾）
+4. 文件在後台線程池中刪除，不阻塞請求
+
+超過 DOCUMENT_BULK_DELETE_SYNC_LIMIT 的請求由 API 轉為後台任務，通過任務 ID 查詢進度。
+"""
+
+import asyncio
+import logging
+import shutil
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.config import settings
+from app.core.logging_utils import AppLogger, log_event, LogLevel
+from app.crud import crud_documents
+from app.crud.crud_document_contents import delete_document_contents
+from app.models.document_models import BatchDeleteResponseDetail
+from app.services.document.field_catalog_service import field_catalog_service
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+_OWNERSHIP_PROJECTION = {"owner_id": 1, "filename": 1, "file_path": 1, "catalog_field_paths": 1}
+
+ProgressCallback = Callable[[int, str, int], Awaitable[None]]
+
+
+@dataclass
+class BulkDeleteResult:
+    """一次批量刪除的結果"""
+    requested: int = 0
+    deleted: int = 0
+    vector_failures: int = 0  # 向量刪除失敗的文檔數（記錄已刪除）
+    files_scheduled: int = 0  # 提交到後台線程池的文件數
+    details: List[BatchDeleteResponseDetail] = field(default_factory=list)
+
+
+@dataclass
+class BulkDeleteStats:
+    """批量刪除統計"""
+    requests: int = 0
+    documents_deleted: int = 0
+    delete_batches: int = 0
+    vector_batches: int = 0
+    files_removed: int = 0
+    file_failures: int = 0
+
+
+def _remove_document_file(document_id: str, file_path: str) -> bool:
+    """刪除文檔文件；Gmail 郵件存放在以文檔 ID 命名的目錄中，整個目錄一起刪除"""
+    path = Path(file_path)
+    if path.parent.name == document_id:
+        shutil.rmtree(path.parent, ignore_errors=False)
+        return True
+    if path.exists():
+        path.unlink()
+        return True
+    return False
+
+
+class DocumentBulkDeleteService:
+    """按批刪除文檔記錄、向量與文件"""
+
+    def __init__(self):
+        self.stats = BulkDeleteStats()
+        self._file_executor: Optional[ThreadPoolExecutor] = None
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._file_executor is None:
+            self._file_executor = ThreadPoolExecutor(
+                max_workers=max(1, settings.DOCUMENT_FILE_DELETE_WORKERS),
+                thread_name_prefix="document-file-delete"
+            )
+        return self._file_executor
+
+    def _on_file_removed(self, document_id: str, file_path: str, future: Future):
+        try:
+            future.result()
+            self.stats.files_removed += 1
+        except Exception as e:
+            self.stats.file_failures += 1
+            logger.warning(f"刪除文檔 {document_id} 的文件 {file_path} 失敗: {e}")
+
+    def schedule_file_removal(self, files: List[Tuple[str, str]]) -> List[Future]:
+        """把 (文檔 ID, 文件路徑) 提交到後台線程池刪除，立即返回"""
+        futures = []
+        for document_id, file_path in files:
+            future = self._executor().submit(_remove_document_file, document_id, file_path)
+            future.add_done_callback(lambda f, d=document_id, p=file_path: self._on_file_removed(d, p, f))
+            futures.append(future)
+        return futures
+
+    async def check_ownership(
+        self,
+        db: AsyncIOMotorDatabase,
+        owner_id: uuid.UUID,
+        document_ids: List[uuid.UUID]
+    ) -> Tuple[List[Dict[str, Any]], List[BatchDeleteResponseDetail]]:
+        """
+        一次 $in 查詢區分可刪除、不存在與無權限的文檔
+
+        Returns:
+            (可刪除文檔的投影記錄（按請求順序）, 不可刪除文檔的結果明細)
+        """
+        unique_ids = list(dict.fromkeys(document_ids))
+        found = await db[crud_documents.DOCUMENT_COLLECTION].find(
+            {"_id": {"$in": unique_ids}}, projection=_OWNERSHIP_PROJECTION
+        ).to_list(length=None)
+        found_by_id = {raw["_id"]: raw for raw in found}
+
+        owned: List[Dict[str, Any]] = []
+        rejected: List[BatchDeleteResponseDetail] = []
+        for document_id in unique_ids:
+            raw = found_by_id.get(document_id)
+            if raw is None:
+                rejected.append(BatchDeleteResponseDetail(id=document_id, status="not_found", message="文件不存在"))
+            elif raw.get("owner_id") != owner_id:
+                rejected.append(BatchDeleteResponseDetail(id=document_id, status="forbidden", message="無權限刪除此文件"))
+            else:
+                owned.append(raw)
+        if any(detail.status == "forbidden" for detail in rejected):
+            logger.warning(f"批量刪除：用戶 {owner_id} 請求刪除 {sum(d.status == 'forbidden' for d in rejected)} 個不屬於自己的文件")
+        return owned, rejected
+
+    async def _split_removed(
+        self,
+        db: AsyncIOMotorDatabase,
+        batch: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], List[BatchDeleteResponseDetail]]:
+        """區分 delete_many 後已不存在的文檔與仍存在（未被本次刪除）的文檔"""
+        remaining = await db[crud_documents.DOCUMENT_COLLECTION].find(
+            {"_id": {"$in": [raw["_id"] for raw in batch]}}, projection={"_id": 1}
+        ).to_list(length=None)
+        remaining_ids = {raw["_id"] for raw in remaining}
+        removed = [raw for raw in batch if raw["_id"] not in remaining_ids]
+        not_deleted = [
+            BatchDeleteResponseDetail(id=raw["_id"], status="not_found", message="文件不存在或已不屬於當前用戶")
+            for raw in batch if raw["_id"] in remaining_ids
+        ]
+        if not_deleted:
+            logger.warning(f"批量刪除：{len(not_deleted)} 個文件在權限檢查後已不屬於當前用戶，未刪除")
+        return removed, not_deleted
+
+    async def _delete_vectors(self, document_ids: List[str]) -> bool:
+        # 延遲導入，避免在未使用向量庫的進程中初始化 ChromaDB
+        from app.services.vector.vector_db_service import vector_db_service
+        self.stats.vector_batches += 1
+        return await asyncio.to_thread(vector_db_service.delete_by_document_ids_batch, document_ids)
+
+    async def delete_documents(
+        self,
+        db: AsyncIOMotorDatabase,
+        owner_id: uuid.UUID,
+        document_ids: List[uuid.UUID],
+        progress_callback: Optional[ProgressCallback] = None,
+        wait_for_files: bool = False,
+        request_id: Optional[str] = None
+    ) -> BulkDeleteResult:
+        """
+        批量刪除用戶的文檔
+
+        Args:
+            progress_callback: 每批完成後回調 (進度百分比, 步驟描述, 已完成數)
+            wait_for_files: 是否等待後台線程池刪完文件（後台任務中使用，使進度包含文件清理）
+        """
+        self.stats.requests += 1
+        result = BulkDeleteResult(requested=len(document_ids))
+        owned, rejected = await self.check_ownership(db, owner_id, document_ids)
+        result.details.extend(rejected)
+
+        batch_size = max(1, settings.DOCUMENT_BULK_DELETE_BATCH_SIZE)
+        file_futures: List[Future] = []
+
+        async def report_progress(start: int):
+            if progress_callback:
+                done = min(start + batch_size, len(owned))
+                await progress_callback(int(done * 100 / len(owned)), f"已刪除 {done}/{len(owned)} 個文件", done)
+
+        for start in range(0, len(owned), batch_size):
+            batch = owned[start:start + batch_size]
+            batch_ids = [raw["_id"] for raw in batch]
+
+            # 帶上 owner_id 條件：檢查與刪除之間文檔不會被轉移，但避免任何越權刪除
+            delete_result = await db[crud_documents.DOCUMENT_COLLECTION].delete_many(
+                {"_id": {"$in": batch_ids}, "owner_id": owner_id}
+            )
+            self.stats.delete_batches += 1
+            if delete_result.deleted_count < len(batch_ids):
+                # 部分文檔未被刪除（檢查後已被轉移或被其他請求刪除）：以刪除後仍存在的文檔為準
+                batch, not_deleted = await self._split_removed(db, batch)
+                batch_ids = [raw["_id"] for raw in batch]
+                result.details.extend(not_deleted)
+                if not batch:
+                    await report_progress(start)
+                    continue
+            await delete_document_contents(db, batch_ids)
+            catalog_paths = [path for raw in batch for path in raw.get("catalog_field_paths") or []]
+            await field_catalog_service.remove_document_fields(db, owner_id, catalog_paths)
+
+            vectors_deleted = False
+            try:
+                vectors_deleted = await self._delete_vectors([str(document_id) for document_id in batch_ids])
+            except Exception as e:
+                logger.error(f"批量刪除：第 {start // batch_size + 1} 批向量刪除失敗: {e}", exc_info=True)
+            if not vectors_deleted:
+                result.vector_failures += len(batch_ids)
+
+            files = [(str(raw["_id"]), raw["file_path"]) for raw in batch if raw.get("file_path")]
+            file_futures.extend(self.schedule_file_removal(files))
+            result.files_scheduled += len(files)
+
+            result.deleted += delete_result.deleted_count
+            result.details.extend(
+                BatchDeleteResponseDetail(
+                    id=raw["_id"],
+                    status="deleted",
+                    message="Document deleted successfully." if vectors_deleted else "文件已刪除，但向量刪除失敗"
+                )
+                for raw in batch
+            )
+            await report_progress(start)
+
+        if owned:
+            crud_documents.invalidate_document_count_cache(owner_id)
+        if wait_for_files and file_futures:
+            await asyncio.gather(*(asyncio.wrap_future(future) for future in file_futures), return_exceptions=True)
+        self.stats.documents_deleted += result.deleted
+
+        await log_event(
+            db=db,
+            level=LogLevel.INFO,
+            message=f"批量刪除完成: 請求 {result.requested}，刪除 {result.deleted}，拒絕 {len(rejected)}",
+            source="service.document_bulk_delete",
+            user_id=str(owner_id),
+            request_id=request_id,
+            details={
+                "requested": result.requested,
+                "deleted": result.deleted,
+                "not_found": sum(detail.status == "not_found" for detail in result.details),
+                "forbidden": sum(detail.status == "forbidden" for detail in rejected),
+                "vector_failures": result.vector_failures,
+                "files_scheduled": result.files_scheduled
+            }
+        )
+        return result
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """獲取批量刪除統計"""
+        return {
+            "requests": self.stats.requests,
+            "documents_deleted": self.stats.documents_deleted,
+            "delete_batches": self.stats.delete_batches,
+            "vector_batches": self.stats.vector_batches,
+            "files_removed": self.stats.files_removed,
+            "file_failures": self.stats.file_failures,
+        }
+
+
+# 全局實例
+document_bulk_delete_service = DocumentBulkDeleteService()
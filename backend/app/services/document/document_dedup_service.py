@@ -0,0 +1,242 @@
+"""
+文檔內容去重服務
+
+同一用戶重複上傳相同發票、或導入轉發郵件時，內容指紋（content_sha256）相同的文檔
+會重新跑一遍文本提取、AI 分析、實體豐富化與向量化。這裡按用戶範圍檢測相同內容，
+按用戶設定（未設定時使用 DOCUMENT_DEDUP_DEFAULT_MODE）處理：
+
+- off：不去重
+- link：不創建新記錄，直接返回已有文檔（合併新標籤）
+- clone：照常創建新記錄，再從已分析的文檔複製提取文本、分析結果、豐富化數據與向量，
+  不調用任何 AI 或 Embedding 接口
+
+每次去重按來源文檔的處理狀態累計節省的分析、豐富化與 Embedding 調用數。
+"""
+
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, UTC
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.config import settings
+from app.core.logging_utils import AppLogger, log_event, LogLevel
+from app.crud import crud_documents
+from app.crud.crud_document_contents import hydrate_raw_document
+from app.crud.crud_document_search import refresh_document_search_terms
+from app.models.document_models import Document, DocumentStatus, VectorStatus
+from app.models.user_models import DocumentDedupMode
+from app.services.document.field_catalog_service import field_catalog_service
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+# 同一內容的候選文檔數上限（優先選擇已完成分析與向量化的）
+_CANDIDATE_LIMIT = 5
+
+_CANDIDATE_PROJECTION = {"_id": 1, "status": 1, "vector_status": 1, "enriched_data": 1, "analysis.tokens_used": 1}
+
+# 分析完成後才有可複製的結果
+_ANALYZED_STATUSES = {DocumentStatus.ANALYSIS_COMPLETED.value, DocumentStatus.COMPLETED.value}
+
+# clone 時從來源文檔複製的欄位
+_CLONED_FIELDS = (
+    "extracted_text",
+    "text_extraction_completed_at",
+    "analysis",
+    "analyzed_content_type",
+    "enriched_data",
+    "status",
+)
+
+
+@dataclass
+class DedupStats:
+    """內容去重統計"""
+    checked: int = 0  # 做過去重檢查的文檔數
+    duplicates: int = 0  # 命中相同內容的文檔數
+    linked: int = 0  # link 模式返回已有文檔的次數
+    cloned: int = 0  # clone 模式複製成功的次數
+    clone_failures: int = 0  # 複製失敗、新文檔保持待處理的次數
+    saved_analysis_calls: int = 0  # 節省的 AI 分析調用
+    saved_enrichment_calls: int = 0  # 節省的實體豐富化
+    saved_embedding_calls: int = 0  # 節省的 Embedding 調用（按向量數計）
+    saved_tokens: int = 0  # 來源文檔分析消耗的 token 之和
+
+
+def _is_analyzed(raw: Dict[str, Any]) -> bool:
+    return raw.get("status") in _ANALYZED_STATUSES
+
+
+def _candidate_rank(raw: Dict[str, Any]) -> int:
+    if _is_analyzed(raw) and raw.get("vector_status") == VectorStatus.VECTORIZED.value:
+        return 0
+    return 1 if _is_analyzed(raw) else 2
+
+
+class DocumentDedupService:
+    """按用戶範圍的內容去重"""
+
+    def __init__(self):
+        self.stats = DedupStats()
+
+    def resolve_mode(self, user: Any) -> DocumentDedupMode:
+        """用戶設定優先，否則使用系統預設；無法識別的值視為 off"""
+        mode = getattr(user, "document_dedup_mode", None) or settings.DOCUMENT_DEDUP_DEFAULT_MODE
+        try:
+            return DocumentDedupMode(mode)
+        except ValueError:
+            logger.warning(f"無法識別的去重模式 {mode!r}，已關閉去重")
+            return DocumentDedupMode.OFF
+
+    async def find_duplicate(
+        self,
+        db: AsyncIOMotorDatabase,
+        owner_id: uuid.UUID,
+        content_sha256: Optional[str],
+        exclude_id: Optional[uuid.UUID] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        查找同一用戶內容相同的文檔，優先返回已完成分析與向量化的
+
+        Returns:
+            候選文檔的 _CANDIDATE_PROJECTION 欄位；沒有相同內容時返回 None
+        """
+        if not content_sha256:
+            return None
+        self.stats.checked += 1
+        query: Dict[str, Any] = {"owner_id": owner_id, "content_sha256": content_sha256}
+        if exclude_id is not None:
+            query["_id"] = {"$ne": exclude_id}
+        candidates = await db[crud_documents.DOCUMENT_COLLECTION].find(
+            query, projection=_CANDIDATE_PROJECTION
+        ).sort("created_at", 1).limit(_CANDIDATE_LIMIT).to_list(length=_CANDIDATE_LIMIT)
+        if not candidates:
+            return None
+        self.stats.duplicates += 1
+        return min(candidates, key=_candidate_rank)
+
+    def _record_savings(self, source: Dict[str, Any], embeddings: int) -> Dict[str, int]:
+        saved = {
+            "analysis_calls": 1 if _is_analyzed(source) else 0,
+            "enrichment_calls": 1 if source.get("enriched_data") else 0,
+            "embedding_calls": embeddings,
+            "tokens": ((source.get("analysis") or {}).get("tokens_used") or 0) if _is_analyzed(source) else 0,
+        }
+        self.stats.saved_analysis_calls += saved["analysis_calls"]
+        self.stats.saved_enrichment_calls += saved["enrichment_calls"]
+        self.stats.saved_embedding_calls += saved["embedding_calls"]
+        self.stats.saved_tokens += saved["tokens"]
+        return saved
+
+    async def link_duplicate(
+        self,
+        db: AsyncIOMotorDatabase,
+        existing: Dict[str, Any],
+        tags: Optional[List[str]] = None,
+        user_id: Optional[str] = None
+    ) -> Optional[Document]:
+        """link 模式：把新標籤合併到已有文檔並返回它"""
+        if tags:
+            await db[crud_documents.DOCUMENT_COLLECTION].update_one(
+                {"_id": existing["_id"]},
+                {"$addToSet": {"tags": {"$each": list(tags)}}, "$set": {"updated_at": datetime.now(UTC)}}
+            )
+            await refresh_document_search_terms(db, existing["_id"])
+        self.stats.linked += 1
+        # link 不讀取向量庫，省下的 Embedding 調用不計入
+        saved = self._record_savings(existing, embeddings=0)
+        await log_event(
+            db=db,
+            level=LogLevel.INFO,
+            message="上傳內容與已有文檔相同，已返回已有文檔",
+            source="service.document_dedup.link",
+            user_id=user_id,
+            details={"document_id": str(existing["_id"]), "saved": saved}
+        )
+        return await crud_documents.get_document_by_id(db, existing["_id"])
+
+    async def clone_document(
+        self,
+        db: AsyncIOMotorDatabase,
+        source: Dict[str, Any],
+        target: Document,
+        user_id: Optional[str] = None
+    ) -> Document:
+        """
+        clone 模式：把來源文檔的處理結果複製到剛創建的文檔
+
+        來源文檔尚未完成分析時只記錄 duplicate_of，新文檔照常等待處理。
+        向量複製失敗時新文檔標記為未向量化（之後可單獨向量化，不需要重新分析）。
+        """
+        duplicate_marker = {"metadata.duplicate_of": str(source["_id"])}
+        if not _is_analyzed(source):
+            updated = await crud_documents.update_document(db, target.id, duplicate_marker)
+            return updated or target
+
+        try:
+            raw = await db[crud_documents.DOCUMENT_COLLECTION].find_one({"_id": source["_id"]})
+            raw = await hydrate_raw_document(db, raw)
+            if raw is None:
+                return target
+
+            update_data: Dict[str, Any] = {field: raw[field] for field in _CLONED_FIELDS if field in raw}
+            update_data.update(duplicate_marker)
+
+            copied_vectors = 0
+            if raw.get("vector_status") == VectorStatus.VECTORIZED.value:
+                # 延遲導入，避免在未使用向量庫的進程中初始化 ChromaDB
+                from app.services.vector.vector_db_service import vector_db_service
+                copied_vectors = vector_db_service.copy_document_vectors(
+                    str(source["_id"]), str(target.id), str(target.owner_id)
+                )
+            update_data["vector_status"] = (
+                VectorStatus.VECTORIZED.value if copied_vectors else VectorStatus.NOT_VECTORIZED.value
+            )
+
+            updated = await crud_documents.update_document(db, target.id, update_data)
+            if updated is None:
+                raise RuntimeError("目標文檔不存在")
+
+            # 分析欄位計入用戶的動態欄位目錄（與 set_document_analysis 相同）
+            await field_catalog_service.record_document_fields(
+                db, target.id, target.owner_id, (raw.get("analysis") or {}).get("ai_analysis_output"), previous_paths=[]
+            )
+        except Exception as e:
+            self.stats.clone_failures += 1
+            logger.error(f"從文檔 {source['_id']} 複製處理結果到 {target.id} 失敗: {e}", exc_info=True)
+            updated = await crud_documents.update_document(db, target.id, duplicate_marker)
+            return updated or target
+
+        self.stats.cloned += 1
+        saved = self._record_savings(raw, embeddings=copied_vectors)
+        await log_event(
+            db=db,
+            level=LogLevel.INFO,
+            message="上傳內容與已有文檔相同，已複製分析結果與向量",
+            source="service.document_dedup.clone",
+            user_id=user_id,
+            details={"document_id": str(target.id), "source_document_id": str(source["_id"]), "saved": saved}
+        )
+        return updated
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """獲取去重統計（命中率與節省的 AI / Embedding 調用數）"""
+        return {
+            "default_mode": settings.DOCUMENT_DEDUP_DEFAULT_MODE,
+            "checked": self.stats.checked,
+            "duplicates": self.stats.duplicates,
+            "duplicate_rate": round(self.stats.duplicates / self.stats.checked, 4) if self.stats.checked else 0.0,
+            "linked": self.stats.linked,
+            "cloned": self.stats.cloned,
+            "clone_failures": self.stats.clone_failures,
+            "saved_analysis_calls": self.stats.saved_analysis_calls,
+            "saved_enrichment_calls": self.stats.saved_enrichment_calls,
+            "saved_embedding_calls": self.stats.saved_embedding_calls,
+            "saved_tokens": self.stats.saved_tokens,
+        }
+
+
+# 全局實例
+document_dedup_service = DocumentDedupService()
@@ -0,0 +1,236 @@
+"""
+批量文檔處理調度器
+
+「處理未處理」與「重試失敗」原先讀取最多 1000 份完整文檔，在請求內逐一觸發分析，
+大量積壓會長時間佔用請求，並與互動流量爭搶文本提取與 AI 配額。這裡改為有界、按用戶公平的調度：
+
+1. 端點只讀取文檔 ID，提交後立即返回後台任務 ID，通過任務查詢進度
+2. 全局最多 DOCUMENT_PROCESSING_MAX_CONCURRENCY 份文檔同時處理，單個用戶最多
+   DOCUMENT_PROCESSING_PER_USER_CONCURRENCY 份；有空位時在有等待文檔的用戶之間輪流取下一份，
+   一個用戶的大量積壓不會擋住其他用戶
+3. 已在隊列中或處理中的文檔不會重複入隊
+4. 分析調用本身仍經過 AI 速率限制器的後台通道，互動請求保持優先
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Set, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.config import settings
+from app.core.logging_utils import AppLogger, log_event, LogLevel
+from app.models.background_task_models import TaskStatus, TaskType
+from app.services.background_task_manager import background_task_manager
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+# 處理單份文檔，返回是否成功
+DocumentProcessor = Callable[[uuid.UUID], Awaitable[bool]]
+
+# 任務結果中最多記錄的失敗文檔 ID 數
+_MAX_FAILED_IDS_IN_RESULT = 100
+
+
+@dataclass
+class ProcessingJob:
+    """一次批量處理請求"""
+    task_id: str
+    owner_id: str
+    db: AsyncIOMotorDatabase
+    process: DocumentProcessor
+    total: int = 0
+    skipped: int = 0  # 已在隊列或處理中而未重複入隊的文檔數
+    succeeded: int = 0
+    failed: int = 0
+    failed_ids: List[str] = field(default_factory=list)
+
+    @property
+    def finished(self) -> int:
+        return self.succeeded + self.failed
+
+
+@dataclass
+class SchedulerStats:
+    """調度統計"""
+    jobs: int = 0
+    admitted: int = 0
+    skipped_in_flight: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    max_queue_depth: int = 0
+    total_queue_wait_seconds: float = 0.0
+    max_queue_wait_seconds: float = 0.0
+
+
+class DocumentProcessingScheduler:
+    """有界並發、按用戶輪流的批量文檔處理調度器"""
+
+    def __init__(self):
+        self._queues: Dict[str, Deque[Tuple[ProcessingJob, uuid.UUID, float]]] = {}
+        self._rotation: Deque[str] = deque()  # 有等待文檔的用戶（輪流順序）
+        self._running: Dict[str, int] = {}
+        self._active = 0
+        self._in_flight_ids: Set[uuid.UUID] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.stats = SchedulerStats()
+
+    def queued_count(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def submit(
+        self,
+        db: AsyncIOMotorDatabase,
+        owner_id: uuid.UUID,
+        document_ids: List[uuid.UUID],
+        process: DocumentProcessor
+    ) -> ProcessingJob:
+        """
+        把文檔加入用戶的隊列並創建後台任務
+
+        Returns:
+            ProcessingJob（task_id 用於查詢進度；沒有可入隊的文檔時任務直接完成）
+        """
+        owner_key = str(owner_id)
+        admitted = [doc_id for doc_id in dict.fromkeys(document_ids) if doc_id not in self._in_flight_ids]
+        task_id = await background_task_manager.create_task(
+            db=db, task_type=TaskType.DOCUMENT_BATCH_PROCESSING, user_id=owner_key, total_items=len(admitted)
+        )
+        job = ProcessingJob(
+            task_id=task_id, owner_id=owner_key, db=db, process=process,
+            total=len(admitted), skipped=len(document_ids) - len(admitted)
+        )
+        self.stats.jobs += 1
+        self.stats.admitted += job.total
+        self.stats.skipped_in_flight += job.skipped
+
+        if not admitted:
+            await self._complete(job)
+            return job
+
+        # 入隊前標記為運行中：狀態更新失敗不影響處理，也不會在文檔處理完成後覆蓋 COMPLETED
+        try:
+            await background_task_manager.update_task_status(db, task_id, TaskStatus.RUNNING)
+        except Exception as e:
+            logger.warning(f"更新批量處理任務 {task_id} 狀態失敗: {e}")
+
+        queued_at = time.monotonic()
+        queue = self._queues.setdefault(owner_key, deque())
+        if not queue:
+            self._rotation.append(owner_key)
+        for doc_id in admitted:
+            queue.append((job, doc_id, queued_at))
+            self._in_flight_ids.add(doc_id)
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.queued_count())
+
+        logger.info(f"用戶 {owner_key} 的 {job.total} 份文檔已加入處理隊列（任務 {task_id}，跳過 {job.skipped} 份）")
+        self._dispatch()
+        return job
+
+    def _dispatch(self):
+        """有空位時在等待中的用戶之間輪流啟動下一份文檔"""
+        max_concurrency = max(1, settings.DOCUMENT_PROCESSING_MAX_CONCURRENCY)
+        per_user_limit = max(1, settings.DOCUMENT_PROCESSING_PER_USER_CONCURRENCY)
+        blocked = 0
+        while self._rotation and self._active < max_concurrency and blocked < len(self._rotation):
+            owner_key = self._rotation[0]
+            self._rotation.rotate(-1)
+            if self._running.get(owner_key, 0) >= per_user_limit:
+                blocked += 1
+                continue
+            blocked = 0
+
+            queue = self._queues[owner_key]
+            job, doc_id, queued_at = queue.popleft()
+            if not queue:
+                del self._queues[owner_key]
+                self._rotation.pop()  # 剛輪轉到隊尾
+
+            wait_seconds = time.monotonic() - queued_at
+            self.stats.total_queue_wait_seconds += wait_seconds
+            self.stats.max_queue_wait_seconds = max(self.stats.max_queue_wait_seconds, wait_seconds)
+            self._running[owner_key] = self._running.get(owner_key, 0) + 1
+            self._active += 1
+            task = asyncio.create_task(self._run(job, doc_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: ProcessingJob, doc_id: uuid.UUID):
+        succeeded = False
+        try:
+            succeeded = await job.process(doc_id)
+        except Exception as e:
+            logger.error(f"批量處理文檔 {doc_id} 失敗（任務 {job.task_id}）: {e}", exc_info=True)
+        finally:
+            self._active -= 1
+            self._running[job.owner_id] -= 1
+            if not self._running[job.owner_id]:
+                del self._running[job.owner_id]
+            self._in_flight_ids.discard(doc_id)
+            self._dispatch()
+
+        if succeeded:
+            job.succeeded += 1
+            self.stats.succeeded += 1
+        else:
+            job.failed += 1
+            self.stats.failed += 1
+            if len(job.failed_ids) < _MAX_FAILED_IDS_IN_RESULT:
+                job.failed_ids.append(str(doc_id))
+
+        try:
+            await background_task_manager.update_task_progress(
+                job.db, job.task_id,
+                progress=int(job.finished * 100 / job.total),
+                current_step=f"已處理 {job.finished}/{job.total} 份文檔（失敗 {job.failed}）",
+                completed_items=job.finished
+            )
+            if job.finished == job.total:
+                await self._complete(job)
+        except Exception as e:
+            logger.warning(f"更新批量處理任務 {job.task_id} 進度失敗: {e}")
+
+    async def _complete(self, job: ProcessingJob):
+        await background_task_manager.set_task_result(job.db, job.task_id, {
+            "total": job.total,
+            "succeeded": job.succeeded,
+            "failed": job.failed,
+            "skipped": job.skipped,
+            "failed_document_ids": job.failed_ids,
+        })
+        await background_task_manager.update_task_status(job.db, job.task_id, TaskStatus.COMPLETED)
+        await log_event(
+            db=job.db,
+            level=LogLevel.INFO,
+            message=f"批量文檔處理完成: 成功 {job.succeeded}，失敗 {job.failed}，跳過 {job.skipped}",
+            source="service.document_processing_scheduler",
+            user_id=job.owner_id,
+            details={"task_id": job.task_id, "total": job.total, "succeeded": job.succeeded, "failed": job.failed}
+        )
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """獲取調度統計（隊列深度、並發佔用與排隊等待時間）"""
+        started = self.stats.succeeded + self.stats.failed + self._active
+        return {
+            "max_concurrency": settings.DOCUMENT_PROCESSING_MAX_CONCURRENCY,
+            "per_user_concurrency": settings.DOCUMENT_PROCESSING_PER_USER_CONCURRENCY,
+            "running": self._active,
+            "queued": self.queued_count(),
+            "queued_users": len(self._rotation),
+            "max_queue_depth": self.stats.max_queue_depth,
+            "jobs": self.stats.jobs,
+            "admitted": self.stats.admitted,
+            "skipped_in_flight": self.stats.skipped_in_flight,
+            "succeeded": self.stats.succeeded,
+            "failed": self.stats.failed,
+            "avg_queue_wait_seconds": round(self.stats.total_queue_wait_seconds / started, 3) if started else 0.0,
+            "max_queue_wait_seconds": round(self.stats.max_queue_wait_seconds, 3),
+        }
+
+
+# 全局實例
+document_processing_scheduler = DocumentProcessingScheduler()
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import uuid
 from pathlib import Path
@@ -10,13 +11,14 @@ from fastapi import HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from ...models import Document, DocumentStatus, TokenUsage, AIImageAnalysisOutput, AITextAnalysisOutput
-from ...crud import crud_documents
+from ...crud import crud_documents, crud_document_contents
 from ...core.config import Settings
 from .document_processing_service import DocumentProcessingService, SUPPORTED_IMAGE_TYPES_FOR_AI
 from ..ai.unified_ai_service_simplified import AIRequest, TaskType as AIServiceTaskType, unified_ai_service_simplified
 from ..ai.unified_ai_config import unified_ai_config
 from ...core.logging_utils import log_event, LogLevel, AppLogger
 from .vectorization_queue import vectorization_queue
+from .text_analysis_batcher import text_analysis_batcher
 
 logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
 
@@ -151,8 +153,10 @@ class DocumentTasksService:
                 logger.warning(f"提取的文本長度 ({len(extracted_text_content)}) 超過最大允許長度 ({max_prompt_len})。將進行截斷。 Doc ID: {doc_uuid}")
                 extracted_text_content = extracted_text_content[:max_prompt_len]
 
-            ai_response = await unified_ai_service_simplified.analyze_text( # type: ignore
-                text=extracted_text_content, model_preference=ai_model_preference, db=db
+            # 小文檔會與同時到達的其他文檔合併為一次分析請求
+            ai_response = await text_analysis_batcher.analyze(
+                text=extracted_text_content, model_preference=ai_model_preference, db=db, user_id=user_id_for_log,
+                ai_ensure_chinese_output=ai_ensure_chinese_output
             )
             
             if not ai_response.success or not isinstance(ai_response.output_data, AITextAnalysisOutput):
@@ -327,6 +331,22 @@ class DocumentTasksService:
             logger.error(f"Service task for doc {document.id} encountered top-level error: {e}", exc_info=True)
             await self._save_analysis_results(document, db, user_id_for_log, request_id_for_log, None, None, None, DocumentStatus.PROCESSING_ERROR, processing_type)
 
+    async def process_documents_content_analysis(self, doc_id_strs: List[str], db: AsyncIOMotorDatabase, user_id_for_log: str, request_id_for_log: Optional[str], settings_obj: Settings, ai_ensure_chinese_output: Optional[bool] = True, ai_model_preference: Optional[str] = None, ai_max_output_tokens: Optional[int] = None) -> None:
+        """
+        並發處理多份文檔（批量導入後使用），讓短文檔可以在文本分析批處理器中合併請求
+        """
+        semaphore = asyncio.Semaphore(max(1, settings_obj.TEXT_ANALYSIS_BATCH_MAX_DOCUMENTS * 2))
+
+        async def _process(doc_id_str: str):
+            async with semaphore:
+                await self.process_document_content_analysis(
+                    doc_id_str, db, user_id_for_log, request_id_for_log, settings_obj,
+                    ai_ensure_chinese_output, ai_model_preference, ai_max_output_tokens
+                )
+
+        logger.info(f"並發處理 {len(doc_id_strs)} 份文檔的內容分析")
+        await asyncio.gather(*[_process(doc_id_str) for doc_id_str in doc_id_strs], return_exceptions=True)
+
     async def trigger_document_analysis(self, db: AsyncIOMotorDatabase, doc_processor: DocumentProcessingService, document_id: uuid.UUID, current_user_id: uuid.UUID, settings_obj: Settings, processing_strategy: Optional[str] = None, custom_prompt_id: Optional[str] = None, analysis_type: Optional[str] = None, task_type_str: Optional[str] = None, request_id: Optional[str] = None, ai_model_preference: Optional[str] = None, ai_ensure_chinese_output: Optional[bool] = None, ai_max_output_tokens: Optional[int] = None) -> Document:
         logger.debug(f"(Service) Triggering analysis for doc ID: {document_id}, strategy: {processing_strategy}")
         
@@ -373,6 +393,7 @@ class DocumentTasksService:
             elif effective_task_type == AIServiceTaskType.TEXT_GENERATION:
                 processing_type_for_save = "text_analysis_triggered"
                 # This part is similar to _process_text_document's content prep
+                document = await crud_document_contents.hydrate_document(db, document)
                 if not document.extracted_text:
                     if not document.file_path or not os.path.exists(document.file_path): # Check path before extraction
                          raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="文本文件路徑不存在。")
@@ -394,13 +415,20 @@ class DocumentTasksService:
             else: # Should have been caught by earlier task type check
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"不支持的AI任務類型進行內部觸發: {effective_task_type}")
 
-            ai_request = AIRequest(
-                task_type=effective_task_type, content=content_for_ai, model_preference=ai_model_preference,
-                require_language_consistency=ai_ensure_chinese_output if ai_ensure_chinese_output is not None else True,
-                generation_params_override={"max_output_tokens": ai_max_output_tokens} if ai_max_output_tokens else None,
-                prompt_params={"user_query": custom_prompt_id} if custom_prompt_id else None, user_id=str(current_user_id)
-            )
-            ai_response = await unified_ai_service_simplified.process_request(ai_request, db) # type: ignore
+            if effective_task_type == AIServiceTaskType.TEXT_GENERATION and not custom_prompt_id and not ai_max_output_tokens:
+                # 無自定義參數的文本分析可與其他文檔合併請求
+                ai_response = await text_analysis_batcher.analyze(
+                    text=content_for_ai, model_preference=ai_model_preference, db=db, user_id=str(current_user_id),
+                    ai_ensure_chinese_output=ai_ensure_chinese_output
+                )
+            else:
+                ai_request = AIRequest(
+                    task_type=effective_task_type, content=content_for_ai, model_preference=ai_model_preference,
+                    require_language_consistency=ai_ensure_chinese_output if ai_ensure_chinese_output is not None else True,
+                    generation_params_override={"max_output_tokens": ai_max_output_tokens} if ai_max_output_tokens else None,
+                    prompt_params={"user_query": custom_prompt_id} if custom_prompt_id else None, user_id=str(current_user_id)
+                )
+                ai_response = await unified_ai_service_simplified.process_request(ai_request, db) # type: ignore
 
             analysis_data_to_save: Optional[dict] = None
             token_usage_to_save: Optional[TokenUsage] = None
@@ -1,5 +1,7 @@
+import hashlib
 import logging
 import json
+import re
 from pathlib import Path
 from typing import Optional, Tuple
 from datetime import datetime
@@ -14,6 +16,44 @@ from app.core.config import settings
 
 logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
 
+# 轉發郵件插入的分隔行，其後是原郵件的頭部欄位與正文
+_FORWARD_MARKER = re.compile(
+    r"^\s*-{3,}\s*(?:Forwarded message|Original Message|轉寄郵件|轉寄的郵件|转发的邮件|原始郵件|原始邮件)\s*-{3,}\s*$",
+    re.IGNORECASE | re.MULTILINE
+)
+_FORWARD_HEADER = re.compile(
+    r"^(?:From|Date|Sent|Subject|To|Cc|寄件者|寄件人|日期|主旨|收件者|收件人|副本|发件人|主题|抄送)\s*[:：]",
+    re.IGNORECASE
+)
+
+
+def normalize_email_body(body: str) -> str:
+    """
+    去重用的正文正規化：統一換行、去掉行尾空白；
+    轉發郵件只保留最內層原郵件的正文（去掉轉發說明、分隔行與原郵件頭部欄位）
+    """
+    text = (body or "").replace("\r\n", "\n").replace("\r", "\n")
+    markers = list(_FORWARD_MARKER.finditer(text))
+    lines = text[markers[-1].end():].split("\n") if markers else text.split("\n")
+    if markers:
+        start = 0
+        while start < len(lines) and (not lines[start].strip() or _FORWARD_HEADER.match(lines[start].strip())):
+            start += 1
+        lines = lines[start:]
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def email_content_sha256(email: EmailMessage) -> Optional[str]:
+    """
+    郵件的內容指紋（正規化正文的 sha256），轉發郵件與原郵件相同
+
+    只有附件或正文無法解碼的郵件正規化後為空，彼此之間無法區分，返回 None 不參與去重
+    """
+    normalized = normalize_email_body(email.body)
+    if not normalized:
+        return None
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
 
 class EmailDocumentProcessor:
     """郵件文檔處理器 - 將 Gmail 郵件轉換為 Document 記錄"""
@@ -112,6 +152,7 @@ class EmailDocumentProcessor:
                 filename=filename,
                 file_type="text/plain",  # 郵件正文存儲為純文本
                 size=file_size,
+                content_sha256=email_content_sha256(email),
                 owner_id=user_id,
                 tags=tags or [],
                 metadata={
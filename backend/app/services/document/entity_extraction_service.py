@@ -10,6 +10,7 @@ from datetime import datetime
 
 from app.models.document_models import Document
 from app.core.logging_utils import AppLogger, log_event, LogLevel
+from app.services.document.field_catalog_service import field_catalog_service
 
 logger = AppLogger(__name__, level=logging.INFO).get_logger()
 
@@ -79,6 +80,11 @@ class EntityExtractionService:
                 }
             }
             
+            # 增量更新所屬用戶的動態欄位目錄（已由 set_document_analysis 計入的欄位不會重複計數）
+            await field_catalog_service.record_document_fields(
+                db, document.id, document.owner_id, ai_analysis_output
+            )
+            
             # 5. 生成embedding (基於summary和keywords的組合)
             # 注意: 這裡不直接生成,而是標記需要生成
             # 實際的embedding生成會在向量化服務中處理
@@ -0,0 +1,333 @@
+"""
+用戶欄位目錄服務
+
+按用戶增量維護 AI 分析結果中 key_information 的動態欄位（dynamic_fields /
+structured_entities）：欄位路徑、出現過的類型、示例值與包含該欄位的文檔數。
+
+分析結果寫入時（set_document_analysis / enrich_document）只按新舊欄位集合的差異
+更新目錄；每個文檔已計入的欄位記錄在文檔的 catalog_field_paths 上，
+因此同一份分析結果重複寫入不會重複計數。詳細查詢構建 Schema 提示時
+按用戶 ID 讀取一個目錄文檔，不再逐次抽樣掃描文檔。
+
+增量更新只覆蓋目錄建立之後寫入的分析結果：只有 rebuild_catalog 從用戶全部文檔
+重建過（帶 rebuilt_at 標記）的目錄才視為完整，否則調用方應排程重建並回退為抽樣掃描。
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, UTC
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from app.core.config import settings
+from app.core.logging_utils import AppLogger
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+FIELD_CATALOG_COLLECTION = "document_field_catalogs"
+DOCUMENT_COLLECTION = "documents"
+
+# 納入目錄的 key_information 欄位組
+CATALOG_FIELD_GROUPS = ("dynamic_fields", "structured_entities")
+
+
+def _catalog_key(path: str) -> str:
+    """將欄位路徑轉為可作為 MongoDB 子欄位名的鍵（轉義 "." 與開頭的 "$"）"""
+    key = path.replace(".", "．")
+    if key.startswith("$"):
+        key = "＄" + key[1:]
+    return key
+
+
+def _format_example(value: Any) -> Optional[str]:
+    """把欄位值轉為簡短示例；列表取第一個元素，空值不作為示例"""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if value is None or value == "" or value == {}:
+        return None
+    if isinstance(value, (dict, list)):
+        text = json.dumps(value, ensure_ascii=False, default=str)
+    else:
+        text = str(value)
+    max_chars = settings.FIELD_CATALOG_EXAMPLE_MAX_CHARS
+    return text if len(text) <= max_chars else text[:max_chars] + "…"
+
+
+def extract_catalog_fields(ai_analysis_output: Optional[Dict[str, Any]]) -> Dict[str, Tuple[str, str, Any]]:
+    """
+    從 AI 分析結果中提取目錄欄位
+
+    Returns:
+        路徑 -> (欄位組, 欄位名, 值)；路徑相對於 key_information，例如 "dynamic_fields.繳費期限"
+    """
+    if not isinstance(ai_analysis_output, dict):
+        return {}
+    key_information = ai_analysis_output.get("key_information")
+    if not isinstance(key_information, dict):
+        return {}
+
+    fields: Dict[str, Tuple[str, str, Any]] = {}
+    for group in CATALOG_FIELD_GROUPS:
+        values = key_information.get(group)
+        if not isinstance(values, dict):
+            continue
+        for name, value in values.items():
+            fields[f"{group}.{name}"] = (group, str(name), value)
+    return fields
+
+
+class FieldCatalogService:
+    """按用戶增量維護的動態欄位目錄"""
+
+    def __init__(self):
+        self._cache: Dict[str, Tuple[float, Dict[str, Dict[str, Any]]]] = {}
+        self._rebuilding: Set[str] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.FIELD_CATALOG_ENABLED
+
+    async def record_document_fields(
+        self,
+        db: AsyncIOMotorDatabase,
+        document_id: uuid.UUID,
+        owner_id: Any,
+        ai_analysis_output: Optional[Dict[str, Any]],
+        previous_paths: Optional[List[str]] = None
+    ) -> bool:
+        """
+        按文檔新舊欄位集合的差異更新所屬用戶的目錄
+
+        Args:
+            previous_paths: 文檔上已計入目錄的欄位路徑；未提供時從文檔讀取
+
+        Returns:
+            目錄是否有變更
+        """
+        if not self.enabled or owner_id is None:
+            return False
+
+        try:
+            if previous_paths is None:
+                raw = await db[DOCUMENT_COLLECTION].find_one(
+                    {"_id": document_id}, projection={"catalog_field_paths": 1}
+                )
+                previous_paths = (raw or {}).get("catalog_field_paths") or []
+
+            fields = extract_catalog_fields(ai_analysis_output)
+            old_paths = set(previous_paths)
+            added = [path for path in fields if path not in old_paths]
+            removed = [path for path in old_paths if path not in fields]
+            if not added and not removed:
+                return False
+
+            update = self._build_update(fields, added, removed)
+            await db[FIELD_CATALOG_COLLECTION].update_one({"_id": owner_id}, update, upsert=True)
+            await db[DOCUMENT_COLLECTION].update_one(
+                {"_id": document_id}, {"$set": {"catalog_field_paths": list(fields)}}
+            )
+            self._cache.pop(str(owner_id), None)
+            logger.debug(f"欄位目錄已更新: 用戶 {owner_id}, 文檔 {document_id}, 新增 {len(added)}, 移除 {len(removed)}")
+            return True
+        except Exception as e:
+            # 目錄只用於查詢提示，更新失敗不影響分析結果的保存
+            logger.warning(f"更新欄位目錄失敗 (文檔 {document_id}): {e}")
+            return False
+
+    async def remove_document_fields(
+        self,
+        db: AsyncIOMotorDatabase,
+        owner_id: Any,
+        field_paths: Optional[List[str]]
+    ) -> None:
+        """文檔刪除後從目錄中扣除它計入的欄位（批量刪除時傳入多個文檔欄位的拼接）"""
+        if not self.enabled or owner_id is None or not field_paths:
+            return
+        try:
+            update = self._build_update({}, [], list(field_paths))
+            await db[FIELD_CATALOG_COLLECTION].update_one({"_id": owner_id}, update)
+            self._cache.pop(str(owner_id), None)
+        except Exception as e:
+            logger.warning(f"從欄位目錄扣除已刪除文檔的欄位失敗: {e}")
+
+    def _build_update(
+        self,
+        fields: Dict[str, Tuple[str, str, Any]],
+        added: List[str],
+        removed: List[str]
+    ) -> Dict[str, Any]:
+        inc: Dict[str, int] = {}
+        set_fields: Dict[str, Any] = {"updated_at": datetime.now(UTC)}
+        add_to_set: Dict[str, Any] = {}
+        push: Dict[str, Any] = {}
+
+        for path in added:
+            group, name, value = fields[path]
+            key = f"fields.{_catalog_key(path)}"
+            inc[f"{key}.count"] = 1
+            set_fields[f"{key}.path"] = path
+            set_fields[f"{key}.group"] = group
+            set_fields[f"{key}.name"] = name
+            add_to_set[f"{key}.types"] = type(value).__name__
+            example = _format_example(value)
+            if example is not None:
+                push[f"{key}.examples"] = {"$each": [example], "$slice": -settings.FIELD_CATALOG_MAX_EXAMPLES}
+        for path in removed:
+            # 批量刪除時同一欄位可能出現多次
+            key = f"fields.{_catalog_key(path)}.count"
+            inc[key] = inc.get(key, 0) - 1
+
+        update: Dict[str, Any] = {"$set": set_fields}
+        if inc:
+            update["$inc"] = inc
+        if add_to_set:
+            update["$addToSet"] = add_to_set
+        if push:
+            update["$push"] = push
+        return update
+
+    async def get_catalog(self, db: AsyncIOMotorDatabase, owner_id: Any) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        讀取用戶的欄位目錄（路徑 -> 條目），只包含仍有文檔使用的欄位
+
+        Returns:
+            目錄字典；用戶還沒有目錄，或目錄未經完整重建（只有增量寫入的部分欄位）時返回 None
+        """
+        cache_key = str(owner_id)
+        cached = self._cache.get(cache_key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        raw = await db[FIELD_CATALOG_COLLECTION].find_one({"_id": owner_id}, projection={"fields": 1, "rebuilt_at": 1})
+        if raw is None or not raw.get("rebuilt_at"):
+            return None
+
+        catalog = {
+            entry["path"]: entry
+            for entry in (raw.get("fields") or {}).values()
+            if isinstance(entry, dict) and entry.get("path") and entry.get("count", 0) > 0
+        }
+        self._cache[cache_key] = (time.monotonic() + settings.FIELD_CATALOG_CACHE_TTL_SECONDS, catalog)
+        return catalog
+
+    async def get_document_field_paths(
+        self,
+        db: AsyncIOMotorDatabase,
+        owner_id: Any,
+        document_ids: List[Any]
+    ) -> List[str]:
+        """讀取目標文檔已計入目錄的欄位路徑（去重，保留順序）"""
+        if not document_ids:
+            return []
+        cursor = db[DOCUMENT_COLLECTION].find(
+            {"_id": {"$in": list(document_ids)}, "owner_id": owner_id}, projection={"catalog_field_paths": 1}
+        )
+        paths: Dict[str, None] = {}
+        async for raw in cursor:
+            for path in raw.get("catalog_field_paths") or []:
+                paths.setdefault(path, None)
+        return list(paths)
+
+    @staticmethod
+    def build_schema_hint(
+        catalog: Dict[str, Dict[str, Any]],
+        max_fields: Optional[int] = None,
+        required_paths: Optional[List[str]] = None
+    ) -> Dict[str, str]:
+        """
+        把目錄轉為詳細查詢的 Schema 提示（按出現頻率排序），格式與抽樣掃描的結果一致
+
+        Args:
+            required_paths: 正在查詢的文檔的欄位，不受 max_fields 截斷，總是包含在提示中
+        """
+        limit = max_fields if max_fields is not None else settings.FIELD_CATALOG_MAX_HINT_FIELDS
+        entries = sorted(catalog.values(), key=lambda entry: (-entry.get("count", 0), entry["path"]))
+        required = [catalog[path] for path in dict.fromkeys(required_paths or []) if path in catalog]
+        required_set = {entry["path"] for entry in required}
+        others = [entry for entry in entries if entry["path"] not in required_set]
+        selected = sorted(
+            required + others[:max(0, limit - len(required))],
+            key=lambda entry: (-entry.get("count", 0), entry["path"])
+        )
+        hint: Dict[str, str] = {}
+        for entry in selected:
+            description = f"{entry.get('name', entry['path'])} ({'/'.join(entry.get('types') or []) or 'unknown'})"
+            examples = entry.get("examples") or []
+            if examples:
+                description += f"，例: {examples[-1]}"
+            description += f"，{entry.get('count', 0)} 份文檔"
+            hint[entry["path"]] = description
+        return hint
+
+    async def rebuild_catalog(self, db: AsyncIOMotorDatabase, owner_id: Any) -> int:
+        """
+        從用戶的所有文檔重建目錄（用於目錄建立前已存在的文檔）
+
+        Returns:
+            目錄中的欄位數
+        """
+        counts: Dict[str, int] = {}
+        entries: Dict[str, Dict[str, Any]] = {}
+        document_updates: List[UpdateOne] = []
+
+        cursor = db[DOCUMENT_COLLECTION].find(
+            {"owner_id": owner_id},
+            projection={
+                f"analysis.ai_analysis_output.key_information.{group}": 1 for group in CATALOG_FIELD_GROUPS
+            }
+        )
+        async for raw in cursor:
+            analysis_output = ((raw.get("analysis") or {}).get("ai_analysis_output")) or {}
+            fields = extract_catalog_fields(analysis_output)
+            for path, (group, name, value) in fields.items():
+                counts[path] = counts.get(path, 0) + 1
+                entry = entries.setdefault(path, {"path": path, "group": group, "name": name, "types": [], "examples": []})
+                type_name = type(value).__name__
+                if type_name not in entry["types"]:
+                    entry["types"].append(type_name)
+                example = _format_example(value)
+                if example is not None and len(entry["examples"]) < settings.FIELD_CATALOG_MAX_EXAMPLES:
+                    entry["examples"].append(example)
+            document_updates.append(UpdateOne({"_id": raw["_id"]}, {"$set": {"catalog_field_paths": list(fields)}}))
+
+        catalog_fields = {
+            _catalog_key(path): {**entry, "count": counts[path]} for path, entry in entries.items()
+        }
+        await db[FIELD_CATALOG_COLLECTION].replace_one(
+            {"_id": owner_id},
+            {"fields": catalog_fields, "updated_at": datetime.now(UTC), "rebuilt_at": datetime.now(UTC)},
+            upsert=True
+        )
+        for start in range(0, len(document_updates), 500):
+            await db[DOCUMENT_COLLECTION].bulk_write(document_updates[start:start + 500], ordered=False)
+        self._cache.pop(str(owner_id), None)
+
+        logger.info(f"已重建用戶 {owner_id} 的欄位目錄: {len(catalog_fields)} 個欄位，{len(document_updates)} 份文檔")
+        return len(catalog_fields)
+
+    def schedule_rebuild(self, db: AsyncIOMotorDatabase, owner_id: Any) -> bool:
+        """在背景重建目錄；同一用戶已在重建時不重複排程"""
+        cache_key = str(owner_id)
+        if not self.enabled or cache_key in self._rebuilding:
+            return False
+        self._rebuilding.add(cache_key)
+
+        async def _run():
+            try:
+                await self.rebuild_catalog(db, owner_id)
+            except Exception as e:
+                logger.error(f"重建用戶 {owner_id} 的欄位目錄失敗: {e}", exc_info=True)
+            finally:
+                self._rebuilding.discard(cache_key)
+
+        asyncio.create_task(_run())
+        return True
+
+
+# 全局實例
+field_catalog_service = FieldCatalogService()
@@ -10,6 +10,13 @@ from app.models.ai_models_simplified import AIPromptRequest
 from app.models.document_models import Document, VectorStatus
 from app.services.ai.prompt_manager_simplified import prompt_manager_simplified, PromptType
 from app.crud.crud_documents import update_document_vector_status
+from app.crud.crud_document_search import refresh_document_search_terms
+from app.crud.crud_document_contents import (
+    content_store_enabled,
+    hydrate_document,
+    save_document_content,
+    split_heavy_fields
+)
 from app.core.config import settings
 from app.utils.text_processing import create_text_chunks, smart_truncate, smart_compress_list
 import logging
@@ -284,6 +291,9 @@ class SemanticSummaryService:
                         source="service.semantic_summary.process_doc_hybrid.start", details=log_details_base)
 
         try:
+            # 提取文本與分析中間結果可能已外置到 document_contents，分塊前按需讀回
+            document = await hydrate_document(db, document)
+
             # Step 1: Update status to PROCESSING
             step_start_time = datetime.now()
             logger.info(f"[{step_start_time.isoformat()}] Updating status to PROCESSING for document {doc_id_str}.")
@@ -648,8 +658,18 @@ class SemanticSummaryService:
                     "analysis.ai_analysis_output": semantic_summary.full_ai_analysis
                 }
             }
+            content = {}
+            if content_store_enabled():
+                inline_fields, unset_fields, content = split_heavy_fields(update_operation["$set"])
+                update_operation = {"$set": inline_fields}
+                if unset_fields:
+                    update_operation["$unset"] = unset_fields
             
             result = await db.documents.update_one({"_id": doc_id}, update_operation)
+            if content and result.matched_count > 0:
+                await save_document_content(db, doc_id, content)
+            if result.modified_count > 0:
+                await refresh_document_search_terms(db, doc_id)
             
             if result.modified_count > 0:
                 await log_event(
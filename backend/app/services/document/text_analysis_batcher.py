@@ -0,0 +1,278 @@
+"""
+文本分析批處理器
+
+批量導入（Gmail 郵件、短收據、筆記）時，每份短文檔各自調用一次 analyze_text，
+大部分延遲和配額都花在單次請求的固定開銷上。此模塊在一個很短的時間窗口內
+收集同時到達的小文檔，在 token 預算內合併為一次結構化輸出請求，
+再按 document_index 拆分回每份文檔。批量請求失敗或某個結果槽位無效時，
+對應文檔回退為單獨調用。
+
+只有同一用戶、同一模型且分析選項相同的文檔才會合併：批量請求的用量記錄、
+速率限制與 db 都按該用戶計，不同用戶的文檔不會出現在同一個提示詞中。
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import ValidationError
+
+from app.core.config import settings
+from app.core.logging_utils import AppLogger
+from app.models.ai_models_simplified import AITextAnalysisOutput, TokenUsage
+from app.services.ai.token_estimator import token_estimator
+from app.services.ai.unified_ai_service_simplified import (
+    AIResponse,
+    TaskType,
+    unified_ai_service_simplified
+)
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+# 合併分組：(用戶 ID, 模型偏好, 是否要求中文輸出)
+_BatchKey = Tuple[Optional[str], Optional[str], bool]
+
+
+@dataclass
+class _PendingAnalysis:
+    """等待合併的一份文檔"""
+    text: str
+    estimated_tokens: int
+    future: asyncio.Future
+    db: Optional[AsyncIOMotorDatabase]
+    user_id: Optional[str]
+
+
+@dataclass
+class BatchingStats:
+    """批量分析統計"""
+    documents: int = 0  # 經過批處理器的文檔總數
+    batch_calls: int = 0  # 合併請求次數
+    batched_documents: int = 0  # 由合併請求成功得到結果的文檔數
+    individual_calls: int = 0  # 單獨調用次數（含回退）
+    failed_batches: int = 0  # 整批失敗後全部回退的批次數
+    fallback_documents: int = 0  # 回退為單獨調用的文檔數
+    batch_sizes: Dict[int, int] = field(default_factory=dict)  # 批次大小分佈
+
+
+class TextAnalysisBatcher:
+    """按用戶、模型與分析選項分組的小文檔文本分析合併器"""
+
+    def __init__(self):
+        self.stats = BatchingStats()
+        self._pending: Dict[_BatchKey, List[_PendingAnalysis]] = {}
+        self._window_tasks: Dict[_BatchKey, asyncio.Task] = {}
+        self._running: Set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.TEXT_ANALYSIS_BATCHING_ENABLED
+
+    async def analyze(
+        self,
+        text: str,
+        model_preference: Optional[str] = None,
+        db: Optional[AsyncIOMotorDatabase] = None,
+        user_id: Optional[str] = None,
+        ai_ensure_chinese_output: Optional[bool] = None
+    ) -> AIResponse:
+        """
+        分析一份文檔的文本；小文檔會與同一用戶同時到達、參數相同的其他文檔合併為一次請求
+
+        Returns:
+            與 analyze_text 相同格式的 AIResponse（output_data 為 AITextAnalysisOutput）
+        """
+        self.stats.documents += 1
+        estimated_tokens = token_estimator.count(text, model_preference)
+        key: _BatchKey = (user_id, model_preference, ai_ensure_chinese_output is not False)
+        if not self.enabled or estimated_tokens > settings.TEXT_ANALYSIS_BATCH_MAX_DOC_TOKENS:
+            return await self._analyze_individually(text, key, db)
+
+        item = _PendingAnalysis(
+            text=text,
+            estimated_tokens=estimated_tokens,
+            future=asyncio.get_running_loop().create_future(),
+            db=db,
+            user_id=user_id
+        )
+        group = self._pending.get(key)
+        if group and sum(p.estimated_tokens for p in group) + estimated_tokens > settings.TEXT_ANALYSIS_BATCH_TOKEN_BUDGET:
+            # 加入後會超出預算：先送出已收集的批次
+            self._flush(key)
+        group = self._pending.setdefault(key, [])
+        group.append(item)
+
+        if len(group) >= settings.TEXT_ANALYSIS_BATCH_MAX_DOCUMENTS:
+            self._flush(key)
+        elif key not in self._window_tasks:
+            self._window_tasks[key] = asyncio.create_task(self._flush_after_window(key))
+
+        return await item.future
+
+    async def _flush_after_window(self, key: _BatchKey):
+        await asyncio.sleep(settings.TEXT_ANALYSIS_BATCH_WINDOW_SECONDS)
+        self._window_tasks.pop(key, None)
+        self._flush(key)
+
+    def _flush(self, key: _BatchKey):
+        """送出指定分組當前收集的批次"""
+        window_task = self._window_tasks.pop(key, None)
+        if window_task is not None and window_task is not asyncio.current_task():
+            window_task.cancel()
+        items = self._pending.pop(key, [])
+        if not items:
+            return
+        task = asyncio.create_task(self._run_batch(items, key))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, items: List[_PendingAnalysis], key: _BatchKey):
+        try:
+            if len(items) == 1:
+                item = items[0]
+                self._resolve(item, await self._analyze_individually(item.text, key, item.db))
+                return
+
+            results = await self._analyze_as_batch(items, key)
+            fallback_items = [item for item, result in zip(items, results) if result is None]
+            for item, result in zip(items, results):
+                if result is not None:
+                    self._resolve(item, result)
+
+            if fallback_items:
+                self.stats.fallback_documents += len(fallback_items)
+                logger.warning(f"批量文本分析有 {len(fallback_items)}/{len(items)} 份文檔回退為單獨調用")
+                responses = await asyncio.gather(
+                    *[self._analyze_individually(item.text, key, item.db) for item in fallback_items],
+                    return_exceptions=True
+                )
+                for item, response in zip(fallback_items, responses):
+                    self._resolve(item, response)
+        except Exception as e:
+            logger.error(f"批量文本分析執行失敗: {e}", exc_info=True)
+            for item in items:
+                self._resolve(item, e)
+
+    async def _analyze_as_batch(
+        self,
+        items: List[_PendingAnalysis],
+        key: _BatchKey
+    ) -> List[Optional[AIResponse]]:
+        """
+        以一次請求分析整批文檔（同一分組的文檔屬於同一用戶）
+
+        Returns:
+            與 items 對應的結果列表；None 表示該文檔需要回退為單獨調用
+        """
+        start_time = time.time()
+        self.stats.batch_calls += 1
+        self.stats.batch_sizes[len(items)] = self.stats.batch_sizes.get(len(items), 0) + 1
+
+        user_id, model_preference, ensure_chinese_output = key
+        response = await unified_ai_service_simplified.analyze_text_batch(
+            texts=[item.text for item in items],
+            model_preference=model_preference,
+            user_id=user_id,
+            db=items[0].db,
+            ai_max_output_tokens=settings.TEXT_ANALYSIS_BATCH_OUTPUT_TOKENS_PER_DOC * len(items),
+            ai_ensure_chinese_output=ensure_chinese_output
+        )
+        if not response.success or response.output_data is None:
+            self.stats.failed_batches += 1
+            logger.warning(f"批量文本分析失敗 ({len(items)} 份文檔)，全部回退: {response.error_message}")
+            return [None] * len(items)
+
+        slots: Dict[int, Dict[str, Any]] = {}
+        for raw in response.output_data.results:
+            index = raw.get("document_index") if isinstance(raw, dict) else None
+            if isinstance(index, int) and 0 <= index < len(items) and index not in slots:
+                slots[index] = raw
+
+        total_estimated = sum(item.estimated_tokens for item in items)
+        results: List[Optional[AIResponse]] = []
+        for index, item in enumerate(items):
+            raw = slots.get(index)
+            if raw is None:
+                results.append(None)
+                continue
+            try:
+                output = AITextAnalysisOutput.model_validate(
+                    {key: value for key, value in raw.items() if key != "document_index"}
+                )
+            except ValidationError as e:
+                logger.warning(f"批量文本分析第 {index} 份結果格式無效，回退: {e.errors()[:1]}")
+                results.append(None)
+                continue
+            output.model_used = response.model_used
+            results.append(AIResponse(
+                success=True,
+                task_type=TaskType.TEXT_GENERATION,
+                model_used=response.model_used,
+                prompt_type_used=response.prompt_type_used,
+                output_data=output,
+                token_usage=self._share_token_usage(response.token_usage, item.estimated_tokens, total_estimated),
+                processing_time_seconds=time.time() - start_time
+            ))
+
+        self.stats.batched_documents += sum(1 for r in results if r is not None)
+        logger.info(f"批量文本分析完成: {len(items)} 份文檔一次調用，成功 {sum(1 for r in results if r is not None)} 份")
+        return results
+
+    async def _analyze_individually(
+        self,
+        text: str,
+        key: _BatchKey,
+        db: Optional[AsyncIOMotorDatabase]
+    ) -> AIResponse:
+        self.stats.individual_calls += 1
+        user_id, model_preference, ensure_chinese_output = key
+        return await unified_ai_service_simplified.analyze_text(
+            text=text, model_preference=model_preference, user_id=user_id, db=db,
+            ai_ensure_chinese_output=ensure_chinese_output
+        )
+
+    @staticmethod
+    def _share_token_usage(usage: Optional[TokenUsage], share: int, total: int) -> Optional[TokenUsage]:
+        """按估算輸入 token 比例把整批的 token 用量分攤到每份文檔"""
+        if usage is None or total <= 0:
+            return usage
+        ratio = share / total
+        prompt_tokens = int(usage.prompt_tokens * ratio)
+        completion_tokens = int(usage.completion_tokens * ratio)
+        return TokenUsage(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens
+        )
+
+    @staticmethod
+    def _resolve(item: _PendingAnalysis, result: Any):
+        if item.future.done():
+            return
+        if isinstance(result, BaseException):
+            item.future.set_exception(result)
+        else:
+            item.future.set_result(result)
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """獲取批量分析統計（每次調用平均處理的文檔數）"""
+        total_calls = self.stats.batch_calls + self.stats.individual_calls
+        return {
+            "enabled": self.enabled,
+            "documents": self.stats.documents,
+            "batch_calls": self.stats.batch_calls,
+            "batched_documents": self.stats.batched_documents,
+            "individual_calls": self.stats.individual_calls,
+            "failed_batches": self.stats.failed_batches,
+            "fallback_documents": self.stats.fallback_documents,
+            "documents_per_call": round(self.stats.documents / total_calls, 2) if total_calls else 0.0,
+            "batch_size_distribution": dict(sorted(self.stats.batch_sizes.items())),
+            "pending": sum(len(items) for items in self._pending.values())
+        }
+
+
+# 全局實例
+text_analysis_batcher = TextAnalysisBatcher()
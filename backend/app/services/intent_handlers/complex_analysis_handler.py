@@ -92,11 +92,7 @@ class ComplexAnalysisHandler:
                 )
             
             # Step 3: 獲取並過濾文檔
-            documents = await get_documents_by_ids(db, [r.document_id for r in semantic_results])
-            if user_id:
-                from uuid import UUID
-                user_uuid = UUID(str(user_id)) if not isinstance(user_id, UUID) else user_id
-                documents = [doc for doc in documents if hasattr(doc, 'owner_id') and doc.owner_id == user_uuid]
+            documents = await get_documents_by_ids(db, [r.document_id for r in semantic_results], owner_id=user_id)
             
             if not documents:
                 return self._create_no_results_response(
@@ -119,17 +115,19 @@ class ComplexAnalysisHandler:
             if selected_doc_ids:
                 schema_info = {"description": "MongoDB文件Schema", "fields": {"filename": "文件名", "extracted_text": "文本", "analysis": "AI分析"}}
                 
-                for doc_id in selected_doc_ids:
-                    detail = await qa_document_processor.query_document_details(
-                        db=db,
-                        document_id=doc_id,
-                        user_question=request.question,
-                        document_schema_info=schema_info,
-                        user_id=str(user_id) if user_id else None,
-                        model_preference=request.model_preference
-                    )
-                    if detail:
-                        detailed_data.append(detail)
+                # 一次批量載入選定文檔（按 AI 選擇的順序返回），並發執行詳細查詢
+                ordered_documents = await get_documents_by_ids(db, selected_doc_ids, owner_id=user_id)
+                details = await qa_document_processor.query_documents_details(
+                    db=db,
+                    documents=ordered_documents,
+                    user_question=request.question,
+                    document_schema_info=schema_info,
+                    user_id=str(user_id) if user_id else None,
+                    model_preference=request.model_preference,
+                    session_id=request_id,
+                    intent=classification.intent.value
+                )
+                detailed_data = [detail for detail in details if detail]
             
             # Step 6: 生成答案
             conv_history = self._format_conversation_history(context) if context else None
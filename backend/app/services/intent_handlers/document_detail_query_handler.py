@@ -17,10 +17,11 @@ from app.models.vector_models import (
     QueryRewriteResult
 )
 from app.models.question_models import QuestionClassification
-from app.models.ai_models_simplified import AIMongoDBQueryDetailOutput
 from app.services.ai.unified_ai_service_simplified import unified_ai_service_simplified
+from app.services.document.field_catalog_service import field_catalog_service
+from app.services.qa_core.qa_document_processor import qa_document_processor
 from app.services.qa_workflow.conversation_helper import conversation_helper
-from app.crud.crud_documents import get_documents_by_ids
+from app.crud.crud_documents import get_documents_by_ids, get_document_summaries_by_ids
 
 logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
 
@@ -132,7 +133,8 @@ class DocumentDetailQueryHandler:
             # 獲取目標文檔名稱（用於顯示）
             doc_names = []
             try:
-                documents = await get_documents_by_ids(db, target_doc_ids)
+                # 顯示名稱只需要文件名
+                documents = await get_document_summaries_by_ids(db, target_doc_ids, owner_id=user_id)
                 doc_names = [doc.filename for doc in documents if hasattr(doc, 'filename')]
             except Exception as e:
                 logger.warning(f"獲取文檔名稱失敗: {e}")
@@ -189,73 +191,30 @@ class DocumentDetailQueryHandler:
         # 步驟4: 動態載入文檔 Schema（合併所有目標文檔的結構）
         logger.info(f"📋 動態載入 {len(target_doc_ids)} 個文檔的 Schema...")
         
-        # 步驟4.1: 獲取所有目標文檔的結構（合併模式，避免遺漏）
+        # 步驟4.1: 從用戶欄位目錄讀取實際欄位（分析結果寫入時增量維護，無需逐次掃描文檔）
         actual_schema_fields = {}
-        schema_by_document = {}  # 記錄每個文檔有哪些欄位
-        
-        if target_doc_ids:
+        catalog = None
+        if user_id and field_catalog_service.enabled:
             try:
-                # 批量輕量級查詢：只獲取結構，不獲取大量數據
-                # 限制最多分析 5 個文檔（避免性能問題）
-                sample_doc_ids = target_doc_ids[:5]
-                
-                cursor = db.documents.find(
-                    {"_id": {"$in": sample_doc_ids}},
-                    projection={
-                        "_id": 1,
-                        "filename": 1,
-                        "analysis.ai_analysis_output.key_information": 1
-                    }
-                )
-                
-                sample_docs = await cursor.to_list(length=5)
-                
-                for doc in sample_docs:
-                    doc_id = str(doc.get("_id"))
-                    doc_filename = doc.get("filename", "未知文檔")
-                    doc_fields = []
-                    
-                    if "analysis" in doc:
-                        key_info = doc.get("analysis", {}).get("ai_analysis_output", {}).get("key_information", {})
-                        
-                        # 提取 dynamic_fields 的實際欄位
-                        if "dynamic_fields" in key_info and isinstance(key_info["dynamic_fields"], dict):
-                            dynamic_fields = key_info["dynamic_fields"]
-                            for field_name, field_value in dynamic_fields.items():
-                                field_type = type(field_value).__name__
-                                field_key = f"dynamic_fields.{field_name}"
-                                
-                                # 合併到總 Schema（使用 set 避免重複）
-                                if field_key not in actual_schema_fields:
-                                    actual_schema_fields[field_key] = f"{field_name} ({field_type})"
-                                
-                                doc_fields.append(field_key)
-                                
-                        # 提取 structured_entities 的實際欄位
-                        if "structured_entities" in key_info and isinstance(key_info["structured_entities"], dict):
-                            struct_entities = key_info["structured_entities"]
-                            for entity_type in struct_entities.keys():
-                                field_key = f"structured_entities.{entity_type}"
-                                
-                                if field_key not in actual_schema_fields:
-                                    actual_schema_fields[field_key] = f"{entity_type} 實體"
-                                
-                                doc_fields.append(field_key)
-                    
-                    # 記錄這個文檔有哪些欄位
-                    if doc_fields:
-                        schema_by_document[doc_filename] = doc_fields
-                
-                logger.info(f"✅ 合併載入了 {len(actual_schema_fields)} 個實際欄位（來自 {len(sample_docs)} 個文檔）")
-                
-                # 日誌記錄每個文檔的差異
-                if len(schema_by_document) > 1:
-                    logger.info(f"📊 文檔結構差異：{len(schema_by_document)} 個文檔有不同的欄位組合")
-                    for filename, fields in schema_by_document.items():
-                        logger.debug(f"  - {filename}: {len(fields)} 個欄位")
-                        
+                from uuid import UUID
+                owner_uuid = UUID(str(user_id)) if not isinstance(user_id, UUID) else user_id
+                catalog = await field_catalog_service.get_catalog(db, owner_uuid)
+                if catalog is None:
+                    # 沒有目錄或目錄未完整重建（只含增量寫入的欄位）：背景重建目錄，本次回退為抽樣掃描
+                    field_catalog_service.schedule_rebuild(db, owner_uuid)
+                else:
+                    # 目標文檔的欄位總是保留，其餘按全用戶頻率補足
+                    target_paths = await field_catalog_service.get_document_field_paths(
+                        db, owner_uuid, [UUID(str(doc_id)) for doc_id in target_doc_ids]
+                    )
+                    actual_schema_fields = field_catalog_service.build_schema_hint(catalog, required_paths=target_paths)
+                    logger.info(f"✅ 從欄位目錄載入了 {len(actual_schema_fields)} 個實際欄位（目錄共 {len(catalog)} 個）")
             except Exception as e:
-                logger.warning(f"⚠️ 動態 Schema 載入失敗，使用通用 Schema: {e}")
+                logger.warning(f"⚠️ 讀取欄位目錄失敗，回退為抽樣掃描: {e}")
+                catalog = None
+        
+        if catalog is None and target_doc_ids:
+            actual_schema_fields = await self._sample_schema_fields(db, target_doc_ids)
         
         # 步驟4.2: 準備文檔 Schema 信息（結合通用 + 動態）
         document_schema_info = {
@@ -292,61 +251,33 @@ class DocumentDetailQueryHandler:
         for idx, doc_id in enumerate(cached_doc_ids, 1):
             document_reference_map[str(doc_id)] = idx
         
-        documents = await get_documents_by_ids(db, target_doc_ids)
+        documents = await get_documents_by_ids(db, target_doc_ids, owner_id=user_id)
         
-        # 過濾權限
-        if user_id:
-            from uuid import UUID
-            user_uuid = UUID(str(user_id)) if not isinstance(user_id, UUID) else user_id
-            documents = [doc for doc in documents if hasattr(doc, 'owner_id') and doc.owner_id == user_uuid]
+        # 並發生成各文檔的查詢（約一次 LLM 延遲），結果按文檔順序返回，失敗的文檔各自回退到基本查詢
+        logger.info(f"並發對 {len(documents)} 個文檔執行詳細查詢")
+        detailed_results = await qa_document_processor.query_documents_details(
+            db=db,
+            documents=documents,
+            user_question=request.question,
+            document_schema_info=document_schema_info,
+            user_id=user_id,
+            model_preference=request.model_preference,
+            session_id=request.session_id,
+            intent=classification.intent.value
+        )
+        api_calls += len(documents)
         
-        for doc in documents:
-            logger.info(f"對文檔 {doc.filename} 執行詳細查詢")
+        for doc, detail in zip(documents, detailed_results):
+            if not detail:
+                continue
             
-            ai_query_response = await unified_ai_service_simplified.generate_mongodb_detail_query(
-                user_question=request.question,
-                document_id=str(doc.id),
-                document_schema_info=document_schema_info,
-                db=db,
-                model_preference=request.model_preference,
-                user_id=user_id,
-                session_id=request.session_id
-            )
-            api_calls += 1
+            # 添加元數據：原始的參考編號（文檔幾）
+            doc_id_str = str(doc.id)
+            if doc_id_str in document_reference_map:
+                detail['_reference_number'] = document_reference_map[doc_id_str]
             
-            if ai_query_response.success and isinstance(ai_query_response.output_data, AIMongoDBQueryDetailOutput):
-                query_components = ai_query_response.output_data
-                
-                mongo_filter = {"_id": doc.id}
-                mongo_projection = query_components.projection
-                
-                if query_components.sub_filter:
-                    mongo_filter.update(query_components.sub_filter)
-                
-                if mongo_projection or query_components.sub_filter:
-                    safe_projection = remove_projection_path_collisions(mongo_projection) if mongo_projection else None
-                    fetched_data = await db.documents.find_one(mongo_filter, projection=safe_projection)
-                    
-                    if fetched_data:
-                        # 資料清理
-                        def sanitize(data: Any) -> Any:
-                            if isinstance(data, dict):
-                                return {k: sanitize(v) for k, v in data.items()}
-                            if isinstance(data, list):
-                                return [sanitize(i) for i in data]
-                            if isinstance(data, uuid.UUID):
-                                return str(data)
-                            return data
-                        
-                        sanitized_data = sanitize(fetched_data)
-                        
-                        # 添加元數據：原始的參考編號（文檔幾）
-                        doc_id_str = str(doc.id)
-                        if doc_id_str in document_reference_map:
-                            sanitized_data['_reference_number'] = document_reference_map[doc_id_str]
-                        
-                        all_detailed_data.append(sanitized_data)
-                        logger.info(f"成功獲取文檔 {doc.filename} 的詳細數據")
+            all_detailed_data.append(detail)
+            logger.info(f"成功獲取文檔 {doc.filename} 的詳細數據")
         
         # 步驟5: 使用詳細數據生成答案
         answer = await self._generate_answer_from_details(
@@ -429,6 +360,76 @@ class DocumentDetailQueryHandler:
             detailed_document_data_from_ai_query=all_detailed_data
         )
     
+    async def _sample_schema_fields(self, db: AsyncIOMotorDatabase, target_doc_ids: List[str]) -> Dict[str, str]:
+        """抽樣掃描目標文檔的動態欄位（欄位目錄尚未建立時的回退）"""
+        actual_schema_fields = {}
+        schema_by_document = {}  # 記錄每個文檔有哪些欄位
+        
+        try:
+            # 批量輕量級查詢：只獲取結構，不獲取大量數據
+            # 限制最多分析 5 個文檔（避免性能問題）
+            sample_doc_ids = target_doc_ids[:5]
+            
+            cursor = db.documents.find(
+                {"_id": {"$in": sample_doc_ids}},
+                projection={
+                    "_id": 1,
+                    "filename": 1,
+                    "analysis.ai_analysis_output.key_information": 1
+                }
+            )
+            
+            sample_docs = await cursor.to_list(length=5)
+            
+            for doc in sample_docs:
+                doc_id = str(doc.get("_id"))
+                doc_filename = doc.get("filename", "未知文檔")
+                doc_fields = []
+                
+                if "analysis" in doc:
+                    key_info = doc.get("analysis", {}).get("ai_analysis_output", {}).get("key_information", {})
+                    
+                    # 提取 dynamic_fields 的實際欄位
+                    if "dynamic_fields" in key_info and isinstance(key_info["dynamic_fields"], dict):
+                        dynamic_fields = key_info["dynamic_fields"]
+                        for field_name, field_value in dynamic_fields.items():
+                            field_type = type(field_value).__name__
+                            field_key = f"dynamic_fields.{field_name}"
+                            
+                            # 合併到總 Schema（使用 set 避免重複）
+                            if field_key not in actual_schema_fields:
+                                actual_schema_fields[field_key] = f"{field_name} ({field_type})"
+                            
+                            doc_fields.append(field_key)
+                            
+                    # 提取 structured_entities 的實際欄位
+                    if "structured_entities" in key_info and isinstance(key_info["structured_entities"], dict):
+                        struct_entities = key_info["structured_entities"]
+                        for entity_type in struct_entities.keys():
+                            field_key = f"structured_entities.{entity_type}"
+                            
+                            if field_key not in actual_schema_fields:
+                                actual_schema_fields[field_key] = f"{entity_type} 實體"
+                            
+                            doc_fields.append(field_key)
+                
+                # 記錄這個文檔有哪些欄位
+                if doc_fields:
+                    schema_by_document[doc_filename] = doc_fields
+            
+            logger.info(f"✅ 合併載入了 {len(actual_schema_fields)} 個實際欄位（來自 {len(sample_docs)} 個文檔）")
+            
+            # 日誌記錄每個文檔的差異
+            if len(schema_by_document) > 1:
+                logger.info(f"📊 文檔結構差異：{len(schema_by_document)} 個文檔有不同的欄位組合")
+                for filename, fields in schema_by_document.items():
+                    logger.debug(f"  - {filename}: {len(fields)} 個欄位")
+                    
+        except Exception as e:
+            logger.warning(f"⚠️ 動態 Schema 載入失敗，使用通用 Schema: {e}")
+        
+        return actual_schema_fields
+    
     async def _generate_answer_from_details(
         self,
         question: str,
@@ -5,7 +5,7 @@
 """
 import time
 import logging
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from app.core.logging_utils import AppLogger, log_event, LogLevel
@@ -21,7 +21,11 @@ from app.services.vector.enhanced_search_service import enhanced_search_service
 from app.services.vector.embedding_service import embedding_service
 from app.services.ai.unified_ai_service_simplified import unified_ai_service_simplified
 from app.services.qa_workflow.conversation_helper import conversation_helper
-from app.crud.crud_documents import get_documents_by_ids
+from app.services.qa_workflow.speculative_retrieval_service import (
+    speculative_retrieval_service,
+    SpeculativeRetrieval
+)
+from app.crud.crud_documents import get_document_summaries_by_ids
 
 logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
 
@@ -36,12 +40,14 @@ class DocumentSearchHandler:
         context: Optional[dict],
         db: Optional[AsyncIOMotorDatabase] = None,
         user_id: Optional[str] = None,
-        request_id: Optional[str] = None
+        request_id: Optional[str] = None,
+        speculative_retrieval: Optional[SpeculativeRetrieval] = None
     ) -> AIQAResponse:
         """
         處理文檔搜索請求
         
         策略:
+        0. 如果推測式檢索結果足夠好(且無對話歷史),直接使用並跳過查詢重寫
         1. 可選輕量級查詢重寫(如果置信度較低)
         2. 請求用戶批准搜索(漸進式交互)
         3. 執行兩階段混合檢索
@@ -55,6 +61,7 @@ class DocumentSearchHandler:
             db: 數據庫連接
             user_id: 用戶ID
             request_id: 請求ID
+            speculative_retrieval: 編排器在分類期間啟動的推測式檢索(可選)
             
         Returns:
             AIQAResponse: 文檔搜索結果和答案
@@ -70,6 +77,7 @@ class DocumentSearchHandler:
         # 如果用戶選擇跳過搜索,直接使用通用知識回答
         if workflow_action == 'skip_search':
             logger.info("用戶跳過文檔搜索,使用通用知識回答")
+            speculative_retrieval_service.discard(speculative_retrieval)
             return await self._handle_skip_search(
                 request, classification, db, user_id, request_id, start_time
             )
@@ -86,6 +94,7 @@ class DocumentSearchHandler:
         # 如果需要批准且用戶未批准,先請求批准
         if needs_approval and workflow_action != 'approve_search' and not getattr(request, 'skip_classification', False):
             logger.info(f"請求用戶批准文檔搜索（置信度:{classification.confidence:.2f}）")
+            speculative_retrieval_service.discard(speculative_retrieval)
             processing_time = time.time() - start_time
             
             # 構建給用戶看的預覽信息（不使用正則提取，讓AI重寫處理）
@@ -128,55 +137,80 @@ class DocumentSearchHandler:
         # 用戶已批准,繼續執行搜索
         logger.info("用戶已批准文檔搜索,開始執行")
         
-        # Step 2: 智能查詢重寫（直接使用AI推理內容）
-        # 策略：讓 AI 查詢重寫功能分析原始問題+分類推理，自動提取最佳查詢
-        
-        # 構建給 AI 查詢重寫的輸入（包含原始問題和分類推理）
-        if classification.reasoning and len(classification.reasoning) > 20:
-            # 有推理內容，組合原始問題和AI的理解
-            query_for_rewrite = f"{request.question}。上下文理解: {classification.reasoning[:300]}"
-            logger.info(f"📝 查詢重寫輸入: 原始問題 + AI推理內容（{len(classification.reasoning)}字）")
-        else:
-            # 沒有推理內容，使用原始問題
-            query_for_rewrite = request.question
-            logger.info(f"📝 查詢重寫輸入: 原始問題（無推理內容）")
+        top_k = request.context_limit or 5
         
-        # 步驟2.2: 執行智能查詢重寫（AI會自動分析推理內容）
-        logger.info(f"🔄 執行智能查詢重寫")
+        # Step 1.5: 推測式檢索結果（分類期間以原始問題進行的混合檢索）
+        speculative_results = await speculative_retrieval_service.consume(speculative_retrieval)
+        has_history = bool(context and context.get('recent_messages'))
         
-        query_rewrite_result = await self._lightweight_query_rewrite(
-            query_for_rewrite,  # 原始問題 + AI推理內容
-            db,
-            user_id
-        )
-        api_calls += 1
-        
-        # 步驟2.3: 構建最終查詢列表
-        if query_rewrite_result and query_rewrite_result.rewritten_queries:
-            # 查詢重寫成功（主要路徑）
-            queries_to_search = query_rewrite_result.rewritten_queries[:2]
-            logger.info(f"✅ 查詢重寫成功，最終查詢: {queries_to_search}")
-        else:
-            # 查詢重寫失敗，使用原始問題（退路）
-            queries_to_search = [request.question]
-            logger.warning(f"⚠️ 查詢重寫失敗，退路: 使用原始問題: {request.question}")
-            
-            # 手動構建query_rewrite_result
+        if not has_history and speculative_retrieval_service.is_strong(speculative_results):
+            # 推測結果足夠好：跳過查詢重寫這一次 LLM 往返
+            speculative_retrieval_service.record_hit()
+            logger.info(f"⚡ 使用推測式檢索結果,跳過查詢重寫（{len(speculative_results)} 個結果）")
             query_rewrite_result = QueryRewriteResult(
                 original_query=request.question,
                 rewritten_queries=[request.question],
-                extracted_parameters={"rewrite_failed": True},
+                extracted_parameters={"speculative_retrieval": True},
                 intent_analysis=classification.reasoning
             )
+            semantic_results = speculative_results[:top_k]
+        else:
+            # Step 2: 智能查詢重寫（直接使用AI推理內容）
+            # 策略：讓 AI 查詢重寫功能分析原始問題+分類推理，自動提取最佳查詢
+        
+            # 構建給 AI 查詢重寫的輸入（包含原始問題和分類推理）
+            if classification.reasoning and len(classification.reasoning) > 20:
+                # 有推理內容，組合原始問題和AI的理解
+                query_for_rewrite = f"{request.question}。上下文理解: {classification.reasoning[:300]}"
+                logger.info(f"📝 查詢重寫輸入: 原始問題 + AI推理內容（{len(classification.reasoning)}字）")
+            else:
+                # 沒有推理內容，使用原始問題
+                query_for_rewrite = request.question
+                logger.info(f"📝 查詢重寫輸入: 原始問題（無推理內容）")
+        
+            # 步驟2.2: 執行智能查詢重寫（AI會自動分析推理內容）
+            logger.info(f"🔄 執行智能查詢重寫")
+        
+            query_rewrite_result = await self._lightweight_query_rewrite(
+                query_for_rewrite,  # 原始問題 + AI推理內容
+                db,
+                user_id
+            )
+            api_calls += 1
         
-        # Step 2: 執行兩階段混合檢索
-        semantic_results = await self._perform_hybrid_search(
-            db=db,
-            queries=queries_to_search,
-            top_k=request.context_limit or 5,
-            user_id=user_id,
-            document_ids=request.document_ids
-        )
+            # 步驟2.3: 構建最終查詢列表
+            if query_rewrite_result and query_rewrite_result.rewritten_queries:
+                # 查詢重寫成功（主要路徑）
+                queries_to_search = query_rewrite_result.rewritten_queries[:2]
+                logger.info(f"✅ 查詢重寫成功，最終查詢: {queries_to_search}")
+            else:
+                # 查詢重寫失敗，使用原始問題（退路）
+                queries_to_search = [request.question]
+                logger.warning(f"⚠️ 查詢重寫失敗，退路: 使用原始問題: {request.question}")
+            
+                # 手動構建query_rewrite_result
+                query_rewrite_result = QueryRewriteResult(
+                    original_query=request.question,
+                    rewritten_queries=[request.question],
+                    extracted_parameters={"rewrite_failed": True},
+                    intent_analysis=classification.reasoning
+                )
+        
+            # Step 2: 執行兩階段混合檢索
+            semantic_results = await self._perform_hybrid_search(
+                db=db,
+                queries=queries_to_search,
+                top_k=top_k,
+                user_id=user_id,
+                document_ids=request.document_ids
+            )
+            
+            # 合併推測式檢索的結果(取最高分)
+            if speculative_results:
+                speculative_retrieval_service.record_merged()
+                semantic_results = self._merge_search_results(semantic_results, speculative_results, top_k)
+            elif speculative_results is not None:
+                speculative_retrieval_service.record_empty()
         
         # Step 3: 準備語義搜索上下文
         semantic_contexts = []
@@ -207,16 +241,9 @@ class DocumentSearchHandler:
             )
         
         document_ids = [result.document_id for result in semantic_results]
-        documents = await get_documents_by_ids(db, document_ids)
-        
-        # 過濾用戶有權限的文檔
-        if user_id:
-            from uuid import UUID
-            user_uuid = UUID(str(user_id)) if not isinstance(user_id, UUID) else user_id
-            documents = [
-                doc for doc in documents
-                if hasattr(doc, 'owner_id') and doc.owner_id == user_uuid
-            ]
+        # 答案只使用文件名、摘要、關鍵概念與主題，不需要讀取完整文檔
+        # 在查詢中過濾擁有者，結果按檢索排名順序返回
+        documents = await get_document_summaries_by_ids(db, document_ids, owner_id=user_id)
         
         if not documents:
             logger.warning("找到文檔但用戶無權訪問")
@@ -382,6 +409,19 @@ class DocumentSearchHandler:
         sorted_results = sorted(all_results.values(), key=lambda x: x.similarity_score, reverse=True)
         return sorted_results[:top_k]
     
+    def _merge_search_results(
+        self,
+        primary: List[SemanticSearchResult],
+        extra: List[SemanticSearchResult],
+        top_k: int
+    ) -> List[SemanticSearchResult]:
+        """合併兩組檢索結果,同一文檔取最高分"""
+        merged = {}
+        for result in list(primary) + list(extra):
+            if result.document_id not in merged or result.similarity_score > merged[result.document_id].similarity_score:
+                merged[result.document_id] = result
+        return sorted(merged.values(), key=lambda x: x.similarity_score, reverse=True)[:top_k]
+    
     async def _generate_answer_from_documents(
         self,
         question: str,
@@ -428,33 +468,31 @@ class DocumentSearchHandler:
         if conversation_history_text:
             context_parts.append(conversation_history_text)
         
+        # 每個文檔取排名最高的檢索結果
+        results_by_document: Dict[str, Any] = {}
+        for result in semantic_results:
+            results_by_document.setdefault(result.document_id, result)
+        
         for i, doc in enumerate(documents[:5], 1):  # 最多5個文檔
             doc_context = []
             doc_context.append(f"=== 文檔 {i}: {getattr(doc, 'filename', 'Unknown')} ===")
             
-            # 嘗試獲取AI分析結果
-            if hasattr(doc, 'analysis') and doc.analysis:
-                if hasattr(doc.analysis, 'ai_analysis_output') and isinstance(doc.analysis.ai_analysis_output, dict):
-                    key_info = doc.analysis.ai_analysis_output.get('key_information', {})
-                    
-                    # 摘要
-                    if key_info.get('content_summary'):
-                        doc_context.append(f"摘要: {key_info['content_summary']}")
-                    
-                    # 關鍵概念
-                    if key_info.get('key_concepts'):
-                        doc_context.append(f"關鍵概念: {', '.join(key_info['key_concepts'][:5])}")
-                    
-                    # 主題
-                    if key_info.get('main_topics'):
-                        doc_context.append(f"主題: {', '.join(key_info['main_topics'][:3])}")
+            # AI分析結果
+            # 摘要
+            if doc.content_summary:
+                doc_context.append(f"摘要: {doc.content_summary}")
+            
+            # 關鍵概念
+            if doc.key_concepts:
+                doc_context.append(f"關鍵概念: {', '.join(doc.key_concepts[:5])}")
+            
+            # 主題
+            if doc.main_topics:
+                doc_context.append(f"主題: {', '.join(doc.main_topics[:3])}")
             
             # 如果沒有AI分析,使用提取的文本片段
             if len(doc_context) == 1:  # 只有標題
-                matching_result = next(
-                    (r for r in semantic_results if r.document_id == str(doc.id)),
-                    None
-                )
+                matching_result = results_by_document.get(str(doc.id))
                 if matching_result:
                     doc_context.append(matching_result.summary_text[:500])
             
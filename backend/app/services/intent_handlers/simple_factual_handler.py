@@ -5,7 +5,7 @@
 """
 import time
 import logging
-from typing import Optional
+from typing import Any, Dict, Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from app.core.logging_utils import AppLogger, log_event, LogLevel
@@ -67,7 +67,7 @@ class SimpleFactualHandler:
         logger.info(f"處理簡單事實查詢: {request.question}")
         
         # Step 1: 生成查詢向量
-        query_embedding = embedding_service.encode_text(request.question)
+        query_embedding = await embedding_service.encode_text_async(request.question)
         if not query_embedding or not any(query_embedding):
             logger.error("無法生成查詢的嵌入向量")
             return self._create_error_response(
@@ -158,16 +158,8 @@ class SimpleFactualHandler:
         # Step 5: 獲取文檔詳細信息
         document_ids = [result.document_id for result in search_results[:3]]  # 只取前3個
         try:
-            documents = await get_documents_by_ids(db, document_ids)
-            
-            # 過濾用戶有權限的文檔
-            if user_id:
-                from uuid import UUID
-                user_uuid = UUID(str(user_id)) if not isinstance(user_id, UUID) else user_id
-                documents = [
-                    doc for doc in documents 
-                    if hasattr(doc, 'owner_id') and doc.owner_id == user_uuid
-                ]
+            # 在查詢中過濾擁有者，結果按檢索排名順序返回
+            documents = await get_documents_by_ids(db, document_ids, owner_id=user_id)
             
         except Exception as e:
             logger.error(f"獲取文檔失敗: {e}", exc_info=True)
@@ -281,6 +273,11 @@ class SimpleFactualHandler:
         if conversation_history_text:
             context_parts.append(conversation_history_text)
         
+        # 每個文檔取排名最高的檢索結果
+        results_by_document: Dict[str, Any] = {}
+        for result in search_results:
+            results_by_document.setdefault(result.document_id, result)
+        
         for i, doc in enumerate(documents[:3], 1):  # 最多3個文檔
             # 嘗試獲取AI分析的摘要
             summary = None
@@ -291,10 +288,7 @@ class SimpleFactualHandler:
             
             # 如果沒有摘要,使用搜索結果中的文本
             if not summary:
-                matching_result = next(
-                    (r for r in search_results if r.document_id == str(doc.id)),
-                    None
-                )
+                matching_result = results_by_document.get(str(doc.id))
                 if matching_result:
                     summary = matching_result.summary_text
             
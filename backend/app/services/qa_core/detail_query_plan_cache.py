@@ -0,0 +1,173 @@
+"""
+詳細查詢計劃緩存
+
+用戶經常對不同文檔問同一類問題（「總金額是多少」、「繳費期限是哪天」），
+每次都要調用 LLM 生成 MongoDB 查詢組件。計劃緩存把已驗證的 projection
+（實際查到數據的 AI 查詢）按「用戶 + 問題意圖 + 文檔欄位簽名」分桶保存，
+新問題與桶內問題的向量相似度達到閾值時直接重用，跳過 LLM。
+
+帶 sub_filter 的查詢通常含有問題特定的條件值，不作為計劃緩存。
+"""
+
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from cachetools import TTLCache
+
+from app.core.config import settings
+from app.core.logging_utils import AppLogger
+from app.models.ai_models_simplified import AIMongoDBQueryDetailOutput
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+
+@dataclass
+class PlanContext:
+    """一次詳細查詢的計劃匹配條件（每個問題只計算一次問題向量）"""
+    owner_id: str
+    intent: str
+    question: str
+    question_vector: np.ndarray  # 已歸一化
+
+
+@dataclass(eq=False)
+class DetailQueryPlan:
+    """已驗證的查詢計劃（按身份比較，向量欄位不參與相等判斷）"""
+    question: str
+    question_vector: np.ndarray
+    projection: Dict[str, Any]
+    created_at: float
+    hits: int = 0
+
+
+@dataclass
+class PlanCacheStats:
+    """計劃緩存統計"""
+    lookups: int = 0
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    invalidations: int = 0  # 重用的計劃未查到數據而被移除的次數
+
+
+def schema_signature(compact_schema: Dict[str, Any]) -> str:
+    """文檔欄位簽名：文檔類型與實際動態欄位集合的哈希，與文檔 ID、文件名無關"""
+    payload = {
+        "content_type": compact_schema.get("content_type"),
+        "fields": sorted(compact_schema.get("fields") or [])
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class DetailQueryPlanCache:
+    """按用戶、意圖與欄位簽名分桶的查詢計劃緩存"""
+
+    def __init__(self):
+        self._buckets: TTLCache[Tuple[str, str, str], List[DetailQueryPlan]] = TTLCache(
+            maxsize=settings.DETAIL_QUERY_PLAN_MAX_BUCKETS,
+            ttl=settings.DETAIL_QUERY_PLAN_TTL_SECONDS
+        )
+        self.stats = PlanCacheStats()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.DETAIL_QUERY_PLAN_CACHE_ENABLED
+
+    async def build_context(
+        self,
+        user_id: Optional[str],
+        intent: Optional[str],
+        question: str
+    ) -> Optional[PlanContext]:
+        """計算問題向量；未啟用、缺少用戶或意圖、或向量無效時返回 None"""
+        if not self.enabled or not user_id or not intent or not question:
+            return None
+        try:
+            from app.services.vector.embedding_service import embedding_service
+            vector = np.asarray(await embedding_service.encode_text_async(question), dtype=float)
+        except Exception as e:
+            logger.warning(f"計算問題向量失敗，本次不使用查詢計劃緩存: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return PlanContext(owner_id=str(user_id), intent=str(intent), question=question, question_vector=vector / norm)
+
+    def lookup(self, context: PlanContext, signature: str) -> Optional[DetailQueryPlan]:
+        """在同一桶中找相似度最高且達到閾值的計劃"""
+        self.stats.lookups += 1
+        bucket = self._buckets.get((context.owner_id, context.intent, signature)) or []
+
+        best_plan, best_score = None, settings.DETAIL_QUERY_PLAN_SIMILARITY_THRESHOLD
+        for plan in bucket:
+            score = float(np.dot(plan.question_vector, context.question_vector))
+            if score >= best_score:
+                best_plan, best_score = plan, score
+
+        if best_plan is None:
+            self.stats.misses += 1
+            return None
+        best_plan.hits += 1
+        self.stats.hits += 1
+        logger.info(f"查詢計劃命中 (相似度 {best_score:.3f}): 「{context.question}」重用「{best_plan.question}」的 projection")
+        return best_plan
+
+    def store(self, context: PlanContext, signature: str, query_components: AIMongoDBQueryDetailOutput) -> bool:
+        """保存已查到數據的 AI 查詢組件；帶 sub_filter 或沒有 projection 的不保存"""
+        if query_components.sub_filter or not query_components.projection:
+            return False
+
+        key = (context.owner_id, context.intent, signature)
+        bucket = list(self._buckets.get(key) or [])
+        for plan in bucket:
+            # 同一問題已有計劃時更新 projection，不重複保存
+            if float(np.dot(plan.question_vector, context.question_vector)) >= 0.999:
+                plan.projection = dict(query_components.projection)
+                self._buckets[key] = bucket
+                return True
+
+        bucket.append(DetailQueryPlan(
+            question=context.question,
+            question_vector=context.question_vector,
+            projection=dict(query_components.projection),
+            created_at=time.time()
+        ))
+        # 超過上限時丟棄最舊的計劃
+        self._buckets[key] = bucket[-settings.DETAIL_QUERY_PLAN_MAX_PER_BUCKET:]
+        self.stats.stores += 1
+        return True
+
+    def invalidate(self, context: PlanContext, signature: str, plan: DetailQueryPlan):
+        """移除重用後沒有查到數據的計劃"""
+        key = (context.owner_id, context.intent, signature)
+        bucket = self._buckets.get(key)
+        if bucket and any(item is plan for item in bucket):
+            self._buckets[key] = [item for item in bucket if item is not plan]
+            self.stats.invalidations += 1
+
+    def clear(self):
+        self._buckets.clear()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """獲取計劃緩存統計（命中率即跳過 LLM 的文檔查詢比例）"""
+        return {
+            "enabled": self.enabled,
+            "lookups": self.stats.lookups,
+            "hits": self.stats.hits,
+            "misses": self.stats.misses,
+            "hit_rate": round(self.stats.hits / self.stats.lookups * 100, 2) if self.stats.lookups else 0.0,
+            "stores": self.stats.stores,
+            "invalidations": self.stats.invalidations,
+            "buckets": len(self._buckets),
+            "plans": sum(len(bucket) for bucket in self._buckets.values()),
+            "similarity_threshold": settings.DETAIL_QUERY_PLAN_SIMILARITY_THRESHOLD
+        }
+
+
+# 全局實例
+detail_query_plan_cache = DetailQueryPlanCache()
@@ -14,6 +14,7 @@ from app.core.logging_utils import AppLogger, log_event, LogLevel
 from app.models.vector_models import QueryRewriteResult, LLMContextDocument
 from app.models.ai_models_simplified import AIDocumentAnalysisOutputDetail, AIGeneratedAnswerOutput
 from app.services.ai.unified_ai_service_simplified import unified_ai_service_simplified, AIResponse as UnifiedAIResponse
+from app.crud.crud_document_contents import hydrate_raw_document, with_content_marker
 
 logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
 
@@ -232,10 +233,12 @@ class QAAnswerService:
             from app.services.qa_document_processor import remove_projection_path_collisions
             safe_projection = remove_projection_path_collisions(basic_projection)
             
+            safe_projection = with_content_marker(safe_projection)
             fetched_data = await db.documents.find_one(
                 {"_id": document.id},
                 projection=safe_projection
             )
+            fetched_data = await hydrate_raw_document(db, fetched_data, safe_projection)
             
             if fetched_data:
                 def sanitize(data: Any) -> Any:
@@ -4,24 +4,93 @@ QA文檔處理器
 處理文檔選擇、詳細查詢等功能
 保留所有原有的 AI 文檔選擇和 MongoDB 查詢功能
 """
+import asyncio
 import logging
+import time
 import uuid
+from dataclasses import dataclass
 from typing import List, Optional, Dict, Any
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import ValidationError
 
+from app.core.config import settings
 from app.core.logging_utils import AppLogger, log_event, LogLevel
 from app.models.vector_models import SemanticContextDocument
-from app.models.ai_models_simplified import AIDocumentSelectionOutput
+from app.models.ai_models_simplified import AIDocumentSelectionOutput, AIMongoDBQueryDetailOutput
 from app.services.ai.unified_ai_service_simplified import unified_ai_service_simplified
 from app.crud.crud_documents import get_documents_by_ids
+from app.crud.crud_document_contents import hydrate_raw_document, with_content_marker
 from app.services.qa.utils.mongodb_utils import remove_projection_path_collisions
+from app.services.qa_core.detail_query_plan_cache import (
+    DetailQueryPlan,
+    PlanContext,
+    detail_query_plan_cache,
+    schema_signature
+)
 
 logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
 
 
+def _sanitize(data: Any) -> Any:
+    """將查詢結果中的 UUID 轉為字符串"""
+    if isinstance(data, dict):
+        return {k: _sanitize(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [_sanitize(i) for i in data]
+    if isinstance(data, uuid.UUID):
+        return str(data)
+    return data
+
+
+def _path_has_value(data: Any, parts: List[str]) -> bool:
+    """點號路徑在結果中是否有非空值（數組逐元素查找）"""
+    if not parts:
+        return data not in (None, "", [], {})
+    if isinstance(data, list):
+        return any(_path_has_value(item, parts) for item in data)
+    if not isinstance(data, dict) or parts[0] not in data:
+        return False
+    return _path_has_value(data[parts[0]], parts[1:])
+
+
+def _has_requested_data(
+    fetched_data: Optional[Dict[str, Any]],
+    projection: Optional[Dict[str, Any]],
+    sub_filter: Optional[Dict[str, Any]]
+) -> bool:
+    """
+    查詢結果是否包含 projection 或 sub_filter 請求的任一非 _id 欄位
+    
+    find_one 總會返回 _id，只看結果是否為空無法判斷查詢是否真的取到數據。
+    """
+    if not fetched_data:
+        return False
+    paths = [key for key, value in (projection or {}).items() if value and key != "_id"]
+    paths += [key for key in (sub_filter or {}) if key != "_id" and not key.startswith("$")]
+    return any(_path_has_value(fetched_data, path.split(".")) for path in paths)
+
+
+@dataclass
+class DetailQueryStats:
+    """詳細查詢生成統計（批量與逐文檔兩種路徑）"""
+    batch_calls: int = 0
+    batch_documents: int = 0  # 送入批量調用的文檔數
+    batched_documents: int = 0  # 批量調用成功生成查詢的文檔數
+    failed_batches: int = 0
+    fallback_documents: int = 0  # 回退為單獨調用的文檔數
+    batch_tokens: int = 0
+    batch_latency_seconds: float = 0.0
+    single_calls: int = 0
+    single_tokens: int = 0
+    single_latency_seconds: float = 0.0
+
+
 class QADocumentProcessor:
     """QA文檔處理器 - 保留所有原有功能"""
     
+    def __init__(self):
+        self.stats = DetailQueryStats()
+    
     async def select_documents_for_detailed_query(
         self,
         db: AsyncIOMotorDatabase,
@@ -165,35 +234,264 @@ class QADocumentProcessor:
         """
         try:
             # 獲取文檔對象
-            documents = await get_documents_by_ids(db, [document_id])
+            documents = await get_documents_by_ids(db, [document_id], owner_id=user_id)
             if not documents:
                 logger.warning(f"文檔 {document_id} 不存在")
                 return None
             
-            target_document = documents[0]
+            return await self._query_single_document(
+                db=db,
+                document=documents[0],
+                user_question=user_question,
+                document_schema_info=document_schema_info,
+                user_id=user_id,
+                model_preference=model_preference
+            )
+                
+        except Exception as e:
+            logger.error(f"查詢文檔詳細資料失敗: {e}", exc_info=True)
+            return None
+    
+    async def query_documents_details(
+        self,
+        db: AsyncIOMotorDatabase,
+        documents: List[Any],
+        user_question: str,
+        document_schema_info: Dict[str, Any],
+        user_id: Optional[str] = None,
+        model_preference: Optional[str] = None,
+        session_id: Optional[str] = None,
+        intent: Optional[str] = None
+    ) -> List[Optional[Dict[str, Any]]]:
+        """
+        並發對多個文檔執行 AI 生成的詳細查詢
+        
+        先按問題向量、意圖與文檔欄位簽名查找可重用的查詢計劃，命中的文檔不調用 LLM；
+        其餘多個文檔時以一次批量調用生成查詢組件（問題與通用 Schema 只發送一次），
+        批量結果缺失或無效的文檔回退為單獨調用；單獨調用同時發出（API 速率仍由全局 AI 限流器控制，
+        本地並發受 QA_DETAIL_QUERY_MAX_CONCURRENCY 限制）。結果按輸入順序返回，
+        單個文檔失敗時只有該文檔回退到基本查詢，不影響其他文檔。
+        """
+        if not documents:
+            return []
+        
+        # 查詢計劃緩存：相似問題 + 相同意圖 + 相同欄位簽名時直接重用已驗證的 projection
+        plan_context = await detail_query_plan_cache.build_context(user_id, intent, user_question)
+        signatures: List[Optional[str]] = [None] * len(documents)
+        plans: List[Optional[DetailQueryPlan]] = [None] * len(documents)
+        if plan_context:
+            for index, document in enumerate(documents):
+                signatures[index] = schema_signature(self._compact_document_schema(document))
+                plans[index] = detail_query_plan_cache.lookup(plan_context, signatures[index])
+        
+        batch_components: List[Optional[AIMongoDBQueryDetailOutput]] = [
+            AIMongoDBQueryDetailOutput(projection=plan.projection) if plan else None for plan in plans
+        ]
+        pending_indexes = [index for index, plan in enumerate(plans) if plan is None]
+        if settings.QA_DETAIL_QUERY_BATCHING_ENABLED and len(pending_indexes) > 1:
+            pending_documents = [documents[index] for index in pending_indexes]
+            batch_size = max(2, settings.QA_DETAIL_QUERY_BATCH_MAX_DOCUMENTS)
+            chunks = [pending_documents[i:i + batch_size] for i in range(0, len(pending_documents), batch_size)]
+            chunk_results = await asyncio.gather(*(
+                self._generate_queries_as_batch(
+                    db=db,
+                    documents=chunk,
+                    user_question=user_question,
+                    document_schema_info=document_schema_info,
+                    user_id=user_id,
+                    model_preference=model_preference,
+                    session_id=session_id
+                )
+                for chunk in chunks
+            ))
+            generated = [components for chunk in chunk_results for components in chunk]
+            for index, components in zip(pending_indexes, generated):
+                batch_components[index] = components
             
-            # 使用 AI 生成 MongoDB 查詢
-            ai_query_response = await unified_ai_service_simplified.generate_mongodb_detail_query(
+            fallback_count = sum(1 for components in generated if components is None)
+            if fallback_count:
+                self.stats.fallback_documents += fallback_count
+                logger.warning(f"批量詳細查詢有 {fallback_count}/{len(pending_documents)} 個文檔回退為單獨調用")
+        
+        semaphore = asyncio.Semaphore(max(1, settings.QA_DETAIL_QUERY_MAX_CONCURRENCY))
+        
+        async def query_with_semaphore(index: int) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                return await self._query_single_document(
+                    db=db,
+                    document=documents[index],
+                    user_question=user_question,
+                    document_schema_info=document_schema_info,
+                    user_id=user_id,
+                    model_preference=model_preference,
+                    session_id=session_id,
+                    query_components=batch_components[index],
+                    plan_context=plan_context,
+                    plan_signature=signatures[index],
+                    plan=plans[index]
+                )
+        
+        results = await asyncio.gather(
+            *(query_with_semaphore(index) for index in range(len(documents))),
+            return_exceptions=True
+        )
+        
+        # gather 按輸入順序返回結果
+        detailed_results: List[Optional[Dict[str, Any]]] = []
+        for document, result in zip(documents, results):
+            if isinstance(result, Exception):
+                logger.error(f"文檔 {document.id} 的詳細查詢失敗: {result}")
+                detailed_results.append(None)
+            else:
+                detailed_results.append(result)
+        
+        logger.info(
+            f"並發詳細查詢完成: {sum(1 for r in detailed_results if r)}/{len(documents)} 個文檔獲取到資料"
+        )
+        return detailed_results
+    
+    async def _generate_queries_as_batch(
+        self,
+        db: AsyncIOMotorDatabase,
+        documents: List[Any],
+        user_question: str,
+        document_schema_info: Dict[str, Any],
+        user_id: Optional[str] = None,
+        model_preference: Optional[str] = None,
+        session_id: Optional[str] = None
+    ) -> List[Optional[AIMongoDBQueryDetailOutput]]:
+        """
+        以一次請求為整批文檔生成查詢組件
+
+        Returns:
+            與 documents 對應的查詢組件列表；None 表示該文檔需要回退為單獨調用
+        """
+        start_time = time.perf_counter()
+        self.stats.batch_calls += 1
+        self.stats.batch_documents += len(documents)
+        
+        try:
+            response = await unified_ai_service_simplified.generate_mongodb_detail_queries_batch(
                 user_question=user_question,
-                document_id=str(target_document.id),
+                documents=[self._compact_document_schema(document) for document in documents],
                 document_schema_info=document_schema_info,
                 db=db,
                 model_preference=model_preference,
-                user_id=user_id
+                user_id=user_id,
+                session_id=session_id,
+                ai_max_output_tokens=settings.QA_DETAIL_QUERY_BATCH_OUTPUT_TOKENS_PER_DOC * len(documents)
             )
-            
-            if not ai_query_response.success or not ai_query_response.output_data:
-                logger.error(f"AI生成MongoDB查詢失敗: {ai_query_response.error_message}")
-                return await self._fallback_basic_query(db, target_document)
-            
-            from app.models.ai_models_simplified import AIMongoDBQueryDetailOutput
-            if not isinstance(ai_query_response.output_data, AIMongoDBQueryDetailOutput):
-                return await self._fallback_basic_query(db, target_document)
-            
-            query_components = ai_query_response.output_data
+        except Exception as e:
+            self.stats.failed_batches += 1
+            logger.warning(f"批量詳細查詢調用異常 ({len(documents)} 個文檔)，全部回退: {e}")
+            return [None] * len(documents)
+        finally:
+            self.stats.batch_latency_seconds += time.perf_counter() - start_time
+        
+        if response.token_usage:
+            self.stats.batch_tokens += response.token_usage.total_tokens
+        if not response.success or response.output_data is None:
+            self.stats.failed_batches += 1
+            logger.warning(f"批量詳細查詢失敗 ({len(documents)} 個文檔)，全部回退: {response.error_message}")
+            return [None] * len(documents)
+        
+        slots: Dict[int, Dict[str, Any]] = {}
+        for raw in response.output_data.results:
+            index = raw.get("document_index") if isinstance(raw, dict) else None
+            if isinstance(index, int) and 0 <= index < len(documents) and index not in slots:
+                slots[index] = raw
+        
+        results: List[Optional[AIMongoDBQueryDetailOutput]] = []
+        for index in range(len(documents)):
+            raw = slots.get(index)
+            if raw is None:
+                results.append(None)
+                continue
+            try:
+                results.append(AIMongoDBQueryDetailOutput.model_validate(
+                    {key: value for key, value in raw.items() if key != "document_index"}
+                ))
+            except ValidationError as e:
+                logger.warning(f"批量詳細查詢第 {index} 個結果格式無效，回退: {e.errors()[:1]}")
+                results.append(None)
+        
+        self.stats.batched_documents += sum(1 for r in results if r is not None)
+        return results
+    
+    @staticmethod
+    def _compact_document_schema(document) -> Dict[str, Any]:
+        """文檔的精簡 Schema：ID、文件名、類型與 key_information 中實際存在的動態欄位"""
+        compact: Dict[str, Any] = {"document_id": str(document.id), "filename": getattr(document, "filename", None)}
+        analysis = getattr(document, "analysis", None)
+        analysis_output = getattr(analysis, "ai_analysis_output", None) if analysis else None
+        key_information = analysis_output.get("key_information") if isinstance(analysis_output, dict) else None
+        if not isinstance(key_information, dict):
+            return compact
+        
+        if key_information.get("content_type"):
+            compact["content_type"] = key_information["content_type"]
+        fields = []
+        for group in ("dynamic_fields", "structured_entities"):
+            values = key_information.get(group)
+            if isinstance(values, dict):
+                fields.extend(f"{group}.{name}" for name in values)
+        if fields:
+            compact["fields"] = fields
+        return compact
+    
+    async def _query_single_document(
+        self,
+        db: AsyncIOMotorDatabase,
+        document,
+        user_question: str,
+        document_schema_info: Dict[str, Any],
+        user_id: Optional[str] = None,
+        model_preference: Optional[str] = None,
+        session_id: Optional[str] = None,
+        query_components: Optional[AIMongoDBQueryDetailOutput] = None,
+        plan_context: Optional[PlanContext] = None,
+        plan_signature: Optional[str] = None,
+        plan: Optional[DetailQueryPlan] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        對已載入的文檔執行 AI 詳細查詢，任何步驟失敗都回退到基本查詢
+        
+        已有批量生成或計劃緩存提供的 query_components 時直接執行，否則單獨調用 AI 生成。
+        AI 生成的查詢實際查到請求的欄位後才保存為查詢計劃（只返回 _id 不算查到數據）；
+        重用的計劃沒有查到數據時移除該計劃。
+        """
+        document_id = str(document.id)
+        try:
+            if query_components is None:
+                # 使用 AI 生成 MongoDB 查詢
+                start_time = time.perf_counter()
+                self.stats.single_calls += 1
+                try:
+                    ai_query_response = await unified_ai_service_simplified.generate_mongodb_detail_query(
+                        user_question=user_question,
+                        document_id=document_id,
+                        document_schema_info=document_schema_info,
+                        db=db,
+                        model_preference=model_preference,
+                        user_id=user_id,
+                        session_id=session_id
+                    )
+                finally:
+                    self.stats.single_latency_seconds += time.perf_counter() - start_time
+                
+                if ai_query_response.token_usage:
+                    self.stats.single_tokens += ai_query_response.token_usage.total_tokens
+                if not ai_query_response.success or not ai_query_response.output_data:
+                    logger.error(f"AI生成MongoDB查詢失敗: {ai_query_response.error_message}")
+                    return await self._fallback_basic_query(db, document)
+                
+                if not isinstance(ai_query_response.output_data, AIMongoDBQueryDetailOutput):
+                    return await self._fallback_basic_query(db, document)
+                
+                query_components = ai_query_response.output_data
             
             # 構建 MongoDB 查詢
-            mongo_filter = {"_id": target_document.id}
+            mongo_filter = {"_id": document.id}
             mongo_projection = query_components.projection
             
             if query_components.sub_filter:
@@ -203,31 +501,62 @@ class QADocumentProcessor:
                 # 執行 AI 生成的詳細查詢
                 logger.debug(f"執行AI查詢 - Filter: {mongo_filter}, Projection: {mongo_projection}")
                 safe_projection = remove_projection_path_collisions(mongo_projection) if mongo_projection else None
+                safe_projection = with_content_marker(safe_projection)
                 fetched_data = await db.documents.find_one(mongo_filter, projection=safe_projection)
+                fetched_data = await hydrate_raw_document(db, fetched_data, safe_projection)
                 
-                if fetched_data:
-                    # 清理數據
-                    def sanitize(data: Any) -> Any:
-                        if isinstance(data, dict):
-                            return {k: sanitize(v) for k, v in data.items()}
-                        if isinstance(data, list):
-                            return [sanitize(i) for i in data]
-                        if isinstance(data, uuid.UUID):
-                            return str(data)
-                        return data
-                    
+                if _has_requested_data(fetched_data, mongo_projection, query_components.sub_filter):
                     logger.info(f"成功獲取文檔 {document_id} 的詳細資料")
-                    return sanitize(fetched_data)
+                    if plan_context and plan is None:
+                        detail_query_plan_cache.store(plan_context, plan_signature, query_components)
+                    return _sanitize(fetched_data)
                 else:
                     # AI 查詢沒有返回結果,使用回退查詢
                     logger.warning(f"文檔 {document_id} 的AI查詢無結果,使用回退查詢")
-                    return await self._fallback_basic_query(db, target_document)
+                    if plan_context and plan is not None:
+                        detail_query_plan_cache.invalidate(plan_context, plan_signature, plan)
+                    return await self._fallback_basic_query(db, document)
             else:
-                return await self._fallback_basic_query(db, target_document)
+                return await self._fallback_basic_query(db, document)
                 
         except Exception as e:
-            logger.error(f"查詢文檔詳細資料失敗: {e}", exc_info=True)
-            return None
+            logger.error(f"查詢文檔 {document_id} 詳細資料失敗,使用回退查詢: {e}", exc_info=True)
+            return await self._fallback_basic_query(db, document)
+    
+    def get_detail_query_statistics(self) -> Dict[str, Any]:
+        """
+        獲取詳細查詢生成統計
+        
+        比較批量路徑與逐文檔路徑的每文檔 token 與每次調用延遲；
+        兩種任務類型在 LLM 調用帳本中也分別記錄，可按 task_type 聚合對比。
+        """
+        stats = self.stats
+        batch_tokens_per_document = stats.batch_tokens / stats.batch_documents if stats.batch_documents else 0.0
+        single_tokens_per_document = stats.single_tokens / stats.single_calls if stats.single_calls else 0.0
+        token_savings = (
+            (1 - batch_tokens_per_document / single_tokens_per_document) * 100
+            if batch_tokens_per_document and single_tokens_per_document else 0.0
+        )
+        return {
+            "batching_enabled": settings.QA_DETAIL_QUERY_BATCHING_ENABLED,
+            "batch": {
+                "calls": stats.batch_calls,
+                "documents": stats.batch_documents,
+                "batched_documents": stats.batched_documents,
+                "failed_calls": stats.failed_batches,
+                "fallback_documents": stats.fallback_documents,
+                "documents_per_call": round(stats.batch_documents / stats.batch_calls, 2) if stats.batch_calls else 0.0,
+                "tokens_per_document": round(batch_tokens_per_document, 1),
+                "avg_latency_ms": round(stats.batch_latency_seconds / stats.batch_calls * 1000, 1) if stats.batch_calls else 0.0
+            },
+            "per_document": {
+                "calls": stats.single_calls,
+                "tokens_per_document": round(single_tokens_per_document, 1),
+                "avg_latency_ms": round(stats.single_latency_seconds / stats.single_calls * 1000, 1) if stats.single_calls else 0.0
+            },
+            "token_savings_percent": round(token_savings, 2),
+            "plan_cache": detail_query_plan_cache.get_statistics()
+        }
     
     async def _fallback_basic_query(self, db: AsyncIOMotorDatabase, document) -> Optional[Dict[str, Any]]:
         """回退到基本查詢"""
@@ -241,24 +570,16 @@ class QADocumentProcessor:
                 "analysis.ai_analysis_output.key_information.key_concepts": 1
             }
             
-            safe_projection = remove_projection_path_collisions(fallback_projection)
+            safe_projection = with_content_marker(remove_projection_path_collisions(fallback_projection))
             fetched_data = await db.documents.find_one(
                 {"_id": document.id},
                 projection=safe_projection
             )
+            fetched_data = await hydrate_raw_document(db, fetched_data, safe_projection)
             
             if fetched_data:
-                def sanitize(data: Any) -> Any:
-                    if isinstance(data, dict):
-                        return {k: sanitize(v) for k, v in data.items()}
-                    if isinstance(data, list):
-                        return [sanitize(i) for i in data]
-                    if isinstance(data, uuid.UUID):
-                        return str(data)
-                    return data
-                
                 logger.info(f"回退查詢成功獲取文檔 {document.id} 的基本資料")
-                return sanitize(fetched_data)
+                return _sanitize(fetched_data)
             
             return None
             
@@ -221,7 +221,7 @@ class QASearchCoordinator:
         logger.info(f"執行傳統單階段搜索: '{query[:50]}...'")
         
         # 生成查詢向量
-        query_embedding = embedding_service.encode_text(query)
+        query_embedding = await embedding_service.encode_text_async(query)
         if not query_embedding or not any(query_embedding):
             logger.error("無法生成查詢向量")
             return []
@@ -277,7 +277,7 @@ class QASearchCoordinator:
     ) -> List[SemanticSearchResult]:
         """最基礎的回退搜索"""
         try:
-            query_embedding = embedding_service.encode_text(query)
+            query_embedding = await embedding_service.encode_text_async(query)
             if not query_embedding or not any(query_embedding):
                 return []
             
@@ -33,6 +33,8 @@ from app.services.qa_core.qa_search_coordinator import qa_search_coordinator
 from app.services.qa_core.qa_answer_service import qa_answer_service
 from app.services.qa_workflow.question_classifier_service import question_classifier_service
 from app.services.qa_workflow.context_loader_service import context_loader_service
+from app.services.qa_workflow.speculative_retrieval_service import speculative_retrieval_service
+from app.services.qa_workflow.qa_analytics_service import qa_analytics_service
 from app.services.qa.utils.search_strategy import extract_search_strategy
 
 # 導入意圖處理器
@@ -125,6 +127,9 @@ class QAOrchestrator:
             logger.info("智能路由已禁用或被跳過,使用標準流程")
             return await self.process_qa_request(db, request, user_id, request_id)
         
+        # Step 0: 推測式檢索（與上下文載入和意圖分類並行）
+        speculation = self._start_speculative_retrieval(db, request, user_id)
+        
         try:
             # Step 1: 載入對話上下文（用於意圖分類）
             from app.services.qa_workflow.unified_context_helper import unified_context_helper
@@ -170,8 +175,8 @@ class QAOrchestrator:
                     db, request, user_id, classification
                 )
                 
-                return await handler.handle(
-                    request, classification, context, db, user_id, request_id
+                return await self._dispatch_to_handler(
+                    handler, request, classification, context, db, user_id, request_id, speculation
                 )
             else:
                 logger.warning(f"未知的意圖類型: {classification.intent}, 使用標準流程")
@@ -193,6 +198,65 @@ class QAOrchestrator:
             
             # 回退到標準流程
             return await self.process_qa_request(db, request, user_id, request_id)
+        finally:
+            # 未被處理器使用的推測結果一律丟棄
+            speculative_retrieval_service.discard(speculation)
+    
+    def _start_speculative_retrieval(
+        self,
+        db: AsyncIOMotorDatabase,
+        request: AIQARequest,
+        user_id: Optional[str]
+    ):
+        """為新問題或已批准的搜索啟動推測式檢索"""
+        if getattr(request, 'workflow_action', None) not in (None, 'approve_search'):
+            return None
+        return speculative_retrieval_service.start(
+            db=db,
+            question=request.question,
+            user_id=str(user_id) if user_id else None,
+            top_k=request.context_limit or 5
+        )
+    
+    async def _dispatch_to_handler(
+        self,
+        handler,
+        request: AIQARequest,
+        classification,
+        context: Optional[dict],
+        db: AsyncIOMotorDatabase,
+        user_id: Optional[str],
+        request_id: Optional[str],
+        speculation=None
+    ) -> AIQAResponse:
+        """調用意圖處理器；只有文檔搜索會使用推測式檢索結果"""
+        if classification.intent == QuestionIntent.DOCUMENT_SEARCH:
+            response = await handler.handle(
+                request, classification, context, db, user_id, request_id,
+                speculative_retrieval=speculation
+            )
+        else:
+            speculative_retrieval_service.discard(speculation)
+            response = await handler.handle(
+                request, classification, context, db, user_id, request_id
+            )
+        
+        # 寒暄處理器自行記錄統計；其餘意圖在此記錄（也是本地意圖分類器的訓練數據）
+        # 批准/跳過等工作流操作是同一問題的後續輪次，提問時已記錄過，不重複記錄
+        is_workflow_turn = getattr(request, 'workflow_action', None) is not None
+        if handler is not greeting_handler and db is not None and not is_workflow_turn:
+            await qa_analytics_service.log_qa_request(
+                db=db,
+                question=request.question,
+                classification=classification,
+                processing_time=response.processing_time,
+                api_calls=classification.estimated_api_calls or 0,
+                strategy_used=classification.suggested_strategy,
+                user_id=str(user_id) if user_id else None,
+                conversation_id=request.conversation_id,
+                tokens_used=response.tokens_used
+            )
+        return response
     
     async def process_qa_request(
         self,
@@ -291,7 +355,7 @@ class QAOrchestrator:
             # Step 6: 獲取完整文檔
             from app.crud.crud_documents import get_documents_by_ids
             document_ids = [result.document_id for result in search_results]
-            documents = await get_documents_by_ids(db, document_ids)
+            documents = await get_documents_by_ids(db, document_ids, owner_id=user_id_str)
             
             if not documents:
                 logger.warning("無法獲取完整文檔")
@@ -388,35 +452,20 @@ class QAOrchestrator:
             if not cached_doc_ids:
                 return None
             
-            # 獲取文檔詳細信息
-            from app.crud.crud_documents import get_documents_by_ids
-            documents = await get_documents_by_ids(db, cached_doc_ids)
+            # 只讀取文件名與摘要所需的欄位
+            from app.crud.crud_documents import get_document_summaries_by_ids
+            documents = await get_document_summaries_by_ids(db, cached_doc_ids, owner_id=user_uuid)
             
             # 構建文檔信息列表
-            cached_documents_info = []
-            for idx, doc in enumerate(documents, 1):
-                doc_info = {
+            cached_documents_info = [
+                {
                     "document_id": str(doc.id),
                     "filename": doc.filename,
                     "reference_number": idx,
-                    "summary": ""
+                    "summary": doc.display_summary
                 }
-                
-                # 安全獲取摘要
-                try:
-                    enriched_data = getattr(doc, 'enriched_data', None)
-                    if enriched_data and isinstance(enriched_data, dict):
-                        doc_info["summary"] = enriched_data.get('summary', '')
-                    
-                    if not doc_info["summary"] and hasattr(doc, 'analysis') and doc.analysis:
-                        if hasattr(doc.analysis, 'ai_analysis_output') and isinstance(doc.analysis.ai_analysis_output, dict):
-                            key_info = doc.analysis.ai_analysis_output.get('key_information', {})
-                            if isinstance(key_info, dict):
-                                doc_info["summary"] = key_info.get('content_summary', '')
-                except Exception as e:
-                    logger.warning(f"獲取文檔 {idx} 摘要失敗: {e}")
-                
-                cached_documents_info.append(doc_info)
+                for idx, doc in enumerate(documents, 1)
+            ]
             
             logger.info(f"準備了 {len(cached_documents_info)} 個緩存文檔信息用於分類")
             return cached_documents_info
@@ -480,6 +529,9 @@ class QAOrchestrator:
         Yields:
             StreamEvent: 流式事件（progress, chunk, metadata, complete, error, approval_needed）
         """
+        # 推測式檢索（與上下文載入和意圖分類並行）
+        speculation = self._start_speculative_retrieval(db, request, user_id)
+        
         try:
             # 檢查是否是批准操作（批准後不發送重複的進度事件）
             is_approval_action = getattr(request, 'workflow_action', None) in [
@@ -697,8 +749,8 @@ class QAOrchestrator:
                         await asyncio.sleep(0.05)
                     
                     # 調用 handler（這些 handlers 接受 context 參數）
-                    response = await handler.handle(
-                        request, classification, context, db, user_id, request_id
+                    response = await self._dispatch_to_handler(
+                        handler, request, classification, context, db, user_id, request_id, speculation
                     )
                     
                     # 發送完成進度
@@ -799,6 +851,8 @@ class QAOrchestrator:
         except Exception as e:
             logger.error(f"流式智能路由失敗: {e}", exc_info=True)
             yield StreamEvent('error', {'message': str(e)})
+        finally:
+            speculative_retrieval_service.discard(speculation)
 
 
 # 創建全局實例
@@ -3,6 +3,7 @@ QA工作流模塊
 
 包含問答工作流管理相關服務:
 - 問題分類
+- 本地快速意圖分類
 - 上下文載入  
 - 對話輔助
 - 統計分析
@@ -13,6 +14,7 @@ from app.services.qa_workflow.question_classifier_service import question_classi
 
 __all__ = [
     'question_classifier_service',
+    'local_intent_classifier',
     'context_loader_service',
     'conversation_helper',
     'qa_analytics_service'
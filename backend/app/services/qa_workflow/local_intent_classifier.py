@@ -0,0 +1,323 @@
+"""
+本地快速意圖分類器
+
+在調用 LLM 分類之前先做一次本地判斷：
+1. 規則：明確的寒暄和閒聊（完全匹配常見用語）
+2. 最近質心：用問題向量與各意圖的質心比較，質心由 qa_analytics 中
+   已記錄的 LLM 高置信度分類訓練得到
+
+只有 GREETING / CHITCHAT / DOCUMENT_SEARCH 且置信度足夠時直接返回，
+其餘情況交給 LLM 分類。
+
+質心相似度不是概率，直接返回的結果把相似度校準到 [LOCAL_CONFIDENT_MIN_CONFIDENCE, 1]，
+與 LLM 高置信度分類同等對待（例如文檔搜索的自動批准）。本地結果的 reasoning 留空，
+下游會把較長的 reasoning 當作上下文理解注入查詢重寫。
+"""
+
+import asyncio
+import logging
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.config import settings
+from app.core.logging_utils import AppLogger
+from app.models.question_models import QuestionClassification, QuestionIntent
+from app.services.vector.embedding_service import embedding_service
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+# 可以不經 LLM 直接返回的意圖
+FAST_PATH_INTENTS = {
+    QuestionIntent.GREETING,
+    QuestionIntent.CHITCHAT,
+    QuestionIntent.DOCUMENT_SEARCH,
+}
+
+# 分類來源標記（寫入 QuestionClassification.classified_by 和 qa_analytics）
+SOURCE_LOCAL_RULE = "local_rule"
+SOURCE_LOCAL_CENTROID = "local_centroid"
+SOURCE_LLM = "llm"
+
+_GREETING_PHRASES = {
+    "你好", "您好", "嗨", "哈囉", "哈嘍", "早安", "午安", "晚安", "早", "早上好", "晚上好",
+    "hi", "hello", "hey", "你好啊", "你好呀", "嗨嗨", "hiya", "good morning", "good evening",
+}
+_CHITCHAT_PHRASES = {
+    "謝謝", "謝謝你", "感謝", "多謝", "thanks", "thank you", "thx", "再見", "掰掰", "bye",
+    "你是誰", "你叫什麼", "你叫什麼名字", "你會做什麼", "你能做什麼", "你可以做什麼",
+    "辛苦了", "哈哈", "哈哈哈", "好棒", "讚",
+}
+# 本地直接返回的結果的最低置信度（與文檔搜索處理器的自動批准閾值一致）
+LOCAL_CONFIDENT_MIN_CONFIDENCE = 0.9
+
+_PUNCTUATION_PATTERN = re.compile(r"[\s,.!?~，。！？～、…:：;；'\"「」]+")
+
+
+def _normalize(question: str) -> str:
+    return _PUNCTUATION_PATTERN.sub(" ", (question or "").lower()).strip()
+
+
+@dataclass
+class LocalClassifierStats:
+    """本地分類器統計"""
+    total: int = 0
+    rule_hits: int = 0
+    centroid_hits: int = 0
+    llm_fallthrough: int = 0
+    agreement_checks: int = 0
+    agreements: int = 0
+    hits_by_intent: Dict[str, int] = field(default_factory=dict)
+    last_trained_at: Optional[float] = None
+    training_samples: int = 0
+
+
+class LocalIntentClassifier:
+    """規則 + 最近質心的本地意圖分類器"""
+
+    def __init__(self):
+        self.stats = LocalClassifierStats()
+        self._centroids: Dict[str, np.ndarray] = {}
+        self._training_task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.LOCAL_INTENT_CLASSIFIER_ENABLED
+
+    def classify_by_rules(
+        self,
+        question: str,
+        has_conversation_history: bool
+    ) -> Optional[QuestionClassification]:
+        """規則判斷：只處理完全匹配的寒暄與閒聊用語"""
+        normalized = _normalize(question)
+        if not normalized:
+            return None
+
+        if normalized in _GREETING_PHRASES:
+            return self._build_classification(
+                QuestionIntent.GREETING, 0.95, SOURCE_LOCAL_RULE
+            )
+        # 有對話歷史時「謝謝」「好棒」等可能是在回應上一輪，交給 LLM 結合上下文判斷
+        if not has_conversation_history and normalized in _CHITCHAT_PHRASES:
+            return self._build_classification(
+                QuestionIntent.CHITCHAT, 0.9, SOURCE_LOCAL_RULE
+            )
+        return None
+
+    async def predict_by_centroid(self, question: str) -> Optional[Tuple[QuestionClassification, bool]]:
+        """
+        最近質心預測（不論置信度高低都返回預測，用於與 LLM 結果的一致率統計）
+
+        Returns:
+            (預測結果, 是否足夠可信可直接使用)；尚未訓練或質心不足兩個時返回 None
+        """
+        centroids = self._centroids
+        if len(centroids) < 2:
+            return None
+
+        vector = np.asarray(await embedding_service.encode_text_async(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        vector = vector / norm
+
+        scores = sorted(
+            ((float(np.dot(vector, centroid)), intent) for intent, centroid in centroids.items()),
+            reverse=True
+        )
+        (best_score, best_intent), (second_score, _) = scores[0], scores[1]
+        intent = QuestionIntent(best_intent)
+        margin = best_score - second_score
+        confident = (
+            intent in FAST_PATH_INTENTS
+            and best_score >= settings.LOCAL_INTENT_CLASSIFIER_MIN_SIMILARITY
+            and margin >= settings.LOCAL_INTENT_CLASSIFIER_MIN_MARGIN
+        )
+        logger.debug(f"本地質心預測: {intent}，相似度 {best_score:.3f}，領先次高 {margin:.3f}，可直接使用: {confident}")
+        confidence = self._calibrate(best_score) if confident else max(0.0, min(best_score, 1.0))
+        classification = self._build_classification(intent, confidence, SOURCE_LOCAL_CENTROID)
+        return classification, confident
+
+    @staticmethod
+    def _calibrate(similarity: float) -> float:
+        """把通過閾值的質心相似度線性映射到 [LOCAL_CONFIDENT_MIN_CONFIDENCE, 1]"""
+        min_similarity = settings.LOCAL_INTENT_CLASSIFIER_MIN_SIMILARITY
+        if min_similarity >= 1.0:
+            return 1.0
+        ratio = max(0.0, min((similarity - min_similarity) / (1.0 - min_similarity), 1.0))
+        return LOCAL_CONFIDENT_MIN_CONFIDENCE + (1.0 - LOCAL_CONFIDENT_MIN_CONFIDENCE) * ratio
+
+    async def classify(
+        self,
+        question: str,
+        has_conversation_history: bool,
+        db: Optional[AsyncIOMotorDatabase] = None
+    ) -> Dict[str, Optional[QuestionClassification]]:
+        """
+        本地分類入口
+
+        Returns:
+            {"result": 可直接使用的分類或 None, "prediction": 質心預測（用於一致率統計）}
+        """
+        self.stats.total += 1
+        if db is not None:
+            self.ensure_trained(db)
+
+        rule_result = self.classify_by_rules(question, has_conversation_history)
+        if rule_result is not None:
+            self._record_hit(rule_result)
+            return {"result": rule_result, "prediction": rule_result}
+
+        prediction, confident = None, False
+        # 有對話歷史的問題多為追問或指代，需要 LLM 結合上下文判斷
+        if not has_conversation_history:
+            try:
+                predicted = await self.predict_by_centroid(question)
+                if predicted is not None:
+                    prediction, confident = predicted
+            except Exception as e:
+                logger.warning(f"本地質心分類失敗，交給 LLM: {e}")
+
+        if prediction is not None and confident:
+            self._record_hit(prediction)
+            return {"result": prediction, "prediction": prediction}
+
+        self.stats.llm_fallthrough += 1
+        return {"result": None, "prediction": prediction}
+
+    def should_verify(self) -> bool:
+        """是否對本次本地命中做一次 LLM 影子驗證（按抽樣率）"""
+        return random.random() < settings.LOCAL_INTENT_CLASSIFIER_SHADOW_RATE
+
+    def record_agreement(
+        self,
+        prediction: Optional[QuestionClassification],
+        llm_classification: QuestionClassification
+    ):
+        """記錄本地預測與 LLM 分類是否一致"""
+        if prediction is None:
+            return
+        self.stats.agreement_checks += 1
+        if str(prediction.intent) == str(llm_classification.intent):
+            self.stats.agreements += 1
+
+    def ensure_trained(self, db: AsyncIOMotorDatabase):
+        """質心過期時在背景重新訓練，不阻塞當前請求"""
+        if self._training_task is not None and not self._training_task.done():
+            return
+        last = self.stats.last_trained_at
+        if last is not None and time.time() - last < settings.LOCAL_INTENT_CLASSIFIER_RETRAIN_SECONDS:
+            return
+        self._training_task = asyncio.create_task(self.train(db))
+
+    async def train(self, db: AsyncIOMotorDatabase) -> int:
+        """
+        從 qa_analytics 中的 LLM 高置信度分類訓練各意圖的質心
+
+        本地分類器自己產生的記錄不參與訓練，避免自我強化。
+
+        Returns:
+            使用的訓練樣本數
+        """
+        self.stats.last_trained_at = time.time()
+        try:
+            questions: Dict[str, List[str]] = {}
+            for intent in QuestionIntent:
+                cursor = db["qa_analytics"].find(
+                    {
+                        "classification.intent": intent.value,
+                        "classification.confidence": {"$gte": settings.LOCAL_INTENT_CLASSIFIER_MIN_TRAINING_CONFIDENCE},
+                        "classification.classified_by": {"$nin": [SOURCE_LOCAL_RULE, SOURCE_LOCAL_CENTROID]},
+                        "question": {"$nin": [None, ""]}
+                    },
+                    {"question": 1}
+                ).sort("created_at", -1).limit(settings.LOCAL_INTENT_CLASSIFIER_MAX_SAMPLES_PER_INTENT)
+                samples = [doc["question"] async for doc in cursor]
+                if len(samples) >= settings.LOCAL_INTENT_CLASSIFIER_MIN_SAMPLES_PER_INTENT:
+                    questions[intent.value] = samples
+
+            centroids: Dict[str, np.ndarray] = {}
+            total = 0
+            for intent, samples in questions.items():
+                vectors = np.asarray(
+                    await asyncio.to_thread(embedding_service.encode_batch, samples),
+                    dtype=np.float32
+                )
+                centroid = vectors.mean(axis=0)
+                norm = np.linalg.norm(centroid)
+                if norm == 0:
+                    continue
+                centroids[intent] = centroid / norm
+                total += len(samples)
+
+            self._centroids = centroids
+            self.stats.training_samples = total
+            logger.info(f"本地意圖分類器訓練完成: {len(centroids)} 個意圖質心，{total} 個樣本")
+            return total
+        except Exception as e:
+            logger.error(f"本地意圖分類器訓練失敗: {e}", exc_info=True)
+            return 0
+
+    def _record_hit(self, classification: QuestionClassification):
+        if classification.classified_by == SOURCE_LOCAL_RULE:
+            self.stats.rule_hits += 1
+        else:
+            self.stats.centroid_hits += 1
+        intent = str(classification.intent)
+        self.stats.hits_by_intent[intent] = self.stats.hits_by_intent.get(intent, 0) + 1
+
+    @staticmethod
+    def _default_strategy(intent: QuestionIntent) -> str:
+        if intent == QuestionIntent.DOCUMENT_SEARCH:
+            return "standard_search"
+        return "direct_answer"
+
+    def _build_classification(
+        self,
+        intent: QuestionIntent,
+        confidence: float,
+        source: str
+    ) -> QuestionClassification:
+        requires_documents = intent == QuestionIntent.DOCUMENT_SEARCH
+        return QuestionClassification(
+            intent=intent,
+            confidence=round(confidence, 4),
+            reasoning="",  # 本地結果沒有可供查詢重寫使用的推理內容
+            requires_documents=requires_documents,
+            requires_context=False,
+            suggested_strategy=self._default_strategy(intent),
+            query_complexity="moderate" if requires_documents else "simple",
+            estimated_api_calls=3 if requires_documents else 1,
+            classified_by=source
+        )
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """獲取 LLM 跳過率與本地/LLM 一致率"""
+        local_hits = self.stats.rule_hits + self.stats.centroid_hits
+        return {
+            "enabled": self.enabled,
+            "total": self.stats.total,
+            "rule_hits": self.stats.rule_hits,
+            "centroid_hits": self.stats.centroid_hits,
+            "llm_fallthrough": self.stats.llm_fallthrough,
+            "llm_skip_rate": round(local_hits / self.stats.total * 100, 2) if self.stats.total else 0.0,
+            "hits_by_intent": dict(self.stats.hits_by_intent),
+            "agreement_checks": self.stats.agreement_checks,
+            "agreement_rate": (
+                round(self.stats.agreements / self.stats.agreement_checks * 100, 2)
+                if self.stats.agreement_checks else None
+            ),
+            "centroids": sorted(self._centroids.keys()),
+            "training_samples": self.stats.training_samples,
+            "last_trained_at": self.stats.last_trained_at
+        }
+
+
+# 全局實例
+local_intent_classifier = LocalIntentClassifier()
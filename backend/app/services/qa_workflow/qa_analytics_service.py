@@ -59,7 +59,8 @@ class QAAnalyticsService:
                     "intent": classification.intent,  # 已經是字符串,不需要 .value
                     "confidence": classification.confidence,
                     "strategy": classification.suggested_strategy,
-                    "complexity": classification.query_complexity
+                    "complexity": classification.query_complexity,
+                    "classified_by": classification.classified_by
                 },
                 "performance": {
                     "processing_time": processing_time,
@@ -1,8 +1,10 @@
 """
 問題分類器服務
 
-使用 Gemini 2.0 Flash 快速分類用戶問題的意圖類型
+使用 Gemini 2.0 Flash 快速分類用戶問題的意圖類型，
+明確的寒暄、閒聊和高置信度文檔搜索先由本地分類器直接判斷
 """
+import asyncio
 import logging
 import time
 from typing import Optional
@@ -19,6 +21,10 @@ from app.services.ai.unified_ai_service_simplified import (
     AIRequest,
     TaskType
 )
+from app.services.qa_workflow.local_intent_classifier import (
+    local_intent_classifier,
+    SOURCE_LLM
+)
 
 logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
 
@@ -35,6 +41,7 @@ class QuestionClassifierService:
             model=settings.QUESTION_CLASSIFIER_MODEL,
             confidence_threshold=settings.QUESTION_CLASSIFIER_CONFIDENCE_THRESHOLD
         )
+        self._shadow_tasks: set = set()
         logger.info(f"問題分類器初始化完成,使用模型: {self.config.model}, 啟用狀態: {self.config.enabled}")
     
     async def classify_question(
@@ -63,6 +70,66 @@ class QuestionClassifierService:
             logger.warning("問題分類器已禁用,返回默認分類")
             return self._get_default_classification(question)
         
+        has_conversation_history = bool(conversation_history and len(conversation_history) > 0)
+        prediction = None
+        
+        # 本地快速分類：明確的寒暄、閒聊和高置信度文檔搜索不調用 LLM
+        if local_intent_classifier.enabled:
+            local = await local_intent_classifier.classify(question, has_conversation_history, db)
+            prediction = local["prediction"]
+            if local["result"] is not None:
+                classification = local["result"]
+                logger.info(
+                    f"本地快速分類命中: intent={classification.intent}, "
+                    f"confidence={classification.confidence:.2f}, source={classification.classified_by}"
+                )
+                if local_intent_classifier.should_verify():
+                    self._start_shadow_verification(
+                        question, conversation_history, has_cached_documents, cached_documents_info, user_id, prediction
+                    )
+                return classification
+        
+        classification = await self._classify_with_llm(
+            question, conversation_history, has_cached_documents, cached_documents_info, db, user_id
+        )
+        if classification.classified_by == SOURCE_LLM:
+            local_intent_classifier.record_agreement(prediction, classification)
+        return classification
+    
+    def _start_shadow_verification(
+        self,
+        question: str,
+        conversation_history: Optional[list],
+        has_cached_documents: bool,
+        cached_documents_info: Optional[list],
+        user_id: Optional[str],
+        prediction: QuestionClassification
+    ):
+        """在背景調用 LLM 分類，用於統計本地命中與 LLM 的一致率（不影響本次結果）"""
+        async def _verify():
+            try:
+                llm_classification = await self._classify_with_llm(
+                    question, conversation_history, has_cached_documents, cached_documents_info, None, user_id
+                )
+                if llm_classification.classified_by == SOURCE_LLM:
+                    local_intent_classifier.record_agreement(prediction, llm_classification)
+            except Exception as e:
+                logger.debug(f"本地分類影子驗證失敗: {e}")
+        
+        task = asyncio.create_task(_verify())
+        self._shadow_tasks.add(task)
+        task.add_done_callback(self._shadow_tasks.discard)
+    
+    async def _classify_with_llm(
+        self,
+        question: str,
+        conversation_history: Optional[list],
+        has_cached_documents: bool,
+        cached_documents_info: Optional[list],
+        db: Optional[AsyncIOMotorDatabase],
+        user_id: Optional[str]
+    ) -> QuestionClassification:
+        """調用 LLM 進行意圖分類"""
         start_time = time.time()
         
         try:
@@ -191,7 +258,8 @@ class QuestionClassifierService:
                 clarification_question=classification_data.get("clarification_question"),
                 suggested_responses=classification_data.get("suggested_responses"),
                 target_document_ids=classification_data.get("target_document_ids"),
-                target_document_reasoning=classification_data.get("target_document_reasoning")
+                target_document_reasoning=classification_data.get("target_document_reasoning"),
+                classified_by=SOURCE_LLM
             )
             
             processing_time = time.time() - start_time
@@ -0,0 +1,170 @@
+"""
+推測式檢索服務
+
+在問題分類（一次 LLM 調用）進行的同時，先用原始問題做向量化和混合檢索。
+分類結果需要檢索時由處理器直接使用這些結果，否則丟棄。
+
+推測檢索使用 RRF 融合，結果的 similarity_score 是排名分數（權重 / (k + 排名)），
+不能與相似度閾值比較；判斷結果是否足夠好時使用 metadata 中的原始餘弦相似度。
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.config import settings
+from app.core.logging_utils import AppLogger
+from app.models.vector_models import SemanticSearchResult
+from app.services.vector.enhanced_search_service import enhanced_search_service
+
+logger = AppLogger(__name__, level=logging.DEBUG).get_logger()
+
+
+@dataclass
+class SpeculativeRetrieval:
+    """一次進行中的推測式檢索"""
+    question: str
+    top_k: int
+    task: asyncio.Task
+    started_at: float = field(default_factory=time.time)
+    finished: bool = False  # 是否已被使用或丟棄
+
+
+@dataclass
+class SpeculationStats:
+    """推測式檢索統計"""
+    started: int = 0
+    hits: int = 0  # 結果足夠好，處理器直接使用並跳過查詢重寫
+    merged: int = 0  # 結果與重寫查詢的結果合併
+    empty: int = 0  # 推測檢索完成但沒有結果
+    discarded: int = 0  # 意圖不需要檢索或需要用戶批准
+    failed: int = 0  # 檢索失敗或超時
+
+
+class SpeculativeRetrievalService:
+    """推測式檢索服務"""
+
+    def __init__(self):
+        self.stats = SpeculationStats()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.ENABLE_SPECULATIVE_RETRIEVAL
+
+    def start(
+        self,
+        db: AsyncIOMotorDatabase,
+        question: str,
+        user_id: Optional[str],
+        top_k: int = 5
+    ) -> Optional[SpeculativeRetrieval]:
+        """
+        在背景開始推測式檢索
+
+        Returns:
+            推測式檢索句柄；未啟用或問題過短時返回 None
+        """
+        if not self.enabled or not user_id:
+            return None
+        if len((question or "").strip()) < settings.SPECULATIVE_RETRIEVAL_MIN_QUESTION_CHARS:
+            return None
+
+        task = asyncio.create_task(
+            enhanced_search_service.two_stage_hybrid_search(
+                db=db,
+                query=question,
+                user_id=str(user_id),
+                search_type="rrf_fusion",
+                stage1_top_k=min(top_k * 2, 15),
+                stage2_top_k=top_k,
+                similarity_threshold=0.3
+            )
+        )
+        self.stats.started += 1
+        logger.debug(f"開始推測式檢索: {question[:50]}")
+        return SpeculativeRetrieval(question=question, top_k=top_k, task=task)
+
+    async def consume(self, speculation: Optional[SpeculativeRetrieval]) -> Optional[List[SemanticSearchResult]]:
+        """
+        取得推測式檢索結果（最多等待設定的超時時間）
+
+        Returns:
+            檢索結果；失敗或超時時返回 None，調用方應走常規檢索流程
+        """
+        if speculation is None or speculation.finished:
+            return None
+        speculation.finished = True
+
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(speculation.task),
+                timeout=settings.SPECULATIVE_RETRIEVAL_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            speculation.task.cancel()
+            self.stats.failed += 1
+            logger.warning("推測式檢索超時，改用常規檢索")
+        except Exception as e:
+            self.stats.failed += 1
+            logger.warning(f"推測式檢索失敗，改用常規檢索: {e}")
+        return None
+
+    def is_strong(self, results: Optional[List[SemanticSearchResult]]) -> bool:
+        """推測結果的最高分是否足以直接使用（跳過查詢重寫）"""
+        if not results:
+            return False
+        return max(self._original_similarity(r) for r in results) >= settings.SPECULATIVE_RETRIEVAL_MIN_SCORE
+
+    @staticmethod
+    def _original_similarity(result: SemanticSearchResult) -> float:
+        """RRF 融合前的向量相似度（非 RRF 結果直接使用 similarity_score）"""
+        metadata = result.metadata or {}
+        if metadata.get("fusion_method") == "rrf":
+            return float(metadata.get("original_similarity") or 0.0)
+        return result.similarity_score
+
+    def record_hit(self):
+        self.stats.hits += 1
+
+    def record_merged(self):
+        self.stats.merged += 1
+
+    def record_empty(self):
+        self.stats.empty += 1
+
+    def discard(self, speculation: Optional[SpeculativeRetrieval]):
+        """丟棄不需要的推測式檢索"""
+        if speculation is None or speculation.finished:
+            return
+        speculation.finished = True
+        if not speculation.task.done():
+            speculation.task.cancel()
+        else:
+            # 讀取結果以避免未處理異常警告
+            if not speculation.task.cancelled():
+                speculation.task.exception()
+        self.stats.discarded += 1
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """獲取推測式檢索統計"""
+        resolved = self.stats.hits + self.stats.merged + self.stats.empty + self.stats.discarded + self.stats.failed
+        used = self.stats.hits + self.stats.merged
+        return {
+            "enabled": self.enabled,
+            "started": self.stats.started,
+            "hits": self.stats.hits,
+            "merged": self.stats.merged,
+            "empty": self.stats.empty,
+            "discarded": self.stats.discarded,
+            "failed": self.stats.failed,
+            "hit_rate": round(self.stats.hits / resolved * 100, 2) if resolved else 0.0,
+            "use_rate": round(used / resolved * 100, 2) if resolved else 0.0
+        }
+
+
+# 全局實例
+speculative_retrieval_service = SpeculativeRetrievalService()
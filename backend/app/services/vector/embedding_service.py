@@ -1,4 +1,5 @@
 from typing import List, Optional, Dict, Any
+import asyncio
 import torch
 import numpy as np
 from sentence_transformers import SentenceTransformer
@@ -7,6 +8,7 @@ import os
 from pathlib import Path
 from app.core.logging_utils import AppLogger, log_event, LogLevel # Added log_event, LogLevel
 from app.core.config import settings
+from app.utils.single_flight import SingleFlight
 
 logger = AppLogger(__name__, level=logging.DEBUG).get_logger() # Existing AppLogger can remain for very fine-grained internal logs
 
@@ -18,6 +20,8 @@ class EmbeddingService:
         self.model = None
         self.vector_dimension = None
         self._model_loaded = False
+        # 合併同時進行中的相同查詢向量化
+        self._query_single_flight = SingleFlight("embedding.encode_query")
         
         # 檢查模型是否已緩存
         self._check_model_cache()
@@ -129,6 +133,26 @@ class EmbeddingService:
             # 返回零向量作為fallback
             return [0.0] * self.vector_dimension
     
+    async def encode_text_async(self, text: str) -> List[float]:
+        """
+        異步編碼查詢文本，在線程池中執行以免阻塞事件循環，
+        並合併同時進行中的相同文本的編碼請求
+        
+        Args:
+            text: 要編碼的文本
+            
+        Returns:
+            向量列表
+        """
+        # 模型加載只需一次，在當前線程完成以避免多個線程同時加載
+        if not self._model_loaded:
+            self._load_model()
+        
+        return await self._query_single_flight.do(
+            text or "",
+            lambda: asyncio.to_thread(self.encode_text, text)
+        )
+    
     def encode_batch(self, texts: List[str], batch_size: int = 32) -> List[List[float]]:
         """
         批量編碼文本為向量
@@ -83,7 +83,7 @@ class EnhancedSearchService:
         
         try:
             # 向量化查詢
-            query_vector = embedding_service.encode_text(query)
+            query_vector = await embedding_service.encode_text_async(query)
             if not query_vector:
                 logger.error("查詢向量化失敗")
                 await log_event(db, LogLevel.ERROR, "查詢向量化失敗", 
@@ -322,6 +322,21 @@ class VectorDatabaseService:
                         source="service.vector_db.delete_by_doc_ids_batch", details=summary_details, request_id=request_id, user_id=user_id)
         return {"deleted_count": deleted_count, "failed_ids": failed_ids, "errors": errors} # Note: deleted_count here is more like "processed_without_error_count"
     
+    def delete_by_document_ids_batch(self, document_ids: List[str]) -> bool:
+        """按 document_id $in 一次刪除多個文檔的向量（批量刪除文檔時使用）"""
+        if not document_ids:
+            return True
+        if not self.collection:
+            logger.warning("集合未初始化，無法批量刪除向量")
+            return False
+        try:
+            self.collection.delete(where={"document_id": {"$in": list(document_ids)}})
+            logger.info(f"已批量刪除 {len(document_ids)} 個文檔的向量")
+            return True
+        except Exception as e:
+            logger.error(f"批量刪除 {len(document_ids)} 個文檔的向量失敗: {e}")
+            return False
+
     def get_user_document_sample(
         self,
         user_id: str,
@@ -426,6 +441,49 @@ class VectorDatabaseService:
         except Exception as e:
             logger.error(f"關閉ChromaDB連接失敗: {e}")
 
+    def copy_document_vectors(self, source_document_id: str, target_document_id: str, owner_id: str) -> int:
+        """
+        把一個文檔的全部向量（含嵌入、元數據與文本）複製到另一個文檔，不重新計算 Embedding。
+        用於內容去重；只複製屬於同一用戶的向量。
+
+        Returns:
+            複製的向量數，失敗時返回 0
+        """
+        if not self.collection:
+            logger.warning("集合未初始化，無法複製向量")
+            return 0
+
+        try:
+            results = self.collection.get(
+                where={
+                    "$and": [
+                        {"document_id": {"$eq": source_document_id}},
+                        {"owner_id": {"$eq": owner_id}}
+                    ]
+                },
+                include=["embeddings", "metadatas", "documents"]
+            )
+            source_ids = results.get("ids") or []
+            if not source_ids:
+                return 0
+
+            created_at = datetime.utcnow().isoformat()
+            metadatas = [
+                {**(metadata or {}), "document_id": target_document_id, "created_at": created_at}
+                for metadata in results["metadatas"]
+            ]
+            self.collection.add(
+                ids=[str(uuid.uuid4()) for _ in source_ids],
+                embeddings=results["embeddings"],
+                metadatas=metadatas,
+                documents=results["documents"]
+            )
+            logger.info(f"已從文檔 {source_document_id} 複製 {len(source_ids)} 條向量到 {target_document_id}")
+            return len(source_ids)
+        except Exception as e:
+            logger.error(f"複製文檔 {source_document_id} 的向量失敗: {e}")
+            return 0
+
     def get_all_chunks_by_doc_id(self, owner_id: str, document_id: str) -> List[Dict[str, Any]]:
         """
         直接按文檔ID獲取其所有相關的向量塊（文本和摘要）。
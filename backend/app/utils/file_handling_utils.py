@@ -1,7 +1,9 @@
 import os
 import uuid
+import hashlib
 import aiofiles
 import logging
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, Tuple
 import mimetypes
@@ -10,7 +12,7 @@ import zipfile # For _validate_and_correct_file_type
 from fastapi import HTTPException, UploadFile, status
 from werkzeug.utils import secure_filename
 
-from ..core.config import Settings
+from ..core.config import Settings, settings
 from ..core.logging_utils import log_event, LogLevel
 # User model no longer needed here after correcting type hint
 # from ..models.user_models import User 
@@ -62,30 +64,105 @@ def prepare_upload_filepath(
     file_path = user_folder / safe_filename
     return file_path, safe_filename
 
-async def save_uploaded_file(file: UploadFile, file_path: Path, safe_filename: str) -> int:
+# 首個分塊中用於嗅探 MIME 類型的文件頭（按順序匹配）
+_MAGIC_SIGNATURES: Tuple[Tuple[bytes, str], ...] = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+    (b"PK\x03\x04", "application/zip"),
+)
+# PDF 規範允許 %PDF 之前有少量垃圾字節
+_PDF_HEADER_WINDOW = 1024
+
+
+@dataclass
+class SavedUpload:
+    """流式保存上傳文件的結果"""
+    size: int  # 寫入的字節數
+    sha256: str  # 文件內容的 sha256（十六進制）
+    sniffed_content_type: Optional[str] = None  # 根據首個分塊嗅探出的 MIME 類型，無法識別時為 None
+
+
+def sniff_content_type(head: bytes) -> Optional[str]:
+    """根據文件頭嗅探 MIME 類型，只識別 PDF、ZIP 容器（Office 文件）與常見圖片格式"""
+    if not head:
+        return None
+    if b"%PDF" in head[:_PDF_HEADER_WINDOW]:
+        return "application/pdf"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in _MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+def _remove_partial_file(file_path: Path) -> None:
+    if file_path.exists():
+        try:
+            os.remove(str(file_path)) # Ensure file_path is string for os.remove
+            logger.info(f"(save_uploaded_file) 已刪除部分寫入的文件: {file_path}")
+        except OSError as rm_error:
+            logger.error(f"(save_uploaded_file) 刪除部分寫入的文件 {file_path} 失敗: {rm_error}")
+
+
+def _too_large(safe_filename: str, max_size: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"文件 '{safe_filename}' 超過大小限制 ({max_size} bytes)"
+    )
+
+
+async def save_uploaded_file(file: UploadFile, file_path: Path, safe_filename: str) -> SavedUpload:
     """
-    Saves the uploaded file to the specified path and returns its size.
-    Raises HTTPException if saving fails.
+    以固定大小的分塊把上傳文件流式寫入磁盤，邊寫邊計算大小與 sha256。
+
+    每次只在內存中保留一個分塊（UPLOAD_CHUNK_SIZE_BYTES）；MIME 嗅探只看首個分塊。
+    超過 UPLOAD_MAX_FILE_SIZE_BYTES 時中止寫入、刪除部分文件並拋出 413，
+    其他失敗拋出 500。
     """
+    chunk_size = max(1, settings.UPLOAD_CHUNK_SIZE_BYTES)
+    max_size = settings.UPLOAD_MAX_FILE_SIZE_BYTES
+
+    # 客戶端聲明的大小已超限時無需讀取內容
+    declared_size = getattr(file, "size", None)
+    if max_size > 0 and declared_size is not None and declared_size > max_size:
+        logger.warning(f"(save_uploaded_file) 文件 '{safe_filename}' 聲明大小 {declared_size} bytes 超過限制 {max_size} bytes")
+        raise _too_large(safe_filename, max_size)
+
+    digest = hashlib.sha256()
+    file_size = 0
+    sniffed_content_type: Optional[str] = None
     try:
         async with aiofiles.open(file_path, 'wb') as out_file:
-            content = await file.read()  # Read file content
-            await out_file.write(content) # Write to disk
-            file_size = len(content) # Get file size
-        # Use the module-level logger
-        logger.info(f"文件 '{safe_filename}' 已保存到 '{file_path}'，大小: {file_size} bytes")
-        return file_size
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                if file_size == 0:
+                    sniffed_content_type = sniff_content_type(chunk)
+                file_size += len(chunk)
+                if max_size > 0 and file_size > max_size:
+                    raise _too_large(safe_filename, max_size)
+                digest.update(chunk)
+                await out_file.write(chunk)
+    except HTTPException:
+        logger.warning(f"(save_uploaded_file) 文件 '{safe_filename}' 寫入時超過大小限制 {max_size} bytes，已中止")
+        _remove_partial_file(file_path)
+        raise
     except Exception as e:
         # Use the module-level logger
         logger.error(f"(save_uploaded_file) 保存文件 '{safe_filename}' 到 '{file_path}' 失敗: {e}")
-        if file_path.exists():
-            try:
-                os.remove(str(file_path)) # Ensure file_path is string for os.remove
-                logger.info(f"(save_uploaded_file) 已刪除部分寫入的文件: {file_path}")
-            except OSError as rm_error:
-                logger.error(f"(save_uploaded_file) 刪除部分寫入的文件 {file_path} 失敗: {rm_error}")
+        _remove_partial_file(file_path)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"無法保存文件: {safe_filename}")
 
+    # Use the module-level logger
+    logger.info(f"文件 '{safe_filename}' 已保存到 '{file_path}'，大小: {file_size} bytes")
+    return SavedUpload(size=file_size, sha256=digest.hexdigest(), sniffed_content_type=sniffed_content_type)
+
 async def validate_and_correct_file_type(
     file_path: Path,
     declared_content_type: Optional[str],
@@ -93,14 +170,19 @@ async def validate_and_correct_file_type(
     safe_filename: str,
     db: AsyncIOMotorDatabase,
     current_user_id: uuid.UUID, 
-    request_id: Optional[str]
+    request_id: Optional[str],
+    sniffed_content_type: Optional[str]
 ) -> Tuple[Optional[str], Optional[str]]:
     """
     Validates the file type based on its content and corrects if necessary.
     Returns the actual content type and any warning message.
+
+    sniffed_content_type 為 save_uploaded_file 根據首個分塊嗅探出的類型（無法識別時為 None），
+    用於驗證 PDF 與圖片而無需重新讀取文件。
     """
     actual_content_type: Optional[str] = declared_content_type
     mime_type_warning: Optional[str] = None
+    sniffed_mismatch = False
     # Removed unused original_mime_type_for_log variable
 
     if file_size == 0:
@@ -134,8 +216,37 @@ async def validate_and_correct_file_type(
                     "corrected_mime_type": actual_content_type
                 }
             )
-    elif declared_content_type == "application/pdf":
-        # Placeholder for potential PDF validation
-        pass
+    elif declared_content_type == "application/pdf" and sniffed_content_type != "application/pdf":
+        logger.warning(f"文件 '{safe_filename}' 聲稱是 PDF，但文件頭不是 PDF 格式 (嗅探結果: {sniffed_content_type})")
+        actual_content_type = "application/octet-stream"
+        mime_type_warning = "文件聲稱是 application/pdf，但文件頭驗證失敗。已作為二進制文件處理。"
+        sniffed_mismatch = True
+    elif (
+        declared_content_type
+        and declared_content_type.startswith("image/")
+        and sniffed_content_type
+        and sniffed_content_type.startswith("image/")
+        and sniffed_content_type != declared_content_type
+    ):
+        logger.info(f"文件 '{safe_filename}' 聲稱是 {declared_content_type}，文件頭為 {sniffed_content_type}，已更正")
+        actual_content_type = sniffed_content_type
+        mime_type_warning = f"文件聲稱是 {declared_content_type}，實際為 {sniffed_content_type}。已按實際類型處理。"
+        sniffed_mismatch = True
+
+    if sniffed_mismatch:
+        await log_event(
+            db=db,
+            level=LogLevel.WARNING,
+            message=mime_type_warning,
+            source="file_handling_utils.validate_file_type",
+            user_id=str(current_user_id),
+            request_id=request_id,
+            details={
+                "filename": safe_filename,
+                "declared_mime_type": declared_content_type,
+                "sniffed_mime_type": sniffed_content_type,
+                "corrected_mime_type": actual_content_type
+            }
+        )
     
     return actual_content_type, mime_type_warning
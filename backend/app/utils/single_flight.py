@@ -0,0 +1,156 @@
+"""
+Single-flight 請求合併工具
+
+同一個 key 的異步調用在執行期間只會真正執行一次，
+後續相同 key 的調用者等待同一個 Future 並共享結果。
+用於避免重複提交、前端重試等情況下的重複 AI 調用與資料庫查詢。
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, TypeVar
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class _InFlightCall:
+    """一個正在執行中的調用"""
+    future: asyncio.Future
+    waiters: int = 0
+
+
+@dataclass
+class SingleFlightStats:
+    """Single-flight 統計資訊"""
+    executions: int = 0  # 實際執行次數
+    shared: int = 0  # 共享了他人結果的調用次數
+    overflow: int = 0  # 等待者已滿而獨立執行的次數
+    timeouts: int = 0  # 等待超時後獨立執行的次數
+    errors: int = 0  # 執行失敗次數（錯誤會傳遞給所有等待者）
+
+
+class SingleFlight:
+    """
+    以 key 合併同時進行中的相同異步調用
+
+    - 等待者數量有上限，超過上限的調用者直接獨立執行
+    - 等待者有超時，超時後獨立執行而不是無限等待
+    - 發起者被取消時，等待者改為獨立執行
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_waiters: int = None,
+        wait_timeout: float = None,
+        enabled: bool = None
+    ):
+        self.name = name
+        self.max_waiters = max_waiters if max_waiters is not None else settings.SINGLE_FLIGHT_MAX_WAITERS
+        self.wait_timeout = wait_timeout if wait_timeout is not None else settings.SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS
+        self.enabled = enabled if enabled is not None else settings.SINGLE_FLIGHT_ENABLED
+        self._inflight: Dict[str, _InFlightCall] = {}
+        self.stats = SingleFlightStats()
+        _registry.append(self)
+
+    @property
+    def inflight_count(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """執行或加入相同 key 的調用，返回結果"""
+        result, _ = await self.run(key, func)
+        return result
+
+    async def run(self, key: str, func: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        執行或加入相同 key 的調用
+
+        Returns:
+            (結果, 是否共享了其他調用者的結果)
+        """
+        if not self.enabled:
+            return await func(), False
+
+        call = self._inflight.get(key)
+        if call is not None:
+            return await self._wait_for_call(key, call, func)
+
+        call = _InFlightCall(future=asyncio.get_running_loop().create_future())
+        self._inflight[key] = call
+        self.stats.executions += 1
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            call.future.cancel()
+            raise
+        except Exception as e:
+            self.stats.errors += 1
+            call.future.set_exception(e)
+            # 標記異常已被讀取，避免沒有等待者時出現未處理警告
+            call.future.exception()
+            raise
+        else:
+            call.future.set_result(result)
+            return result, False
+        finally:
+            if self._inflight.get(key) is call:
+                del self._inflight[key]
+
+    async def _wait_for_call(
+        self,
+        key: str,
+        call: _InFlightCall,
+        func: Callable[[], Awaitable[T]]
+    ) -> Tuple[T, bool]:
+        if call.waiters >= self.max_waiters:
+            self.stats.overflow += 1
+            logger.debug(f"[SingleFlight:{self.name}] 等待者已達上限 {self.max_waiters}，獨立執行: {key[:32]}")
+            return await func(), False
+
+        call.waiters += 1
+        try:
+            result = await asyncio.wait_for(asyncio.shield(call.future), timeout=self.wait_timeout)
+            self.stats.shared += 1
+            logger.debug(f"[SingleFlight:{self.name}] 共享進行中的調用結果: {key[:32]}")
+            return result, True
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            logger.warning(f"[SingleFlight:{self.name}] 等待超時 ({self.wait_timeout}s)，獨立執行: {key[:32]}")
+            return await func(), False
+        except asyncio.CancelledError:
+            # 發起者被取消時改為自行執行；調用者自身被取消則繼續向上拋出
+            if call.future.cancelled():
+                return await func(), False
+            raise
+        finally:
+            call.waiters -= 1
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """獲取統計資訊"""
+        total_calls = self.stats.executions + self.stats.shared + self.stats.overflow + self.stats.timeouts
+        return {
+            "name": self.name,
+            "enabled": self.enabled,
+            "inflight": self.inflight_count,
+            "executions": self.stats.executions,
+            "shared": self.stats.shared,
+            "overflow": self.stats.overflow,
+            "timeouts": self.stats.timeouts,
+            "errors": self.stats.errors,
+            "dedup_rate": round(self.stats.shared / total_calls * 100, 2) if total_calls > 0 else 0.0
+        }
+
+
+_registry: List[SingleFlight] = []
+
+
+def get_single_flight_statistics() -> Dict[str, Dict[str, Any]]:
+    """獲取所有 single-flight 實例的統計資訊"""
+    return {instance.name: instance.get_statistics() for instance in _registry}
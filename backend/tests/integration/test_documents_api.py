@@ -178,6 +178,37 @@ class TestListDocuments:
         all_ids = page1_ids + page2_ids + page3_ids
         assert len(all_ids) == len(set(all_ids))  # 无重复
     
+    @pytest.mark.asyncio
+    async def test_list_documents_cursor_pagination(self, test_db, test_user):
+        """
+        场景：以游标分页获取文档
+        预期：逐页返回全部文档，不重复，最后一页没有下一页游标
+        """
+        for i in range(5):
+            doc_data = DocumentCreate(
+                filename=f"cursor_test_{i}.txt",
+                owner_id=test_user.id,
+                file_type="text/plain",
+                size=100
+            )
+            await crud_documents.create_document(
+                test_db, doc_data, test_user.id, f"/test/cursor_test_{i}.txt"
+            )
+        
+        all_ids = []
+        cursor = None
+        for _ in range(3):
+            page, cursor = await crud_documents.get_documents_page(
+                test_db, owner_id=test_user.id, limit=2, cursor=cursor
+            )
+            all_ids.extend(doc.id for doc in page)
+            if cursor is None:
+                break
+        
+        assert cursor is None
+        assert len(all_ids) == 5
+        assert len(all_ids) == len(set(all_ids))  # 无重复
+    
     @pytest.mark.asyncio
     async def test_list_documents_filter_by_status(self, test_db, test_user):
         """
@@ -0,0 +1,118 @@
+"""
+AI 調用限流器單元測試
+
+測試目標:
+1. 並發數限制與互動請求保留並發位
+2. 互動請求優先於排隊中的後台請求
+3. RPM 限制與 429 自適應退避
+4. 排隊等待統計
+"""
+
+import asyncio
+import time
+import pytest
+from unittest.mock import patch
+
+from app.services.ai.ai_rate_limiter import AIRateLimiter, RequestPriority
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture
+def limits():
+    with patch("app.services.ai.ai_rate_limiter.settings") as mock_settings:
+        mock_settings.AI_RATE_LIMIT_ENABLED = True
+        mock_settings.AI_RATE_LIMITS = {"default": {"rpm": 0, "tpm": 0, "max_concurrency": 2}}
+        mock_settings.AI_RATE_LIMIT_INTERACTIVE_RESERVED_SLOTS = 1
+        mock_settings.AI_RATE_LIMIT_MAX_BACKOFF_SECONDS = 60.0
+        yield mock_settings
+
+
+@pytest.mark.asyncio
+async def test_background_leaves_slot_for_interactive(limits):
+    """測試後台請求不能佔滿為互動請求保留的並發位"""
+    limiter = AIRateLimiter()
+    bg = await limiter.acquire("m", priority=RequestPriority.BACKGROUND)
+
+    # 第二個後台請求需要等待（max_concurrency=2，保留 1 個給互動請求）
+    second_bg = asyncio.create_task(limiter.acquire("m", priority=RequestPriority.BACKGROUND))
+    await asyncio.sleep(0.05)
+    assert not second_bg.done()
+
+    # 互動請求可以立即獲得配額
+    interactive = await asyncio.wait_for(limiter.acquire("m", priority=RequestPriority.INTERACTIVE), timeout=1)
+
+    await limiter.release(bg)
+    await limiter.release(interactive)
+    await limiter.release(await asyncio.wait_for(second_bg, timeout=1))
+
+
+@pytest.mark.asyncio
+async def test_interactive_preempts_queued_background(limits):
+    """測試互動請求插隊到排隊中的後台請求之前"""
+    limits.AI_RATE_LIMITS = {"default": {"rpm": 0, "tpm": 0, "max_concurrency": 1}}
+    limits.AI_RATE_LIMIT_INTERACTIVE_RESERVED_SLOTS = 0
+    limiter = AIRateLimiter()
+    holder = await limiter.acquire("m", priority=RequestPriority.BACKGROUND)
+    order = []
+
+    async def _run(name, priority):
+        async with limiter.limit("m", priority=priority):
+            order.append(name)
+
+    bg_task = asyncio.create_task(_run("background", RequestPriority.BACKGROUND))
+    await asyncio.sleep(0.01)
+    it_task = asyncio.create_task(_run("interactive", RequestPriority.INTERACTIVE))
+    await asyncio.sleep(0.01)
+
+    await limiter.release(holder)
+    await asyncio.wait_for(asyncio.gather(bg_task, it_task), timeout=1)
+
+    assert order == ["interactive", "background"]
+
+
+@pytest.mark.asyncio
+async def test_rpm_limit_delays_request(limits):
+    """測試達到 RPM 上限時請求需等待窗口滑動"""
+    limits.AI_RATE_LIMITS = {"default": {"rpm": 1, "tpm": 0, "max_concurrency": 0}}
+    limiter = AIRateLimiter()
+    async with limiter.limit("m"):
+        pass
+
+    # 將上一次請求的時間戳移到窗口邊緣，第二次請求應短暫等待後通過
+    limiter._limiters["m"].request_times[0] = time.time() - 59.9
+    start = time.monotonic()
+    async with limiter.limit("m"):
+        pass
+
+    assert time.monotonic() - start >= 0.05
+    stats = limiter.get_statistics()["models"]["m"]
+    assert stats["lanes"]["interactive"]["acquired"] == 2
+    assert stats["lanes"]["interactive"]["max_wait_seconds"] > 0
+
+
+@pytest.mark.asyncio
+async def test_report_rate_limited_backs_off_and_recovers(limits):
+    """測試 429 觸發指數退避，成功後逐步恢復"""
+    limiter = AIRateLimiter()
+    limiter.report_rate_limited("m")
+    limiter.report_rate_limited("m")
+    model_limiter = limiter._limiters["m"]
+
+    assert model_limiter.backoff_seconds == 4.0
+    assert model_limiter.rate_limited_count == 2
+    assert model_limiter.capacity_delay(time.time(), 0, RequestPriority.INTERACTIVE) > 0
+
+    limiter.report_success("m")
+    assert model_limiter.backoff_seconds == 2.0
+
+
+@pytest.mark.asyncio
+async def test_actual_tokens_replace_estimate(limits):
+    """測試釋放時以實際 token 數修正 TPM 窗口"""
+    limits.AI_RATE_LIMITS = {"default": {"rpm": 0, "tpm": 1000, "max_concurrency": 0}}
+    limiter = AIRateLimiter()
+    async with limiter.limit("m", estimated_tokens=500) as reservation:
+        reservation.actual_tokens = 120
+
+    assert limiter.get_statistics()["models"]["m"]["tokens_last_minute"] == 120
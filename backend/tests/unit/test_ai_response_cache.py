@@ -0,0 +1,125 @@
+"""
+LLM 回應精確匹配緩存單元測試
+
+測試目標:
+1. 緩存鍵值由模型、任務、提示詞和生成配置共同決定
+2. 按任務類型的 TTL 與過期處理
+3. process_request 命中緩存時不再調用 AI API
+"""
+
+import time
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.services.ai.ai_cache_manager import AICacheManager
+from app.models.ai_models_simplified import TokenUsage
+
+pytestmark = pytest.mark.unit
+
+
+def _make_manager(task_ttls=None) -> AICacheManager:
+    manager = AICacheManager()
+    manager.llm_response_cache_enabled = True
+    manager.llm_response_task_ttls = task_ttls or {"query_rewrite": 60}
+    manager.redis_client = None
+    return manager
+
+
+def test_cache_key_depends_on_all_inputs():
+    """測試緩存鍵值隨模型、提示詞、生成配置變化"""
+    manager = _make_manager()
+    base = dict(model_id="m1", task_type="query_rewrite", system_prompt="sys", user_prompt="q", generation_config={"temperature": 0.1})
+    key = manager.build_llm_response_cache_key(**base)
+
+    assert key == manager.build_llm_response_cache_key(**base)
+    assert key != manager.build_llm_response_cache_key(**{**base, "model_id": "m2"})
+    assert key != manager.build_llm_response_cache_key(**{**base, "user_prompt": "q2"})
+    assert key != manager.build_llm_response_cache_key(**{**base, "generation_config": {"temperature": 0.2}})
+
+
+def test_only_tasks_with_ttl_are_cacheable():
+    """測試只有配置了 TTL 的任務才會緩存"""
+    manager = _make_manager({"query_rewrite": 60, "answer_generation": 0})
+
+    assert manager.is_llm_response_cacheable("query_rewrite")
+    assert not manager.is_llm_response_cacheable("answer_generation")
+    assert not manager.is_llm_response_cacheable("text_generation")
+
+    manager.llm_response_cache_enabled = False
+    assert not manager.is_llm_response_cacheable("query_rewrite")
+
+
+@pytest.mark.asyncio
+async def test_get_set_and_tokens_saved():
+    """測試寫入後命中，並累計節省的 token"""
+    manager = _make_manager()
+    key = manager.build_llm_response_cache_key("m1", "query_rewrite", None, "q")
+
+    assert await manager.get_llm_response(key) is None
+    await manager.set_llm_response(key, "query_rewrite", '{"a": 1}', total_tokens=120)
+
+    entry = await manager.get_llm_response(key)
+    assert entry["output_text"] == '{"a": 1}'
+
+    stats = manager.get_llm_response_cache_statistics()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["local_hits"] == 1
+    assert stats["tokens_saved"] == 120
+
+
+@pytest.mark.asyncio
+async def test_expired_entry_is_miss():
+    """測試過期條目視為未命中"""
+    manager = _make_manager()
+    key = manager.build_llm_response_cache_key("m1", "query_rewrite", None, "q")
+    await manager.set_llm_response(key, "query_rewrite", "out", total_tokens=10)
+    manager.llm_response_cache[key]["expires_at"] = time.time() - 1
+
+    assert await manager.get_llm_response(key) is None
+    assert key not in manager.llm_response_cache
+
+
+@pytest.mark.asyncio
+async def test_redis_tier_backfills_local_cache():
+    """測試 Redis 命中時回填本地緩存"""
+    manager = _make_manager()
+    key = manager.build_llm_response_cache_key("m1", "query_rewrite", None, "q")
+    manager.redis_client = MagicMock()
+    manager.redis_client.get = AsyncMock(
+        return_value='{"output_text": "out", "task_type": "query_rewrite", "total_tokens": 50, "expires_at": 9999999999}'
+    )
+
+    entry = await manager.get_llm_response(key)
+
+    assert entry["output_text"] == "out"
+    assert key in manager.llm_response_cache
+    assert manager.get_llm_response_cache_statistics()["redis_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_process_request_uses_response_cache():
+    """測試相同請求第二次不再調用 AI API"""
+    from app.services.ai import unified_ai_service_simplified as module
+    from app.services.ai.unified_ai_service_simplified import AIRequest
+    from app.services.ai.unified_ai_config import TaskType
+
+    manager = _make_manager({"question_intent_classification": 60})
+    service = module.UnifiedAIServiceSimplified()
+    ai_output = '{"intent": "greeting", "confidence": 0.95}'
+
+    with patch.object(module, "ai_cache_manager", manager), \
+         patch.object(module.unified_ai_config, "get_model_for_task", new=AsyncMock(return_value="gemini-2.5-flash")), \
+         patch.object(module.prompt_manager_simplified, "get_prompt", new=AsyncMock(return_value=MagicMock())), \
+         patch.object(module.prompt_manager_simplified, "format_prompt", return_value=("sys", "user")), \
+         patch.object(service, "_execute_google_ai_request", new=AsyncMock(
+             return_value=(ai_output, TokenUsage(prompt_tokens=80, completion_tokens=20, total_tokens=100))
+         )) as mock_execute:
+        first = await service.process_request(AIRequest(task_type=TaskType.QUESTION_INTENT_CLASSIFICATION, content="你好"))
+        second = await service.process_request(AIRequest(task_type=TaskType.QUESTION_INTENT_CLASSIFICATION, content="你好"))
+
+    assert first.success and second.success
+    assert mock_execute.await_count == 1
+    assert second.token_usage.total_tokens == 0
+    assert second.output_data == {"intent": "greeting", "confidence": 0.95}
+    assert manager.get_llm_response_cache_statistics()["tokens_saved"] == 100
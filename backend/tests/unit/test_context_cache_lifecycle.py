@@ -0,0 +1,274 @@
+"""
+Gemini Context Cache 生命週期單元測試
+
+測試目標:
+1. 系統指令超過 token 閾值時首次使用即創建緩存，低於閾值時不創建
+2. process_request 後續請求以緩存 ID 調用，系統指令不再隨請求發送，並記錄實測節省
+3. 剩餘 TTL 低於續期閾值時先續期
+4. cleanup_expired_caches 清理過期緩存
+5. 遠端緩存失效時改為帶系統指令重發
+6. 創建失敗的系統指令在負緩存 TTL 內不再重試，本地系統指令緩存有 LRU 上限
+7. Google 提供商以 GenerativeModel.from_cached_content 和創建時保存的 CachedContent 構建模型
+"""
+
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from cachetools import LRUCache, TTLCache
+
+from google.api_core.exceptions import NotFound
+
+from app.models.ai_models_simplified import AIPromptRequest
+from app.services.ai.fake_llm_provider import FakeLLMProvider
+from app.services.ai.unified_ai_config import TaskType
+from app.services.cache.google_context_cache_service import (
+    ContextCacheConfig,
+    ContextCacheType,
+    GoogleContextCacheBackend,
+    GoogleContextCacheService
+)
+
+pytestmark = pytest.mark.unit
+
+MODULE = "app.services.cache.google_context_cache_service"
+FAKE_MODULE = "app.services.ai.fake_llm_provider"
+
+SYSTEM_PROMPT = "你是文件分析助手，請嚴格按照 JSON 格式輸出。" * 20
+
+
+@pytest.fixture
+def cache_settings():
+    with patch(f"{MODULE}.settings") as mock_settings:
+        mock_settings.AI_CONTEXT_CACHE_ENABLED = True
+        mock_settings.AI_CONTEXT_CACHE_BACKEND = "memory"
+        mock_settings.AI_CONTEXT_CACHE_MIN_TOKENS = {"default": 100, "gemini-2.5-pro": 100000}
+        mock_settings.AI_CONTEXT_CACHE_TTL_SECONDS = 3600
+        mock_settings.AI_CONTEXT_CACHE_REFRESH_BEFORE_SECONDS = 300
+        yield mock_settings
+
+
+@pytest.fixture
+def fake_settings():
+    with patch(f"{FAKE_MODULE}.settings") as mock_settings:
+        mock_settings.FAKE_LLM_TASK_LATENCY_MEDIANS = {}
+        mock_settings.FAKE_LLM_LATENCY_MEDIAN_SECONDS = 0.0
+        mock_settings.FAKE_LLM_ERROR_RATE = 0.0
+        mock_settings.FAKE_LLM_RATE_LIMIT_RATE = 0.0
+        mock_settings.FAKE_LLM_OUTPUT_TOKENS = 0
+        yield mock_settings
+
+
+def _config(model: str = "gemini-2.5-flash", content: str = SYSTEM_PROMPT) -> ContextCacheConfig:
+    return ContextCacheConfig(cache_type=ContextCacheType.SYSTEM_INSTRUCTION, content=content, model=model)
+
+
+@pytest.mark.asyncio
+async def test_create_respects_token_threshold(cache_settings):
+    """測試超過閾值時創建緩存並登記，低於閾值時不創建"""
+    service = GoogleContextCacheService()
+
+    cache_info = await service.create_context_cache(_config())
+    below = await service.create_context_cache(_config(model="gemini-2.5-pro"))
+
+    assert cache_info is not None and cache_info.token_count >= 100
+    assert await service.get_cache_info(cache_info.cache_id) is cache_info
+    assert below is None
+    assert len(service.backend) == 1
+
+
+@pytest.mark.asyncio
+async def test_process_request_reuses_cache_id(cache_settings, fake_settings):
+    """測試後續請求以緩存 ID 調用、不再發送系統指令，並記錄緩存提供的輸入 token"""
+    from app.services.ai import llm_providers
+    from app.services.ai.unified_ai_service_simplified import AIRequest, unified_ai_service_simplified
+
+    service = GoogleContextCacheService()
+    provider = FakeLLMProvider(seed=1)
+    calls = []
+    original_generate = provider.generate
+
+    async def _spy(task_type, model_id, prompt_parts, *args, **kwargs):
+        calls.append((prompt_parts, kwargs.get("cached_content")))
+        return await original_generate(task_type, model_id, prompt_parts, *args, **kwargs)
+
+    provider.generate = _spy
+    with patch.object(llm_providers, "_providers", {"fake": provider}), \
+         patch.object(llm_providers.settings, "AI_PROVIDER_BACKEND", "fake"), \
+         patch.object(unified_ai_service_simplified, "context_cache_service", service), \
+         patch(f"{MODULE}.google_context_cache_service", service), \
+         patch.object(unified_ai_service_simplified, "_system_instruction_caches", {}), \
+         patch.object(unified_ai_service_simplified, "_uncacheable_system_prompts", set()):
+        for query in ["去年的水電費帳單", "今年的保險合約"]:
+            response = await unified_ai_service_simplified.process_request(AIRequest(
+                task_type=TaskType.QUERY_REWRITE,
+                content=query,
+                prompt_params={"original_query": query}
+            ))
+            assert response.success, response.error_message
+
+    cache_ids = {cached for _, cached in calls}
+    assert len(cache_ids) == 1 and None not in cache_ids
+    assert service.usage_stats.created == 1
+    for prompt_parts, _ in calls:
+        assert len(prompt_parts) == 1
+    savings = service.get_measured_savings()
+    assert savings["requests_using_cache"] == 2
+    assert 0 < savings["cached_input_tokens"] < savings["total_input_tokens"]
+    assert savings["billable_input_tokens_saved"] > 0
+
+
+@pytest.mark.asyncio
+async def test_refresh_before_expiry(cache_settings):
+    """測試剩餘 TTL 低於續期閾值時續期，尚早時不續期"""
+    service = GoogleContextCacheService()
+    cache_info = await service.create_context_cache(_config())
+
+    assert await service.ensure_fresh(cache_info)
+    assert service.usage_stats.refreshed == 0
+
+    cache_info.expires_at = datetime.utcnow() + timedelta(seconds=60)
+    assert await service.ensure_fresh(cache_info)
+    assert service.usage_stats.refreshed == 1
+    assert cache_info.expires_at > datetime.utcnow() + timedelta(seconds=3000)
+
+
+@pytest.mark.asyncio
+async def test_cleanup_removes_expired_caches(cache_settings):
+    """測試清理過期緩存，未過期的保留"""
+    service = GoogleContextCacheService()
+    expired = await service.create_context_cache(_config())
+    active = await service.create_context_cache(_config(content=SYSTEM_PROMPT + "補充說明"))
+    expired.expires_at = datetime.utcnow() - timedelta(seconds=1)
+
+    assert await service.cleanup_expired_caches() == 1
+    assert service.get_registered_cache(expired.cache_id) is None
+    assert service.get_registered_cache(active.cache_id) is active
+    assert not await service.ensure_fresh(expired)
+
+
+@pytest.mark.asyncio
+async def test_stale_remote_cache_falls_back_to_system_prompt(cache_settings, fake_settings):
+    """測試遠端緩存已失效時移除登記並帶系統指令重發"""
+    from app.services.ai import llm_providers
+    from app.services.ai.unified_ai_service_simplified import unified_ai_service_simplified
+
+    service = GoogleContextCacheService()
+    cache_info = await service.create_context_cache(_config(model="gemini-2.0-flash"))
+    provider = FakeLLMProvider(seed=1)
+    original_generate = provider.generate
+    sent_parts = []
+
+    async def _generate(task_type, model_id, prompt_parts, *args, cached_content=None):
+        if cached_content:
+            raise NotFound("cached content not found")
+        sent_parts.append(prompt_parts)
+        return await original_generate(task_type, model_id, prompt_parts, *args)
+
+    provider.generate = _generate
+    with patch.object(llm_providers, "_providers", {"fake": provider}), \
+         patch.object(llm_providers.settings, "AI_PROVIDER_BACKEND", "fake"), \
+         patch.object(unified_ai_service_simplified, "context_cache_service", service):
+        output_text, usage = await unified_ai_service_simplified._execute_google_ai_request(
+            model_id="gemini-2.0-flash",
+            prompt_request=AIPromptRequest(system_prompt=SYSTEM_PROMPT, user_prompt="<user_query>合約</user_query>"),
+            generation_config_dict={},
+            safety_settings={},
+            task_type=TaskType.QUERY_REWRITE,
+            context_cache=cache_info
+        )
+
+    assert output_text is not None
+    assert sent_parts == [[SYSTEM_PROMPT, "<user_query>合約</user_query>"]]
+    assert service.get_registered_cache(cache_info.cache_id) is None
+
+
+@pytest.mark.asyncio
+async def test_failed_creation_is_not_retried_until_ttl_expires(cache_settings):
+    """測試創建失敗後在負緩存 TTL 內直接返回 None，過期後才重試"""
+    from app.services.ai.unified_ai_service_simplified import UnifiedAIServiceSimplified
+
+    service = GoogleContextCacheService()
+    ai_service = UnifiedAIServiceSimplified()
+    ai_service.context_cache_service = service
+    clock = [0.0]
+    ai_service._failed_system_instruction_caches = TTLCache(maxsize=8, ttl=300, timer=lambda: clock[0])
+
+    with patch.object(service, "create_context_cache", AsyncMock(return_value=None)) as create:
+        for _ in range(3):
+            assert await ai_service._get_or_create_system_instruction_cache(
+                TaskType.QUERY_REWRITE, "gemini-2.5-flash", SYSTEM_PROMPT
+            ) is None
+        assert create.await_count == 1
+
+        clock[0] = 301
+        await ai_service._get_or_create_system_instruction_cache(
+            TaskType.QUERY_REWRITE, "gemini-2.5-flash", SYSTEM_PROMPT
+        )
+        assert create.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_system_instruction_caches_evict_least_recently_used(cache_settings):
+    """測試本地系統指令緩存超出上限時淘汰最久未使用的條目"""
+    from app.services.ai.unified_ai_service_simplified import UnifiedAIServiceSimplified
+
+    service = GoogleContextCacheService()
+    ai_service = UnifiedAIServiceSimplified()
+    ai_service.context_cache_service = service
+    ai_service._system_instruction_caches = LRUCache(maxsize=2)
+
+    prompts = [SYSTEM_PROMPT + suffix for suffix in ("甲", "乙", "丙")]
+    first = await ai_service._get_or_create_system_instruction_cache(TaskType.QUERY_REWRITE, "gemini-2.5-flash", prompts[0])
+    await ai_service._get_or_create_system_instruction_cache(TaskType.QUERY_REWRITE, "gemini-2.5-flash", prompts[1])
+    # 再次使用第一個，使第二個成為最久未使用
+    again = await ai_service._get_or_create_system_instruction_cache(TaskType.QUERY_REWRITE, "gemini-2.5-flash", prompts[0])
+    await ai_service._get_or_create_system_instruction_cache(TaskType.QUERY_REWRITE, "gemini-2.5-flash", prompts[2])
+
+    assert again is first
+    assert len(ai_service._system_instruction_caches) == 2
+    assert first in ai_service._system_instruction_caches.values()
+    assert service.usage_stats.created == 3
+
+
+@pytest.mark.asyncio
+async def test_google_backend_reuses_created_cached_content(cache_settings):
+    """測試 Google 後端保存創建時的 CachedContent，取用時不再請求遠端"""
+    cached = MagicMock()
+    cached.name = "cachedContents/abc"
+    cached.usage_metadata.total_token_count = 1200
+
+    with patch(f"{MODULE}.genai_caching") as mock_caching:
+        mock_caching.CachedContent.create.return_value = cached
+        backend = GoogleContextCacheBackend()
+        cache_id, tokens = await backend.create("gemini-2.5-flash", SYSTEM_PROMPT, 3600, "system_instruction")
+
+        assert (cache_id, tokens) == ("cachedContents/abc", 1200)
+        assert await backend.get_cached_content(cache_id) is cached
+        mock_caching.CachedContent.get.assert_not_called()
+
+        backend.forget(cache_id)
+        assert await backend.get_cached_content(cache_id) is mock_caching.CachedContent.get.return_value
+
+
+@pytest.mark.asyncio
+async def test_google_provider_builds_model_from_cached_content():
+    """測試帶緩存 ID 的調用以 GenerativeModel.from_cached_content 構建模型"""
+    from app.services.ai.llm_providers import GoogleAIProvider
+
+    cached = MagicMock()
+    with patch("app.services.ai.llm_providers.genai") as mock_genai, \
+         patch(f"{MODULE}.google_context_cache_service.get_cached_content", AsyncMock(return_value=cached)):
+        model = mock_genai.GenerativeModel.from_cached_content.return_value
+        model.generate_content_async = AsyncMock(return_value="response")
+
+        result = await GoogleAIProvider().generate(
+            TaskType.QUERY_REWRITE, "gemini-2.5-flash", ["<user_query>合約</user_query>"],
+            {"temperature": 0}, {}, cached_content="cachedContents/abc"
+        )
+
+    assert result == "response"
+    mock_genai.GenerativeModel.from_cached_content.assert_called_once_with(
+        cached, generation_config={"temperature": 0}, safety_settings={}
+    )
+    mock_genai.GenerativeModel.assert_not_called()
@@ -0,0 +1,170 @@
+"""
+詳細查詢計劃緩存單元測試
+
+測試目標:
+1. 相似度達到閾值且意圖、欄位簽名相同時命中，否則不命中
+2. 帶 sub_filter 的查詢不保存為計劃
+3. 重複的問題形態跳過 LLM，命中率被統計
+4. 重用的計劃沒有查到數據時被移除
+5. 新生成的查詢只返回 _id 時不保存為計劃
+"""
+
+import uuid
+import numpy as np
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.models.ai_models_simplified import AIMongoDBQueryDetailOutput
+from app.services.qa_core.detail_query_plan_cache import (
+    DetailQueryPlanCache,
+    PlanContext,
+    schema_signature
+)
+from app.services.qa_core.qa_document_processor import QADocumentProcessor
+
+pytestmark = pytest.mark.unit
+
+MODULE = "app.services.qa_core.detail_query_plan_cache"
+PROCESSOR_MODULE = "app.services.qa_core.qa_document_processor"
+
+
+@pytest.fixture
+def plan_settings():
+    with patch(f"{MODULE}.settings") as mock_settings:
+        mock_settings.DETAIL_QUERY_PLAN_CACHE_ENABLED = True
+        mock_settings.DETAIL_QUERY_PLAN_SIMILARITY_THRESHOLD = 0.9
+        mock_settings.DETAIL_QUERY_PLAN_TTL_SECONDS = 3600
+        mock_settings.DETAIL_QUERY_PLAN_MAX_BUCKETS = 100
+        mock_settings.DETAIL_QUERY_PLAN_MAX_PER_BUCKET = 5
+        yield mock_settings
+
+
+@pytest.fixture
+def processor_settings():
+    with patch(f"{PROCESSOR_MODULE}.settings") as mock_settings:
+        mock_settings.QA_DETAIL_QUERY_MAX_CONCURRENCY = 5
+        mock_settings.QA_DETAIL_QUERY_BATCHING_ENABLED = False
+        yield mock_settings
+
+
+def _context(question: str, vector, intent: str = "document_detail_query", owner: str = "user-1") -> PlanContext:
+    vector = np.asarray(vector, dtype=float)
+    return PlanContext(owner_id=owner, intent=intent, question=question, question_vector=vector / np.linalg.norm(vector))
+
+
+def _components(**kwargs) -> AIMongoDBQueryDetailOutput:
+    return AIMongoDBQueryDetailOutput(projection={"analysis.ai_analysis_output.key_information.amounts_mentioned": 1}, **kwargs)
+
+
+def test_lookup_requires_similarity_intent_and_signature(plan_settings):
+    """測試只有相似問題、相同意圖與欄位簽名時命中"""
+    cache = DetailQueryPlanCache()
+    signature = schema_signature({"content_type": "帳單", "fields": ["dynamic_fields.金額"]})
+    cache.store(_context("總金額是多少", [1.0, 0.0]), signature, _components())
+
+    assert cache.lookup(_context("金額總共多少", [0.95, 0.1]), signature) is not None
+    assert cache.lookup(_context("繳費期限是哪天", [0.2, 1.0]), signature) is None
+    assert cache.lookup(_context("金額總共多少", [0.95, 0.1], intent="complex_analysis"), signature) is None
+    assert cache.lookup(_context("金額總共多少", [0.95, 0.1]), schema_signature({"fields": []})) is None
+
+    stats = cache.get_statistics()
+    assert stats["hits"] == 1 and stats["lookups"] == 4 and stats["hit_rate"] == 25.0
+
+
+def test_sub_filter_queries_are_not_stored(plan_settings):
+    """測試帶 sub_filter 的查詢不保存為計劃"""
+    cache = DetailQueryPlanCache()
+    stored = cache.store(_context("王小明的金額", [1.0, 0.0]), "sig", _components(sub_filter={"owner": "王小明"}))
+
+    assert not stored
+    assert cache.get_statistics()["plans"] == 0
+
+
+def _mock_service():
+    async def _generate(user_question, document_id, **kwargs):
+        return SimpleNamespace(success=True, output_data=_components(), token_usage=None, error_message=None)
+
+    service = MagicMock()
+    service.generate_mongodb_detail_query = AsyncMock(side_effect=_generate)
+    return service
+
+
+def _mock_db(found: bool = True):
+    async def _find_one(mongo_filter, projection=None):
+        if "extracted_text" in (projection or {}):
+            return {"_id": mongo_filter["_id"], "extracted_text": "全文", "projection": projection}
+        if not found:
+            # projection 請求的欄位不存在時 MongoDB 仍返回 _id
+            return {"_id": mongo_filter["_id"]}
+        amounts = {"analysis": {"ai_analysis_output": {"key_information": {"amounts_mentioned": [100]}}}}
+        return {"_id": mongo_filter["_id"], **amounts, "projection": projection}
+
+    db = MagicMock()
+    db.documents.find_one = AsyncMock(side_effect=_find_one)
+    return db
+
+
+@pytest.mark.asyncio
+async def test_repeated_question_shape_skips_llm(plan_settings, processor_settings):
+    """測試相同形態的問題對其他文檔重用計劃，不再調用 LLM"""
+    cache = DetailQueryPlanCache()
+    service = _mock_service()
+    contexts = iter([_context("總金額是多少", [1.0, 0.0]), _context("金額合計多少", [0.97, 0.05])])
+    cache.build_context = AsyncMock(side_effect=lambda *args: next(contexts))
+    processor = QADocumentProcessor()
+
+    with patch(f"{PROCESSOR_MODULE}.unified_ai_service_simplified", service), \
+         patch(f"{PROCESSOR_MODULE}.detail_query_plan_cache", cache):
+        first = await processor.query_documents_details(
+            db=_mock_db(), documents=[SimpleNamespace(id=uuid.uuid4(), filename="a.pdf")],
+            user_question="總金額是多少", document_schema_info={}, user_id="user-1", intent="document_detail_query"
+        )
+        second = await processor.query_documents_details(
+            db=_mock_db(), documents=[SimpleNamespace(id=uuid.uuid4(), filename="b.pdf")],
+            user_question="金額合計多少", document_schema_info={}, user_id="user-1", intent="document_detail_query"
+        )
+        plan_stats = processor.get_detail_query_statistics()["plan_cache"]
+
+    assert service.generate_mongodb_detail_query.await_count == 1
+    assert first[0]["projection"] == second[0]["projection"]
+    assert plan_stats["hits"] == 1 and plan_stats["stores"] == 1 and plan_stats["hit_rate"] == 50.0
+
+
+@pytest.mark.asyncio
+async def test_plan_without_data_is_invalidated(plan_settings, processor_settings):
+    """測試重用的計劃沒有查到數據時回退並移除計劃"""
+    cache = DetailQueryPlanCache()
+    context = _context("總金額是多少", [1.0, 0.0])
+    cache.build_context = AsyncMock(return_value=context)
+    document = SimpleNamespace(id=uuid.uuid4(), filename="a.pdf")
+    cache.store(context, schema_signature(QADocumentProcessor._compact_document_schema(document)), _components())
+
+    with patch(f"{PROCESSOR_MODULE}.unified_ai_service_simplified", _mock_service()), \
+         patch(f"{PROCESSOR_MODULE}.detail_query_plan_cache", cache):
+        results = await QADocumentProcessor().query_documents_details(
+            db=_mock_db(found=False), documents=[document],
+            user_question="總金額是多少", document_schema_info={}, user_id="user-1", intent="document_detail_query"
+        )
+
+    assert "extracted_text" in results[0]["projection"]
+    assert cache.get_statistics()["invalidations"] == 1
+    assert cache.get_statistics()["plans"] == 0
+
+
+@pytest.mark.asyncio
+async def test_empty_projection_result_is_not_cached(plan_settings, processor_settings):
+    """測試新生成的查詢只查到 _id 時回退且不保存計劃"""
+    cache = DetailQueryPlanCache()
+    cache.build_context = AsyncMock(return_value=_context("總金額是多少", [1.0, 0.0]))
+
+    with patch(f"{PROCESSOR_MODULE}.unified_ai_service_simplified", _mock_service()), \
+         patch(f"{PROCESSOR_MODULE}.detail_query_plan_cache", cache):
+        results = await QADocumentProcessor().query_documents_details(
+            db=_mock_db(found=False), documents=[SimpleNamespace(id=uuid.uuid4(), filename="a.pdf")],
+            user_question="總金額是多少", document_schema_info={}, user_id="user-1", intent="document_detail_query"
+        )
+
+    assert "extracted_text" in results[0]["projection"]
+    assert cache.get_statistics()["stores"] == 0
+    assert cache.get_statistics()["plans"] == 0
@@ -0,0 +1,184 @@
+"""
+文檔批量刪除單元測試
+
+測試目標:
+1. 一次 $in 查詢區分可刪除、不存在與無權限的文檔
+2. 每批一次 delete_many（帶 owner_id）、一次外置內容刪除與一次向量刪除
+3. 文件提交到後台線程池刪除；郵件目錄整體刪除
+4. 向量刪除失敗時記錄仍刪除並在明細中註明
+5. 欄位目錄扣減支持同一欄位出現多次
+6. delete_many 未刪除的文檔不標記為已刪除，也不刪除其向量與文件；整批都已消失時繼續處理後續批次
+"""
+
+import sys
+import uuid
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.services.document import document_bulk_delete_service as bulk_module
+from app.services.document.document_bulk_delete_service import DocumentBulkDeleteService
+from app.services.document.field_catalog_service import FieldCatalogService
+
+pytestmark = pytest.mark.unit
+
+MODULE = "app.services.document.document_bulk_delete_service"
+
+
+def _mock_db(found):
+    documents = MagicMock()
+    documents.find.return_value.to_list = AsyncMock(return_value=found)
+    documents.delete_many = AsyncMock(side_effect=lambda query: SimpleNamespace(deleted_count=len(query["_id"]["$in"])))
+    db = MagicMock()
+    db.__getitem__.return_value = documents
+    return db, documents
+
+
+@pytest.fixture
+def bulk_env():
+    vector_service = MagicMock()
+    vector_service.delete_by_document_ids_batch.return_value = True
+    with patch(f"{MODULE}.settings") as mock_settings, \
+         patch(f"{MODULE}.log_event", new_callable=AsyncMock), \
+         patch(f"{MODULE}.delete_document_contents", new_callable=AsyncMock) as mock_contents, \
+         patch(f"{MODULE}.field_catalog_service") as mock_catalog, \
+         patch.dict(sys.modules, {"app.services.vector.vector_db_service": SimpleNamespace(vector_db_service=vector_service)}):
+        mock_settings.DOCUMENT_BULK_DELETE_BATCH_SIZE = 2
+        mock_settings.DOCUMENT_FILE_DELETE_WORKERS = 2
+        mock_catalog.remove_document_fields = AsyncMock()
+        yield SimpleNamespace(vectors=vector_service, contents=mock_contents, catalog=mock_catalog)
+
+
+@pytest.mark.asyncio
+async def test_ownership_checked_with_single_query(bulk_env):
+    """測試一次 $in 查詢區分可刪除、不存在與無權限"""
+    owner_id = uuid.uuid4()
+    mine, others, missing = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    db, documents = _mock_db([
+        {"_id": mine, "owner_id": owner_id},
+        {"_id": others, "owner_id": uuid.uuid4()},
+    ])
+
+    owned, rejected = await DocumentBulkDeleteService().check_ownership(db, owner_id, [mine, others, missing, mine])
+
+    assert documents.find.call_count == 1
+    assert documents.find.call_args.args[0] == {"_id": {"$in": [mine, others, missing]}}
+    assert [raw["_id"] for raw in owned] == [mine]
+    assert {(detail.id, detail.status) for detail in rejected} == {(others, "forbidden"), (missing, "not_found")}
+
+
+@pytest.mark.asyncio
+async def test_deletes_in_batches(bulk_env, tmp_path):
+    """測試按批刪除記錄、內容、欄位目錄與向量，文件在後台線程池刪除"""
+    owner_id = uuid.uuid4()
+    ids = [uuid.uuid4() for _ in range(3)]
+    upload = tmp_path / "a.pdf"
+    upload.write_bytes(b"x")
+    email_dir = tmp_path / "emails" / str(ids[1])
+    email_dir.mkdir(parents=True)
+    (email_dir / "content.txt").write_text("body")
+    (email_dir / "full.eml").write_text("eml")
+    db, documents = _mock_db([
+        {"_id": ids[0], "owner_id": owner_id, "file_path": str(upload), "catalog_field_paths": ["a", "b"]},
+        {"_id": ids[1], "owner_id": owner_id, "file_path": str(email_dir / "content.txt"), "catalog_field_paths": ["a"]},
+        {"_id": ids[2], "owner_id": owner_id},
+    ])
+    progress = AsyncMock()
+
+    result = await DocumentBulkDeleteService().delete_documents(
+        db, owner_id, ids, progress_callback=progress, wait_for_files=True
+    )
+
+    assert result.deleted == 3 and result.vector_failures == 0 and result.files_scheduled == 2
+    assert [call.args[0] for call in documents.delete_many.call_args_list] == [
+        {"_id": {"$in": ids[:2]}, "owner_id": owner_id},
+        {"_id": {"$in": ids[2:]}, "owner_id": owner_id},
+    ]
+    assert bulk_env.contents.await_count == 2
+    assert bulk_env.catalog.remove_document_fields.call_args_list[0].args[2] == ["a", "b", "a"]
+    assert [call.args[0] for call in bulk_env.vectors.delete_by_document_ids_batch.call_args_list] == [
+        [str(ids[0]), str(ids[1])], [str(ids[2])]
+    ]
+    assert [call.args[0] for call in progress.call_args_list] == [66, 100]
+    assert not upload.exists() and not email_dir.exists()
+    assert all(detail.status == "deleted" for detail in result.details)
+
+
+@pytest.mark.asyncio
+async def test_vector_failure_keeps_deletion(bulk_env):
+    """測試向量刪除失敗時記錄仍刪除並註明"""
+    owner_id = uuid.uuid4()
+    document_id = uuid.uuid4()
+    bulk_env.vectors.delete_by_document_ids_batch.return_value = False
+    db, _ = _mock_db([{"_id": document_id, "owner_id": owner_id}])
+
+    result = await DocumentBulkDeleteService().delete_documents(db, owner_id, [document_id])
+
+    assert result.deleted == 1 and result.vector_failures == 1
+    assert result.details[0].status == "deleted" and "向量" in result.details[0].message
+
+
+@pytest.mark.asyncio
+async def test_only_removed_documents_marked_deleted(bulk_env):
+    """測試權限檢查後被轉移的文檔未被刪除時，明細與向量刪除只包含實際刪除的文檔"""
+    owner_id = uuid.uuid4()
+    removed_id, transferred_id = uuid.uuid4(), uuid.uuid4()
+    db, documents = _mock_db([
+        {"_id": removed_id, "owner_id": owner_id},
+        {"_id": transferred_id, "owner_id": owner_id},
+    ])
+    documents.delete_many = AsyncMock(return_value=SimpleNamespace(deleted_count=1))
+    # 第一次 find 為權限檢查，第二次為刪除後仍存在的文檔
+    documents.find.return_value.to_list = AsyncMock(side_effect=[
+        [{"_id": removed_id, "owner_id": owner_id}, {"_id": transferred_id, "owner_id": owner_id}],
+        [{"_id": transferred_id}],
+    ])
+
+    result = await DocumentBulkDeleteService().delete_documents(db, owner_id, [removed_id, transferred_id])
+
+    assert result.deleted == 1
+    assert {(detail.id, detail.status) for detail in result.details} == {
+        (removed_id, "deleted"), (transferred_id, "not_found")
+    }
+    assert bulk_env.vectors.delete_by_document_ids_batch.call_args.args[0] == [str(removed_id)]
+    assert bulk_env.contents.call_args.args[1] == [removed_id]
+
+
+@pytest.mark.asyncio
+async def test_batch_with_nothing_deleted_continues(bulk_env):
+    """測試整批文檔在檢查後都已不屬於當前用戶時跳過清理，後續批次照常刪除並回報進度"""
+    owner_id = uuid.uuid4()
+    ids = [uuid.uuid4() for _ in range(3)]
+    db, documents = _mock_db([{"_id": document_id, "owner_id": owner_id} for document_id in ids])
+    documents.delete_many = AsyncMock(side_effect=[
+        SimpleNamespace(deleted_count=0), SimpleNamespace(deleted_count=1)
+    ])
+    # 第一次 find 為權限檢查，第二次為第一批刪除後仍存在的文檔
+    documents.find.return_value.to_list = AsyncMock(side_effect=[
+        [{"_id": document_id, "owner_id": owner_id} for document_id in ids],
+        [{"_id": ids[0]}, {"_id": ids[1]}],
+    ])
+    progress = AsyncMock()
+
+    result = await DocumentBulkDeleteService().delete_documents(db, owner_id, ids, progress_callback=progress)
+
+    assert result.deleted == 1
+    assert {(detail.id, detail.status) for detail in result.details} == {
+        (ids[0], "not_found"), (ids[1], "not_found"), (ids[2], "deleted")
+    }
+    assert [call.args[0] for call in bulk_env.vectors.delete_by_document_ids_batch.call_args_list] == [[str(ids[2])]]
+    assert [call.args[0] for call in progress.call_args_list] == [66, 100]
+
+
+def test_catalog_removal_counts_repeated_paths():
+    """測試同一欄位被多個文檔計入時一次扣減多次"""
+    with patch("app.services.document.field_catalog_service.settings"):
+        update = FieldCatalogService()._build_update({}, [], ["amounts.total", "amounts.total", "vendor"])
+
+    counts = update["$inc"]
+    assert sorted(counts.values()) == [-2, -1]
+
+
+def test_module_exports_global_instance():
+    """測試模組提供全局實例"""
+    assert isinstance(bulk_module.document_bulk_delete_service, DocumentBulkDeleteService)
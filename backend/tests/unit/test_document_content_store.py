@@ -0,0 +1,193 @@
+"""
+文檔內容外置單元測試
+
+測試目標:
+1. 更新拆分：提取文本與分析中間結果移到外置內容，documents 只保留可查詢欄位並加上標記
+2. 外置內容寫入後可讀回；部分更新只替換對應的鍵
+3. 投影查詢的結果只補充投影請求的外置欄位，並移除查詢時附加的標記
+4. 未標記的文檔不額外查詢 document_contents
+5. zstd 壓縮的內容可以解壓讀回
+6. 遷移腳本按鍵取出內容、遷回時內嵌值優先
+"""
+
+import uuid
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.crud import crud_document_contents
+from app.crud.crud_document_contents import (
+    CONTENT_MARKER_FIELD,
+    hydrate_raw_document,
+    load_document_content,
+    save_document_content,
+    split_heavy_fields,
+    with_content_marker,
+)
+from app.db.migrate_document_contents import _restore_update, extract_heavy_content
+
+pytestmark = pytest.mark.unit
+
+MODULE = "app.crud.crud_document_contents"
+
+
+class _FakeContents:
+    """只支持 _id 查詢與 $set 的內存集合"""
+
+    def __init__(self):
+        self.docs = {}
+        self.find_one = AsyncMock(side_effect=self._find_one)
+        self.update_one = AsyncMock(side_effect=self._update_one)
+
+    async def _find_one(self, query):
+        return self.docs.get(query["_id"])
+
+    async def _update_one(self, query, update, upsert=False):
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"]})
+        for path, value in update["$set"].items():
+            target = doc
+            *parents, leaf = path.split(".")
+            for part in parents:
+                target = target.setdefault(part, {})
+            target[leaf] = value
+
+
+def _mock_db():
+    contents = _FakeContents()
+    db = MagicMock()
+    db.__getitem__.side_effect = lambda name: contents
+    return db, contents
+
+
+@pytest.fixture
+def store_settings():
+    with patch(f"{MODULE}.settings") as mock_settings:
+        mock_settings.DOCUMENT_CONTENT_STORE_ENABLED = True
+        mock_settings.DOCUMENT_CONTENT_COMPRESSION = "none"
+        mock_settings.DOCUMENT_CONTENT_COMPRESSION_LEVEL = 3
+        yield mock_settings
+
+
+def test_split_moves_heavy_fields(store_settings):
+    """測試更新拆分：重欄位外置，可查詢的分析欄位保留在 documents"""
+    inline, unset, content = split_heavy_fields({
+        "status": "analysis_completed",
+        "extracted_text": "全文" * 100,
+        "analysis": {"tokens_used": 10, "ai_analysis_output": {
+            "key_information": {"content_summary": "摘要"},
+            "extracted_text": "OCR 文字",
+            "intermediate_analysis": {"step": 1}
+        }}
+    })
+
+    assert inline["status"] == "analysis_completed"
+    assert "extracted_text" not in inline
+    assert inline["analysis"]["ai_analysis_output"] == {"key_information": {"content_summary": "摘要"}}
+    assert inline["analysis"]["tokens_used"] == 10
+    assert inline[CONTENT_MARKER_FIELD] is True
+    assert unset == {"extracted_text": ""}
+    assert content["extracted_text"] == "全文" * 100
+    assert content["analysis_extras"] == {"extracted_text": "OCR 文字", "intermediate_analysis": {"step": 1}}
+
+
+def test_split_leaves_light_updates_untouched(store_settings):
+    """測試不含重欄位的更新保持原樣，也不加標記"""
+    update = {"status": "analyzing", "vector_status": "processing"}
+
+    inline, unset, content = split_heavy_fields(update)
+
+    assert inline == update
+    assert unset == {} and content == {}
+
+
+@pytest.mark.asyncio
+async def test_save_and_load_roundtrip(store_settings):
+    """測試寫入後讀回，部分更新只替換對應的鍵"""
+    db, _ = _mock_db()
+    document_id = uuid.uuid4()
+    _, _, content = split_heavy_fields({
+        "extracted_text": "全文",
+        "analysis": {"ai_analysis_output": {"extracted_text": "OCR", "intermediate_analysis": {"step": 1}}}
+    })
+
+    await save_document_content(db, document_id, content)
+    _, _, partial = split_heavy_fields({"analysis.ai_analysis_output.intermediate_analysis": {"step": 2}})
+    await save_document_content(db, document_id, partial)
+
+    loaded = await load_document_content(db, document_id)
+    assert loaded == {
+        "extracted_text": "全文",
+        "analysis_extras": {"extracted_text": "OCR", "intermediate_analysis": {"step": 2}}
+    }
+
+
+@pytest.mark.asyncio
+async def test_hydrate_respects_projection(store_settings):
+    """測試投影查詢只補充請求的外置欄位並移除標記"""
+    db, _ = _mock_db()
+    document_id = uuid.uuid4()
+    await save_document_content(db, document_id, {
+        "extracted_text": "全文",
+        "analysis_extras": {"intermediate_analysis": {"amounts": {"total": 1280}, "notes": "略"}}
+    })
+    projection = with_content_marker({
+        "_id": 1,
+        "analysis.ai_analysis_output.intermediate_analysis.amounts": 1
+    })
+    assert projection[CONTENT_MARKER_FIELD] == 1
+
+    raw = await hydrate_raw_document(db, {"_id": document_id, CONTENT_MARKER_FIELD: True}, projection)
+
+    assert raw == {"_id": document_id, "analysis": {"ai_analysis_output": {
+        "intermediate_analysis": {"amounts": {"total": 1280}}
+    }}}
+
+
+@pytest.mark.asyncio
+async def test_unmarked_document_is_not_hydrated(store_settings):
+    """測試未標記的文檔不查詢 document_contents，排除式投影不加標記"""
+    db, contents = _mock_db()
+    raw = {"_id": uuid.uuid4(), "extracted_text": "內嵌全文"}
+
+    result = await hydrate_raw_document(db, raw, with_content_marker({"_id": 1, "extracted_text": 1}))
+
+    assert result == raw
+    contents.find_one.assert_not_awaited()
+    assert with_content_marker({"analysis": 0}) == {"analysis": 0}
+
+
+@pytest.mark.asyncio
+async def test_zstd_roundtrip(store_settings):
+    """測試 zstd 壓縮的內容可以解壓讀回"""
+    if not crud_document_contents.ZSTD_AVAILABLE:
+        pytest.skip("zstandard 未安裝")
+    store_settings.DOCUMENT_CONTENT_COMPRESSION = "zstd"
+    db, contents = _mock_db()
+    document_id = uuid.uuid4()
+
+    await save_document_content(db, document_id, {"extracted_text": "重複的內容" * 500})
+
+    assert contents.docs[document_id]["extracted_text"]["codec"] == "zstd"
+    assert (await load_document_content(db, document_id))["extracted_text"] == "重複的內容" * 500
+
+
+def test_migration_extract_and_restore():
+    """測試遷移取出內容與遷回時內嵌值優先"""
+    raw = {
+        "_id": uuid.uuid4(),
+        "extracted_text": "全文",
+        "analysis": {"ai_analysis_output": {"intermediate_analysis": {"step": 1}}}
+    }
+
+    assert extract_heavy_content(raw) == {
+        "extracted_text": "全文",
+        "analysis_extras_partial": {"intermediate_analysis": {"step": 1}}
+    }
+
+    restored = _restore_update(
+        {"_id": raw["_id"], "extracted_text": "新內嵌全文", "analysis": {"ai_analysis_output": {}}},
+        {"extracted_text": "舊全文", "analysis_extras": {"intermediate_analysis": {"step": 1}}}
+    )
+    assert restored == {
+        CONTENT_MARKER_FIELD: False,
+        "analysis.ai_analysis_output.intermediate_analysis": {"step": 1}
+    }
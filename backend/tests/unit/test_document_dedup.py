@@ -0,0 +1,178 @@
+"""
+文檔內容去重單元測試
+
+測試目標:
+1. 去重模式：用戶設定優先，未設定時使用系統預設，無法識別時關閉
+2. 相同內容的候選文檔按用戶範圍查詢，優先已完成分析與向量化的
+3. clone 複製分析結果與向量並累計節省的調用；來源未完成分析時只記錄 duplicate_of
+4. link 合併標籤並返回已有文檔
+5. 轉發郵件與原郵件的內容指紋相同；正文為空的郵件沒有指紋，不參與去重
+"""
+
+import sys
+import uuid
+import pytest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.models.document_models import Document
+from app.models.email_models import EmailMessage
+from app.models.user_models import DocumentDedupMode
+from app.services.document.document_dedup_service import DocumentDedupService
+from app.services.document.email_document_processor import email_content_sha256
+
+pytestmark = pytest.mark.unit
+
+MODULE = "app.services.document.document_dedup_service"
+
+
+def _document(**overrides) -> Document:
+    values = {
+        "id": uuid.uuid4(), "owner_id": uuid.uuid4(), "filename": "invoice.pdf",
+        "created_at": datetime(2024, 5, 1), "updated_at": datetime(2024, 5, 1)
+    }
+    values.update(overrides)
+    return Document(**values)
+
+
+def _email(body: str, email_id: str = "m1") -> EmailMessage:
+    return EmailMessage(
+        email_id=email_id, message_id=f"<{email_id}>", thread_id=email_id, subject="帳單",
+        from_address="a@example.com", date=datetime(2024, 5, 1), body=body, snippet=""
+    )
+
+
+@pytest.fixture
+def dedup_service():
+    with patch(f"{MODULE}.settings") as mock_settings, \
+         patch(f"{MODULE}.log_event", new_callable=AsyncMock), \
+         patch(f"{MODULE}.field_catalog_service") as mock_catalog:
+        mock_settings.DOCUMENT_DEDUP_DEFAULT_MODE = "clone"
+        mock_catalog.record_document_fields = AsyncMock()
+        yield DocumentDedupService()
+
+
+def test_resolve_mode(dedup_service):
+    """測試用戶設定優先於系統預設"""
+    assert dedup_service.resolve_mode(SimpleNamespace(document_dedup_mode=None)) == DocumentDedupMode.CLONE
+    assert dedup_service.resolve_mode(SimpleNamespace(document_dedup_mode=DocumentDedupMode.LINK)) == DocumentDedupMode.LINK
+    assert dedup_service.resolve_mode(SimpleNamespace(document_dedup_mode="bogus")) == DocumentDedupMode.OFF
+
+
+@pytest.mark.asyncio
+async def test_find_duplicate_prefers_processed(dedup_service):
+    """測試候選文檔按用戶與指紋查詢，優先返回已完成分析與向量化的"""
+    owner_id = uuid.uuid4()
+    pending = {"_id": uuid.uuid4(), "status": "uploaded"}
+    analyzed = {"_id": uuid.uuid4(), "status": "analysis_completed", "vector_status": "not_vectorized"}
+    vectorized = {"_id": uuid.uuid4(), "status": "analysis_completed", "vector_status": "vectorized"}
+    collection = MagicMock()
+    collection.find.return_value.sort.return_value.limit.return_value.to_list = AsyncMock(
+        return_value=[pending, analyzed, vectorized]
+    )
+    db = MagicMock()
+    db.__getitem__.return_value = collection
+
+    found = await dedup_service.find_duplicate(db, owner_id, "abc")
+
+    assert found is vectorized
+    assert collection.find.call_args.args[0] == {"owner_id": owner_id, "content_sha256": "abc"}
+    assert await dedup_service.find_duplicate(db, owner_id, None) is None
+    assert dedup_service.stats.checked == 1 and dedup_service.stats.duplicates == 1
+
+
+@pytest.mark.asyncio
+async def test_clone_copies_results_and_vectors(dedup_service):
+    """測試 clone 複製分析結果與向量，不觸發 AI 調用"""
+    target = _document()
+    source_id = uuid.uuid4()
+    source_raw = {
+        "_id": source_id, "owner_id": target.owner_id, "status": "analysis_completed", "vector_status": "vectorized",
+        "extracted_text": "全文", "enriched_data": {"title": "電費"},
+        "analysis": {"tokens_used": 1200, "ai_analysis_output": {"key_information": {"content_summary": "摘要"}}},
+    }
+    collection = MagicMock()
+    collection.find_one = AsyncMock(return_value=source_raw)
+    db = MagicMock()
+    db.__getitem__.return_value = collection
+    fake_vector_module = SimpleNamespace(vector_db_service=MagicMock())
+    fake_vector_module.vector_db_service.copy_document_vectors.return_value = 3
+
+    with patch.dict(sys.modules, {"app.services.vector.vector_db_service": fake_vector_module}), \
+         patch(f"{MODULE}.crud_documents.update_document", new_callable=AsyncMock) as mock_update:
+        mock_update.return_value = _document(id=target.id, owner_id=target.owner_id, status="analysis_completed")
+        cloned = await dedup_service.clone_document(db, source=source_raw, target=target)
+
+    assert cloned.status == "analysis_completed"
+    update_data = mock_update.call_args.args[2]
+    assert update_data["extracted_text"] == "全文"
+    assert update_data["analysis"] == source_raw["analysis"]
+    assert update_data["enriched_data"] == {"title": "電費"}
+    assert update_data["vector_status"] == "vectorized"
+    assert update_data["metadata.duplicate_of"] == str(source_id)
+    fake_vector_module.vector_db_service.copy_document_vectors.assert_called_once_with(
+        str(source_id), str(target.id), str(target.owner_id)
+    )
+    statistics = dedup_service.get_statistics()
+    assert statistics["cloned"] == 1
+    assert statistics["saved_analysis_calls"] == 1
+    assert statistics["saved_enrichment_calls"] == 1
+    assert statistics["saved_embedding_calls"] == 3
+    assert statistics["saved_tokens"] == 1200
+
+
+@pytest.mark.asyncio
+async def test_clone_of_unprocessed_source_only_marks(dedup_service):
+    """測試來源文檔未完成分析時只記錄 duplicate_of"""
+    target = _document()
+    with patch(f"{MODULE}.crud_documents.update_document", new_callable=AsyncMock) as mock_update:
+        mock_update.return_value = target
+        await dedup_service.clone_document(MagicMock(), source={"_id": "src", "status": "uploaded"}, target=target)
+
+    assert mock_update.call_args.args[2] == {"metadata.duplicate_of": "src"}
+    assert dedup_service.stats.cloned == 0
+
+
+@pytest.mark.asyncio
+async def test_link_merges_tags(dedup_service):
+    """測試 link 合併新標籤並返回已有文檔"""
+    existing = {"_id": uuid.uuid4(), "status": "analysis_completed", "enriched_data": {"title": "電費"}}
+    collection = MagicMock()
+    collection.update_one = AsyncMock()
+    db = MagicMock()
+    db.__getitem__.return_value = collection
+
+    with patch(f"{MODULE}.refresh_document_search_terms", new_callable=AsyncMock), \
+         patch(f"{MODULE}.crud_documents.get_document_by_id", new_callable=AsyncMock) as mock_get:
+        mock_get.return_value = _document(id=existing["_id"])
+        document = await dedup_service.link_duplicate(db, existing, tags=["家庭"])
+
+    assert document.id == existing["_id"]
+    assert collection.update_one.call_args.args[1]["$addToSet"] == {"tags": {"$each": ["家庭"]}}
+    assert dedup_service.stats.linked == 1 and dedup_service.stats.saved_analysis_calls == 1
+
+
+def test_forwarded_email_fingerprint_matches_original():
+    """測試轉發郵件的指紋與原郵件相同"""
+    original = _email("本月電費 1280 元\r\n謝謝\r\n")
+    forwarded = _email(
+        "請參考\n\n---------- Forwarded message ---------\nFrom: 台電 <bill@example.com>\n"
+        "Date: 2024年5月1日\nSubject: 帳單\nTo: me@example.com\n\n\n本月電費 1280 元  \n謝謝",
+        email_id="m2"
+    )
+
+    assert email_content_sha256(forwarded) == email_content_sha256(original)
+    assert email_content_sha256(_email("另一張帳單")) != email_content_sha256(original)
+
+
+@pytest.mark.asyncio
+async def test_attachment_only_emails_are_not_deduplicated(dedup_service):
+    """測試只有附件（正文為空）的不同郵件沒有指紋，不會被判為重複"""
+    first = _email("", email_id="m1").model_copy(update={"attachments": [{"filename": "發票.pdf"}]})
+    second = _email(" \r\n ", email_id="m2").model_copy(update={"attachments": [{"filename": "合約.pdf"}]})
+    db = MagicMock()
+
+    assert email_content_sha256(first) is None and email_content_sha256(second) is None
+    assert await dedup_service.find_duplicate(db, uuid.uuid4(), email_content_sha256(second)) is None
+    db.__getitem__.assert_not_called()
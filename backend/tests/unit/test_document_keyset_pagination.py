@@ -0,0 +1,141 @@
+"""
+文檔列表游標分頁單元測試
+
+測試目標:
+1. 游標保留 datetime / UUID 類型，可完整還原
+2. 游標條件按排序方向比較，並正確處理 null / 缺失的排序鍵
+3. get_documents_page 不使用 skip，以 limit + 1 判斷下一頁，並與已有的 $or 過濾疊加
+4. 游標與排序方式不一致或格式無效時拋出 ValueError
+5. 列表總數緩存命中，並在用戶新增或刪除文檔時失效
+"""
+
+import uuid
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+from app.crud import crud_documents
+from app.crud.crud_documents import (
+    _keyset_condition,
+    count_documents_cached,
+    decode_page_cursor,
+    encode_page_cursor,
+    get_documents_page,
+    invalidate_document_count_cache
+)
+
+pytestmark = pytest.mark.unit
+
+
+def _raw_documents(owner_id, count):
+    base = datetime(2024, 5, 1, 12, 0, 0)
+    return [
+        {
+            "_id": uuid.uuid4(),
+            "owner_id": owner_id,
+            "filename": f"doc_{index}.pdf",
+            "created_at": base - timedelta(minutes=index),
+            "updated_at": base - timedelta(minutes=index),
+            "status": "uploaded"
+        }
+        for index in range(count)
+    ]
+
+
+def _mock_db(raw_documents):
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.limit.return_value = cursor
+    cursor.to_list = AsyncMock(return_value=raw_documents)
+    collection = MagicMock()
+    collection.find.return_value = cursor
+    db = MagicMock()
+    db.__getitem__.return_value = collection
+    return db, collection, cursor
+
+
+def test_cursor_round_trip_preserves_types():
+    """測試游標還原後排序鍵與 _id 保持 datetime / UUID 類型"""
+    document_id = uuid.uuid4()
+    created_at = datetime(2024, 5, 1, 12, 0, 0, 123000)
+
+    token = encode_page_cursor("created_at", "desc", {"_id": document_id, "created_at": created_at})
+    position = decode_page_cursor(token)
+
+    assert "=" not in token
+    assert position == {"s": "created_at", "o": "desc", "v": created_at, "i": document_id}
+
+
+def test_keyset_condition_handles_null_sort_keys():
+    """測試游標條件的比較方向與 null 排序鍵的處理"""
+    document_id = uuid.uuid4()
+
+    assert _keyset_condition("size", -1, 100, document_id) == {"$or": [
+        {"size": {"$lt": 100}}, {"size": 100, "_id": {"$lt": document_id}}, {"size": None}
+    ]}
+    assert _keyset_condition("size", 1, 100, document_id) == {"$or": [
+        {"size": {"$gt": 100}}, {"size": 100, "_id": {"$gt": document_id}}
+    ]}
+    assert _keyset_condition("size", 1, None, document_id) == {"$or": [
+        {"size": None, "_id": {"$gt": document_id}}, {"size": {"$ne": None}}
+    ]}
+    assert _keyset_condition("size", -1, None, document_id) == {"$or": [
+        {"size": None, "_id": {"$lt": document_id}}
+    ]}
+
+
+@pytest.mark.asyncio
+async def test_page_uses_keyset_instead_of_skip():
+    """測試首頁多取一條判斷下一頁，下一頁以游標條件疊加在已有過濾之上"""
+    owner_id = uuid.uuid4()
+    raw = _raw_documents(owner_id, 3)
+    db, collection, cursor = _mock_db(raw)
+
+    documents, next_cursor = await get_documents_page(db, owner_id=owner_id, limit=2)
+
+    assert [doc.id for doc in documents] == [raw[0]["_id"], raw[1]["_id"]]
+    cursor.sort.assert_called_with([("created_at", -1), ("_id", -1)])
+    cursor.limit.assert_called_with(3)
+    assert not cursor.skip.called
+    assert decode_page_cursor(next_cursor)["i"] == raw[1]["_id"]
+
+    cursor.to_list.return_value = raw[2:]
+    documents, last_cursor = await get_documents_page(
+        db, owner_id=owner_id, limit=2, cursor=next_cursor, clustering_status="pending"
+    )
+
+    query = collection.find.call_args.args[0]
+    assert query["owner_id"] == owner_id
+    assert "$or" in query  # 待分類過濾保持不變
+    assert query["$and"] == [_keyset_condition("created_at", -1, raw[1]["created_at"], raw[1]["_id"])]
+    assert [doc.id for doc in documents] == [raw[2]["_id"]]
+    assert last_cursor is None
+
+
+@pytest.mark.asyncio
+async def test_invalid_or_mismatched_cursor_is_rejected():
+    """測試無效或排序方式不一致的游標被拒絕"""
+    owner_id = uuid.uuid4()
+    db, _, _ = _mock_db([])
+    token = encode_page_cursor("created_at", "desc", {"_id": uuid.uuid4(), "created_at": datetime(2024, 5, 1)})
+
+    with pytest.raises(ValueError):
+        await get_documents_page(db, owner_id=owner_id, cursor=token, sort_by="filename")
+    with pytest.raises(ValueError):
+        await get_documents_page(db, owner_id=owner_id, cursor="not-a-cursor")
+
+
+@pytest.mark.asyncio
+async def test_count_cache_hits_and_invalidates(monkeypatch):
+    """測試列表總數緩存命中，用戶文檔變化後失效"""
+    owner_id = uuid.uuid4()
+    count_mock = AsyncMock(return_value=7)
+    monkeypatch.setattr(crud_documents, "count_documents", count_mock)
+
+    assert await count_documents_cached(MagicMock(), owner_id=owner_id, status_in=None) == 7
+    assert await count_documents_cached(MagicMock(), owner_id=owner_id, status_in=None) == 7
+    assert count_mock.await_count == 1
+
+    invalidate_document_count_cache(owner_id)
+    await count_documents_cached(MagicMock(), owner_id=owner_id, status_in=None)
+    assert count_mock.await_count == 2
@@ -0,0 +1,153 @@
+"""
+批量文檔處理調度器單元測試
+
+測試目標:
+1. 全局並發與單用戶並發不超過配置上限
+2. 多個用戶之間輪流調度，大量積壓的用戶不會擋住後來的用戶
+3. 已在隊列或處理中的文檔不會重複入隊
+4. 處理失敗（返回 False 或拋出異常）計入失敗，任務完成時寫入結果
+5. 任務狀態更新失敗不計為文檔處理失敗
+"""
+
+import asyncio
+import uuid
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.models.background_task_models import TaskStatus
+from app.services.document.document_processing_scheduler import DocumentProcessingScheduler
+
+pytestmark = pytest.mark.unit
+
+MODULE = "app.services.document.document_processing_scheduler"
+
+
+@pytest.fixture
+def task_manager():
+    with patch(f"{MODULE}.settings") as mock_settings, \
+         patch(f"{MODULE}.log_event", new_callable=AsyncMock), \
+         patch(f"{MODULE}.background_task_manager") as mock_manager:
+        mock_settings.DOCUMENT_PROCESSING_MAX_CONCURRENCY = 3
+        mock_settings.DOCUMENT_PROCESSING_PER_USER_CONCURRENCY = 2
+        mock_manager.create_task = AsyncMock(side_effect=lambda **kwargs: f"task-{kwargs['user_id'][:4]}")
+        mock_manager.update_task_status = AsyncMock()
+        mock_manager.update_task_progress = AsyncMock()
+        mock_manager.set_task_result = AsyncMock()
+        yield mock_manager
+
+
+async def _drain(scheduler: DocumentProcessingScheduler):
+    while scheduler._tasks:
+        await asyncio.gather(*list(scheduler._tasks))
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limits_and_round_robin(task_manager):
+    """測試並發上限與用戶之間輪流調度"""
+    scheduler = DocumentProcessingScheduler()
+    heavy_user, light_user = uuid.uuid4(), uuid.uuid4()
+    order = []
+    running = {"total": 0, "max_total": 0, heavy_user: 0, light_user: 0, "max_user": 0}
+    gate = asyncio.Event()
+
+    def processor(owner_id):
+        async def process(doc_id):
+            running["total"] += 1
+            running[owner_id] += 1
+            running["max_total"] = max(running["max_total"], running["total"])
+            running["max_user"] = max(running["max_user"], running[owner_id])
+            order.append(owner_id)
+            await gate.wait()
+            running["total"] -= 1
+            running[owner_id] -= 1
+            return True
+        return process
+
+    await scheduler.submit(None, heavy_user, [uuid.uuid4() for _ in range(10)], processor(heavy_user))
+    await scheduler.submit(None, light_user, [uuid.uuid4() for _ in range(2)], processor(light_user))
+    await asyncio.sleep(0)
+
+    # 積壓用戶只佔用單用戶上限，空出的位置給後來的用戶
+    assert order == [heavy_user, heavy_user, light_user]
+    assert scheduler.get_statistics()["queued"] == 9
+
+    gate.set()
+    await _drain(scheduler)
+
+    assert running["max_total"] <= 3 and running["max_user"] <= 2
+    assert order.count(light_user) == 2
+    # 輕量用戶的兩份文檔在積壓用戶處理完之前就已開始
+    assert max(i for i, owner in enumerate(order) if owner == light_user) < 6
+    assert scheduler.get_statistics()["succeeded"] == 12
+
+
+@pytest.mark.asyncio
+async def test_in_flight_documents_not_requeued(task_manager):
+    """測試已在隊列中的文檔不重複入隊"""
+    scheduler = DocumentProcessingScheduler()
+    owner_id = uuid.uuid4()
+    doc_ids = [uuid.uuid4() for _ in range(3)]
+    gate = asyncio.Event()
+
+    async def process(doc_id):
+        await gate.wait()
+        return True
+
+    await scheduler.submit(None, owner_id, doc_ids, process)
+    second = await scheduler.submit(None, owner_id, doc_ids + [uuid.uuid4()], process)
+
+    assert second.total == 1 and second.skipped == 3
+    gate.set()
+    await _drain(scheduler)
+    assert scheduler.stats.succeeded == 4
+
+
+@pytest.mark.asyncio
+async def test_failures_recorded_in_task_result(task_manager):
+    """測試失敗計數與任務結果"""
+    scheduler = DocumentProcessingScheduler()
+    owner_id = uuid.uuid4()
+    ok_id, failed_id, error_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+
+    async def process(doc_id):
+        if doc_id == error_id:
+            raise RuntimeError("boom")
+        return doc_id == ok_id
+
+    job = await scheduler.submit(None, owner_id, [ok_id, failed_id, error_id], process)
+    await _drain(scheduler)
+
+    assert (job.succeeded, job.failed) == (1, 2)
+    result = task_manager.set_task_result.call_args.args[2]
+    assert result["succeeded"] == 1 and result["failed"] == 2
+    assert set(result["failed_document_ids"]) == {str(failed_id), str(error_id)}
+    assert task_manager.update_task_status.call_args.args[2] == TaskStatus.COMPLETED
+    assert task_manager.update_task_progress.call_args.kwargs["progress"] == 100
+
+
+@pytest.mark.asyncio
+async def test_empty_submission_completes_immediately(task_manager):
+    """測試沒有可入隊的文檔時任務直接完成"""
+    scheduler = DocumentProcessingScheduler()
+
+    job = await scheduler.submit(None, uuid.uuid4(), [], AsyncMock())
+
+    assert job.total == 0
+    task_manager.update_task_status.assert_awaited_once()
+    assert task_manager.update_task_status.call_args.args[2] == TaskStatus.COMPLETED
+
+
+@pytest.mark.asyncio
+async def test_status_update_failure_not_counted_as_processing_failure(task_manager):
+    """測試標記運行中失敗時文檔仍被處理並計為成功"""
+    scheduler = DocumentProcessingScheduler()
+    task_manager.update_task_status = AsyncMock(side_effect=[RuntimeError("db down"), None])
+    process = AsyncMock(return_value=True)
+
+    job = await scheduler.submit(None, uuid.uuid4(), [uuid.uuid4(), uuid.uuid4()], process)
+    await _drain(scheduler)
+
+    assert process.await_count == 2
+    assert (job.succeeded, job.failed) == (2, 0)
+    assert task_manager.update_task_status.call_args_list[0].args[2] == TaskStatus.RUNNING
+    assert task_manager.update_task_status.call_args.args[2] == TaskStatus.COMPLETED
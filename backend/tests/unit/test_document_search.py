@@ -0,0 +1,121 @@
+"""
+文檔列表 n-gram 搜索單元測試
+
+測試目標:
+1. 中文取二元組、字母數字取三元組，不區分大小寫
+2. 任意子串的 n-gram 都包含在原文的 n-gram 中（預過濾不會漏掉正則能匹配的文檔）
+3. 搜索欄位由文件名、標籤與摘要構建，相關度只用文件名與標籤
+4. 過濾條件：q 使用 search_terms 的 $all，查詢詞太短時回退正則；filename_contains 開啟預過濾後保留正則複核
+5. 相關度排序使用聚合管道，游標分頁拒絕相關度排序
+"""
+
+import uuid
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.crud import crud_documents
+from app.crud.crud_document_search import (
+    SEARCH_SCORE_FIELD,
+    SEARCH_TERMS_FIELD,
+    SEARCH_TITLE_TERMS_FIELD,
+    build_search_terms,
+    text_ngrams,
+)
+
+pytestmark = pytest.mark.unit
+
+MODULE = "app.crud.crud_document_search"
+
+
+@pytest.fixture
+def search_settings():
+    with patch(f"{MODULE}.settings") as mock_settings:
+        mock_settings.DOCUMENT_SEARCH_FILENAME_PREFILTER = False
+        mock_settings.DOCUMENT_SEARCH_SUMMARY_MAX_CHARS = 500
+        mock_settings.DOCUMENT_SEARCH_FILENAME_MATCH_BOOST = 2.0
+        yield mock_settings
+
+
+def test_ngrams_mix_cjk_bigrams_and_latin_trigrams():
+    """測試中文二元組與英文數字三元組，統一小寫"""
+    assert text_ngrams("2024電費帳單_Report.PDF") == [
+        "電費", "費帳", "帳單", "202", "024", "rep", "epo", "por", "ort", "pdf"
+    ]
+    assert text_ngrams("帳") == []
+    assert text_ngrams(None) == []
+
+
+@pytest.mark.parametrize("text", ["2024年度電費帳單_Report.pdf", "台電-五月 Statement（最終版）.docx"])
+def test_substring_ngrams_are_subset(text):
+    """測試任意子串的 n-gram 都是原文 n-gram 的子集"""
+    terms = set(text_ngrams(text))
+    for start in range(len(text)):
+        for end in range(start + 1, len(text) + 1):
+            assert set(text_ngrams(text[start:end])) <= terms, text[start:end]
+
+
+def test_search_terms_cover_filename_tags_and_summary(search_settings):
+    """測試搜索欄位包含文件名、標籤與摘要，標題欄位只包含文件名與標籤"""
+    fields = build_search_terms({
+        "filename": "電費.pdf",
+        "tags": ["家庭"],
+        "analysis": {"ai_analysis_output": {"key_information": {"content_summary": "台電帳單"}}}
+    })
+
+    assert fields[SEARCH_TITLE_TERMS_FIELD] == sorted(["電費", "pdf", "家庭"])
+    assert fields[SEARCH_TERMS_FIELD] == sorted(["電費", "pdf", "家庭", "台電", "電帳", "帳單"])
+
+
+def test_filter_query_uses_ngrams(search_settings):
+    """測試 q 與 filename_contains 構建的過濾條件"""
+    owner_id = uuid.uuid4()
+
+    query = crud_documents._build_document_filter_query(owner_id=owner_id, search=" 電費帳單 ")
+    assert query["$and"] == [{SEARCH_TERMS_FIELD: {"$all": sorted(["電費", "費帳", "帳單"])}}]
+
+    short = crud_documents._build_document_filter_query(owner_id=owner_id, search="帳")
+    assert short["$and"] == [{"$or": [
+        {"filename": {"$regex": "帳", "$options": "i"}},
+        {"tags": {"$regex": "帳", "$options": "i"}}
+    ]}]
+
+    regex_only = crud_documents._build_document_filter_query(owner_id=owner_id, filename_contains="帳單")
+    assert "$and" not in regex_only
+
+    search_settings.DOCUMENT_SEARCH_FILENAME_PREFILTER = True
+    prefiltered = crud_documents._build_document_filter_query(owner_id=owner_id, filename_contains="帳單")
+    assert prefiltered["$and"] == [{SEARCH_TERMS_FIELD: {"$all": ["帳單"]}}]
+    assert prefiltered["filename"] == {"$regex": "帳單", "$options": "i"}
+
+
+@pytest.mark.asyncio
+async def test_relevance_sort_uses_aggregation(search_settings):
+    """測試相關度排序通過聚合管道計算分數並分頁"""
+    raw = {
+        "_id": uuid.uuid4(), "owner_id": uuid.uuid4(), "filename": "電費帳單.pdf",
+        "created_at": datetime(2024, 5, 1), "updated_at": datetime(2024, 5, 1), "status": "uploaded"
+    }
+    collection = MagicMock()
+    collection.aggregate.return_value.to_list = AsyncMock(return_value=[raw])
+    db = MagicMock()
+    db.__getitem__.return_value = collection
+
+    documents = await crud_documents.get_document_summaries(
+        db, owner_id=raw["owner_id"], skip=20, limit=10, search="電費", sort_by="relevance"
+    )
+
+    assert [doc.filename for doc in documents] == ["電費帳單.pdf"]
+    collection.find.assert_not_called()
+    pipeline = collection.aggregate.call_args.args[0]
+    assert pipeline[0]["$match"]["$and"] == [{SEARCH_TERMS_FIELD: {"$all": ["電費"]}}]
+    assert SEARCH_SCORE_FIELD in pipeline[1]["$addFields"]
+    assert pipeline[2] == {"$sort": {SEARCH_SCORE_FIELD: -1, "created_at": -1, "_id": -1}}
+    assert pipeline[3:5] == [{"$skip": 20}, {"$limit": 10}]
+
+
+@pytest.mark.asyncio
+async def test_cursor_pagination_rejects_relevance(search_settings):
+    """測試游標分頁不支持相關度排序"""
+    with pytest.raises(ValueError):
+        await crud_documents.get_documents_page(MagicMock(), owner_id=uuid.uuid4(), search="電費", sort_by="relevance")
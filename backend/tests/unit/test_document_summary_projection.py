@@ -0,0 +1,130 @@
+"""
+文檔輕量投影單元測試
+
+測試目標:
+1. DocumentSummary 從投影後的原始文檔展平標題、摘要、關鍵概念與主題
+2. 按 ID 批量獲取與游標分頁在 summary 模式下只讀取投影欄位
+3. 問答分類使用的緩存文檔信息以輕量視圖構建
+4. 按 ID 批量獲取在查詢中過濾擁有者，並按請求順序返回
+"""
+
+import uuid
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.crud import crud_documents
+from app.crud.crud_documents import DOCUMENT_SUMMARY_PROJECTION
+from app.models.document_models import DocumentSummary
+
+pytestmark = pytest.mark.unit
+
+
+def _raw_document(**overrides):
+    raw = {
+        "_id": uuid.uuid4(),
+        "owner_id": uuid.uuid4(),
+        "filename": "電費單.pdf",
+        "file_type": "application/pdf",
+        "created_at": datetime(2024, 5, 1),
+        "updated_at": datetime(2024, 5, 1),
+        "status": "analysis_completed",
+        "enriched_data": {"title": "五月電費", "summary": "台電五月帳單"},
+        "analysis": {"ai_analysis_output": {"key_information": {
+            "content_summary": "電費帳單，應繳 1280 元",
+            "key_concepts": ["電費", "帳單"],
+            "main_topics": ["公用事業"]
+        }}}
+    }
+    raw.update(overrides)
+    return raw
+
+
+def _mock_db(raw_documents):
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.limit.return_value = cursor
+    cursor.to_list = AsyncMock(return_value=raw_documents)
+    collection = MagicMock()
+    collection.find.return_value = cursor
+    db = MagicMock()
+    db.__getitem__.return_value = collection
+    return db, collection
+
+
+def test_summary_flattens_projected_fields():
+    """測試從投影結果展平標題、摘要、關鍵概念與主題"""
+    raw = _raw_document()
+
+    summary = DocumentSummary(**raw)
+
+    assert summary.id == raw["_id"]
+    assert summary.title == "五月電費"
+    assert summary.summary == "台電五月帳單"
+    assert summary.content_summary == "電費帳單，應繳 1280 元"
+    assert summary.key_concepts == ["電費", "帳單"]
+    assert summary.main_topics == ["公用事業"]
+    assert summary.display_summary == "台電五月帳單"
+    assert "extracted_text" not in summary.model_dump()
+
+
+def test_summary_tolerates_missing_analysis():
+    """測試未分析的文檔使用預設值，摘要回退為空字串"""
+    summary = DocumentSummary(**_raw_document(enriched_data=None, analysis=None, status="uploaded"))
+
+    assert summary.key_concepts == [] and summary.main_topics == []
+    assert summary.display_summary == ""
+
+
+@pytest.mark.asyncio
+async def test_summary_fetches_use_projection():
+    """測試按 ID 批量獲取與游標分頁在 summary 模式下傳入投影"""
+    raw = _raw_document()
+    db, collection = _mock_db([raw])
+
+    summaries = await crud_documents.get_document_summaries_by_ids(db, [str(raw["_id"])])
+    assert collection.find.call_args.args[1] == DOCUMENT_SUMMARY_PROJECTION
+    assert isinstance(summaries[0], DocumentSummary)
+
+    documents, _ = await crud_documents.get_documents_page(db, owner_id=raw["owner_id"], summary_only=True)
+    assert collection.find.call_args.args[1] == DOCUMENT_SUMMARY_PROJECTION
+    assert isinstance(documents[0], DocumentSummary)
+
+    # 游標分頁從記錄中讀取排序鍵，允許的排序欄位都必須在投影中
+    assert all(field in DOCUMENT_SUMMARY_PROJECTION for field in crud_documents.ALLOWED_SORT_FIELDS)
+
+
+@pytest.mark.asyncio
+async def test_cached_documents_info_uses_summaries():
+    """測試問答分類的緩存文檔信息以輕量視圖構建"""
+    from app.services.qa_orchestrator import QAOrchestrator
+
+    raw = _raw_document(enriched_data=None)
+    conversation_id, user_id = uuid.uuid4(), uuid.uuid4()
+
+    with patch("app.crud.crud_conversations.get_cached_documents", new=AsyncMock(return_value=([str(raw["_id"])], {}))), \
+         patch.object(crud_documents, "get_document_summaries_by_ids", new=AsyncMock(return_value=[DocumentSummary(**raw)])):
+        info = await QAOrchestrator()._get_cached_documents_info(MagicMock(), str(conversation_id), str(user_id))
+
+    assert info == [{
+        "document_id": str(raw["_id"]),
+        "filename": "電費單.pdf",
+        "reference_number": 1,
+        "summary": "電費帳單，應繳 1280 元"
+    }]
+
+
+@pytest.mark.asyncio
+async def test_fetch_by_ids_filters_owner_and_keeps_request_order():
+    """測試擁有者條件在查詢中過濾，結果按請求順序返回，重複與無效 ID 跳過"""
+    owner_id = uuid.uuid4()
+    first, second, missing = _raw_document(owner_id=owner_id), _raw_document(owner_id=owner_id), uuid.uuid4()
+    db, collection = _mock_db([first, second])
+    requested = [str(second["_id"]), "not-a-uuid", str(missing), str(first["_id"]), str(second["_id"])]
+
+    summaries = await crud_documents.get_document_summaries_by_ids(db, requested, owner_id=str(owner_id))
+
+    assert [summary.id for summary in summaries] == [second["_id"], first["_id"]]
+    query = collection.find.call_args.args[0]
+    assert query["owner_id"] == owner_id
+    assert query["_id"]["$in"] == [second["_id"], missing, first["_id"]]
@@ -0,0 +1,164 @@
+"""
+本地模擬 LLM 提供商單元測試
+
+測試目標:
+1. 每個任務類型的模擬輸出都能通過對應輸出模型驗證
+2. 輸出內容取自提示詞（候選文檔 ID、批量文檔索引、聚類編號）
+3. 選擇 fake 後端時 process_request 完整走通且回報 token 用量
+4. 注入的錯誤經由服務的錯誤處理返回
+5. 流式輸出按設定的塊大小切分
+"""
+
+import json
+import pytest
+from unittest.mock import patch
+
+from app.models.ai_models_simplified import (
+    AIBatchClusterLabelsOutput,
+    AIBatchTextAnalysisOutput,
+    AIClusterLabelOutput,
+    AIDocumentSelectionOutput,
+    AIGeneratedAnswerOutput,
+    AIImageAnalysisOutput,
+    AIMongoDBQueryDetailOutput,
+    AIQueryRewriteOutput,
+    AITextAnalysisOutput
+)
+from app.models.question_models import QuestionIntent
+from app.models.suggested_question_models import AIGeneratedQuestionsOutput
+from app.services.ai.fake_llm_provider import FakeLLMProvider
+from app.services.ai.unified_ai_config import TaskType
+
+pytestmark = pytest.mark.unit
+
+MODULE = "app.services.ai.fake_llm_provider"
+
+
+@pytest.fixture
+def fast_settings():
+    with patch(f"{MODULE}.settings") as mock_settings:
+        mock_settings.FAKE_LLM_TASK_LATENCY_MEDIANS = {}
+        mock_settings.FAKE_LLM_LATENCY_MEDIAN_SECONDS = 0.0
+        mock_settings.FAKE_LLM_LATENCY_SIGMA = 0.5
+        mock_settings.FAKE_LLM_MAX_LATENCY_SECONDS = 1.0
+        mock_settings.FAKE_LLM_ERROR_RATE = 0.0
+        mock_settings.FAKE_LLM_RATE_LIMIT_RATE = 0.0
+        mock_settings.FAKE_LLM_OUTPUT_TOKENS = 0
+        mock_settings.FAKE_LLM_STREAM_CHUNK_CHARS = 10
+        mock_settings.FAKE_LLM_STREAM_CHUNK_INTERVAL_SECONDS = 0.0
+        mock_settings.FAKE_LLM_INTENT_WEIGHTS = {"document_search": 1.0}
+        yield mock_settings
+
+
+@pytest.mark.parametrize("task_type, model", [
+    (TaskType.TEXT_GENERATION, AITextAnalysisOutput),
+    (TaskType.IMAGE_ANALYSIS, AIImageAnalysisOutput),
+    (TaskType.QUERY_REWRITE, AIQueryRewriteOutput),
+    (TaskType.ANSWER_GENERATION, AIGeneratedAnswerOutput),
+    (TaskType.MONGODB_DETAIL_QUERY_GENERATION, AIMongoDBQueryDetailOutput),
+    (TaskType.CLUSTER_LABEL_GENERATION, AIClusterLabelOutput),
+    (TaskType.QUESTION_GENERATION, AIGeneratedQuestionsOutput),
+])
+def test_outputs_validate_against_task_models(fast_settings, task_type, model):
+    """測試各任務的模擬輸出能通過對應輸出模型驗證"""
+    output = FakeLLMProvider(seed=1).build_output(task_type, "問題：<user_question>去年的發票</user_question>")
+    model.model_validate_json(output)
+
+
+def test_outputs_follow_prompt_content(fast_settings):
+    """測試輸出取自提示詞中的候選文檔、批量文檔與聚類編號"""
+    provider = FakeLLMProvider(seed=1)
+
+    selection = AIDocumentSelectionOutput.model_validate_json(provider.build_output(
+        TaskType.DOCUMENT_SELECTION_FOR_QUERY,
+        json.dumps([{"document_id": "doc-a"}, {"document_id": "doc-b"}])
+    ))
+    batch = AIBatchTextAnalysisOutput.model_validate_json(provider.build_output(
+        TaskType.BATCH_TEXT_ANALYSIS,
+        '<document index="0">\n甲\n</document>\n<document index="1">\n乙\n</document>'
+    ))
+    labels = AIBatchClusterLabelsOutput.model_validate_json(provider.build_output(
+        TaskType.BATCH_CLUSTER_LABELS,
+        "聚類 0 (共3個文檔):\n• 發票\n\n聚類 4 (共2個文檔):\n• 合約"
+    ))
+
+    assert selection.selected_document_ids == ["doc-a", "doc-b"]
+    assert [item["document_index"] for item in batch.results] == [0, 1]
+    for item in batch.results:
+        AITextAnalysisOutput.model_validate({k: v for k, v in item.items() if k != "document_index"})
+    assert [label.cluster_index for label in labels.labels] == [0, 4]
+
+
+def test_detail_query_intent_requires_cached_documents(fast_settings):
+    """測試沒有緩存文檔時不會返回文檔詳細查詢意圖"""
+    fast_settings.FAKE_LLM_INTENT_WEIGHTS = {"document_detail_query": 1.0}
+    provider = FakeLLMProvider(seed=1)
+
+    without_cache = json.loads(provider.build_output(TaskType.QUESTION_INTENT_CLASSIFICATION, "無緩存文檔"))
+    with_cache = json.loads(provider.build_output(
+        TaskType.QUESTION_INTENT_CLASSIFICATION, "文檔1 (ID: 64f0c0ffee):\n  文件名: a.pdf"
+    ))
+
+    assert without_cache["intent"] == QuestionIntent.DOCUMENT_SEARCH.value
+    assert with_cache["intent"] == QuestionIntent.DOCUMENT_DETAIL_QUERY.value
+    assert with_cache["target_document_ids"] == ["64f0c0ffee"]
+
+
+@pytest.mark.asyncio
+async def test_process_request_runs_on_fake_backend(fast_settings):
+    """測試選擇 fake 後端時 process_request 返回解析後的結果與 token 用量"""
+    from app.services.ai import llm_providers
+    from app.services.ai.unified_ai_service_simplified import AIRequest, unified_ai_service_simplified
+
+    provider = FakeLLMProvider(seed=1)
+    with patch.object(llm_providers, "_providers", {"fake": provider}), \
+         patch.object(llm_providers.settings, "AI_PROVIDER_BACKEND", "fake"):
+        response = await unified_ai_service_simplified.process_request(AIRequest(
+            task_type=TaskType.QUERY_REWRITE,
+            content="去年的水電費帳單",
+            prompt_params={"original_query": "去年的水電費帳單"}
+        ))
+
+    assert response.success, response.error_message
+    assert isinstance(response.output_data, AIQueryRewriteOutput)
+    assert response.output_data.rewritten_queries[0] == "去年的水電費帳單"
+    assert response.token_usage.prompt_tokens > 0
+    assert provider.get_statistics()["calls_by_task"] == {"query_rewrite": 1}
+
+
+@pytest.mark.asyncio
+async def test_injected_error_is_reported(fast_settings):
+    """測試注入的服務不可用錯誤經由服務的錯誤處理返回"""
+    from app.services.ai import llm_providers
+    from app.services.ai.unified_ai_service_simplified import AIPromptRequest, unified_ai_service_simplified
+
+    fast_settings.FAKE_LLM_ERROR_RATE = 1.0
+    provider = FakeLLMProvider(seed=1)
+    with patch.object(llm_providers, "_providers", {"fake": provider}), \
+         patch.object(llm_providers.settings, "AI_PROVIDER_BACKEND", "fake"):
+        output_text, usage = await unified_ai_service_simplified._execute_google_ai_request(
+            model_id="gemini-2.0-flash",
+            prompt_request=AIPromptRequest(user_prompt="測試"),
+            generation_config_dict={},
+            safety_settings={},
+            task_type=TaskType.QUERY_REWRITE
+        )
+
+    assert output_text is None
+    assert "模擬服務不可用" in usage.error_message
+    assert provider.get_statistics()["injected_errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_chunk_cadence(fast_settings):
+    """測試流式輸出按設定的塊大小切分並回報用量"""
+    provider = FakeLLMProvider(seed=1)
+    stream = await provider.stream(
+        TaskType.ANSWER_GENERATION, "gemini-2.0-flash", ["系統", "<user_question>合約</user_question>"], None, None
+    )
+    chunks = [chunk async for chunk in stream.chunks()]
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 10 for chunk in chunks)
+    assert "合約" in "".join(chunks)
+    assert stream.usage_metadata.candidates_token_count > 0
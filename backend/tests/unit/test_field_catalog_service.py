@@ -0,0 +1,188 @@
+"""
+用戶欄位目錄單元測試
+
+測試目標:
+1. 新文檔的欄位計入目錄（頻率、類型、示例），並記錄在文檔上
+2. 同一份分析結果重複寫入不重複計數
+3. 重新分析時按差異增減頻率
+4. 讀取目錄過濾已無文檔使用的欄位，結果被緩存且寫入時失效
+5. Schema 提示按頻率排序，包含類型、示例與文檔數；正在查詢的文檔的欄位不被截斷
+6. 未經完整重建的目錄視為不完整，重建後寫入 rebuilt_at 標記
+"""
+
+import uuid
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.services.document.field_catalog_service import FieldCatalogService
+
+pytestmark = pytest.mark.unit
+
+MODULE = "app.services.document.field_catalog_service"
+
+
+@pytest.fixture
+def catalog_settings():
+    with patch(f"{MODULE}.settings") as mock_settings:
+        mock_settings.FIELD_CATALOG_ENABLED = True
+        mock_settings.FIELD_CATALOG_CACHE_TTL_SECONDS = 60
+        mock_settings.FIELD_CATALOG_MAX_EXAMPLES = 3
+        mock_settings.FIELD_CATALOG_EXAMPLE_MAX_CHARS = 10
+        mock_settings.FIELD_CATALOG_MAX_HINT_FIELDS = 50
+        yield mock_settings
+
+
+def _mock_db(catalog_doc=None):
+    catalogs = MagicMock()
+    catalogs.update_one = AsyncMock()
+    catalogs.find_one = AsyncMock(return_value=catalog_doc)
+    documents = MagicMock()
+    documents.update_one = AsyncMock()
+    documents.find_one = AsyncMock(return_value={})
+    db = MagicMock()
+    db.__getitem__.side_effect = lambda name: catalogs if name == "document_field_catalogs" else documents
+    return db, catalogs, documents
+
+
+def _analysis(dynamic_fields=None, structured_entities=None):
+    return {"key_information": {
+        "dynamic_fields": dynamic_fields or {},
+        "structured_entities": structured_entities or {}
+    }}
+
+
+@pytest.mark.asyncio
+async def test_new_document_fields_are_counted(catalog_settings):
+    """測試新文檔的欄位計入目錄並記錄在文檔上"""
+    service = FieldCatalogService()
+    db, catalogs, documents = _mock_db()
+    owner_id, document_id = uuid.uuid4(), uuid.uuid4()
+
+    changed = await service.record_document_fields(
+        db, document_id, owner_id,
+        _analysis({"繳費期限": "2024-05-31", "金額.含稅": 1280}, {"vendors": ["台灣電力公司"]}),
+        previous_paths=[]
+    )
+
+    assert changed
+    update = catalogs.update_one.await_args.args[1]
+    assert catalogs.update_one.await_args.args[0] == {"_id": owner_id}
+    assert catalogs.update_one.await_args.kwargs["upsert"] is True
+    assert update["$inc"] == {
+        "fields.dynamic_fields．繳費期限.count": 1,
+        "fields.dynamic_fields．金額．含稅.count": 1,
+        "fields.structured_entities．vendors.count": 1,
+    }
+    assert update["$set"]["fields.dynamic_fields．金額．含稅.path"] == "dynamic_fields.金額.含稅"
+    assert update["$addToSet"]["fields.dynamic_fields．金額．含稅.types"] == "int"
+    assert update["$push"]["fields.dynamic_fields．繳費期限.examples"]["$each"] == ["2024-05-31"]
+    assert update["$push"]["fields.structured_entities．vendors.examples"]["$each"] == ["台灣電力公司"]
+    assert documents.update_one.await_args.args[1] == {"$set": {"catalog_field_paths": [
+        "dynamic_fields.繳費期限", "dynamic_fields.金額.含稅", "structured_entities.vendors"
+    ]}}
+
+
+@pytest.mark.asyncio
+async def test_rewrite_of_same_analysis_is_noop(catalog_settings):
+    """測試已計入的欄位重複寫入時不更新目錄"""
+    service = FieldCatalogService()
+    db, catalogs, documents = _mock_db()
+    documents.find_one.return_value = {"catalog_field_paths": ["dynamic_fields.繳費期限"]}
+
+    changed = await service.record_document_fields(
+        db, uuid.uuid4(), uuid.uuid4(), _analysis({"繳費期限": "2024-05-31"})
+    )
+
+    assert not changed
+    catalogs.update_one.assert_not_awaited()
+    documents.update_one.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_reanalysis_applies_difference(catalog_settings):
+    """測試重新分析時新增欄位加一、消失的欄位減一"""
+    service = FieldCatalogService()
+    db, catalogs, _ = _mock_db()
+
+    await service.record_document_fields(
+        db, uuid.uuid4(), uuid.uuid4(),
+        _analysis({"繳費期限": "2024-05-31", "電號": "07-1234"}),
+        previous_paths=["dynamic_fields.繳費期限", "dynamic_fields.戶名"]
+    )
+
+    assert catalogs.update_one.await_args.args[1]["$inc"] == {
+        "fields.dynamic_fields．電號.count": 1,
+        "fields.dynamic_fields．戶名.count": -1,
+    }
+
+
+@pytest.mark.asyncio
+async def test_get_catalog_filters_and_caches(catalog_settings):
+    """測試讀取目錄時過濾頻率為零的欄位，結果被緩存且本進程寫入後失效"""
+    service = FieldCatalogService()
+    owner_id = uuid.uuid4()
+    db, catalogs, _ = _mock_db({"_id": owner_id, "rebuilt_at": "2024-05-01", "fields": {
+        "dynamic_fields．繳費期限": {"path": "dynamic_fields.繳費期限", "count": 2},
+        "dynamic_fields．戶名": {"path": "dynamic_fields.戶名", "count": 0},
+    }})
+
+    catalog = await service.get_catalog(db, owner_id)
+    await service.get_catalog(db, owner_id)
+
+    assert list(catalog) == ["dynamic_fields.繳費期限"]
+    assert catalogs.find_one.await_count == 1
+
+    await service.record_document_fields(db, uuid.uuid4(), owner_id, _analysis({"電號": "07"}), previous_paths=[])
+    await service.get_catalog(db, owner_id)
+    assert catalogs.find_one.await_count == 2
+
+
+def test_schema_hint_orders_by_frequency(catalog_settings):
+    """測試 Schema 提示按頻率排序並包含類型、示例與文檔數"""
+    catalog = {
+        "dynamic_fields.電號": {"path": "dynamic_fields.電號", "name": "電號", "types": ["str"], "examples": ["07"], "count": 1},
+        "dynamic_fields.金額": {"path": "dynamic_fields.金額", "name": "金額", "types": ["int", "str"], "examples": ["100", "1280"], "count": 5},
+    }
+
+    hint = FieldCatalogService.build_schema_hint(catalog)
+
+    assert list(hint) == ["dynamic_fields.金額", "dynamic_fields.電號"]
+    assert hint["dynamic_fields.金額"] == "金額 (int/str)，例: 1280，5 份文檔"
+    assert list(FieldCatalogService.build_schema_hint(catalog, max_fields=1)) == ["dynamic_fields.金額"]
+
+
+def test_schema_hint_keeps_target_document_fields(catalog_settings):
+    """測試截斷到前 N 個欄位時仍保留正在查詢的文檔的欄位"""
+    catalog = {
+        f"dynamic_fields.常見{i}": {"path": f"dynamic_fields.常見{i}", "name": f"常見{i}", "types": ["str"], "count": 10 + i}
+        for i in range(3)
+    }
+    catalog["dynamic_fields.罕見"] = {"path": "dynamic_fields.罕見", "name": "罕見", "types": ["str"], "count": 1}
+
+    hint = FieldCatalogService.build_schema_hint(
+        catalog, max_fields=2, required_paths=["dynamic_fields.罕見", "dynamic_fields.不存在"]
+    )
+
+    assert list(hint) == ["dynamic_fields.常見2", "dynamic_fields.罕見"]
+
+
+@pytest.mark.asyncio
+async def test_incremental_only_catalog_is_incomplete(catalog_settings):
+    """測試只有增量寫入（沒有 rebuilt_at）的目錄返回 None，重建後帶標記"""
+    service = FieldCatalogService()
+    owner_id = uuid.uuid4()
+    db, catalogs, documents = _mock_db({"_id": owner_id, "fields": {
+        "dynamic_fields．電號": {"path": "dynamic_fields.電號", "count": 1},
+    }})
+
+    assert await service.get_catalog(db, owner_id) is None
+
+    async def _no_documents():
+        return
+        yield
+
+    documents.find = MagicMock(return_value=_no_documents())
+    catalogs.replace_one = AsyncMock()
+    await service.rebuild_catalog(db, owner_id)
+
+    assert catalogs.replace_one.await_args.args[1]["rebuilt_at"] is not None
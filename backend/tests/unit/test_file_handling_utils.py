@@ -0,0 +1,131 @@
+"""
+上傳文件流式保存單元測試
+
+測試目標:
+1. 按分塊讀取寫入，大小與 sha256 與整體內容一致，每次讀取不超過分塊大小
+2. MIME 嗅探只使用首個分塊
+3. 寫入中超過大小限制時返回 413 並刪除部分文件；聲明大小超限時不讀取內容
+4. PDF 文件頭驗證失敗回退為二進制；圖片類型按文件頭更正
+"""
+
+import hashlib
+import uuid
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi import HTTPException
+
+from app.utils.file_handling_utils import save_uploaded_file, sniff_content_type, validate_and_correct_file_type
+
+pytestmark = pytest.mark.unit
+
+MODULE = "app.utils.file_handling_utils"
+
+
+class _ChunkedUpload:
+    """記錄每次 read 請求大小的上傳文件替身"""
+
+    def __init__(self, data: bytes, size=None):
+        self.data = data
+        self.size = size
+        self.offset = 0
+        self.read_sizes = []
+
+    async def read(self, size: int = -1) -> bytes:
+        self.read_sizes.append(size)
+        end = len(self.data) if size < 0 else self.offset + size
+        chunk = self.data[self.offset:end]
+        self.offset += len(chunk)
+        return chunk
+
+
+@pytest.fixture
+def upload_settings():
+    with patch(f"{MODULE}.settings") as mock_settings:
+        mock_settings.UPLOAD_CHUNK_SIZE_BYTES = 4
+        mock_settings.UPLOAD_MAX_FILE_SIZE_BYTES = 64
+        yield mock_settings
+
+
+@pytest.mark.asyncio
+async def test_streams_in_chunks_and_hashes(upload_settings, tmp_path):
+    """測試分塊寫入的大小、sha256 與嗅探結果"""
+    data = b"%PDF-1.7 streamed body"
+    upload = _ChunkedUpload(data)
+    target = tmp_path / "a.pdf"
+
+    saved = await save_uploaded_file(upload, target, "a.pdf")
+
+    assert target.read_bytes() == data
+    assert saved.size == len(data)
+    assert saved.sha256 == hashlib.sha256(data).hexdigest()
+    assert saved.sniffed_content_type == "application/pdf"
+    assert set(upload.read_sizes) == {4}
+
+
+@pytest.mark.asyncio
+async def test_sniff_uses_first_chunk_only(upload_settings, tmp_path):
+    """測試 PDF 標記不在首個分塊內時不嗅探為 PDF"""
+    saved = await save_uploaded_file(_ChunkedUpload(b"abc%PDF-1.7"), tmp_path / "b.bin", "b.bin")
+
+    assert saved.sniffed_content_type is None
+
+
+@pytest.mark.asyncio
+async def test_size_limit_enforced_mid_stream(upload_settings, tmp_path):
+    """測試寫入中超限返回 413 並刪除部分文件"""
+    upload_settings.UPLOAD_MAX_FILE_SIZE_BYTES = 10
+    upload = _ChunkedUpload(b"x" * 100)
+    target = tmp_path / "big.bin"
+
+    with pytest.raises(HTTPException) as exc_info:
+        await save_uploaded_file(upload, target, "big.bin")
+
+    assert exc_info.value.status_code == 413
+    assert not target.exists()
+    assert upload.offset <= 12
+
+
+@pytest.mark.asyncio
+async def test_declared_size_rejected_before_reading(upload_settings, tmp_path):
+    """測試聲明大小超限時直接拒絕"""
+    upload = _ChunkedUpload(b"x" * 100, size=100)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await save_uploaded_file(upload, tmp_path / "big.bin", "big.bin")
+
+    assert exc_info.value.status_code == 413
+    assert upload.read_sizes == []
+
+
+def test_sniff_signatures():
+    """測試常見文件頭的嗅探"""
+    assert sniff_content_type(b"\x00\x00%PDF-1.4") == "application/pdf"
+    assert sniff_content_type(b"\x89PNG\r\n\x1a\n....") == "image/png"
+    assert sniff_content_type(b"\xff\xd8\xff\xe0") == "image/jpeg"
+    assert sniff_content_type(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+    assert sniff_content_type(b"PK\x03\x04") == "application/zip"
+    assert sniff_content_type(b"plain text") is None
+
+
+@pytest.mark.asyncio
+async def test_validate_uses_sniffed_type(tmp_path):
+    """測試 PDF 與圖片根據嗅探結果驗證與更正"""
+    with patch(f"{MODULE}.log_event", new_callable=AsyncMock) as mock_log:
+        common = dict(file_path=tmp_path / "f", file_size=10, safe_filename="f", db=MagicMock(),
+                      current_user_id=uuid.uuid4(), request_id=None)
+
+        fake_pdf = await validate_and_correct_file_type(
+            declared_content_type="application/pdf", sniffed_content_type=None, **common
+        )
+        real_pdf = await validate_and_correct_file_type(
+            declared_content_type="application/pdf", sniffed_content_type="application/pdf", **common
+        )
+        png_as_jpeg = await validate_and_correct_file_type(
+            declared_content_type="image/jpeg", sniffed_content_type="image/png", **common
+        )
+
+    assert fake_pdf[0] == "application/octet-stream" and fake_pdf[1]
+    assert real_pdf == ("application/pdf", None)
+    assert png_as_jpeg[0] == "image/png" and png_as_jpeg[1]
+    assert mock_log.await_count == 2
@@ -0,0 +1,110 @@
+"""
+索引顧問單元測試
+
+測試目標:
+1. 解析經典引擎、SBE 與分片集群的 explain 輸出，識別 COLLSCAN 與內存排序
+2. 按查詢形態構建 find / count 的 explain 命令，並標記有問題的形態
+3. 每個文檔查詢形態的過濾與排序欄位都有以 owner_id 為前綴的複合索引覆蓋
+"""
+
+import uuid
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.db.db_init import DOCUMENT_OWNER_INDEXES
+from app.db.index_advisor import IndexAdvisor, QueryShape, analyze_explain, index_advisor
+
+pytestmark = pytest.mark.unit
+
+
+def _explain(winning_plan):
+    return {"queryPlanner": {"winningPlan": winning_plan}}
+
+
+def test_analyze_classic_plan_flags_collscan_and_sort():
+    """測試經典引擎的 SORT <- COLLSCAN 計劃"""
+    result = analyze_explain(_explain({
+        "stage": "LIMIT",
+        "inputStage": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}
+    }))
+
+    assert result["stages"] == ["LIMIT", "SORT", "COLLSCAN"]
+    assert result["collscan"] and result["in_memory_sort"]
+    assert result["indexes"] == []
+
+
+def test_analyze_sbe_and_sharded_plans():
+    """測試 SBE 的 queryPlan 嵌套與分片計劃中的索引掃描"""
+    sbe = analyze_explain(_explain({"queryPlan": {
+        "stage": "FETCH",
+        "inputStage": {"stage": "IXSCAN", "indexName": "owner_created_at"}
+    }}))
+    sharded = analyze_explain(_explain({"stage": "SHARD_MERGE", "shards": [
+        {"winningPlan": {"stage": "OR", "inputStages": [
+            {"stage": "IXSCAN", "indexName": "owner_clustering_status_created_at"},
+            {"stage": "COLLSCAN"}
+        ]}}
+    ]}))
+
+    assert sbe["indexes"] == ["owner_created_at"]
+    assert not sbe["collscan"] and not sbe["in_memory_sort"]
+    assert sharded["collscan"]
+    assert sharded["indexes"] == ["owner_clustering_status_created_at"]
+
+
+@pytest.mark.asyncio
+async def test_run_builds_commands_and_flags_problems():
+    """測試 explain 命令的構建與問題標記，explain 失敗時記錄錯誤"""
+    advisor = IndexAdvisor()
+    advisor.register(QueryShape(
+        name="list", collection="documents",
+        build_filter=lambda owner_id: {"owner_id": owner_id},
+        sort=(("created_at", -1),), limit=20
+    ))
+    advisor.register(QueryShape(
+        name="count", collection="documents",
+        build_filter=lambda owner_id: {"owner_id": owner_id}, operation="count"
+    ))
+    advisor.register(QueryShape(name="broken", collection="documents", build_filter=lambda owner_id: {}))
+
+    owner_id = uuid.uuid4()
+    db = MagicMock()
+    db.command = AsyncMock(side_effect=[
+        _explain({"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}),
+        _explain({"stage": "COUNT_SCAN", "indexName": "owner_created_at"}),
+        RuntimeError("explain not allowed"),
+    ])
+
+    report = await advisor.run(db, owner_id=owner_id)
+
+    commands = [call.args[0] for call in db.command.await_args_list]
+    assert commands[0] == {
+        "explain": {"find": "documents", "filter": {"owner_id": owner_id}, "sort": {"created_at": -1}, "limit": 20},
+        "verbosity": "queryPlanner"
+    }
+    assert commands[1]["explain"] == {"count": "documents", "query": {"owner_id": owner_id}}
+    assert report["checked"] == 3 and report["flagged"] == 1 and report["errors"] == 1
+    assert report["shapes"][0]["problems"] == ["COLLSCAN", "IN_MEMORY_SORT"]
+    assert report["shapes"][1]["problems"] == []
+
+
+def test_document_shapes_have_owner_prefixed_indexes():
+    """測試每個文檔查詢形態的相等條件與排序欄位都被一個 owner_id 前綴索引覆蓋"""
+    index_keys = [list(index.document["key"].keys()) for index in DOCUMENT_OWNER_INDEXES]
+    assert all(keys[0] == "owner_id" for keys in index_keys)
+
+    for shape in index_advisor.shapes:
+        if shape.collection != "documents":
+            continue
+        query_filter = shape.build_filter(uuid.uuid4())
+        equality_fields = [
+            field for field, value in query_filter.items()
+            if not field.startswith("$") and not (isinstance(value, dict) and "$ne" in value)
+        ]
+        if "$or" in query_filter:
+            equality_fields += sorted({field for clause in query_filter["$or"] for field in clause})
+        sort_fields = [field for field, _ in shape.sort or ()]
+        assert any(
+            set(equality_fields) <= set(keys[:len(equality_fields)]) and keys[len(equality_fields):len(equality_fields) + len(sort_fields)] == sort_fields
+            for keys in index_keys
+        ), shape.name
@@ -0,0 +1,151 @@
+"""
+LLM 調用帳本單元測試
+
+測試目標:
+1. 記錄按批次大小批量寫入
+2. 寫入失敗時記錄留在緩衝區，緩衝區滿時丟棄最舊的記錄
+3. process_request 寫入包含任務、模型、token、延遲、重試與緩存結果的記錄
+4. 聚合按分組欄位與時間桶分組，不支援 $percentile 時退回平均值
+5. 不支援的分組欄位被拒絕
+"""
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from pymongo.errors import OperationFailure
+
+from app.services.ai.fake_llm_provider import FakeLLMProvider
+from app.services.ai.llm_call_ledger import CacheOutcome, LLMCallLedger
+from app.services.ai.unified_ai_config import TaskType
+
+pytestmark = pytest.mark.unit
+
+MODULE = "app.services.ai.llm_call_ledger"
+FAKE_MODULE = "app.services.ai.fake_llm_provider"
+
+
+@pytest.fixture
+def ledger_settings():
+    with patch(f"{MODULE}.settings") as mock_settings:
+        mock_settings.AI_LLM_LEDGER_ENABLED = True
+        mock_settings.AI_LLM_LEDGER_TTL_DAYS = 30
+        mock_settings.AI_LLM_LEDGER_BATCH_SIZE = 2
+        mock_settings.AI_LLM_LEDGER_FLUSH_INTERVAL_SECONDS = 60
+        mock_settings.AI_LLM_LEDGER_MAX_BUFFER = 3
+        yield mock_settings
+
+
+def _mock_db():
+    collection = MagicMock()
+    collection.insert_many = AsyncMock()
+    db = MagicMock()
+    db.__getitem__.return_value = collection
+    return db, collection
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_in_batches(ledger_settings):
+    """測試緩衝區中的記錄按批次大小寫入"""
+    ledger = LLMCallLedger()
+    db, collection = _mock_db()
+    ledger._db = db
+    for _ in range(3):
+        ledger.record(task_type="query_rewrite", model_id="flash", prompt_tokens=10, completion_tokens=5)
+
+    assert await ledger.flush() == 3
+
+    batch_sizes = [len(call.args[0]) for call in collection.insert_many.await_args_list]
+    assert sorted(batch_sizes) == [1, 2]
+    assert collection.insert_many.await_args_list[0].args[0][0]["total_tokens"] == 15
+    assert ledger.get_statistics()["buffered"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_records_and_caps_buffer(ledger_settings):
+    """測試寫入失敗時記錄保留在緩衝區，超過上限時丟棄最舊的記錄"""
+    ledger = LLMCallLedger()
+    db, collection = _mock_db()
+    collection.insert_many.side_effect = ConnectionError("mongo down")
+    ledger._db = db
+    for index in range(4):
+        ledger.record(task_type=f"task_{index}", model_id="flash")
+
+    assert await ledger.flush() == 0
+
+    stats = ledger.get_statistics()
+    assert stats["buffered"] == 3
+    assert stats["dropped"] == 1
+    assert stats["flush_failures"] >= 1
+    assert [entry["task_type"] for entry in ledger._buffer] == ["task_1", "task_2", "task_3"]
+
+
+@pytest.mark.asyncio
+async def test_process_request_emits_ledger_record(ledger_settings):
+    """測試 process_request 寫入一條結構化的帳本記錄"""
+    from app.services.ai import llm_providers
+    from app.services.ai.unified_ai_service_simplified import AIRequest, unified_ai_service_simplified
+
+    ledger = LLMCallLedger()
+    with patch(f"{FAKE_MODULE}.settings") as fake_settings:
+        fake_settings.FAKE_LLM_TASK_LATENCY_MEDIANS = {}
+        fake_settings.FAKE_LLM_LATENCY_MEDIAN_SECONDS = 0.0
+        fake_settings.FAKE_LLM_ERROR_RATE = 0.0
+        fake_settings.FAKE_LLM_RATE_LIMIT_RATE = 0.0
+        fake_settings.FAKE_LLM_OUTPUT_TOKENS = 0
+        with patch.object(llm_providers, "_providers", {"fake": FakeLLMProvider(seed=1)}), \
+             patch.object(llm_providers.settings, "AI_PROVIDER_BACKEND", "fake"), \
+             patch("app.services.ai.unified_ai_service_simplified.llm_call_ledger", ledger):
+            response = await unified_ai_service_simplified.process_request(AIRequest(
+                task_type=TaskType.QUERY_REWRITE,
+                content="上個月的電費",
+                prompt_params={"original_query": "上個月的電費"},
+                user_id="user-1"
+            ))
+
+    assert response.success, response.error_message
+    entry = ledger._buffer[-1]
+    assert entry["task_type"] == "query_rewrite"
+    assert entry["model_id"] == response.model_used
+    assert entry["user_id"] == "user-1"
+    assert entry["prompt_tokens"] == response.token_usage.prompt_tokens > 0
+    assert entry["retries"] == 0
+    assert entry["cache_outcome"] == CacheOutcome.MISS
+    assert entry["success"] is True
+    assert entry["network_latency_ms"] <= entry["total_latency_ms"]
+
+
+@pytest.mark.asyncio
+async def test_rollup_groups_and_falls_back_without_percentile(ledger_settings):
+    """測試聚合的分組與時間桶，$percentile 不可用時退回平均值"""
+    ledger = LLMCallLedger()
+    row = {
+        "_id": {"task_type": "query_rewrite", "bucket": "2026-10-18"},
+        "calls": 4, "prompt_tokens": 400, "completion_tokens": 100, "total_tokens": 500,
+        "cached_input_tokens": 0, "avg_total_tokens": 125.0, "avg_queue_wait_ms": 2.0,
+        "avg_network_latency_ms": 800.0, "avg_total_latency_ms": 850.0, "max_total_latency_ms": 1200.0,
+        "retries": 1, "errors": 1, "cache_hits": 2
+    }
+    cursor = MagicMock()
+    cursor.to_list = AsyncMock(return_value=[row])
+    collection = MagicMock()
+    collection.aggregate.side_effect = [OperationFailure("unknown group operator '$percentile'"), cursor]
+    db = MagicMock()
+    db.__getitem__.return_value = collection
+
+    result = await ledger.get_rollup(db, group_by=["task_type"], time_range="7d", bucket="day", user_id="user-1")
+
+    pipeline = collection.aggregate.call_args_list[-1].args[0]
+    assert pipeline[0]["$match"]["user_id"] == "user-1"
+    assert set(pipeline[1]["$group"]["_id"]) == {"task_type", "bucket"}
+    assert result["percentiles_available"] is False
+    group = result["groups"][0]
+    assert group["task_type"] == "query_rewrite" and group["bucket"] == "2026-10-18"
+    assert group["error_rate"] == 25.0
+    assert group["cache_hit_rate"] == 50.0
+
+
+@pytest.mark.asyncio
+async def test_rollup_rejects_unknown_group_field(ledger_settings):
+    """測試不支援的分組欄位被拒絕"""
+    with pytest.raises(ValueError):
+        await LLMCallLedger().get_rollup(MagicMock(), group_by=["prompt_text"])
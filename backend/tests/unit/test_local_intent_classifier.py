@@ -0,0 +1,184 @@
+"""
+本地快速意圖分類器單元測試
+
+測試目標:
+1. 規則判斷寒暄與閒聊
+2. 最近質心分類的置信度閾值與領先差
+3. 從 qa_analytics 記錄訓練質心
+4. 本地命中時跳過 LLM 分類，未命中時統計一致率
+5. 直接返回的質心結果置信度經校準可自動批准，reasoning 留空
+6. 批准等工作流後續輪次不重複記錄分析數據
+"""
+
+import numpy as np
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.models.question_models import QuestionIntent
+from app.services.qa_workflow.local_intent_classifier import (
+    LocalIntentClassifier,
+    SOURCE_LOCAL_CENTROID,
+    SOURCE_LOCAL_RULE
+)
+
+pytestmark = pytest.mark.unit
+
+MODULE = "app.services.qa_workflow.local_intent_classifier"
+
+
+def _trained_classifier() -> LocalIntentClassifier:
+    classifier = LocalIntentClassifier()
+    classifier._centroids = {
+        "document_search": np.array([1.0, 0.0, 0.0], dtype=np.float32),
+        "complex_analysis": np.array([0.0, 1.0, 0.0], dtype=np.float32),
+    }
+    classifier.stats.last_trained_at = 1e12  # 避免觸發背景訓練
+    return classifier
+
+
+class _FakeCursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def limit(self, n):
+        self._docs = self._docs[:n]
+        return self
+
+    def __aiter__(self):
+        self._iter = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def test_rules_match_greeting_and_chitchat():
+    """測試完全匹配的寒暄與閒聊由規則直接判斷"""
+    classifier = LocalIntentClassifier()
+
+    greeting = classifier.classify_by_rules("你好！", has_conversation_history=True)
+    assert greeting.intent == QuestionIntent.GREETING
+    assert greeting.classified_by == SOURCE_LOCAL_RULE
+
+    assert classifier.classify_by_rules("謝謝", has_conversation_history=False).intent == QuestionIntent.CHITCHAT
+    # 有對話歷史時閒聊用語交給 LLM 判斷
+    assert classifier.classify_by_rules("謝謝", has_conversation_history=True) is None
+    assert classifier.classify_by_rules("你好，幫我找發票", has_conversation_history=False) is None
+
+
+@pytest.mark.asyncio
+async def test_confident_centroid_returns_document_search():
+    """測試相似度和領先差都足夠時直接返回文檔搜索"""
+    classifier = _trained_classifier()
+    with patch(f"{MODULE}.embedding_service.encode_text_async", new=AsyncMock(return_value=[0.95, 0.1, 0.0])):
+        local = await classifier.classify("幫我找去年的水電費帳單", has_conversation_history=False)
+
+    assert local["result"].intent == QuestionIntent.DOCUMENT_SEARCH
+    assert local["result"].classified_by == SOURCE_LOCAL_CENTROID
+    # 原始相似度約 0.99 以下，校準後不低於文檔搜索的自動批准閾值
+    assert local["result"].confidence >= 0.9
+    assert local["result"].reasoning == ""
+    assert classifier.get_statistics()["llm_skip_rate"] == 100.0
+
+
+@pytest.mark.asyncio
+async def test_ambiguous_or_non_fast_path_falls_through():
+    """測試領先差不足或非快速通道意圖時交給 LLM"""
+    classifier = _trained_classifier()
+    with patch(f"{MODULE}.embedding_service.encode_text_async", new=AsyncMock(return_value=[0.7, 0.7, 0.0])):
+        ambiguous = await classifier.classify("比較這幾份合約", has_conversation_history=False)
+    with patch(f"{MODULE}.embedding_service.encode_text_async", new=AsyncMock(return_value=[0.0, 1.0, 0.0])):
+        complex_analysis = await classifier.classify("分析這三份報告的差異", has_conversation_history=False)
+
+    assert ambiguous["result"] is None
+    assert ambiguous["prediction"] is not None
+    assert complex_analysis["result"] is None
+    assert complex_analysis["prediction"].intent == QuestionIntent.COMPLEX_ANALYSIS
+    assert classifier.get_statistics()["llm_fallthrough"] == 2
+
+
+@pytest.mark.asyncio
+async def test_train_builds_centroids_from_analytics():
+    """測試從 qa_analytics 記錄訓練質心，樣本不足的意圖不建立質心"""
+    records = {
+        "document_search": [{"question": f"找文件{i}"} for i in range(6)],
+        "greeting": [{"question": f"你好{i}"} for i in range(6)],
+        "complex_analysis": [{"question": "分析"}],
+    }
+    collection = MagicMock()
+    collection.find.side_effect = lambda query, projection: _FakeCursor(
+        records.get(query["classification.intent"], [])
+    )
+    db = MagicMock()
+    db.__getitem__.return_value = collection
+
+    def _encode_batch(texts):
+        return [[1.0, 0.0] if t.startswith("找") else [0.0, 1.0] for t in texts]
+
+    classifier = LocalIntentClassifier()
+    with patch(f"{MODULE}.embedding_service.encode_batch", side_effect=_encode_batch):
+        total = await classifier.train(db)
+
+    assert total == 12
+    assert sorted(classifier._centroids) == ["document_search", "greeting"]
+    query = collection.find.call_args_list[0].args[0]
+    assert SOURCE_LOCAL_CENTROID in query["classification.classified_by"]["$nin"]
+
+
+@pytest.mark.asyncio
+async def test_classify_question_skips_llm_on_local_hit():
+    """測試本地命中時不調用 LLM，未命中時調用 LLM 並統計一致率"""
+    from app.services.qa_workflow import question_classifier_service as module
+
+    classifier = _trained_classifier()
+    llm_response = MagicMock(success=True, output_data={
+        "intent": "complex_analysis", "confidence": 0.9, "reasoning": "需要比較", "suggested_strategy": "analysis"
+    })
+
+    with patch.object(module, "local_intent_classifier", classifier), \
+         patch.object(module.unified_ai_service_simplified, "process_request", new=AsyncMock(return_value=llm_response)) as mock_llm, \
+         patch(f"{MODULE}.settings.LOCAL_INTENT_CLASSIFIER_SHADOW_RATE", 0.0):
+        greeting = await module.question_classifier_service.classify_question("哈囉")
+        mock_llm.assert_not_called()
+
+        with patch(f"{MODULE}.embedding_service.encode_text_async", new=AsyncMock(return_value=[0.7, 0.7, 0.0])):
+            result = await module.question_classifier_service.classify_question("比較這兩份報價單")
+
+    assert greeting.intent == QuestionIntent.GREETING
+    assert result.intent == QuestionIntent.COMPLEX_ANALYSIS
+    mock_llm.assert_awaited_once()
+    stats = classifier.get_statistics()
+    assert stats["agreement_checks"] == 1
+    assert stats["llm_skip_rate"] == 50.0
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_skips_analytics_for_workflow_turns():
+    """測試批准輪次不重複寫入 qa_analytics"""
+    from app.models.question_models import QuestionClassification
+    from app.models.vector_models import AIQARequest
+    from app.services import qa_orchestrator as module
+
+    handler = MagicMock()
+    handler.handle = AsyncMock(return_value=MagicMock(processing_time=0.1, tokens_used=0))
+    classification = QuestionClassification(
+        intent=QuestionIntent.SIMPLE_FACTUAL, confidence=0.9, reasoning="", suggested_strategy="direct_answer"
+    )
+
+    with patch.object(module.qa_analytics_service, "log_qa_request", new=AsyncMock()) as mock_log:
+        orchestrator = module.QAOrchestrator()
+        await orchestrator._dispatch_to_handler(
+            handler, AIQARequest(question="發票金額是多少"), classification, None, MagicMock(), "u1", None
+        )
+        await orchestrator._dispatch_to_handler(
+            handler, AIQARequest(question="發票金額是多少", workflow_action="approve_search"),
+            classification, None, MagicMock(), "u1", None
+        )
+
+    mock_log.assert_awaited_once()
@@ -0,0 +1,205 @@
+"""
+並發詳細查詢單元測試
+
+測試目標:
+1. 多個文檔的查詢生成並發發出，總耗時約為一次 LLM 延遲
+2. 結果按輸入文檔順序返回
+3. 單個文檔失敗時只有該文檔回退到基本查詢
+4. 本地並發數受 QA_DETAIL_QUERY_MAX_CONCURRENCY 限制
+5. 批量路徑一次調用生成所有文檔的查詢，缺失或無效的結果回退為單獨調用
+6. 批量任務經 process_request 的提示詞與輸出解析
+"""
+
+import asyncio
+import time
+import uuid
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.models.ai_models_simplified import AIMongoDBQueryDetailOutput
+from app.services.qa_core.qa_document_processor import QADocumentProcessor
+
+pytestmark = pytest.mark.unit
+
+MODULE = "app.services.qa_core.qa_document_processor"
+
+LLM_LATENCY = 0.1
+
+
+def _documents(count: int):
+    return [SimpleNamespace(id=uuid.uuid4(), filename=f"doc_{index}.pdf") for index in range(count)]
+
+
+def _mock_db():
+    async def _find_one(mongo_filter, projection=None):
+        # 返回投影請求的欄位，使查詢被視為查到數據
+        fields = {key: "value" for key in (projection or {}) if key != "_id" and "." not in key}
+        return {"_id": mongo_filter["_id"], **fields, "projection": projection}
+
+    db = MagicMock()
+    db.documents.find_one = AsyncMock(side_effect=_find_one)
+    return db
+
+
+def _mock_ai_service(failing_ids=(), tracker=None):
+    """每次查詢生成耗時 LLM_LATENCY，failing_ids 中的文檔拋出異常"""
+
+    async def _generate(user_question, document_id, **kwargs):
+        if tracker is not None:
+            tracker["active"] += 1
+            tracker["peak"] = max(tracker["peak"], tracker["active"])
+        try:
+            await asyncio.sleep(LLM_LATENCY)
+        finally:
+            if tracker is not None:
+                tracker["active"] -= 1
+        if document_id in failing_ids:
+            raise RuntimeError("模型調用失敗")
+        return SimpleNamespace(
+            success=True,
+            output_data=AIMongoDBQueryDetailOutput(projection={"filename": 1, "document_id_hint": 1}),
+            token_usage=SimpleNamespace(total_tokens=100),
+            error_message=None
+        )
+
+    service = MagicMock()
+    service.generate_mongodb_detail_query = AsyncMock(side_effect=_generate)
+    return service
+
+
+@pytest.fixture
+def detail_settings():
+    with patch(f"{MODULE}.settings") as mock_settings:
+        mock_settings.QA_DETAIL_QUERY_MAX_CONCURRENCY = 5
+        mock_settings.QA_DETAIL_QUERY_BATCHING_ENABLED = False
+        mock_settings.QA_DETAIL_QUERY_BATCH_MAX_DOCUMENTS = 8
+        mock_settings.QA_DETAIL_QUERY_BATCH_OUTPUT_TOKENS_PER_DOC = 512
+        yield mock_settings
+
+
+@pytest.mark.asyncio
+async def test_queries_run_concurrently_in_order(detail_settings):
+    """測試多個文檔的查詢並發執行，結果按輸入順序返回"""
+    documents = _documents(4)
+    service = _mock_ai_service()
+
+    with patch(f"{MODULE}.unified_ai_service_simplified", service):
+        started = time.perf_counter()
+        results = await QADocumentProcessor().query_documents_details(
+            db=_mock_db(),
+            documents=documents,
+            user_question="合約金額是多少",
+            document_schema_info={}
+        )
+        elapsed = time.perf_counter() - started
+
+    assert elapsed < LLM_LATENCY * 2
+    assert [result["_id"] for result in results] == [str(doc.id) for doc in documents]
+    assert service.generate_mongodb_detail_query.await_count == 4
+
+
+@pytest.mark.asyncio
+async def test_failed_document_falls_back_individually(detail_settings):
+    """測試單個文檔失敗時只有該文檔使用基本查詢"""
+    documents = _documents(3)
+    service = _mock_ai_service(failing_ids={str(documents[1].id)})
+
+    with patch(f"{MODULE}.unified_ai_service_simplified", service):
+        results = await QADocumentProcessor().query_documents_details(
+            db=_mock_db(),
+            documents=documents,
+            user_question="合約金額是多少",
+            document_schema_info={}
+        )
+
+    assert [result["_id"] for result in results] == [str(doc.id) for doc in documents]
+    assert "document_id_hint" in results[0]["projection"]
+    assert "extracted_text" in results[1]["projection"]
+    assert "document_id_hint" in results[2]["projection"]
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_capped(detail_settings):
+    """測試同時進行的查詢數不超過設定上限"""
+    detail_settings.QA_DETAIL_QUERY_MAX_CONCURRENCY = 2
+    tracker = {"active": 0, "peak": 0}
+    service = _mock_ai_service(tracker=tracker)
+
+    with patch(f"{MODULE}.unified_ai_service_simplified", service):
+        results = await QADocumentProcessor().query_documents_details(
+            db=_mock_db(),
+            documents=_documents(5),
+            user_question="合約金額是多少",
+            document_schema_info={}
+        )
+
+    assert len(results) == 5 and all(results)
+    assert tracker["peak"] == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_generates_all_queries_in_one_call(detail_settings):
+    """測試批量路徑一次調用生成查詢，缺失與無效的結果各自回退為單獨調用"""
+    detail_settings.QA_DETAIL_QUERY_BATCHING_ENABLED = True
+    documents = _documents(4)
+    service = _mock_ai_service()
+    service.generate_mongodb_detail_queries_batch = AsyncMock(return_value=SimpleNamespace(
+        success=True,
+        output_data=SimpleNamespace(results=[
+            {"document_index": 2, "projection": {"batch_hint": 1}},
+            {"document_index": 0, "projection": {"batch_hint": 1}},
+            {"document_index": 1, "projection": "無效"},
+        ]),
+        token_usage=SimpleNamespace(total_tokens=200),
+        error_message=None
+    ))
+    processor = QADocumentProcessor()
+
+    with patch(f"{MODULE}.unified_ai_service_simplified", service):
+        results = await processor.query_documents_details(
+            db=_mock_db(),
+            documents=documents,
+            user_question="合約金額是多少",
+            document_schema_info={}
+        )
+
+    assert [result["_id"] for result in results] == [str(doc.id) for doc in documents]
+    assert "batch_hint" in results[0]["projection"] and "batch_hint" in results[2]["projection"]
+    assert "document_id_hint" in results[1]["projection"] and "document_id_hint" in results[3]["projection"]
+    service.generate_mongodb_detail_queries_batch.assert_awaited_once()
+    sent_documents = service.generate_mongodb_detail_queries_batch.await_args.kwargs["documents"]
+    assert [doc["document_id"] for doc in sent_documents] == [str(doc.id) for doc in documents]
+    assert service.generate_mongodb_detail_query.await_count == 2
+
+    stats = processor.get_detail_query_statistics()
+    assert stats["batch"]["calls"] == 1
+    assert stats["batch"]["fallback_documents"] == 2
+    assert stats["batch"]["tokens_per_document"] == 50.0
+    assert stats["per_document"]["tokens_per_document"] == 100.0
+    assert stats["token_savings_percent"] == 50.0
+
+
+@pytest.mark.asyncio
+async def test_batch_task_round_trip_with_fake_provider():
+    """測試批量詳細查詢任務的提示詞格式化與輸出解析"""
+    from app.services.ai import llm_providers
+    from app.services.ai.fake_llm_provider import FakeLLMProvider
+    from app.services.ai.unified_ai_service_simplified import unified_ai_service_simplified
+
+    with patch("app.services.ai.fake_llm_provider.settings") as fake_settings:
+        fake_settings.FAKE_LLM_TASK_LATENCY_MEDIANS = {}
+        fake_settings.FAKE_LLM_LATENCY_MEDIAN_SECONDS = 0.0
+        fake_settings.FAKE_LLM_ERROR_RATE = 0.0
+        fake_settings.FAKE_LLM_RATE_LIMIT_RATE = 0.0
+        fake_settings.FAKE_LLM_OUTPUT_TOKENS = 0
+        with patch.object(llm_providers, "_providers", {"fake": FakeLLMProvider(seed=1)}), \
+             patch.object(llm_providers.settings, "AI_PROVIDER_BACKEND", "fake"):
+            response = await unified_ai_service_simplified.generate_mongodb_detail_queries_batch(
+                user_question="合約金額是多少",
+                documents=[{"document_id": str(uuid.uuid4()), "filename": f"doc_{i}.pdf"} for i in range(3)],
+                document_schema_info={"description": "通用 Schema"}
+            )
+
+    assert response.success, response.error_message
+    assert [item["document_index"] for item in response.output_data.results] == [0, 1, 2]
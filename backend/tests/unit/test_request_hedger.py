@@ -0,0 +1,165 @@
+"""
+AI 請求對沖與故障轉移單元測試
+
+測試目標:
+1. 在截止時間內返回時不對沖
+2. 超過截止時間時對沖到後備模型，先成功者勝出，落後者被取消
+3. 失敗時立即轉移到後備模型
+4. 後台請求不對沖
+5. 截止時間取 p95 延遲且不超過任務 SLO
+6. 原請求在限流器排隊期間不對沖，延遲樣本不含排隊時間
+"""
+
+import asyncio
+import pytest
+from unittest.mock import patch
+
+from app.models.ai_models_simplified import TokenUsage
+from app.services.ai.request_hedger import RequestHedger
+
+pytestmark = pytest.mark.unit
+
+MODULE = "app.services.ai.request_hedger"
+
+
+def _usage() -> TokenUsage:
+    return TokenUsage(prompt_tokens=1, completion_tokens=1, total_tokens=2)
+
+
+def _failure() -> TokenUsage:
+    return TokenUsage(prompt_tokens=0, completion_tokens=0, total_tokens=0, error_message="服務不可用")
+
+
+@pytest.fixture
+def hedge_settings():
+    with patch(f"{MODULE}.settings") as mock_settings:
+        mock_settings.AI_HEDGING_ENABLED = True
+        mock_settings.AI_HEDGE_TASK_SLO_SECONDS = {"default": 0.05}
+        mock_settings.AI_HEDGE_LATENCY_PERCENTILE = 95.0
+        mock_settings.AI_HEDGE_DEADLINE_MULTIPLIER = 1.0
+        mock_settings.AI_HEDGE_MIN_DEADLINE_SECONDS = 0.01
+        mock_settings.AI_HEDGE_MIN_SAMPLES = 5
+        mock_settings.AI_HEDGE_LATENCY_WINDOW = 100
+        mock_settings.AI_HEDGE_MAX_ATTEMPTS = 3
+        mock_settings.AI_HEDGE_SAME_MODEL_WHEN_NO_FALLBACK = True
+        yield mock_settings
+
+
+def _make_call(delays, results=None, queue_delays=None):
+    """按模型返回延遲與結果的模擬調用（可先在限流器排隊），記錄被取消的模型"""
+    calls, cancelled = [], []
+
+    async def _call(model_id, on_start):
+        calls.append(model_id)
+        try:
+            await asyncio.sleep((queue_delays or {}).get(model_id, 0.0))
+            on_start()
+            await asyncio.sleep(delays[model_id])
+        except asyncio.CancelledError:
+            cancelled.append(model_id)
+            raise
+        if results and results.get(model_id) is None:
+            return None, _failure()
+        return f"來自 {model_id}", _usage()
+
+    return _call, calls, cancelled
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged(hedge_settings):
+    """測試在截止時間內返回時不發出對沖"""
+    hedger = RequestHedger()
+    call, calls, _ = _make_call({"flash": 0.0, "pro": 0.0})
+
+    text, _, model_id = await hedger.execute("query_rewrite", "flash", call, ["pro"])
+
+    assert (text, model_id) == ("來自 flash", "flash")
+    assert calls == ["flash"]
+    assert hedger.get_statistics()["tasks"]["query_rewrite"]["hedged"] == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_cancelled(hedge_settings):
+    """測試超過截止時間時對沖到後備模型，對沖先成功且原請求被取消"""
+    hedger = RequestHedger()
+    call, calls, cancelled = _make_call({"flash": 5.0, "pro": 0.0})
+
+    text, _, model_id = await hedger.execute("answer_generation", "flash", call, ["pro"])
+    await asyncio.sleep(0)
+
+    assert model_id == "pro"
+    assert calls == ["flash", "pro"]
+    assert cancelled == ["flash"]
+    stats = hedger.get_statistics()["tasks"]["answer_generation"]
+    assert stats["hedge_rate"] == 100.0
+    assert stats["hedge_wins"] == 1
+    assert stats["cancelled"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failure_fails_over_to_next_model(hedge_settings):
+    """測試失敗時立即轉移到後備模型"""
+    hedger = RequestHedger()
+    call, calls, _ = _make_call({"flash": 0.0, "pro": 0.0}, results={"flash": None, "pro": "ok"})
+
+    text, _, model_id = await hedger.execute("query_rewrite", "flash", call, ["pro"], hedge=False)
+
+    assert model_id == "pro"
+    assert calls == ["flash", "pro"]
+    stats = hedger.get_statistics()["tasks"]["query_rewrite"]
+    assert stats["failovers"] == 1
+    assert stats["failover_successes"] == 1
+
+
+@pytest.mark.asyncio
+async def test_background_request_waits_without_hedging(hedge_settings):
+    """測試後台請求超過截止時間也不對沖"""
+    hedger = RequestHedger()
+    call, calls, _ = _make_call({"flash": 0.1, "pro": 0.0})
+
+    _, _, model_id = await hedger.execute("text_generation", "flash", call, ["pro"], hedge=False)
+
+    assert model_id == "flash"
+    assert calls == ["flash"]
+
+
+@pytest.mark.asyncio
+async def test_all_attempts_fail_returns_last_error(hedge_settings):
+    """測試所有模型都失敗時返回最後的錯誤"""
+    hedger = RequestHedger()
+    call, calls, _ = _make_call({"flash": 0.0, "pro": 0.0}, results={"flash": None, "pro": None})
+
+    text, usage, _ = await hedger.execute("query_rewrite", "flash", call, ["pro"])
+
+    assert text is None
+    assert usage.error_message == "服務不可用"
+    assert hedger.get_statistics()["tasks"]["query_rewrite"]["failures"] == 1
+
+
+@pytest.mark.asyncio
+async def test_queued_primary_is_not_hedged(hedge_settings):
+    """測試原請求在限流器排隊超過截止時間也不對沖，延遲只記錄放行後的時間"""
+    hedger = RequestHedger()
+    call, calls, _ = _make_call({"flash": 0.0, "pro": 0.0}, queue_delays={"flash": 0.2})
+
+    _, _, model_id = await hedger.execute("answer_generation", "flash", call, ["pro"])
+
+    assert model_id == "flash"
+    assert calls == ["flash"]
+    assert hedger.get_statistics()["tasks"]["answer_generation"]["hedged"] == 0
+    assert max(hedger._latencies["answer_generation:flash"]) < 0.05
+
+
+def test_deadline_uses_p95_capped_by_slo(hedge_settings):
+    """測試截止時間取 p95 延遲，樣本不足時使用 SLO，且不超過 SLO"""
+    hedge_settings.AI_HEDGE_TASK_SLO_SECONDS = {"default": 10.0}
+    hedger = RequestHedger()
+    assert hedger.get_deadline("query_rewrite", "flash") == 10.0
+
+    for latency in [1.0] * 19 + [3.0]:
+        hedger.record_latency("query_rewrite", "flash", latency)
+    assert hedger.get_deadline("query_rewrite", "flash") == 3.0
+
+    for _ in range(100):
+        hedger.record_latency("query_rewrite", "flash", 30.0)
+    assert hedger.get_deadline("query_rewrite", "flash") == 10.0
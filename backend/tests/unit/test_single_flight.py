@@ -0,0 +1,117 @@
+"""
+Single-flight 請求合併單元測試
+
+測試目標:
+1. 相同 key 的並發調用只執行一次並共享結果
+2. 等待者上限與超時後獨立執行
+3. 錯誤傳遞給所有等待者
+4. get_documents_by_ids 按 ID 集合合併查詢（各調用者按自己的請求順序返回）
+"""
+
+import asyncio
+import uuid
+import pytest
+from unittest.mock import MagicMock, patch
+
+from app.utils.single_flight import SingleFlight
+
+pytestmark = pytest.mark.unit
+
+
+def _slow_func(counter: dict, result="ok", delay: float = 0.05):
+    async def _func():
+        counter["calls"] += 1
+        await asyncio.sleep(delay)
+        return result
+    return _func
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_single_execution():
+    """測試並發的相同調用只執行一次"""
+    flight = SingleFlight("test.share", max_waiters=10, wait_timeout=5, enabled=True)
+    counter = {"calls": 0}
+
+    results = await asyncio.gather(*[flight.run("k", _slow_func(counter)) for _ in range(5)])
+
+    assert counter["calls"] == 1
+    assert [r for r, _ in results] == ["ok"] * 5
+    assert sum(1 for _, shared in results if shared) == 4
+    assert flight.inflight_count == 0
+    assert flight.get_statistics()["shared"] == 4
+
+
+@pytest.mark.asyncio
+async def test_different_keys_execute_separately():
+    """測試不同 key 各自執行"""
+    flight = SingleFlight("test.keys", enabled=True)
+    counter = {"calls": 0}
+
+    await asyncio.gather(flight.do("a", _slow_func(counter)), flight.do("b", _slow_func(counter)))
+
+    assert counter["calls"] == 2
+
+
+@pytest.mark.asyncio
+async def test_waiter_overflow_executes_independently():
+    """測試等待者超過上限時獨立執行"""
+    flight = SingleFlight("test.overflow", max_waiters=1, wait_timeout=5, enabled=True)
+    counter = {"calls": 0}
+
+    await asyncio.gather(*[flight.do("k", _slow_func(counter)) for _ in range(3)])
+
+    assert counter["calls"] == 2
+    assert flight.get_statistics()["overflow"] == 1
+
+
+@pytest.mark.asyncio
+async def test_waiter_timeout_executes_independently():
+    """測試等待超時後獨立執行"""
+    flight = SingleFlight("test.timeout", max_waiters=10, wait_timeout=0.01, enabled=True)
+    counter = {"calls": 0}
+
+    await asyncio.gather(flight.do("k", _slow_func(counter, delay=0.1)), flight.do("k", _slow_func(counter, delay=0)))
+
+    assert counter["calls"] == 2
+    assert flight.get_statistics()["timeouts"] == 1
+
+
+@pytest.mark.asyncio
+async def test_error_propagates_to_waiters():
+    """測試發起者的錯誤傳遞給等待者"""
+    flight = SingleFlight("test.error", enabled=True)
+
+    async def _fail():
+        await asyncio.sleep(0.02)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(flight.do("k", _fail), flight.do("k", _fail), return_exceptions=True)
+
+    assert all(isinstance(r, ValueError) for r in results)
+    assert flight.get_statistics()["executions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_get_documents_by_ids_coalesces_same_id_set():
+    """測試相同 ID 集合（順序不同）的並發查詢只訪問資料庫一次"""
+    from app.crud import crud_documents
+
+    ids = [str(uuid.uuid4()), str(uuid.uuid4())]
+    counter = {"calls": 0}
+
+    async def _fake_fetch(db, uuid_ids, *args):
+        counter["calls"] += 1
+        await asyncio.sleep(0.02)
+        return {doc_id: f"doc-{doc_id}" for doc_id in uuid_ids}
+
+    with patch.object(crud_documents, "_fetch_documents_by_ids", _fake_fetch):
+        db = MagicMock()
+        first, second = await asyncio.gather(
+            crud_documents.get_documents_by_ids(db, ids),
+            crud_documents.get_documents_by_ids(db, list(reversed(ids)))
+        )
+
+    assert counter["calls"] == 1
+    # 共享同一次查詢，各自按請求順序返回
+    assert first == [f"doc-{doc_id}" for doc_id in ids]
+    assert second == list(reversed(first))
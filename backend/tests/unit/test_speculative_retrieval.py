@@ -0,0 +1,192 @@
+"""
+推測式檢索單元測試
+
+測試目標:
+1. 推測式檢索的啟動、使用與丟棄統計
+2. 文檔搜索處理器在推測結果足夠好時跳過查詢重寫
+3. 推測結果不足時與重寫查詢結果合併
+4. 以 RRF 融合前的原始相似度判斷推測結果是否足夠好（RRF 分數遠小於閾值）
+5. 推測檢索沒有結果時不計為合併
+"""
+
+import asyncio
+import uuid
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.models.vector_models import AIQARequest, SemanticSearchResult
+from app.models.question_models import QuestionClassification, QuestionIntent
+from app.services.qa_workflow.speculative_retrieval_service import SpeculativeRetrievalService
+
+pytestmark = pytest.mark.unit
+
+
+def _result(doc_id: str, score: float) -> SemanticSearchResult:
+    return SemanticSearchResult(document_id=doc_id, similarity_score=score, summary_text="摘要")
+
+
+async def _rrf_results(doc_id: str, similarity: float):
+    """推測檢索實際返回的 RRF 融合結果（摘要與內容塊都命中同一文檔）"""
+    from app.services.vector.enhanced_search_service import enhanced_search_service
+    return await enhanced_search_service._apply_rrf_algorithm(
+        [_result(doc_id, similarity)], [_result(doc_id, similarity)], 5, {},
+        {"summary": 2.0, "chunks": 1.0}, 60
+    )
+
+
+def _classification() -> QuestionClassification:
+    return QuestionClassification(
+        intent=QuestionIntent.DOCUMENT_SEARCH,
+        confidence=0.95,
+        reasoning="用戶想查找文檔",
+        requires_documents=True,
+        suggested_strategy="document_search"
+    )
+
+
+@pytest.fixture
+def service():
+    return SpeculativeRetrievalService()
+
+
+@pytest.mark.asyncio
+async def test_start_and_consume(service):
+    """測試推測式檢索啟動後可被處理器取得結果"""
+    results = [_result("d1", 0.8)]
+    with patch(
+        "app.services.qa_workflow.speculative_retrieval_service.enhanced_search_service.two_stage_hybrid_search",
+        new=AsyncMock(return_value=results)
+    ):
+        speculation = service.start(db=MagicMock(), question="去年的發票在哪裡", user_id="u1")
+        consumed = await service.consume(speculation)
+
+    assert consumed == results
+    assert service.is_strong(consumed)
+    assert service.get_statistics()["started"] == 1
+
+
+def test_start_skips_short_question_and_anonymous(service):
+    """測試過短問題與無用戶時不啟動推測"""
+    assert service.start(db=MagicMock(), question="hi", user_id="u1") is None
+    assert service.start(db=MagicMock(), question="去年的發票在哪裡", user_id=None) is None
+
+
+@pytest.mark.asyncio
+async def test_discard_cancels_pending_task(service):
+    """測試丟棄未完成的推測會取消任務並計入統計"""
+    async def _slow(**kwargs):
+        await asyncio.sleep(10)
+
+    with patch(
+        "app.services.qa_workflow.speculative_retrieval_service.enhanced_search_service.two_stage_hybrid_search",
+        new=_slow
+    ):
+        speculation = service.start(db=MagicMock(), question="去年的發票在哪裡", user_id="u1")
+        service.discard(speculation)
+        await asyncio.sleep(0)
+
+    assert speculation.task.cancelled() or speculation.task.cancelling()
+    assert service.get_statistics()["discarded"] == 1
+    # 已丟棄的推測不能再被使用
+    assert await service.consume(speculation) is None
+
+
+@pytest.mark.asyncio
+async def test_handler_uses_strong_speculation_and_skips_rewrite():
+    """測試推測結果足夠好時處理器跳過查詢重寫"""
+    from app.services.intent_handlers import document_search_handler as module
+
+    doc_id = str(uuid.uuid4())
+    user_id = uuid.uuid4()
+    document = MagicMock(id=doc_id, owner_id=user_id)
+    speculation = MagicMock(finished=False)
+    stats_service = SpeculativeRetrievalService()
+
+    with patch.object(module, "speculative_retrieval_service", stats_service), \
+         patch.object(stats_service, "consume", new=AsyncMock(return_value=await _rrf_results(doc_id, 0.9))), \
+         patch.object(module, "get_document_summaries_by_ids", new=AsyncMock(return_value=[document])), \
+         patch.object(module.DocumentSearchHandler, "_lightweight_query_rewrite", new=AsyncMock()) as mock_rewrite, \
+         patch.object(module.DocumentSearchHandler, "_perform_hybrid_search", new=AsyncMock()) as mock_search, \
+         patch.object(module.DocumentSearchHandler, "_generate_answer_from_documents", new=AsyncMock(return_value="答案")):
+        response = await module.DocumentSearchHandler().handle(
+            AIQARequest(question="去年的發票在哪裡", context_limit=5),
+            _classification(),
+            None,
+            db=None,
+            user_id=str(user_id),
+            speculative_retrieval=speculation
+        )
+
+    mock_rewrite.assert_not_called()
+    mock_search.assert_not_called()
+    assert response.source_documents == [doc_id]
+    assert stats_service.get_statistics()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_handler_merges_weak_speculation():
+    """測試推測結果不足時仍執行查詢重寫並合併結果"""
+    from app.services.intent_handlers import document_search_handler as module
+
+    user_id = uuid.uuid4()
+    doc_a, doc_b = str(uuid.uuid4()), str(uuid.uuid4())
+    documents = [MagicMock(id=doc_a, owner_id=user_id), MagicMock(id=doc_b, owner_id=user_id)]
+    stats_service = SpeculativeRetrievalService()
+
+    with patch.object(module, "speculative_retrieval_service", stats_service), \
+         patch.object(stats_service, "consume", new=AsyncMock(return_value=await _rrf_results(doc_b, 0.4))), \
+         patch.object(module, "get_document_summaries_by_ids", new=AsyncMock(return_value=documents)) as mock_get_docs, \
+         patch.object(module.DocumentSearchHandler, "_lightweight_query_rewrite", new=AsyncMock(return_value=None)) as mock_rewrite, \
+         patch.object(module.DocumentSearchHandler, "_perform_hybrid_search", new=AsyncMock(return_value=[_result(doc_a, 0.5)])), \
+         patch.object(module.DocumentSearchHandler, "_generate_answer_from_documents", new=AsyncMock(return_value="答案")):
+        await module.DocumentSearchHandler().handle(
+            AIQARequest(question="去年的發票在哪裡", context_limit=5),
+            _classification(),
+            None,
+            db=None,
+            user_id=str(user_id),
+            speculative_retrieval=MagicMock(finished=False)
+        )
+
+    mock_rewrite.assert_awaited_once()
+    assert mock_get_docs.await_args.args[1] == [doc_a, doc_b]
+    assert stats_service.get_statistics()["merged"] == 1
+
+
+@pytest.mark.asyncio
+async def test_is_strong_uses_similarity_before_rrf(service):
+    """測試 RRF 分數遠低於閾值時仍按原始相似度判斷"""
+    strong = await _rrf_results("d1", 0.8)
+    weak = await _rrf_results("d2", 0.4)
+
+    assert strong[0].similarity_score < 0.1
+    assert service.is_strong(strong)
+    assert not service.is_strong(weak)
+
+
+@pytest.mark.asyncio
+async def test_handler_does_not_count_empty_speculation_as_merged():
+    """測試推測檢索沒有結果時只計為空結果"""
+    from app.services.intent_handlers import document_search_handler as module
+
+    user_id = uuid.uuid4()
+    doc_a = str(uuid.uuid4())
+    stats_service = SpeculativeRetrievalService()
+
+    with patch.object(module, "speculative_retrieval_service", stats_service), \
+         patch.object(stats_service, "consume", new=AsyncMock(return_value=[])), \
+         patch.object(module, "get_document_summaries_by_ids", new=AsyncMock(return_value=[MagicMock(id=doc_a, owner_id=user_id)])), \
+         patch.object(module.DocumentSearchHandler, "_lightweight_query_rewrite", new=AsyncMock(return_value=None)), \
+         patch.object(module.DocumentSearchHandler, "_perform_hybrid_search", new=AsyncMock(return_value=[_result(doc_a, 0.5)])), \
+         patch.object(module.DocumentSearchHandler, "_generate_answer_from_documents", new=AsyncMock(return_value="答案")):
+        await module.DocumentSearchHandler().handle(
+            AIQARequest(question="去年的發票在哪裡", context_limit=5),
+            _classification(),
+            None,
+            db=None,
+            user_id=str(user_id),
+            speculative_retrieval=MagicMock(finished=False)
+        )
+
+    stats = stats_service.get_statistics()
+    assert stats["merged"] == 0 and stats["empty"] == 1
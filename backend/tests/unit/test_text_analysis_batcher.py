@@ -0,0 +1,190 @@
+"""
+文本分析批處理器單元測試
+
+測試目標:
+1. 同時到達的小文檔合併為一次批量分析請求，並按 document_index 拆分結果
+2. 批量請求失敗或結果槽位無效時回退為單獨調用
+3. 大文檔直接單獨分析
+4. 每次調用平均文檔數統計
+5. 不同用戶或分析選項不同的文檔不會合併到同一批
+"""
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.models.ai_models_simplified import AIBatchTextAnalysisOutput, AITextAnalysisOutput, TokenUsage
+from app.services.ai.unified_ai_service_simplified import AIResponse, TaskType
+from app.services.document.text_analysis_batcher import TextAnalysisBatcher
+
+pytestmark = pytest.mark.unit
+
+MODULE = "app.services.document.text_analysis_batcher"
+
+
+def _analysis(summary: str) -> dict:
+    return {
+        "initial_summary": summary,
+        "content_type": "收據",
+        "intermediate_analysis": {"analysis_approach": "測試"},
+        "key_information": {"content_summary": summary}
+    }
+
+
+def _batch_response(results) -> AIResponse:
+    return AIResponse(
+        success=True,
+        task_type=TaskType.BATCH_TEXT_ANALYSIS,
+        model_used="gemini-2.0-flash",
+        output_data=AIBatchTextAnalysisOutput(results=results),
+        token_usage=TokenUsage(prompt_tokens=300, completion_tokens=600, total_tokens=900)
+    )
+
+
+def _single_response(summary: str = "單獨") -> AIResponse:
+    return AIResponse(
+        success=True,
+        task_type=TaskType.TEXT_GENERATION,
+        model_used="gemini-2.0-flash",
+        output_data=AITextAnalysisOutput(**_analysis(summary)),
+        token_usage=TokenUsage(prompt_tokens=10, completion_tokens=10, total_tokens=20)
+    )
+
+
+@pytest.fixture
+def batch_settings():
+    with patch(f"{MODULE}.settings") as mock_settings:
+        mock_settings.TEXT_ANALYSIS_BATCHING_ENABLED = True
+        mock_settings.TEXT_ANALYSIS_BATCH_WINDOW_SECONDS = 0.02
+        mock_settings.TEXT_ANALYSIS_BATCH_MAX_DOCUMENTS = 8
+        mock_settings.TEXT_ANALYSIS_BATCH_TOKEN_BUDGET = 1000
+        mock_settings.TEXT_ANALYSIS_BATCH_MAX_DOC_TOKENS = 200
+        mock_settings.TEXT_ANALYSIS_BATCH_OUTPUT_TOKENS_PER_DOC = 1000
+        yield mock_settings
+
+
+@pytest.mark.asyncio
+async def test_concurrent_small_documents_share_one_call(batch_settings):
+    """測試同時到達的三份小文檔只發出一次批量請求"""
+    batcher = TextAnalysisBatcher()
+    batch_mock = AsyncMock(return_value=_batch_response([
+        {"document_index": 2, **_analysis("文檔C")},
+        {"document_index": 0, **_analysis("文檔A")},
+        {"document_index": 1, **_analysis("文檔B")},
+    ]))
+
+    with patch(f"{MODULE}.unified_ai_service_simplified.analyze_text_batch", new=batch_mock), \
+         patch(f"{MODULE}.unified_ai_service_simplified.analyze_text", new=AsyncMock()) as single_mock:
+        responses = await asyncio.gather(*[batcher.analyze(text) for text in ("收據A", "收據B", "收據C")])
+
+    batch_mock.assert_awaited_once()
+    assert batch_mock.await_args.kwargs["texts"] == ["收據A", "收據B", "收據C"]
+    single_mock.assert_not_called()
+    assert [r.output_data.initial_summary for r in responses] == ["文檔A", "文檔B", "文檔C"]
+    assert all(r.task_type == TaskType.TEXT_GENERATION for r in responses)
+    assert sum(r.token_usage.total_tokens for r in responses) <= 900
+    stats = batcher.get_statistics()
+    assert stats["documents_per_call"] == 3.0
+    assert stats["batch_size_distribution"] == {3: 1}
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_falls_back_to_individual_calls(batch_settings):
+    """測試批量請求失敗時每份文檔回退為單獨調用"""
+    batcher = TextAnalysisBatcher()
+    failed = AIResponse(success=False, task_type=TaskType.BATCH_TEXT_ANALYSIS, error_message="JSON 格式錯誤")
+
+    with patch(f"{MODULE}.unified_ai_service_simplified.analyze_text_batch", new=AsyncMock(return_value=failed)), \
+         patch(f"{MODULE}.unified_ai_service_simplified.analyze_text", new=AsyncMock(return_value=_single_response())) as single_mock:
+        responses = await asyncio.gather(batcher.analyze("郵件1"), batcher.analyze("郵件2"))
+
+    assert single_mock.await_count == 2
+    assert all(r.success for r in responses)
+    stats = batcher.get_statistics()
+    assert stats["failed_batches"] == 1
+    assert stats["fallback_documents"] == 2
+
+
+@pytest.mark.asyncio
+async def test_missing_or_invalid_slot_falls_back(batch_settings):
+    """測試缺少或格式無效的結果槽位只回退對應文檔"""
+    batcher = TextAnalysisBatcher()
+    batch_mock = AsyncMock(return_value=_batch_response([
+        {"document_index": 0, **_analysis("文檔A")},
+        {"document_index": 1, "initial_summary": "缺少必填欄位"},
+    ]))
+
+    with patch(f"{MODULE}.unified_ai_service_simplified.analyze_text_batch", new=batch_mock), \
+         patch(f"{MODULE}.unified_ai_service_simplified.analyze_text", new=AsyncMock(return_value=_single_response())) as single_mock:
+        responses = await asyncio.gather(*[batcher.analyze(text) for text in ("筆記A", "筆記B", "筆記C")])
+
+    assert responses[0].output_data.initial_summary == "文檔A"
+    assert responses[1].output_data.initial_summary == "單獨"
+    assert responses[2].output_data.initial_summary == "單獨"
+    assert single_mock.await_count == 2
+    assert batcher.get_statistics()["batched_documents"] == 1
+
+
+@pytest.mark.asyncio
+async def test_large_document_and_budget_split(batch_settings):
+    """測試大文檔直接單獨分析，超出 token 預算時拆成多批"""
+    batch_settings.TEXT_ANALYSIS_BATCH_TOKEN_BUDGET = 300
+    batcher = TextAnalysisBatcher()
+
+    async def _batch(texts, **kwargs):
+        return _batch_response([{"document_index": i, **_analysis(t)} for i, t in enumerate(texts)])
+
+    medium = "字" * 180  # 約 180 token，兩份會超出 300 的預算
+    with patch(f"{MODULE}.unified_ai_service_simplified.analyze_text_batch", new=AsyncMock(side_effect=_batch)) as batch_mock, \
+         patch(f"{MODULE}.unified_ai_service_simplified.analyze_text", new=AsyncMock(return_value=_single_response())) as single_mock:
+        await batcher.analyze("長" * 1000)
+        await asyncio.gather(batcher.analyze(medium), batcher.analyze(medium), batcher.analyze("短"))
+
+    # 大文檔單獨調用一次；第一份中等文檔在預算滿時單獨成批（也是單獨調用）
+    assert single_mock.await_count == 2
+    batch_mock.assert_awaited_once()
+    assert len(batch_mock.await_args.kwargs["texts"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_different_users_never_share_a_batch(batch_settings):
+    """測試同一窗口內兩個用戶的文檔各自成批，用量按各自用戶記錄"""
+    batcher = TextAnalysisBatcher()
+
+    async def _batch(texts, **kwargs):
+        return _batch_response([{"document_index": i, **_analysis(t)} for i, t in enumerate(texts)])
+
+    with patch(f"{MODULE}.unified_ai_service_simplified.analyze_text_batch", new=AsyncMock(side_effect=_batch)) as batch_mock, \
+         patch(f"{MODULE}.unified_ai_service_simplified.analyze_text", new=AsyncMock(return_value=_single_response())) as single_mock:
+        responses = await asyncio.gather(
+            batcher.analyze("甲的收據1", user_id="user-a"),
+            batcher.analyze("乙的收據1", user_id="user-b"),
+            batcher.analyze("甲的收據2", user_id="user-a"),
+            batcher.analyze("乙的收據2", user_id="user-b"),
+            batcher.analyze("甲的英文筆記", user_id="user-a", ai_ensure_chinese_output=False),
+        )
+
+    batches = {call.kwargs["user_id"]: call.kwargs["texts"] for call in batch_mock.await_args_list}
+    assert batches == {"user-a": ["甲的收據1", "甲的收據2"], "user-b": ["乙的收據1", "乙的收據2"]}
+    assert all(call.kwargs["ai_ensure_chinese_output"] is True for call in batch_mock.await_args_list)
+    # 選項不同的文檔單獨分析，選項按原樣傳遞
+    single_mock.assert_awaited_once()
+    assert single_mock.await_args.kwargs["user_id"] == "user-a"
+    assert single_mock.await_args.kwargs["ai_ensure_chinese_output"] is False
+    assert [r.output_data.initial_summary for r in responses[:4]] == ["甲的收據1", "乙的收據1", "甲的收據2", "乙的收據2"]
+
+def test_batch_prompt_contains_documents():
+    """測試批量分析提示詞包含文檔數量和每份文檔內容"""
+    from app.services.ai.prompt_manager_simplified import prompt_manager_simplified, PromptType
+
+    template = prompt_manager_simplified._prompts[PromptType.BATCH_TEXT_ANALYSIS]
+    system_prompt, user_prompt = prompt_manager_simplified.format_prompt(
+        template,
+        document_count="2",
+        documents_data='<document index="0">\n甲\n</document>\n<document index="1">\n乙\n</document>'
+    )
+
+    assert "document_index" in system_prompt
+    assert "key_information" in system_prompt
+    assert "2 份文檔" in user_prompt
+    assert '<document index="1">' in user_prompt
@@ -0,0 +1,104 @@
+"""
+本地 token 估算器與提示詞預算分配單元測試
+
+測試目標:
+1. 中日韓字符與其他字符的啟發式估算
+2. 以 API 回報的實際 token 數按模型校準
+3. 截斷結果不超過 token 上限，對話歷史保留最近內容
+4. format_prompt 超出預算時先壓縮對話歷史，問題保持完整
+"""
+
+import pytest
+from unittest.mock import patch
+
+from app.services.ai.token_estimator import (
+    PromptSegment,
+    TokenEstimator,
+    allocate_token_budget
+)
+
+pytestmark = pytest.mark.unit
+
+
+@pytest.fixture
+def estimator():
+    return TokenEstimator(tokenizer_path="")
+
+
+def test_heuristic_counts_cjk_and_other_characters(estimator):
+    """測試中文每字約 1 token，英文約 4 字元 1 token"""
+    assert estimator.count("") == 0
+    assert estimator.count("發票" * 50) == 100
+    assert estimator.count("a" * 400) == 100
+    assert estimator.count("發票 invoice") == 2 + 2
+    assert estimator.backend == "heuristic"
+
+
+def test_calibration_is_per_model(estimator):
+    """測試校準係數只作用於對應模型"""
+    text = "合約" * 100  # 原始估算 200
+    estimator.calibrate("gemini-2.0-flash", estimator.count_raw(text), 150)
+
+    assert estimator.count(text, "gemini-2.0-flash") == 150
+    assert estimator.count(text, "gemini-2.5-pro") == 200
+    stats = estimator.get_statistics()["models"]["gemini-2.0-flash"]
+    assert stats["samples"] == 1
+    assert stats["factor"] == 0.75
+
+
+def test_truncate_respects_limit_and_keep_side(estimator):
+    """測試截斷後不超過上限；tail 模式保留結尾"""
+    text = "".join(f"第{i}輪對話。" for i in range(200))
+
+    head = estimator.truncate(text, 100)
+    tail = estimator.truncate(text, 100, keep="tail")
+
+    assert estimator.count(head) <= 100
+    assert estimator.count(tail) <= 100
+    assert head.startswith("第0輪")
+    assert tail.endswith("第199輪對話。")
+    assert estimator.truncate("短文", 100) == "短文"
+
+
+def test_allocator_compresses_lowest_priority_first(estimator):
+    """測試預算不足時先壓縮低價值部分，預算足夠時不壓縮"""
+    segments = [
+        PromptSegment(name="history", text="歷" * 300, priority=0, keep="tail"),
+        PromptSegment(name="context", text="文" * 300, priority=1),
+        PromptSegment(name="question", text="問" * 50, priority=3),
+    ]
+
+    untouched = allocate_token_budget(segments, 1000, estimator)
+    assert untouched["history"] == "歷" * 300
+
+    allocated = allocate_token_budget(segments, 500, estimator)
+    assert estimator.count(allocated["history"]) <= 150
+    assert allocated["context"] == "文" * 300
+    assert allocated["question"] == "問" * 50
+    assert sum(estimator.count(text) for text in allocated.values()) <= 500
+
+
+def test_format_prompt_applies_budget():
+    """測試 format_prompt 按預算壓縮對話歷史，保持問題完整"""
+    from app.services.ai.prompt_manager_simplified import PromptType, prompt_manager_simplified
+    from app.services.ai import token_estimator as module
+
+    template = prompt_manager_simplified._prompts[PromptType.GENERATE_CLARIFICATION_QUESTION]
+    history = "".join(f"用戶: 第{i}個問題\n助手: 回答{i}\n" for i in range(400))
+    question = "上次提到的那份合約呢"
+
+    with patch.object(module, "token_estimator", TokenEstimator(tokenizer_path="")):
+        unbudgeted_system, unbudgeted_user = prompt_manager_simplified.format_prompt(
+            template, user_question=question, conversation_history=history, ambiguity_reason="指代不明",
+            max_prompt_tokens=10 ** 6
+        )
+        system_prompt, user_prompt = prompt_manager_simplified.format_prompt(
+            template, user_question=question, conversation_history=history, ambiguity_reason="指代不明",
+            max_prompt_tokens=3000
+        )
+
+    estimator = TokenEstimator(tokenizer_path="")
+    assert estimator.count(unbudgeted_system + unbudgeted_user) > 3000
+    assert estimator.count(system_prompt + user_prompt) <= 3000
+    assert question in system_prompt + user_prompt
+    assert "較早的內容已按 token 預算省略" in system_prompt + user_prompt
@@ -438,7 +438,14 @@ const DocumentsPage: React.FC<DocumentsPageProps> = ({ showPCMessage }) => {
       setIsDeleting(true);
       try {
         const idsToDelete = Array.from(selectedDocuments);
-        const result = await deleteDocuments(idsToDelete);
+        // 大批量刪除在後台執行，deleteDocuments 會輪詢到任務完成才返回
+        let backgroundNotified = false;
+        const result = await deleteDocuments(idsToDelete, () => {
+          if (!backgroundNotified) {
+            backgroundNotified = true;
+            showPCMessage('文件較多，正在後台刪除，完成後將自動刷新列表', 'info');
+          }
+        });
 
         showPCMessage(result.message, result.success ? 'success' : 'info'); 
 
@@ -6,6 +6,7 @@ import type {
   UploadDocumentOptions,
   BasicResponse,
   BatchDeleteDocumentsApiResponse,
+  BatchDeleteTaskStatusResponse,
   TriggerDocumentProcessingOptions
 } from '../types/apiTypes';
 import axios from 'axios'; // For isAxiosError check in deleteDocument
@@ -110,12 +111,55 @@ export const deleteDocument = async (documentId: string): Promise<BasicResponse>
   }
 };
 
-export const deleteDocuments = async (documentIds: string[]): Promise<BatchDeleteDocumentsApiResponse> => {
+const BATCH_DELETE_POLL_INTERVAL_MS = 1000;
+const BATCH_DELETE_MAX_POLLS = 600; // 最多等待 10 分鐘
+
+export const getBatchDeleteTaskStatus = async (taskId: string): Promise<BatchDeleteTaskStatusResponse> => {
+  const response = await apiClient.get<BatchDeleteTaskStatusResponse>(`/documents/batch-delete/${taskId}`);
+  return response.data;
+};
+
+// 輪詢後台批量刪除任務直到完成，並轉換為與同步刪除相同的結果格式
+const waitForBatchDeleteTask = async (
+  taskId: string,
+  onProgress?: (task: BatchDeleteTaskStatusResponse) => void
+): Promise<BatchDeleteDocumentsApiResponse> => {
+  for (let attempt = 0; attempt < BATCH_DELETE_MAX_POLLS; attempt++) {
+    const task = await getBatchDeleteTaskStatus(taskId);
+    onProgress?.(task);
+    if (task.status === 'completed') {
+      const deleted = task.result?.deleted ?? 0;
+      const rejected = task.result?.rejected ?? [];
+      return {
+        success: rejected.length === 0,
+        message: `Batch delete operation completed. Requested: ${task.result?.requested ?? task.total_items}, Succeeded: ${deleted}.`,
+        processed_count: deleted + rejected.length,
+        success_count: deleted,
+        details: rejected,
+        task_id: taskId
+      };
+    }
+    if (task.status === 'failed') {
+      throw new Error(task.error_message || '批量刪除任務失敗');
+    }
+    await new Promise(resolve => setTimeout(resolve, BATCH_DELETE_POLL_INTERVAL_MS));
+  }
+  throw new Error('批量刪除任務超時，請稍後刷新查看結果');
+};
+
+export const deleteDocuments = async (
+  documentIds: string[],
+  onProgress?: (task: BatchDeleteTaskStatusResponse) => void
+): Promise<BatchDeleteDocumentsApiResponse> => {
   console.log(`API: Attempting to batch delete documents with IDs: ${documentIds.join(', ')}`);
   try {
     const response = await apiClient.post<BatchDeleteDocumentsApiResponse>('/documents/batch-delete', {
       document_ids: documentIds 
     });
+    if (response.data.task_id) {
+      // 超過同步上限時後台刪除：等待任務完成後再返回，避免調用方在刪除完成前刷新列表
+      return await waitForBatchDeleteTask(response.data.task_id, onProgress);
+    }
     return response.data;
   } catch (error) {
     console.error('API: Failed to batch delete documents:', error);
@@ -33,6 +33,33 @@ export interface BatchDeleteDocumentsApiResponse {
   processed_count: number;
   success_count: number;
   details: BatchDeleteErrorDetail[];
+  task_id?: string; // 超過同步上限時在後台刪除，通過 /documents/batch-delete/{task_id} 查詢進度
+}
+
+export interface BatchDeleteTaskResult {
+  requested: number;
+  deleted: number;
+  vector_failures: number;
+  rejected: BatchDeleteErrorDetail[]; // 只包含未刪除的文件
+}
+
+export interface BatchDeleteTaskStatusResponse {
+  task_id: string;
+  status: 'pending' | 'running' | 'completed' | 'failed';
+  progress: number;
+  current_step: string;
+  total_items: number;
+  completed_items: number;
+  result?: BatchDeleteTaskResult | null;
+  error_message?: string | null;
+}
+
+// POST /documents/process-unprocessed 與 /documents/retry-failed 的響應
+export interface DocumentProcessingJobResponse {
+  message: string;
+  task_id: string | null; // 沒有需要處理的文檔時為 null；否則通過 /documents/processing-jobs/{task_id} 查詢進度
+  queued_count: number;
+  skipped_count?: number; // 已在隊列或處理中而未重複入隊的文檔數
 }
 
 export interface Activity {